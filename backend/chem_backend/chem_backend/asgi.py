@@ -5,6 +5,13 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Le flux SSE /api/compounds/events/ est servi ici (uvicorn, daphne...) par
+compounds.events.sse_endpoint, hors des middlewares Django : chaque
+connexion est une coroutine, pas un thread.
+
+    uvicorn chem_backend.asgi:application --workers 4
+    (avec plusieurs workers : COMPOUND_EVENTS_BACKEND=postgres)
 """
 
 import os
@@ -13,4 +20,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chem_backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Après django.setup() (fait par get_asgi_application)
+from django.urls import reverse  # noqa: E402
+
+from compounds.events import sse_endpoint  # noqa: E402
+
+SSE_PATH = reverse("compound_events")
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == SSE_PATH:
+        return await sse_endpoint(scope, receive, send)
+    return await django_application(scope, receive, send)
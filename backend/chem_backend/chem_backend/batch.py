@@ -0,0 +1,214 @@
+# chem_backend/batch.py
+"""
+Requêtes GET groupées : un seul aller-retour pour le chargement d'une page.
+
+POST /api/batch/   {"requests": ["/api/csrf/", {"id": "me", "url": "/api/auth/me/"}, ...]}
+→ {"responses": [{"id", "status", "headers"?, "body"}, ...]}  (même ordre)
+
+Chaque sous-requête est une copie de la requête HTTP (cookies, session et
+utilisateur déjà résolus par les middlewares : une seule fois pour tout le
+lot), routée vers la vue existante sans repasser par la chaîne de
+middlewares. Les sous-requêtes (GET, donc indépendantes) s'exécutent en
+parallèle dans un pool de BATCH_WORKERS threads, chacun avec sa connexion DB.
+
+Par sous-requête : débit / délestage de sa classe d'endpoint (shedding.admit),
+garde-fou SQL (queryguard.guarding), budget de requêtes SQL
+(querybudget.budgeted, hors du compteur du lot, même en séquentiel) et
+métriques sous son propre nom d'URL.
+Les corps JSON sont recopiés tels quels dans l'enveloppe (pas de
+re-sérialisation) ; une réponse 2xx non JSON (fichier, SSE...) donne 406. Pas de POST : la vue est exemptée de CSRF mais
+exige Content-Type: application/json (pré-vol CORS pour une origine tierce).
+"""
+import copy
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse, JsonResponse, QueryDict
+from django.middleware.csrf import get_token
+from django.urls import Resolver404, get_script_prefix, resolve
+from django.utils.datastructures import MultiValueDict
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import metrics, querybudget, queryguard, shedding
+
+logger = logging.getLogger(__name__)
+
+# Propres à la requête englobante : ne pas les transmettre aux sous-requêtes
+_DROPPED_META = (
+    "CONTENT_LENGTH", "CONTENT_TYPE", "HTTP_IF_MATCH", "HTTP_IF_NONE_MATCH",
+    "HTTP_IF_MODIFIED_SINCE", "HTTP_X_PROFILE",
+)
+_KEPT_HEADERS = ("ETag", "Last-Modified", "Location", "Retry-After", "X-Query-Downgraded")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.BATCH_WORKERS, thread_name_prefix="batch")
+        return _pool
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_batch(body: bytes):
+    """[(id, chemin, query string)] ; BatchError si le corps est invalide."""
+    try:
+        data = json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        raise BatchError("Invalid JSON") from None
+    items = data.get("requests") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise BatchError("'requests' must be a non-empty array")
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        raise BatchError(f"At most {settings.BATCH_MAX_REQUESTS} requests per batch")
+
+    parsed = []
+    for i, item in enumerate(items):
+        ident, url = (str(i), item) if isinstance(item, str) else (
+            (str(item.get("id", i)), item.get("url")) if isinstance(item, dict) else (str(i), None)
+        )
+        if not isinstance(url, str):
+            raise BatchError(f"Request {i}: 'url' is required")
+        parts = urlsplit(url)
+        if parts.scheme or parts.netloc or not parts.path.startswith("/api/"):
+            raise BatchError(f"Request {i}: only relative /api/ URLs are allowed")
+        parsed.append((ident, parts.path, parts.query))
+    return parsed
+
+
+def _subrequest(request, path, query, match):
+    sub = copy.copy(request)
+    sub.__dict__.pop("headers", None)  # cached_property calculée sur META
+    sub.method = "GET"
+    sub.path_info = path
+    sub.path = get_script_prefix().rstrip("/") + path
+    sub.META = {k: v for k, v in request.META.items() if k not in _DROPPED_META}
+    sub.META.update(REQUEST_METHOD="GET", PATH_INFO=path, QUERY_STRING=query)
+    sub.GET = QueryDict(query)
+    sub._post, sub._files = QueryDict(), MultiValueDict()  # corps de la requête englobante : non transmis
+    sub.resolver_match = match
+    return sub
+
+
+def _call_view(sub, match):
+    view = match.func
+    try:
+        if iscoroutinefunction(view):
+            return async_to_sync(view)(sub, *match.args, **match.kwargs)
+        return view(sub, *match.args, **match.kwargs)
+    except Http404:
+        return JsonResponse({"error": "Not found"}, status=404)
+    except PermissionDenied:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    except Exception as exc:
+        guarded = queryguard.error_response(exc)  # délai dépassé, coût, client parti
+        if guarded is not None:
+            return guarded
+        logger.exception("Batch sub-request failed: %s", sub.get_full_path())
+        return JsonResponse({"error": "Internal server error"}, status=500)
+
+
+def _run(request, path, query, match):
+    """Exécute une sous-requête (débit, délestage, métriques) ; retourne sa réponse."""
+    sub = _subrequest(request, path, query, match)
+    cls = shedding.endpoint_class(match.url_name) if settings.SHED_ENABLED else None
+    if settings.SHED_ENABLED:
+        refused = shedding.admit(sub, cls)
+        if refused is not None:
+            return refused
+    with metrics.measuring() as timer, ExitStack() as stack:
+        stack.enter_context(querybudget.budgeted(match.url_name, path))
+        if settings.SHED_ENABLED:
+            stack.enter_context(shedding.occupying(cls))
+        guard = stack.enter_context(queryguard.guarding(sub, match.url_name))
+        response = _call_view(sub, match)
+    if guard is not None and guard.downgraded:
+        response["X-Query-Downgraded"] = guard.downgraded
+    if settings.METRICS_ENABLED and not response.streaming:
+        metrics.record(match.view_name, "GET", response.status_code, timer,
+                       time.perf_counter() - timer.start, None, len(response.content))
+    return response
+
+
+def _run_in_worker(request, path, query, match):
+    close_old_connections()  # comme request_started / request_finished
+    try:
+        return _run(request, path, query, match)
+    finally:
+        close_old_connections()
+
+
+def _encode(ident, response) -> bytes:
+    """Élément de l'enveloppe ; le corps JSON est inséré sans être re-parsé."""
+    item = {"id": ident, "status": response.status_code}
+    headers = {h: response[h] for h in _KEPT_HEADERS if response.has_header(h)}
+    if headers:
+        item["headers"] = headers
+    body = b"null"
+    if not response.streaming and response.get("Content-Type", "").startswith("application/json"):
+        body = response.content or b"null"
+    elif 200 <= response.status_code < 300:
+        item["status"] = 406
+        body = b'{"error": "Only JSON responses can be batched"}'
+    response.close()
+    return json.dumps(item)[:-1].encode() + b', "body": ' + body + b"}"
+
+
+@csrf_exempt  # GET uniquement, sans effet de bord ; Content-Type JSON imposé (pré-vol CORS)
+@require_POST
+def batch_view(request):
+    if request.content_type != "application/json":
+        return JsonResponse({"error": "Content-Type must be application/json"}, status=415)
+    try:
+        items = parse_batch(request.body)
+    except BatchError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Résolus une fois pour tout le lot (partagés, en lecture, par les threads)
+    _ = request.session.keys(), request.user.is_authenticated
+
+    jobs, results = [], {}
+    for index, (ident, path, query) in enumerate(items):
+        try:
+            match = resolve(path)
+        except Resolver404:
+            results[index] = JsonResponse({"error": "Not found"}, status=404)
+            continue
+        if match.url_name in settings.BATCH_EXCLUDED_URL_NAMES:
+            results[index] = JsonResponse({"error": "This endpoint cannot be batched"}, status=400)
+            continue
+        if match.url_name == "csrf":
+            get_token(request)  # même secret pour tout le lot ; cookie posé sur la réponse englobante
+        jobs.append((index, path, query, match))
+
+    if len(jobs) > 1 and settings.BATCH_WORKERS > 1:
+        pool = _executor()
+        futures = [(index, pool.submit(_run_in_worker, request, path, query, match))
+                   for index, path, query, match in jobs]
+        results.update((index, future.result()) for index, future in futures)
+    else:
+        results.update((index, _run(request, path, query, match)) for index, path, query, match in jobs)
+
+    content = b'{"responses": [' + b", ".join(
+        _encode(ident, results[index]) for index, (ident, _, _) in enumerate(items)
+    ) + b"]}"
+    response = HttpResponse(content, content_type="application/json")
+    for sub_response in results.values():
+        response.cookies.update(sub_response.cookies)
+    return response
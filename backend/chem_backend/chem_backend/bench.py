@@ -0,0 +1,291 @@
+# chem_backend/bench.py
+"""
+Harnais de charge pour l'API.
+
+Chaque scénario (public, private, detail, search, add, admin_users...) est
+joué pendant `duration` secondes par `concurrency` threads, soit en process
+(django.test.Client, aucun serveur nécessaire) soit en HTTP contre un serveur
+local (`base_url`). Les résultats (débit, p50/p95/p99) sont un dict JSON
+sérialisable pour comparer les versions.
+"""
+import http.cookiejar
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import django
+from django.db import connection, connections
+
+from compounds.synthetic import BENCH_EMAIL_PREFIX, BENCH_PASSWORD, random_compound
+
+
+# ---------- Scénarios ----------
+
+SEARCH_TERMS = ["benz", "chloro", "methyl", "pyridine", "amino", "CC", "c1cc", "C6H", "naphth", "zzz"]
+
+
+def _offset(rng, ctx):
+    return rng.randrange(0, max(1, ctx["max_offset"]))
+
+
+def _public(rng, ctx):
+    return "GET", f"/api/compounds/public/?limit=20&offset={_offset(rng, ctx)}", None
+
+
+def _private(rng, ctx):
+    return "GET", f"/api/compounds/private/?limit=20&offset={_offset(rng, ctx)}", None
+
+
+def _detail(rng, ctx):
+    return "GET", f"/api/compounds/{rng.randint(ctx['min_id'], ctx['max_id'])}/", None
+
+
+def _search(rng, ctx):
+    return "GET", f"/api/compounds/public/?q={rng.choice(SEARCH_TERMS)}&limit=20", None
+
+
+def _add(rng, ctx):
+    data = random_compound(rng)
+    data["is_public"] = rng.random() < 0.7
+    return "POST", "/api/compounds/add/", data
+
+
+def _admin_users(rng, ctx):
+    return "GET", f"/api/admin/users/?limit=50&offset={_offset(rng, ctx)}", None
+
+
+def _admin_compounds(rng, ctx):
+    return "GET", f"/api/admin/compounds/?limit=50&offset={_offset(rng, ctx)}", None
+
+
+def _login(rng, ctx):
+    # Moitié de bons mots de passe, moitié d'échecs (credential stuffing)
+    email = f"{BENCH_EMAIL_PREFIX}{rng.randint(1, max(1, ctx['bench_users']))}@example.com"
+    password = ctx["password"] if rng.random() < 0.5 else "wrong-password"
+    return "POST", "/api/auth/login/", {"email": email, "password": password}
+
+
+# nom -> (générateur de requête, profil d'authentification)
+SCENARIOS = {
+    "public": (_public, None),
+    "private": (_private, "user"),
+    "detail": (_detail, "user"),
+    "search": (_search, None),
+    "add": (_add, "user"),
+    "admin_users": (_admin_users, "admin"),
+    "admin_compounds": (_admin_compounds, "admin"),
+    "login": (_login, None),
+}
+
+
+# ---------- Transports ----------
+
+class InProcessTransport:
+    """Requêtes via django.test.Client (un client par thread)."""
+
+    def __init__(self, user=None, remote_addr="127.0.0.1"):
+        from django.test import Client
+        self.client = Client(HTTP_HOST="localhost", REMOTE_ADDR=remote_addr)
+        if user is not None:
+            self.client.force_login(user)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = {f"HTTP_{k.upper().replace('-', '_')}": v for k, v in (headers or {}).items()}
+        if method == "GET":
+            resp = self.client.get(path, **headers)
+        else:
+            resp = self.client.generic(method, path, json.dumps(body or {}),
+                                       content_type="application/json", **headers)
+        content = b"".join(resp.streaming_content) if resp.streaming else resp.content
+        return resp.status_code, len(content)
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    """Requêtes HTTP réelles (urllib + cookies de session + CSRF)."""
+
+    def __init__(self, base_url, credentials=None):
+        self.base_url = base_url.rstrip("/")
+        self.jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.jar))
+        self.request("GET", "/api/csrf/")
+        if credentials:
+            status, _ = self.request("POST", "/api/auth/login/", credentials)
+            if status != 200:
+                raise RuntimeError(f"Login failed for {credentials.get('email')} (HTTP {status})")
+
+    def _csrf(self):
+        for cookie in self.jar:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        return ""
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header("Accept", "application/json")
+        for k, v in (headers or {}).items():
+            req.add_header(k, v)
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        if method != "GET":
+            req.add_header("X-CSRFToken", self._csrf())
+        try:
+            with self.opener.open(req) as resp:
+                return resp.status, len(resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+    def close(self):
+        pass
+
+
+# ---------- Exécution ----------
+
+def percentile(sorted_values, p):
+    """Percentile par rang le plus proche (valeurs déjà triées)."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def summarize(latencies, statuses, nbytes, wall):
+    lat = sorted(latencies)
+    errors = sum(1 for s in statuses if s >= 500 or s == 0)
+    return {
+        "requests": len(lat),
+        "errors": errors,
+        "status_codes": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        "throughput_rps": round(len(lat) / wall, 2) if wall else 0.0,
+        "bytes_per_request": round(nbytes / len(lat), 1) if lat else 0,
+        "mean_ms": _ms(sum(lat) / len(lat)) if lat else None,
+        "p50_ms": _ms(percentile(lat, 50)),
+        "p95_ms": _ms(percentile(lat, 95)),
+        "p99_ms": _ms(percentile(lat, 99)),
+        "max_ms": _ms(lat[-1]) if lat else None,
+    }
+
+
+def run_scenario(make_request, transport_factory, ctx, concurrency, duration,
+                 max_requests=None, seed=0, headers=None, stop_event=None):
+    """
+    Joue un scénario avec `concurrency` threads pendant `duration` secondes
+    (ou jusqu'à `max_requests` au total). Retourne le résumé statistique.
+    """
+    lock = threading.Lock()
+    latencies, statuses = [], []
+    nbytes = [0]
+    remaining = [max_requests if max_requests is not None else float("inf")]
+    clock = {}
+
+    def start_clock():
+        # Le chrono démarre quand tous les threads sont connectés (login exclu).
+        clock["start"] = time.perf_counter()
+        clock["deadline"] = clock["start"] + duration
+
+    barrier = threading.Barrier(concurrency, action=start_clock)
+
+    def worker(idx):
+        rng = random.Random(seed * 1000 + idx)
+        try:
+            transport = transport_factory()
+        except Exception:
+            barrier.abort()
+            raise
+        barrier.wait()
+        local_lat, local_status, local_bytes = [], [], 0
+        try:
+            while time.perf_counter() < clock["deadline"] and not (stop_event and stop_event.is_set()):
+                with lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+                method, path, body = make_request(rng, ctx)
+                t0 = time.perf_counter()
+                try:
+                    status, size = transport.request(method, path, body, headers)
+                except Exception:
+                    status, size = 0, 0
+                local_lat.append(time.perf_counter() - t0)
+                local_status.append(status)
+                local_bytes += size
+        finally:
+            transport.close()
+            with lock:
+                latencies.extend(local_lat)
+                statuses.extend(local_status)
+                nbytes[0] += local_bytes
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - clock["start"]
+    return summarize(latencies, statuses, nbytes[0], wall)
+
+
+def build_context(max_offset=1000, password=BENCH_PASSWORD):
+    from compounds.models import Compound
+    from django.contrib.auth import get_user_model
+    from django.db.models import Max, Min
+    agg = Compound.objects.aggregate(lo=Min("id"), hi=Max("id"))
+    bench_users = get_user_model().objects.filter(email__startswith=BENCH_EMAIL_PREFIX).count()
+    return {
+        "min_id": agg["lo"] or 1,
+        "max_id": agg["hi"] or 1,
+        "max_offset": max_offset,
+        "bench_users": max(1, bench_users - 1),  # hors bench-admin
+        "password": password,
+    }
+
+
+def run_benchmark(scenarios, concurrency=8, duration=10.0, max_requests=None,
+                  base_url=None, user_credentials=None, admin_credentials=None,
+                  user=None, admin=None, max_offset=1000, seed=0, label=""):
+    """
+    Joue chaque scénario l'un après l'autre et retourne un dict JSON :
+    {"meta": {...}, "endpoints": {nom: {throughput_rps, p50_ms, p95_ms, p99_ms, ...}}}
+    """
+    from compounds.models import Compound
+    from django.contrib.auth import get_user_model
+
+    ctx = build_context(max_offset)
+    results = {}
+    for name in scenarios:
+        make_request, auth = SCENARIOS[name]
+        if base_url:
+            creds = {"user": user_credentials, "admin": admin_credentials}.get(auth)
+            factory = lambda creds=creds: HttpTransport(base_url, creds)  # noqa: E731
+        else:
+            who = {"user": user, "admin": admin}.get(auth)
+            factory = lambda who=who: InProcessTransport(who)  # noqa: E731
+        results[name] = run_scenario(make_request, factory, ctx, concurrency, duration,
+                                     max_requests=max_requests, seed=seed)
+
+    return {
+        "meta": {
+            "label": label,
+            "timestamp": datetime.now(dt_timezone.utc).isoformat(),
+            "transport": "http" if base_url else "in-process",
+            "base_url": base_url,
+            "db_vendor": connections["default"].vendor,
+            "django": django.get_version(),
+            "concurrency": concurrency,
+            "duration_s": duration,
+            "max_requests": max_requests,
+            "compounds": Compound.objects.count(),
+            "users": get_user_model().objects.count(),
+        },
+        "endpoints": results,
+    }
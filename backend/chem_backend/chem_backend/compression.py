@@ -0,0 +1,242 @@
+# chem_backend/compression.py
+"""
+Compression négociée des réponses : zstd, brotli ou gzip selon
+Accept-Encoding (q-values) et l'ordre de préférence du serveur.
+
+- Seuil de taille (COMPRESSION_MIN_SIZE) : en dessous, l'en-tête coûte plus
+  que le gain.
+- Réponses en streaming (exports, FileResponse) compressées au fil de l'eau,
+  sans tout charger en mémoire.
+- Niveau choisi par type de contenu (COMPRESSION_LEVELS) ; un type absent de
+  la table n'est pas compressé (images, archives, text/event-stream...).
+- Contenu déjà compressé (gzip, zip, zstd, PNG...) détecté par ses premiers
+  octets et renvoyé tel quel : utile pour les fichiers de structure servis en
+  application/octet-stream.
+
+brotli et zstandard sont optionnels (pip install brotli zstandard) ; sans
+eux, seul gzip est proposé.
+"""
+import zlib
+
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Signatures de formats déjà compressés
+COMPRESSED_MAGIC = (
+    b"\x1f\x8b",              # gzip
+    b"PK\x03\x04",            # zip (.npz, .xlsx...)
+    b"\x28\xb5\x2f\xfd",      # zstd
+    b"BZh",                   # bzip2
+    b"\xfd7zXZ\x00",          # xz
+    b"7z\xbc\xaf\x27\x1c",    # 7z
+    b"\x89PNG",
+    b"\xff\xd8\xff",          # JPEG
+    b"GIF8",
+    b"PAR1",                  # Parquet
+)
+
+
+def looks_compressed(head: bytes) -> bool:
+    return head.startswith(COMPRESSED_MAGIC)
+
+
+# ---------- Encodages ----------
+
+class _GzipCompressor:
+    def __init__(self, level):
+        self._c = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = en-tête gzip
+
+    def compress(self, data):
+        return self._c.compress(data)
+
+    def flush(self):
+        return self._c.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, level):
+        self._c = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._c = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._c.compress(data)
+
+    def flush(self):
+        return self._c.flush()
+
+
+COMPRESSORS = {"gzip": _GzipCompressor, "br": _BrotliCompressor, "zstd": _ZstdCompressor}
+
+
+def available_encodings():
+    """Encodages installés, dans l'ordre de préférence de COMPRESSION_ENCODINGS."""
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [e for e in settings.COMPRESSION_ENCODINGS if installed.get(e)]
+
+
+def get_compressor(encoding, level):
+    return COMPRESSORS[encoding](level)
+
+
+def compress_bytes(data: bytes, encoding, level) -> bytes:
+    c = get_compressor(encoding, level)
+    return c.compress(data) + c.flush()
+
+
+def negotiate(accept_encoding: str, encodings):
+    """
+    Choisit l'encodage : q-value la plus haute, puis ordre de `encodings`.
+    Retourne None si aucun n'est acceptable.
+    """
+    prefs = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        prefs[coding] = q
+    if "x-gzip" in prefs:
+        prefs.setdefault("gzip", prefs["x-gzip"])
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = prefs.get(encoding, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def level_for(content_type: str, encoding):
+    """Niveau pour ce type de contenu (clé exacte, sinon préfixe "text/")."""
+    ct = (content_type or "").split(";")[0].strip().lower()
+    table = settings.COMPRESSION_LEVELS
+    if ct in table:
+        levels = table[ct]
+    else:
+        levels = None
+        for key, value in table.items():
+            if key.endswith("/") and ct.startswith(key):
+                levels = value
+                break
+    return levels.get(encoding) if levels else None
+
+
+def _file_head(response):
+    """Premiers octets d'un FileResponse (None si le fichier n'est pas relisible)."""
+    f = getattr(response, "file_to_stream", None)
+    if f is None or not getattr(f, "seekable", lambda: False)():
+        return None
+    pos = f.tell()
+    head = f.read(8)
+    f.seek(pos)
+    return head
+
+
+def _compress_iter(content, compressor):
+    for chunk in content:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def _acompress_iter(content, compressor):
+    async for chunk in content:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ---------- Middleware ----------
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Remplace django.middleware.gzip.GZipMiddleware. Se place dans MIDDLEWARE
+    après MetricsMiddleware, QueryBudgetMiddleware et ProfilingMiddleware,
+    avant CORS, sessions et auth :
+    - tout ce qui est en dessous (en-têtes CORS, cookies, vue) a déjà produit
+      la réponse finale quand elle est compressée ;
+    - MetricsMiddleware mesure les tailles réellement envoyées, et
+      ProfilingMiddleware, qui enveloppe le reste de la chaîne, inclut le
+      coût de la compression dans les profils.
+    """
+
+    def process_response(self, request, response):
+        if not settings.COMPRESSION_ENABLED or response.has_header("Content-Encoding"):
+            return response
+        if response.status_code in (206, 304) or "no-transform" in response.get("Cache-Control", ""):
+            return response
+        content_type = response.get("Content-Type")
+        if all(level_for(content_type, e) is None for e in COMPRESSORS):
+            return response
+
+        # La représentation dépend d'Accept-Encoding, même si on ne compresse pas
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""), available_encodings())
+        if encoding is None:
+            return response
+        level = level_for(content_type, encoding)
+        if level is None:
+            return response
+        min_size = settings.COMPRESSION_MIN_SIZE
+
+        if response.streaming:
+            length = response.get("Content-Length")
+            if length is not None and int(length) < min_size:
+                return response
+            if isinstance(response, FileResponse):
+                head = _file_head(response)
+                if head and looks_compressed(head):
+                    return response
+            compressor = get_compressor(encoding, level)
+            if response.is_async:
+                response.streaming_content = _acompress_iter(response.streaming_content, compressor)
+            else:
+                response.streaming_content = _compress_iter(response.streaming_content, compressor)
+            response.headers.pop("Content-Length", None)
+        else:
+            content = response.content
+            if len(content) < min_size or looks_compressed(content[:8]):
+                return response
+            compressed = compress_bytes(content, encoding, level)
+            if len(compressed) >= len(content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # Le corps change : un ETag fort ne peut plus être conservé tel quel
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,329 @@
+# chem_backend/metrics.py
+"""
+Métriques par endpoint (nom d'URL) au format Prometheus + en-tête Server-Timing.
+
+`MetricsMiddleware` (en tête de MIDDLEWARE) mesure chaque requête : latence
+(histogramme), code de statut, taille de la requête et de la réponse (après
+compression), temps et nombre de requêtes SQL, temps passé dans
+serialize_compound. `cache_event()` compte les hits/miss des caches (auth,
+dépictions, exports).
+
+Agrégation sans verrou : chaque thread écrit dans son propre `Shard` (un
+seul écrivain par dictionnaire) ; la collecte (GET /api/metrics/) copie et
+additionne les shards. Les compteurs sont par process : Prometheus doit
+interroger chaque worker (ou passer par un agent) ; process_start_time
+permet à rate() de gérer les redémarrages.
+
+Server-Timing : db, serialize, app (reste avant la fin de la vue), render
+(après la vue : middlewares de réponse, compression) et total, en ms.
+`ViewTimingMiddleware` (dernier de MIDDLEWARE) marque la fin de la vue.
+"""
+import functools
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # secondes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)  # octets
+
+PROCESS_START = time.time()
+
+_current = ContextVar("request_timer", default=None)
+
+
+# ---------- Mesures d'une requête ----------
+
+class RequestTimer:
+    """Temps par phase d'une requête ; sert aussi d'execute_wrapper (temps SQL)."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_end = None
+        self.db = 0.0
+        self.queries = 0
+        self.phases = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self, total) -> str:
+        view = (self.view_end or self.start + total) - self.start
+        app = view - self.db - sum(self.phases.values())
+        parts = [f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"']
+        parts += [f"{name};dur={secs * 1000:.1f}" for name, secs in self.phases.items()]
+        parts += [
+            f"app;dur={max(0.0, app) * 1000:.1f}",
+            f"render;dur={(total - view) * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ]
+        return ", ".join(parts)
+
+
+@contextmanager
+def phase(name):
+    """Ajoute la durée du bloc à la phase `name` de la requête en cours (sans effet hors requête)."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.phases[name] += time.perf_counter() - start
+
+
+@contextmanager
+def measuring():
+    """Mesure le bloc (requête HTTP ou sous-requête de /api/batch/) : RequestTimer courant + temps SQL."""
+    timer = RequestTimer()
+    token = _current.set(timer)
+    try:
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(timer))
+            yield timer
+    finally:
+        _current.reset(token)
+
+
+def timed(name):
+    """Décorateur : la durée de chaque appel s'ajoute à la phase `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = _current.get()
+            if timer is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.phases[name] += time.perf_counter() - start
+        return wrapper
+    return decorator
+
+
+# ---------- Agrégation par thread ----------
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, n):
+        self.counts = [0] * (n + 1)  # dernier : +Inf
+        self.sum = 0.0
+
+    def observe(self, buckets, value):
+        self.counts[bisect_left(buckets, value)] += 1
+        self.sum += value
+
+
+class Shard:
+    """Compteurs d'un thread : seul ce thread écrit, la collecte ne fait que copier."""
+
+    def __init__(self):
+        self.requests = defaultdict(int)      # (view, method, status)
+        self.latency = {}                     # (view, method) → Histogram
+        self.request_bytes = {}               # view → Histogram
+        self.response_bytes = {}              # view → Histogram
+        self.db_seconds = defaultdict(float)  # view
+        self.db_queries = defaultdict(int)    # view
+        self.phase_seconds = defaultdict(float)  # (view, phase)
+        self.cache = defaultdict(int)         # (cache, "hit" | "miss")
+
+    def observe(self, table, key, buckets, value):
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = Histogram(len(buckets))
+        hist.observe(buckets, value)
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()  # seulement à la création du shard d'un thread
+
+
+def _shard() -> Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def cache_event(name: str, hit: bool):
+    if settings.METRICS_ENABLED:
+        _shard().cache[(name, "hit" if hit else "miss")] += 1
+
+
+def record(view, method, status, timer, total, request_size, response_size):
+    shard = _shard()
+    shard.requests[(view, method, str(status))] += 1
+    shard.observe(shard.latency, (view, method), LATENCY_BUCKETS, total)
+    if request_size is not None:
+        shard.observe(shard.request_bytes, view, SIZE_BUCKETS, request_size)
+    if response_size is not None:
+        shard.observe(shard.response_bytes, view, SIZE_BUCKETS, response_size)
+    shard.db_seconds[view] += timer.db
+    shard.db_queries[view] += timer.queries
+    for name, secs in timer.phases.items():
+        shard.phase_seconds[(view, name)] += secs
+
+
+# ---------- Export Prometheus ----------
+
+def _merge(attr):
+    with _shards_lock:
+        shards = list(_shards)
+    merged = {}
+    for shard in shards:
+        for key, value in getattr(shard, attr).copy().items():
+            if isinstance(value, Histogram):
+                acc = merged.get(key)
+                if acc is None:
+                    acc = merged[key] = Histogram(len(value.counts) - 1)
+                acc.counts = [a + b for a, b in zip(acc.counts, value.counts)]
+                acc.sum += value.sum
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return sorted(merged.items())
+
+
+def _labels(**labels) -> str:
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _family(lines, name, kind, help_text):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _histogram(lines, name, help_text, items, buckets, label_names):
+    _family(lines, name, "histogram", help_text)
+    for key, hist in items:
+        labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+        cumulative = 0
+        for le, n in zip((*buckets, "+Inf"), hist.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(**labels, le=le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(**labels)} {_num(hist.sum)}")
+        lines.append(f"{name}_count{_labels(**labels)} {cumulative}")
+
+
+def render_prometheus() -> str:
+    from .shedding import shedder
+
+    lines = []
+    _family(lines, "chem_process_start_time_seconds", "gauge", "Start time of this worker process.")
+    lines.append(f"chem_process_start_time_seconds {_num(PROCESS_START)}")
+    _family(lines, "chem_http_in_flight_requests", "gauge", "Requests being processed by this process.")
+    lines.append(f"chem_http_in_flight_requests {shedder.in_flight}")
+
+    _family(lines, "chem_http_requests_total", "counter", "HTTP requests by URL name, method and status.")
+    for (view, method, status), n in _merge("requests"):
+        lines.append(f"chem_http_requests_total{_labels(view=view, method=method, status=status)} {n}")
+    _histogram(lines, "chem_http_request_duration_seconds", "Time until the response left the middleware stack.",
+               _merge("latency"), LATENCY_BUCKETS, ("view", "method"))
+    _histogram(lines, "chem_http_request_size_bytes", "Request body size (Content-Length).",
+               _merge("request_bytes"), SIZE_BUCKETS, ("view",))
+    _histogram(lines, "chem_http_response_size_bytes", "Response body size as sent (after compression).",
+               _merge("response_bytes"), SIZE_BUCKETS, ("view",))
+
+    _family(lines, "chem_db_query_seconds_total", "counter", "Time spent in SQL queries.")
+    for view, secs in _merge("db_seconds"):
+        lines.append(f"chem_db_query_seconds_total{_labels(view=view)} {_num(secs)}")
+    _family(lines, "chem_db_queries_total", "counter", "SQL queries executed.")
+    for view, n in _merge("db_queries"):
+        lines.append(f"chem_db_queries_total{_labels(view=view)} {n}")
+    _family(lines, "chem_phase_seconds_total", "counter", "Time spent in instrumented phases (serialize...).")
+    for (view, name), secs in _merge("phase_seconds"):
+        lines.append(f"chem_phase_seconds_total{_labels(view=view, phase=name)} {_num(secs)}")
+    _family(lines, "chem_cache_requests_total", "counter", "Cache lookups by cache and result (hit/miss).")
+    for (name, result), n in _merge("cache"):
+        lines.append(f"chem_cache_requests_total{_labels(cache=name, result=result)} {n}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """
+    GET /api/metrics/ — texte Prometheus. Accès : `Authorization: Bearer
+    <METRICS_TOKEN>` (scraper) ou session staff.
+    """
+    token = settings.METRICS_TOKEN
+    auth = request.META.get("HTTP_AUTHORIZATION", "")
+    allowed = bool(token) and auth.startswith("Bearer ") and hmac.compare_digest(auth[7:], token)
+    if not allowed:
+        user = getattr(request, "user", None)
+        allowed = user is not None and user.is_authenticated and user.is_staff
+    if not allowed:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ---------- Middlewares ----------
+
+def _size(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+class MetricsMiddleware:
+    """En tête de MIDDLEWARE : mesure toute la chaîne (session, auth, compression...)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        with measuring() as timer:
+            response = self.get_response(request)
+        total = time.perf_counter() - timer.start
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or "unmatched"
+        if response.streaming:
+            response_size = _size(response.get("Content-Length"))
+        else:
+            response_size = len(response.content)
+        record(view, request.method, response.status_code, timer, total,
+               _size(request.META.get("CONTENT_LENGTH")), response_size)
+        if settings.METRICS_SERVER_TIMING:
+            response["Server-Timing"] = timer.server_timing(total)
+        return response
+
+
+class ViewTimingMiddleware:
+    """Dernier de MIDDLEWARE : marque la fin de la vue (sépare app et render)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        timer = _current.get()
+        if timer is not None:
+            timer.view_end = time.perf_counter()
+        return response
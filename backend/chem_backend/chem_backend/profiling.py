@@ -0,0 +1,319 @@
+# chem_backend/profiling.py
+"""
+Profilage à la demande d'une requête (staff uniquement).
+
+Déclenchement : en-tête `X-Profile: 1` ou `?_profile=1`. `ProfilingMiddleware`
+(juste après QueryBudgetMiddleware) exécute alors le reste de la chaîne
+(session, auth, vue, compression) sous :
+- un échantillonneur de piles : un thread relève la pile du thread de la
+  requête toutes les PROFILING_INTERVAL_MS (sys._current_frames), sans
+  tracer chaque appel ;
+- un execute_wrapper qui note chaque requête SQL (début, durée, SQL).
+
+Le résultat n'est conservé que si l'utilisateur s'avère staff (connu après
+l'auth) : PROFILING_DIR/<id>.json (métadonnées, chronologie SQL, fonctions
+les plus coûteuses) et <id>.folded (piles repliées, format flamegraph.pl /
+speedscope). L'id revient dans X-Profile-Id ; le flamegraph SVG est rendu à
+la lecture (/api/admin/profiles/<id>/flamegraph.svg).
+
+Sans déclencheur, le middleware ne fait qu'un test. Avec déclencheur, la
+session est vérifiée (compte staff actif) avant de réserver le profileur :
+un cookie de session inventé ou un compte non staff n'occupe jamais la
+place et ne paie pas l'échantillonnage. Une seule requête profilée à la
+fois par process.
+"""
+import html
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import ExitStack
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import connections
+
+from .querybudget import normalize_sql
+
+PROFILE_ID_RE = re.compile(r"^[0-9a-f]{16}$")
+
+_busy = threading.Lock()
+_labels = {}
+
+
+def _frame_label(code) -> str:
+    """'compounds/views.py:apply_search' (chemin relatif au projet ou à site-packages)."""
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        for root in (str(settings.BASE_DIR), *sorted(sys.path, key=len, reverse=True)):
+            if root and path.startswith(root + os.sep):
+                path = path[len(root) + 1:]
+                break
+        label = _labels[code] = f"{path}:{code.co_qualname}".replace(";", ",")
+    return label
+
+
+class StackSampler(threading.Thread):
+    """Relève périodiquement la pile d'un thread, sous la frame `root` (exclue)."""
+
+    def __init__(self, thread_id, root, interval):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id, self.root, self.interval = thread_id, root, interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.root:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack and not self._done.is_set():  # pas la pile de stop() elle-même
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class SqlTimeline:
+    """execute_wrapper : (début ms, durée ms, alias, SQL) de chaque requête."""
+
+    def __init__(self, alias, origin):
+        self.alias, self.origin = alias, origin
+        self.entries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.entries.append({
+                "start_ms": round((start - self.origin) * 1000, 3),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                "db": self.alias,
+                "many": many,
+                "sql": normalize_sql(sql)[:2000],
+            })
+
+
+def requested(request) -> bool:
+    return (
+        request.META.get("HTTP_X_PROFILE") == "1" or request.GET.get("_profile") == "1"
+    ) and settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def staff_session(request) -> bool:
+    """
+    La session du cookie appartient-elle à un staff actif ? Lue ici, avant
+    SessionMiddleware et l'auth (qui la relisent ensuite) : seules les
+    requêtes avec déclencheur paient ces lectures.
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(request.COOKIES[settings.SESSION_COOKIE_NAME])
+    user = get_user(SimpleNamespace(session=session))
+    return user.is_authenticated and user.is_staff
+
+
+def top_functions(stacks, limit=25):
+    """Temps propre (feuille) et cumulé par fonction, en nombre d'échantillons."""
+    own, total = Counter(), Counter()
+    for stack, n in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += n
+        for frame in set(frames):
+            total[frame] += n
+    return [
+        {"function": f, "self": n, "total": total[f]} for f, n in own.most_common(limit)
+    ]
+
+
+# ---------- Stockage ----------
+
+def profile_path(profile_id, ext) -> str:
+    return os.path.join(settings.PROFILING_DIR, f"{profile_id}.{ext}")
+
+
+def _prune():
+    keep = settings.PROFILING_KEEP
+    try:
+        names = [n for n in os.listdir(settings.PROFILING_DIR) if n.endswith(".json")]
+    except FileNotFoundError:
+        return
+    if len(names) <= keep:
+        return
+    names.sort(key=lambda n: os.stat(os.path.join(settings.PROFILING_DIR, n)).st_mtime)
+    for name in names[:-keep]:
+        for ext in ("json", "folded"):
+            try:
+                os.remove(profile_path(name[:-5], ext))
+            except FileNotFoundError:
+                pass
+
+
+def save_profile(meta, stacks, sql) -> str:
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    profile_id = secrets.token_hex(8)
+    meta = dict(meta, id=profile_id, samples=sum(stacks.values()),
+                top_functions=top_functions(stacks), sql=sql)
+    with open(profile_path(profile_id, "folded"), "w") as fh:
+        for stack, n in stacks.most_common():
+            fh.write(f"{stack} {n}\n")
+    # .json en dernier : sa présence signale un profil complet
+    with open(profile_path(profile_id, "json"), "w") as fh:
+        json.dump(meta, fh)
+    _prune()
+    return profile_id
+
+
+def list_profiles():
+    try:
+        names = [n for n in os.listdir(settings.PROFILING_DIR) if n.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    out = []
+    for name in names:
+        try:
+            with open(os.path.join(settings.PROFILING_DIR, name)) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        out.append({k: meta.get(k) for k in
+                    ("id", "started_at", "method", "path", "status", "duration_ms", "user", "samples")})
+    out.sort(key=lambda m: m["started_at"] or "", reverse=True)
+    return out
+
+
+def load_profile(profile_id):
+    """Métadonnées d'un profil (None si id invalide ou inconnu)."""
+    if not PROFILE_ID_RE.match(profile_id or ""):
+        return None
+    try:
+        with open(profile_path(profile_id, "json")) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def load_stacks(profile_id) -> Counter:
+    stacks = Counter()
+    with open(profile_path(profile_id, "folded")) as fh:
+        for line in fh:
+            stack, _, n = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(n)
+    return stacks
+
+
+# ---------- Flamegraph SVG ----------
+
+def flamegraph_svg(stacks, title="", width=1200, row=16) -> str:
+    """Flamegraph (racine en bas) : largeur ∝ échantillons, survol = <title>."""
+    root = {"children": {}, "value": 0}
+    for stack, n in stacks.items():
+        node = root
+        node["value"] += n
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"children": {}, "value": 0})
+            node["value"] += n
+    total = root["value"] or 1
+
+    rects, depth_max = [], 0
+
+    def walk(node, x, depth):
+        nonlocal depth_max
+        for name, child in sorted(node["children"].items()):
+            w = child["value"] / total * width
+            if w >= 0.3:
+                depth_max = max(depth_max, depth)
+                rects.append((name, child["value"], x, depth, w))
+                walk(child, x, depth + 1)
+            x += w
+
+    walk(root, 0.0, 0)
+    top = 40
+    height = top + (depth_max + 1) * row + 10
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="monospace" font-size="11">',
+        f'<rect width="{width}" height="{height}" fill="#fafafa"/>',
+        f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="14">{html.escape(title)}</text>',
+        f'<text x="{width - 10}" y="20" text-anchor="end">{total} samples</text>',
+    ]
+    for name, value, x, depth, w in rects:
+        y = height - 10 - (depth + 1) * row
+        hue = zlib.crc32(name.split(":")[0].encode()) % 40 + 10  # rouge → jaune, stable par fichier
+        label = html.escape(name)
+        parts.append(
+            f'<g><title>{label} ({value} samples, {value * 100 / total:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="hsl({hue},85%,60%)"/>'
+        )
+        chars = int(w / 7)
+        if chars >= 3:
+            text = name if len(name) <= chars else name[:chars - 2] + ".."
+            parts.append(f'<text x="{x + 2:.1f}" y="{y + row - 4}">{html.escape(text)}</text>')
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+# ---------- Middleware ----------
+
+class ProfilingMiddleware:
+    """À placer juste après QueryBudgetMiddleware (profile aussi session/auth/compression)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (settings.PROFILING_ENABLED and requested(request) and staff_session(request)):
+            return self.get_response(request)
+        if not _busy.acquire(blocking=False):
+            return self.get_response(request)  # un profil déjà en cours dans ce process
+        try:
+            return self.profile(request)
+        finally:
+            _busy.release()
+
+    def profile(self, request):
+        origin = time.perf_counter()
+        started_at = time.time()
+        timelines = []
+        sampler = StackSampler(threading.get_ident(), sys._getframe(), settings.PROFILING_INTERVAL_MS / 1000)
+        with ExitStack() as stack:
+            for conn in connections.all():
+                timelines.append(SqlTimeline(conn.alias, origin))
+                stack.enter_context(conn.execute_wrapper(timelines[-1]))
+            stack.callback(sampler.stop)
+            sampler.start()
+            response = self.get_response(request)
+        duration = time.perf_counter() - origin
+
+        user = getattr(request, "user", None)
+        if not (user is not None and user.is_authenticated and user.is_staff):
+            return response
+        sql = sorted((e for t in timelines for e in t.entries), key=lambda e: e["start_ms"])
+        match = getattr(request, "resolver_match", None)
+        profile_id = save_profile({
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(started_at)),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "url_name": match.url_name if match else None,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "user": user.get_username(),
+            "interval_ms": settings.PROFILING_INTERVAL_MS,
+            "sql_count": len(sql),
+            "sql_ms": round(sum(e["duration_ms"] for e in sql), 3),
+        }, sampler.stacks, sql)
+        response["X-Profile-Id"] = profile_id
+        return response
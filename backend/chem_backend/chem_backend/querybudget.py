@@ -0,0 +1,193 @@
+# chem_backend/querybudget.py
+"""
+Compteur de requêtes SQL par vue + détection N+1.
+
+- `QueryBudgetMiddleware` enregistre, pour chaque requête HTTP, le nombre de
+  requêtes SQL, le temps DB total et les "formes" SQL répétées.
+- En dev (QUERY_STATS_ENABLED), il loggue les motifs N+1 (même template SQL
+  exécuté plus de QUERY_NPLUSONE_THRESHOLD fois) et ajoute des en-têtes X-DB-*.
+- En tests, `QUERY_BUDGET_ENFORCE=True` fait échouer toute vue qui dépasse son
+  budget déclaré dans QUERY_BUDGETS (clé = nom d'URL), et `assert_query_budget`
+  permet de vérifier une réponse du client de test.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# "IN (%s, %s, %s)" -> "IN (%s...)" pour que les listes de taille variable
+# comptent comme une seule forme.
+_PLACEHOLDER_LIST_RE = re.compile(r"%s(?:\s*,\s*%s)+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def normalize_sql(sql: str) -> str:
+    sql = _PLACEHOLDER_LIST_RE.sub("%s...", sql)
+    return _WHITESPACE_RE.sub(" ", sql).strip()
+
+
+class QueryStats:
+    """
+    Statistiques SQL d'une requête HTTP (ou d'un bloc de code).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # secondes
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Signature de connection.execute_wrapper()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[normalize_sql(sql)] += 1
+
+    def repeated(self, threshold: int):
+        """Formes SQL exécutées plus de `threshold` fois (suspicion de N+1)."""
+        return [(sql, n) for sql, n in self.shapes.most_common() if n > threshold]
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "duration_ms": round(self.duration * 1000, 3),
+            "shapes": dict(self.shapes),
+        }
+
+
+@contextmanager
+def record_queries():
+    """
+    Enregistre les requêtes SQL exécutées dans le bloc, sur toutes les connexions.
+        with record_queries() as stats:
+            ...
+        stats.count, stats.duration, stats.shapes
+    """
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(stats))
+        yield stats
+
+
+@contextmanager
+def detached():
+    """
+    Suspend, pendant le bloc, les compteurs QueryStats posés sur les
+    connexions du thread courant (ceux des middlewares englobants).
+    """
+    saved = []
+    for conn in connections.all():
+        saved.append((conn, list(conn.execute_wrappers)))
+        conn.execute_wrappers[:] = [w for w in conn.execute_wrappers if not isinstance(w, QueryStats)]
+    try:
+        yield
+    finally:
+        for conn, wrappers in saved:
+            conn.execute_wrappers[:] = wrappers
+
+
+@contextmanager
+def budgeted(url_name, path=""):
+    """
+    Compte le bloc à part, contre le budget de `url_name` : sous-requêtes de
+    /api/batch/, qu'elles tournent dans un thread du pool ou dans celui de la
+    requête englobante (dont le compteur ne les voit pas).
+    """
+    enabled = getattr(settings, "QUERY_STATS_ENABLED", False)
+    enforce = getattr(settings, "QUERY_BUDGET_ENFORCE", False)
+    if not (enabled or enforce):
+        with detached():
+            yield None
+        return
+    with detached(), record_queries() as stats:
+        yield stats
+    _check(url_name, path, stats, enabled, enforce)
+
+
+def get_budget(url_name):
+    if not url_name:
+        return None
+    return getattr(settings, "QUERY_BUDGETS", {}).get(url_name)
+
+
+def assert_query_budget(response, budget=None):
+    """
+    Helper de test : vérifie qu'une réponse du client de test respecte le budget
+    SQL de sa vue (QUERY_BUDGETS[url_name] ou `budget` explicite).
+    """
+    stats = getattr(response, "query_stats", None)
+    if stats is None:
+        raise AssertionError("No query stats on response (is QueryBudgetMiddleware enabled?)")
+    url_name = getattr(response, "query_url_name", None)
+    if budget is None:
+        budget = get_budget(url_name)
+    if budget is None:
+        raise AssertionError(f"No query budget declared for '{url_name}'")
+    if stats.count > budget:
+        raise QueryBudgetExceeded(_budget_message(url_name, stats, budget))
+    return stats
+
+
+def _budget_message(url_name, stats, budget):
+    lines = [f"'{url_name}' executed {stats.count} queries (budget: {budget})"]
+    for sql, n in stats.shapes.most_common():
+        lines.append(f"  {n}x {sql}")
+    return "\n".join(lines)
+
+
+class QueryBudgetMiddleware:
+    """
+    À placer en tête de MIDDLEWARE pour compter aussi les requêtes session/auth.
+    Inactif (coût nul) si ni QUERY_STATS_ENABLED ni QUERY_BUDGET_ENFORCE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        enabled = getattr(settings, "QUERY_STATS_ENABLED", False)
+        enforce = getattr(settings, "QUERY_BUDGET_ENFORCE", False)
+        if not (enabled or enforce):
+            return self.get_response(request)
+
+        with record_queries() as stats:
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        url_name = match.url_name if match else None
+        response.query_stats = stats
+        response.query_url_name = url_name
+
+        if enabled:
+            response["X-DB-Queries"] = str(stats.count)
+            response["X-DB-Time-Ms"] = f"{stats.duration * 1000:.1f}"
+        _check(url_name, request.path, stats, enabled, enforce)
+        return response
+
+
+def _check(url_name, path, stats, enabled, enforce):
+    """Log des motifs N+1 (QUERY_STATS_ENABLED) et contrôle du budget de `url_name`."""
+    if enabled:
+        for sql, n in stats.repeated(getattr(settings, "QUERY_NPLUSONE_THRESHOLD", 5)):
+            logger.warning("Possible N+1 in '%s' (%s): %dx %s", url_name, path, n, sql)
+
+    budget = get_budget(url_name)
+    if budget is not None and stats.count > budget:
+        message = _budget_message(url_name, stats, budget)
+        if enforce:
+            raise QueryBudgetExceeded(message)
+        logger.warning("Query budget exceeded: %s", message)
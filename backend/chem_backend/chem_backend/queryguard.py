@@ -0,0 +1,232 @@
+# chem_backend/queryguard.py
+"""
+Garde-fou sur le coût des requêtes SQL des endpoints de recherche.
+
+`QueryGuardMiddleware` exécute les vues listées dans QUERY_GUARD_ENDPOINTS
+(clé = nom d'URL) sous :
+- un délai maximal par requête SQL (`timeout_ms`) : statement_timeout local
+  à la transaction sur PostgreSQL (vue dans une transaction en lecture),
+  progress handler sur SQLite ;
+- un budget de coût (`max_cost`, unités du planificateur PostgreSQL) :
+  `within_budget(qs)` compare l'estimation d'EXPLAIN au budget, ce qui permet à
+  la vue de se rabattre sur une requête moins chère (apply_search : recherche
+  par préfixe au lieu de sous-chaîne, en-tête X-Query-Downgraded) ;
+  `ensure_within_budget(qs)` lève QueryTooExpensive ;
+- une surveillance du client : s'il ferme la connexion, la requête SQL en
+  cours est annulée (socket du worker gunicorn ; ailleurs, seul le délai joue).
+
+Les erreurs deviennent une réponse JSON structurée (`code`) au lieu d'un
+worker bloqué : 422 query_too_expensive / query_timeout, 499 si le client est
+parti. Les autres endpoints gardent le délai par défaut de la connexion
+(QUERY_GUARD_DEFAULT_TIMEOUT_MS, options de DATABASES).
+"""
+import json
+import select
+import socket
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.http import JsonResponse
+
+QUERY_CANCELED = "57014"  # SQLSTATE PostgreSQL (statement_timeout ou pg_cancel_backend)
+
+_current = ContextVar("query_guard", default=None)
+
+
+class QueryTooExpensive(Exception):
+    def __init__(self, cost, max_cost):
+        super().__init__(f"Estimated cost {cost:.0f} exceeds budget {max_cost:.0f}")
+        self.cost, self.max_cost = cost, max_cost
+
+
+class QueryGuard:
+    """État du garde-fou pour la requête HTTP en cours."""
+
+    def __init__(self, timeout_ms=None, max_cost=None):
+        self.timeout_ms, self.max_cost = timeout_ms, max_cost
+        self.deadline = float("inf")
+        self.cancelled = False  # client parti
+        self.downgraded = None
+        self.raw = None  # connexion DB-API du thread de la requête
+
+    def cancel(self):
+        """Appelé depuis le thread de surveillance : interrompt la requête SQL en cours."""
+        self.cancelled = True
+        if self.raw is not None and hasattr(self.raw, "cancel"):
+            try:
+                self.raw.cancel()  # psycopg : message d'annulation sur une connexion dédiée
+            except Exception:
+                pass
+        # SQLite : le progress handler voit `cancelled` au prochain pas
+
+
+# ---------- Budget de coût (EXPLAIN) ----------
+
+def estimated_cost(qs):
+    """Coût total estimé par le planificateur (None hors PostgreSQL)."""
+    if connection.vendor != "postgresql":
+        return None
+    plan = qs.explain(format="json")
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return float(plan[0]["Plan"]["Total Cost"])
+
+
+def within_budget(qs) -> bool:
+    guard = _current.get()
+    if guard is None or guard.max_cost is None:
+        return True
+    cost = estimated_cost(qs)
+    return cost is None or cost <= guard.max_cost
+
+
+def ensure_within_budget(qs):
+    guard = _current.get()
+    if guard is None or guard.max_cost is None:
+        return
+    cost = estimated_cost(qs)
+    if cost is not None and cost > guard.max_cost:
+        raise QueryTooExpensive(cost, guard.max_cost)
+
+
+def mark_downgraded(mode: str):
+    guard = _current.get()
+    if guard is not None:
+        guard.downgraded = mode
+
+
+# ---------- Délai et annulation ----------
+
+def _is_cancellation(exc) -> bool:
+    cause = exc.__cause__
+    code = getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)
+    return code == QUERY_CANCELED or str(cause) == "interrupted"  # SQLite
+
+
+def _sqlite_progress(guard):
+    def handler():
+        return 1 if guard.cancelled or time.monotonic() > guard.deadline else 0
+    return handler
+
+
+class ClientWatcher(threading.Thread):
+    """Surveille la socket du client ; fermée (recv → b"") → guard.cancel()."""
+
+    def __init__(self, sock, guard, interval=0.1):
+        super().__init__(name="query-guard-watcher", daemon=True)
+        self.sock, self.guard, self.interval = sock, guard, interval
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            try:
+                readable, _, _ = select.select([self.sock], [], [], self.interval)
+                if not readable:
+                    continue
+                if self.sock.recv(1, socket.MSG_PEEK) == b"":
+                    self.guard.cancel()
+                return  # données en attente (requête suivante) : plus rien à surveiller
+            except (OSError, ValueError):
+                return
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _client_socket(request):
+    sock = request.META.get("gunicorn.socket")
+    return sock if isinstance(sock, socket.socket) else None
+
+
+def _error(code, message, status, **extra):
+    return JsonResponse({"error": message, "code": code, **extra}, status=status)
+
+
+def error_response(exception):
+    """Exception levée sous guarding() → réponse JSON structurée (None si étrangère au garde-fou)."""
+    guard = _current.get()
+    if guard is None:
+        return None
+    if isinstance(exception, QueryTooExpensive):
+        return _error("query_too_expensive", "Query too expensive; refine the search", 422,
+                      cost=round(exception.cost), max_cost=exception.max_cost)
+    if not (isinstance(exception, DatabaseError) and _is_cancellation(exception)):
+        return None
+    if connection.in_atomic_block:
+        transaction.set_rollback(True)  # transaction avortée : pas de COMMIT
+    if guard.cancelled:
+        return _error("client_closed_request", "Client disconnected", 499)
+    return _error("query_timeout", "Query took too long; refine the search", 422,
+                  timeout_ms=guard.timeout_ms)
+
+
+def _arm(guard, request, stack):
+    connection.ensure_connection()
+    guard.raw = connection.connection
+    sock = _client_socket(request)
+    if guard.timeout_ms:
+        guard.deadline = time.monotonic() + guard.timeout_ms / 1000
+        if connection.vendor == "postgresql":
+            # is_local=true (SET LOCAL) : rétabli en fin de transaction, même si la vue échoue
+            stack.enter_context(transaction.atomic())
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(guard.timeout_ms))])
+    if connection.vendor == "sqlite" and (guard.timeout_ms or sock is not None):
+        guard.raw.set_progress_handler(_sqlite_progress(guard), 1000)
+        stack.callback(guard.raw.set_progress_handler, None, 0)
+    if sock is not None:
+        watcher = ClientWatcher(sock, guard)
+        watcher.start()
+        stack.callback(watcher.stop)
+
+
+@contextmanager
+def guarding(request, url_name):
+    """Exécute le bloc sous le garde-fou de l'endpoint `url_name` (yield None s'il n'en a pas)."""
+    config = settings.QUERY_GUARD_ENDPOINTS.get(url_name) if settings.QUERY_GUARD_ENABLED else None
+    if config is None:
+        yield None
+        return
+    guard = QueryGuard(config.get("timeout_ms"), config.get("max_cost"))
+    token = _current.set(guard)
+    try:
+        with ExitStack() as stack:
+            _arm(guard, request, stack)
+            yield guard
+    finally:
+        _current.reset(token)
+
+
+class QueryGuardMiddleware:
+    """
+    Après l'authentification : ne garde que la vue (pas session/auth). Le
+    garde-fou est armé dans process_view (request.resolver_match, pas de
+    second resolve) et levé par __call__ après la réponse.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_GUARD_ENABLED:
+            return self.get_response(request)
+        with ExitStack() as stack:
+            request._query_guard_stack = stack
+            response = self.get_response(request)
+        guard = getattr(request, "_query_guard", None)
+        if guard is not None and guard.downgraded:
+            response["X-Query-Downgraded"] = guard.downgraded
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stack = getattr(request, "_query_guard_stack", None)
+        if stack is not None:
+            request._query_guard = stack.enter_context(guarding(request, request.resolver_match.url_name))
+        return None
+
+    def process_exception(self, request, exception):
+        return error_response(exception)
@@ -40,18 +40,26 @@ INSTALLED_APPS = [
     'corsheaders',
     'compounds',
     'users',
+    'stats',
 ]
 AUTH_USER_MODEL = 'users.CustomUser'
 
 MIDDLEWARE = [
+    "chem_backend.metrics.MetricsMiddleware",  # latence, statuts, tailles, temps DB ; Server-Timing
+    "chem_backend.querybudget.QueryBudgetMiddleware",  # en tête : compte aussi session/auth
+    "chem_backend.profiling.ProfilingMiddleware",  # X-Profile: 1 (staff) ; inactif sinon
+    "chem_backend.compression.CompressionMiddleware",  # gzip/br/zstd négocié
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "chem_backend.shedding.LoadSheddingMiddleware",  # débit / délestage (dépend de request.user)
+    "chem_backend.queryguard.QueryGuardMiddleware",  # délai SQL / coût EXPLAIN des recherches
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "chem_backend.metrics.ViewTimingMiddleware",  # dernier : fin de la vue (Server-Timing render)
 ]
 
 ROOT_URLCONF = "chem_backend.urls"
@@ -77,19 +85,111 @@ WSGI_APPLICATION = "chem_backend.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+from corsheaders.defaults import default_headers
 from decouple import config
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
-        'HOST': 'localhost',
-        'PORT': '5432',
+if config('DB_ENGINE', default='postgresql') == 'sqlite3':
+    # Base locale sans serveur (benchmarks, dev rapide)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': 'localhost',
+            'PORT': '5432',
+            # Délai par défaut de toute requête SQL (chem_backend/queryguard.py : délais par endpoint)
+            'OPTIONS': {
+                'options': f"-c statement_timeout={config('DB_STATEMENT_TIMEOUT_MS', default=30000, cast=int)}",
+            },
+        }
+    }
+
+# Cache
+# Partagé entre workers via Redis si REDIS_URL est défini, sinon cache mémoire local.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Sessions + utilisateur en cache (aucune requête SQL pour les GET authentifiés).
+# Activé seulement si le cache est partagé (Redis) ou en dev mono-process :
+# avec un cache local par worker, une déconnexion/désactivation ne serait pas
+# vue par les autres workers.
+AUTH_CACHE_ENABLED = config('AUTH_CACHE_ENABLED', default=bool(REDIS_URL) or DEBUG, cast=bool)
+SESSION_ENGINE = (
+    'django.contrib.sessions.backends.cached_db' if AUTH_CACHE_ENABLED
+    else 'django.contrib.sessions.backends.db'
+)
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+USER_CACHE_TIMEOUT = 300  # secondes ; invalidé à chaque save()/delete() du user
+
+# Hash des mots de passe (users/hashing.py) : pool borné + throttle en amont
+PASSWORD_HASHER_WORKERS = config('PASSWORD_HASHER_WORKERS', default=0, cast=int)  # 0 = min(4, nb CPU)
+PASSWORD_HASHER_QUEUE = 32        # au-delà : 503 immédiat
+USER_BULK_MAX_ROWS = 20           # lignes par POST admin/users/bulk/ (~0,4 s de PBKDF2 chacune, dans le pool ci-dessus) ; au-delà : provision_users
+PASSWORD_THROTTLE_RATES = {       # (jetons/seconde, rafale)
+    "ip": (1.0, 20),
+    "email": (0.1, 5),
+}
+THROTTLE_TRUST_X_FORWARDED_FOR = False  # True derrière un reverse proxy de confiance
+# "local" : buckets par process ; "cache" : partagés via CACHES (Redis) entre workers
+THROTTLE_BACKEND = config('THROTTLE_BACKEND', default='cache' if REDIS_URL else 'local')
+
+# Délestage (chem_backend/shedding.py)
+SHED_ENABLED = config('SHED_ENABLED', default=True, cast=bool)
+SHED_ENDPOINT_CLASSES = {            # classe → noms d'URL concernés
+    "list": ["get_all_compounds_public", "get_compounds", "compound_depictions"],
+    "search": ["mass_search", "compound_changes", "compound_lookup"],
+    "export": ["compound_export", "catalog_file"],
+    "detail": ["compound_detail", "compound_depiction"],
+}
+SHED_RATES = {                       # (jetons/seconde, rafale) ; admin : illimité
+    "anon": (5.0, 60),
+    "user": (20.0, 300),
+}
+SHED_CONCURRENCY = {"list": 16, "search": 8, "export": 2, "detail": 32}  # par process
+SHED_ANON_SHARE = 0.5                # part des places ouverte aux anonymes
+SHED_MAX_IN_FLIGHT = config('SHED_MAX_IN_FLIGHT', default=64, cast=int)
+SHED_DB_LATENCY_MS = config('SHED_DB_LATENCY_MS', default=50, cast=float)  # moyenne par requête SQL
+
+# Garde-fou des recherches (chem_backend/queryguard.py), clé = nom d'URL
+# timeout_ms : délai par requête SQL ; max_cost : coût EXPLAIN max (PostgreSQL),
+# au-delà apply_search passe en recherche par préfixe, puis 422 query_too_expensive.
+QUERY_GUARD_ENABLED = config('QUERY_GUARD_ENABLED', default=True, cast=bool)
+QUERY_GUARD_ENDPOINTS = {
+    "get_all_compounds_public": {"timeout_ms": 2000, "max_cost": 50_000},
+    "get_compounds": {"timeout_ms": 2000, "max_cost": 50_000},
+    "admin_list_compounds": {"timeout_ms": 5000, "max_cost": 200_000},
+    "compound_lookup": {"timeout_ms": 3000},
+    "mass_search": {"timeout_ms": 3000},
 }
 
+# Requêtes groupées (chem_backend/batch.py, /api/batch/)
+BATCH_MAX_REQUESTS = 20
+BATCH_WORKERS = config('BATCH_WORKERS', default=4, cast=int)  # threads par process (1 = séquentiel)
+BATCH_EXCLUDED_URL_NAMES = [         # flux et fichiers : pas de corps JSON à regrouper
+    "batch", "compound_events", "compound_export", "catalog_file", "metrics",
+    "admin_profile_stacks", "admin_profile_flamegraph",
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -133,11 +233,29 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Fichiers générés à l'exécution (index, caches, exports, profils...) : hors
+# dépôt en production (VAR_DIR=/var/lib/chem), ignorés par git sinon.
+VAR_DIR = Path(config('VAR_DIR', default=str(BASE_DIR / 'var')))
+
+# ---------- Envoi par morceaux des fichiers 3D (compounds/uploads/) ----------
+# Même système de fichiers que MEDIA_ROOT : la finalisation est un simple rename.
+UPLOAD_TEMP_DIR = config('UPLOAD_TEMP_DIR', default=str(VAR_DIR / 'uploads'))
+UPLOAD_MAX_BYTES = config('UPLOAD_MAX_BYTES', default=2 * 1024 ** 3, cast=int)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024        # taille conseillée au client
+UPLOAD_CHUNK_MAX_BYTES = 64 * 1024 * 1024  # par PUT
+UPLOAD_SESSION_TTL_HOURS = 24              # sans activité → purge_uploads
+
 CORS_ALLOWED_ORIGINS = [
    "http://localhost:5173",
     "http://127.0.0.1:5173",  # React Vite dev server
 ]
 CORS_ALLOW_CREDENTIALS = True  # indispensable pour envoyer/recevoir les cookies
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    "if-match",    # PATCH conditionnel (compounds/updates.py)
+    "x-profile",   # profilage à la demande (chem_backend/profiling.py)
+)
+CORS_EXPOSE_HEADERS = ["ETag", "X-Profile-Id", "Server-Timing", "X-Query-Downgraded"]
 
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:5173",
@@ -147,4 +265,138 @@ CSRF_TRUSTED_ORIGINS = [
 SESSION_COOKIE_SECURE = False
 CSRF_COOKIE_SECURE = False
 SESSION_COOKIE_SAMESITE = "Lax"
-CSRF_COOKIE_SAMESITE = "Lax"
\ No newline at end of file
+CSRF_COOKIE_SAMESITE = "Lax"
+
+# Query budget / détection N+1 (chem_backend/querybudget.py)
+QUERY_STATS_ENABLED = DEBUG          # en-têtes X-DB-* + logs N+1 en dev
+QUERY_NPLUSONE_THRESHOLD = 5         # même template SQL exécuté plus de K fois → warning
+QUERY_BUDGET_ENFORCE = False         # True en tests : dépassement de budget → exception
+
+# ---------- Métriques (chem_backend/metrics.py, GET /api/metrics/) ----------
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # Bearer du scraper Prometheus (sinon staff seulement)
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=True, cast=bool)
+
+# ---------- Profilage à la demande (chem_backend/profiling.py) ----------
+# Requête staff avec `X-Profile: 1` ou `?_profile=1` → piles échantillonnées +
+# chronologie SQL, consultables via /api/admin/profiles/<id>/ (X-Profile-Id).
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=True, cast=bool)
+PROFILING_DIR = config('PROFILING_DIR', default=str(VAR_DIR / 'profiles'))
+PROFILING_INTERVAL_MS = config('PROFILING_INTERVAL_MS', default=1.0, cast=float)
+PROFILING_KEEP = 200                 # profils conservés (les plus anciens supprimés)
+QUERY_BUDGETS = {                    # nombre max de requêtes SQL par nom d'URL
+    "get_all_compounds_public": 5,   # count + page (+ PostgreSQL : statement_timeout, 1-2 EXPLAIN si ?q=)
+    "get_compounds": 7,              # session + user + count + page (+ idem)
+    "compound_detail": 5,            # + propriétés, composés apparentés
+    "compound_changes": 4,           # session + user + journal + composés
+    "mass_search": 6,                # session + user + journal (+ composés touchés) + noms (+ statement_timeout)
+    "compound_export": 3,            # session + user + version (journal) ; construction hors budget
+    "compound_depiction": 3,         # session + user + SMILES
+    "compound_depictions": 3,
+    "property_definitions": 1,
+    "property_bulk_upsert": 7,       # session + user + définitions + composés + upsert (+ suppressions)
+    "compound_lookup": 8,            # session + user + une requête IN par LOOKUP_CHUNK_SIZE clés (+ statement_timeout)
+    # Écritures : compteurs stats en un upsert (stats/counters.py) ; mesuré sur SQLite
+    # (WriteQueryBudgetTests) : add 4, update 6-7, delete 9, set_active 5-6, set_admin 5-6
+    "add_compound": 8,               # + compteurs stats (total, visibilité, owner) + journal
+    "update_compound": 10,
+    "delete_compound": 11,
+    "me": 3,                         # 0 si AUTH_CACHE_ENABLED et cache chaud
+    "admin_list_users": 4,
+    "admin_list_compounds": 7,       # + PostgreSQL : statement_timeout, 1-2 EXPLAIN si ?q=
+    "admin_set_active": 9,
+    "admin_set_admin": 10,
+    "admin_stats": 3,
+    "admin_list_profiles": 2,        # session + user ; fichiers hors base
+    "admin_get_profile": 2,
+    "metrics": 2,                    # session + user (0 avec le jeton du scraper)
+    "batch": 2,                      # session + user ; chaque sous-requête compte sur le budget de sa vue
+    "catalog_manifest": 2,           # fichiers hors base (session + user si connecté)
+    "catalog_file": 2,
+    "create_upload": 5,              # session + user + composé + insertion
+    "upload_detail": 4,              # session + user + session d'envoi (+ relecture, offset)
+    "finalize_upload": 12,           # + composé, fichier (save_changed), journal, statut de l'envoi
+}
+
+# ---------- Flux de changements (compounds/changes/) ----------
+# Délai avant qu'une entrée du journal soit servie : laisse aux transactions
+# concurrentes le temps de valider (les ids sont attribués à l'insertion).
+COMPOUND_CHANGES_SETTLE_SECONDS = config('COMPOUND_CHANGES_SETTLE_SECONDS', default=2, cast=float)
+
+# ---------- Événements en direct (compounds/events/, SSE) ----------
+# "local" : un seul process ; "postgres" : LISTEN/NOTIFY entre workers (psycopg 3,
+# +1 requête pg_notify par écriture de composé).
+COMPOUND_EVENTS_BACKEND = config('COMPOUND_EVENTS_BACKEND', default='local')
+COMPOUND_EVENTS_CHANNEL = "compound_events"
+SSE_MAX_CONNECTIONS = config('SSE_MAX_CONNECTIONS', default=10000, cast=int)  # par process
+SSE_HEARTBEAT_SECONDS = 15     # commentaire ": ping" pour les proxys
+SSE_MAX_AGE_SECONDS = 300      # puis reconnexion (auth revérifiée, Last-Event-ID)
+SSE_RETRY_MS = 3000
+SSE_QUEUE_SIZE = 256           # au-delà, client trop lent → event "resync"
+SSE_REPLAY_LIMIT = 500
+
+# ---------- Compression des réponses (chem_backend/compression.py) ----------
+COMPRESSION_ENABLED = config('COMPRESSION_ENABLED', default=True, cast=bool)
+COMPRESSION_MIN_SIZE = 1024                     # octets ; en dessous : pas de compression
+COMPRESSION_ENCODINGS = ("zstd", "br", "gzip")  # préférence serveur à q égal
+# Niveau par type de contenu ("text/" = préfixe). Type absent = jamais compressé.
+# API JSON : niveaux rapides (latence) ; fichiers de structure : plus serrés,
+# ils sont servis plus rarement et se compressent très bien.
+_FAST = {"gzip": 5, "br": 4, "zstd": 3}
+_DENSE = {"gzip": 6, "br": 6, "zstd": 6}
+COMPRESSION_LEVELS = {
+    "application/json": _FAST,
+    "text/csv": _FAST,
+    "text/event-stream": None,                  # SSE : jamais (mise en tampon)
+    "text/": _DENSE,
+    "application/javascript": _DENSE,
+    "application/xml": _DENSE,
+    "image/svg+xml": _DENSE,
+    "chemical/": _DENSE,                        # chemical/x-mdl-molfile, x-pdb...
+    "application/octet-stream": _DENSE,         # .mol/.sdf sans type connu (sinon détecté comme déjà compressé)
+}
+
+# ---------- Export colonnaire (compounds/export/) ----------
+EXPORT_CACHE_DIR = config('EXPORT_CACHE_DIR', default=str(VAR_DIR / 'exports'))
+EXPORT_BATCH_SIZE = 10_000   # lignes lues par aller-retour base
+EXPORT_ZIP_LEVEL = 1         # deflate rapide pour .npz (chaînes surtout)
+
+# ---------- Instantanés du catalogue public (compounds/catalog/, publish_catalog) ----------
+CATALOG_DIR = config('CATALOG_DIR', default=str(VAR_DIR / 'catalog'))
+CATALOG_SNAPSHOT_EVERY = config('CATALOG_SNAPSHOT_EVERY', default=24, cast=int)  # instantané toutes les N versions (cron horaire : 1/jour)
+CATALOG_KEEP_SNAPSHOTS = 3
+CATALOG_KEEP_VERSIONS = 200       # deltas conservés (un miroir plus en retard repart d'un instantané)
+
+# ---------- Composés apparentés (compounds/related.py) ----------
+RELATED_TOP_K = config('RELATED_TOP_K', default=10, cast=int)
+RELATED_MIN_SIMILARITY = config('RELATED_MIN_SIMILARITY', default=0.35, cast=float)  # Tanimoto
+RELATED_FULL_RECOMPUTE_RATIO = 0.25  # au-delà de cette part de composés modifiés : calcul complet
+
+# ---------- Propriétés expérimentales (compounds/properties/) ----------
+PROPERTY_BULK_MAX_ROWS = 10_000   # lignes par POST properties/bulk/
+
+# ---------- Compteurs statistiques (stats/counters.py) ----------
+COUNTER_SHARDS = 8                # lignes par compteur (écritures concurrentes sur des lignes distinctes)
+
+# ---------- Recherche groupée (compounds/lookup/) ----------
+LOOKUP_MAX_KEYS = 5000            # clés par requête
+LOOKUP_CHUNK_SIZE = 1000          # clés par requête IN
+LOOKUP_MAX_MATCHES = 50           # composés par nom / formule / SMILES
+
+# ---------- Recherche par masse (compounds/mass-search/) ----------
+MASS_SEARCH_MAX_QUERIES = 10_000  # m/z par requête
+MASS_INDEX_OVERLAY_MAX = 512      # composés modifiés avant fusion dans l'index principal
+MASS_INDEX_CATCHUP_SECONDS = 1.0  # relecture du journal au plus une fois par intervalle
+
+# ---------- Index de recherche partagés (mmap, compounds/indexfile.py) ----------
+# Un fichier par index, mappé en lecture seule par tous les workers
+SEARCH_INDEX_DIR = config('SEARCH_INDEX_DIR', default=str(VAR_DIR / 'index'))
+SEARCH_INDEX_SHARED = config('SEARCH_INDEX_SHARED', default=True, cast=bool)
+
+# ---------- Dépictions 2D (compounds/<id>/depiction.svg, compounds/depictions/) ----------
+DEPICTION_CACHE_DIR = config('DEPICTION_CACHE_DIR', default=str(VAR_DIR / 'depictions'))
+DEPICTION_CACHE_MAX_BYTES = config('DEPICTION_CACHE_MAX_BYTES', default=256 * 1024 * 1024, cast=int)
+DEPICTION_DEFAULT_SIZE = 300      # px (carré)
+DEPICTION_THUMBNAIL_SIZE = 120    # mode lot (pages de liste)
+DEPICTION_MAX_SIZE = 1000
+DEPICTION_BATCH_MAX = 100         # = taille de page max
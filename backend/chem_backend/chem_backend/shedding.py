@@ -0,0 +1,230 @@
+# chem_backend/shedding.py
+"""
+Limitation de débit et délestage adaptatif.
+
+`LoadSheddingMiddleware` classe chaque requête :
+- par client : "admin" (is_staff), "user" (connecté) ou "anon" (par IP) ;
+- par classe d'endpoint (SHED_ENDPOINT_CLASSES, clé = nom d'URL).
+
+Puis, dans l'ordre :
+1. Token bucket par client (SHED_RATES[tier]) → 429 + Retry-After. Une page
+   de liste coûte limit / 20 jetons : `limit=100` coûte 5 fois une page par défaut.
+2. Délestage adaptatif : si la latence moyenne des requêtes SQL (moyenne
+   mobile) dépasse SHED_DB_LATENCY_MS, ou si le nombre de requêtes en cours
+   dans le process dépasse SHED_MAX_IN_FLIGHT, une part croissante du trafic
+   anonyme est refusée (503) ; le trafic connecté seulement au-delà du double
+   du seuil ; les admins jamais.
+3. Concurrence par classe d'endpoint (SHED_CONCURRENCY, par process) : les
+   anonymes n'ont droit qu'à SHED_ANON_SHARE des places → 503 + Retry-After.
+
+Les admins ne sont ni limités ni délestés : sous surcharge, la capacité
+restante leur revient (ainsi qu'aux utilisateurs connectés).
+"""
+import math
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from .throttle import client_ip, shared_buckets, too_many_requests
+
+TIERS = ("anon", "user", "admin")
+
+
+def service_unavailable(retry_after: float, message="Server busy, retry later"):
+    resp = JsonResponse({"error": message}, status=503)
+    resp["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return resp
+
+
+class DecayingAverage:
+    """Moyenne mobile exponentielle qui retombe vers 0 sans nouvelle mesure (demi-vie)."""
+
+    def __init__(self, alpha=0.2, half_life=10.0):
+        self.alpha, self.half_life = alpha, half_life
+        self.value, self.updated = 0.0, time.monotonic()
+
+    def _decayed(self, now):
+        return self.value * 0.5 ** ((now - self.updated) / self.half_life)
+
+    def add(self, sample):
+        now = time.monotonic()
+        self.value = (1 - self.alpha) * self._decayed(now) + self.alpha * sample
+        self.updated = now
+
+    def get(self):
+        return self._decayed(time.monotonic())
+
+
+class _DbTimer:
+    """execute_wrapper : temps et nombre de requêtes SQL de la requête HTTP."""
+
+    def __init__(self):
+        self.count, self.duration = 0, 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class LoadShedder:
+    """État du process : requêtes en cours (total et par classe), latence SQL."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.by_class = {}
+        self.db_latency = DecayingAverage()  # secondes par requête SQL
+        self.shed = {tier: 0 for tier in TIERS}
+        self.throttled = {tier: 0 for tier in TIERS}
+
+    def pressure(self) -> float:
+        """> 1 : surcharge (max des rapports latence SQL / seuil et en cours / max)."""
+        latency = self.db_latency.get() * 1000 / settings.SHED_DB_LATENCY_MS
+        depth = self.in_flight / settings.SHED_MAX_IN_FLIGHT
+        return max(latency, depth)
+
+    def should_shed(self, tier: str) -> bool:
+        if tier == "admin":
+            return False
+        pressure = self.pressure()
+        excess = pressure - (1.0 if tier == "anon" else 2.0)
+        if excess <= 0:
+            return False
+        # Jamais 100 % : quelques requêtes passent et mettent la latence à jour
+        return random.random() < min(0.95, 0.5 + excess)
+
+    def enter(self, endpoint_class, tier) -> bool:
+        """Réserve une place ; False si la classe est pleine pour ce client."""
+        limit = settings.SHED_CONCURRENCY.get(endpoint_class) if endpoint_class else None
+        with self._lock:
+            current = self.by_class.get(endpoint_class, 0)
+            if limit is not None and tier != "admin":
+                allowed = limit if tier == "user" else max(1, int(limit * settings.SHED_ANON_SHARE))
+                if current >= allowed:
+                    return False
+            self.by_class[endpoint_class] = current + 1
+            self.in_flight += 1
+            return True
+
+    def leave(self, endpoint_class, timer):
+        with self._lock:
+            self.by_class[endpoint_class] -= 1
+            self.in_flight -= 1
+            if timer.count:
+                self.db_latency.add(timer.duration / timer.count)
+
+    def count(self, kind, tier):
+        with self._lock:
+            getattr(self, kind)[tier] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "by_class": {k: v for k, v in self.by_class.items() if k},
+                "db_latency_ms": round(self.db_latency.get() * 1000, 3),
+                "pressure": round(self.pressure(), 3),
+                "shed": dict(self.shed),
+                "throttled": dict(self.throttled),
+            }
+
+
+shedder = LoadShedder()
+
+
+def client_tier(request):
+    """(tier, clé du bucket)."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return ("admin" if user.is_staff else "user"), f"user:{user.pk}"
+    return "anon", f"ip:{client_ip(request)}"
+
+
+def request_cost(request, endpoint_class) -> float:
+    if endpoint_class != "list":
+        return 1.0
+    try:
+        limit = int(request.GET.get("limit", 20))
+    except ValueError:
+        limit = 20
+    return max(1.0, min(limit, 100) / 20)
+
+
+def endpoint_class(url_name):
+    """Classe d'endpoint d'un nom d'URL (SHED_ENDPOINT_CLASSES), None si non classé."""
+    for cls, names in settings.SHED_ENDPOINT_CLASSES.items():
+        if url_name in names:
+            return cls
+    return None
+
+
+def admit(request, endpoint_class):
+    """
+    Débit, délestage et place dans la classe : None si la requête passe (à
+    libérer par shedder.leave), sinon la réponse 429 / 503 à renvoyer.
+    """
+    tier, key = client_tier(request)
+    rate = settings.SHED_RATES.get(tier) if endpoint_class else None
+    if rate is not None:
+        allowed, retry_after = shared_buckets().take(f"shed:{key}", *rate, request_cost(request, endpoint_class))
+        if not allowed:
+            shedder.count("throttled", tier)
+            return too_many_requests(retry_after)
+
+    if endpoint_class and shedder.should_shed(tier):
+        shedder.count("shed", tier)
+        return service_unavailable(1 + shedder.pressure())
+    if not shedder.enter(endpoint_class, tier):
+        shedder.count("shed", tier)
+        return service_unavailable(1)
+    return None
+
+
+@contextmanager
+def occupying(endpoint_class):
+    """Place réservée par admit() : libérée en sortie, avec le temps SQL mesuré."""
+    timer = _DbTimer()
+    try:
+        with connections["default"].execute_wrapper(timer):
+            yield
+    finally:
+        shedder.leave(endpoint_class, timer)
+
+
+class LoadSheddingMiddleware:
+    """
+    À placer après AuthenticationMiddleware (le tier dépend de request.user).
+    Le tri se fait dans process_view, sur request.resolver_match (pas de
+    second resolve) ; la place est rendue par __call__ après la réponse. Une
+    URL inconnue (404) n'atteint pas process_view : ni débit ni place.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SHED_ENABLED:
+            return self.get_response(request)
+        with ExitStack() as stack:
+            request._shedding = stack
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stack = getattr(request, "_shedding", None)
+        if stack is None:
+            return None
+        cls = endpoint_class(request.resolver_match.url_name)
+        refused = admit(request, cls)
+        if refused is not None:
+            return refused
+        stack.enter_context(occupying(cls))
+        return None
@@ -0,0 +1,120 @@
+# chem_backend/throttle.py
+"""
+Token buckets en mémoire du process.
+
+    allowed, retry_after = buckets.take("login:ip:1.2.3.4", rate=1.0, capacity=20)
+
+`rate` = jetons rechargés par seconde, `capacity` = rafale maximale.
+
+`shared_buckets()` renvoie le registre choisi par THROTTLE_BACKEND : "local"
+(ci-dessus, par process) ou "cache" (compteurs dans le cache Django, donc
+communs à tous les workers si le cache est Redis).
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float):
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, capacity: float, cost: float = 1.0):
+        """Retourne (autorisé, secondes avant le prochain jeton)."""
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True, 0.0
+        return False, (cost - self.tokens) / rate if rate > 0 else float("inf")
+
+
+class BucketRegistry:
+    """
+    Ensemble de buckets indexés par clé, borné en taille (LRU) pour qu'un
+    balayage d'IP ne fasse pas grossir la mémoire indéfiniment.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(capacity)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take(rate, capacity, cost)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+buckets = BucketRegistry()
+
+
+class CacheBucketRegistry:
+    """
+    Même interface que BucketRegistry, état dans le cache partagé.
+    Sans compare-and-swap dans l'API de cache, le bucket est approché par une
+    fenêtre fixe de capacity / rate secondes autorisant `capacity` jetons
+    (même débit moyen ; cache.incr est atomique sur Redis).
+    """
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0):
+        cache = caches[self.alias]
+        window = max(1.0, capacity / rate) if rate > 0 else 3600.0
+        now = time.time()
+        slot = int(now // window)
+        name = f"throttle:{key}:{slot}"
+        cost = math.ceil(cost)
+        cache.add(name, 0, timeout=math.ceil(window) + 1)
+        try:
+            used = cache.incr(name, cost)
+        except ValueError:  # expirée entre add() et incr()
+            cache.set(name, cost, timeout=math.ceil(window) + 1)
+            used = cost
+        if used <= capacity:
+            return True, 0.0
+        return False, (slot + 1) * window - now
+
+    def clear(self):
+        caches[self.alias].clear()
+
+
+def shared_buckets():
+    if getattr(settings, "THROTTLE_BACKEND", "local") == "cache":
+        return CacheBucketRegistry(getattr(settings, "THROTTLE_CACHE_ALIAS", "default"))
+    return buckets
+
+
+def client_ip(request) -> str:
+    if getattr(settings, "THROTTLE_TRUST_X_FORWARDED_FOR", False):
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "") or "unknown"
+
+
+def too_many_requests(retry_after: float, message="Too many requests, retry later"):
+    resp = JsonResponse({"error": message}, status=429)
+    resp["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return resp
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
 from users.views import csrf_token_view  # CSRF endpoint
+from chem_backend.batch import batch_view
+from chem_backend.metrics import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -8,6 +10,12 @@ urlpatterns = [
     # CSRF cookie bootstrap
     path("api/csrf/", csrf_token_view, name="csrf"),
 
+    # Métriques Prometheus (jeton METRICS_TOKEN ou staff)
+    path("api/metrics/", metrics_view, name="metrics"),
+
+    # Requêtes GET groupées (un aller-retour au chargement d'une page)
+    path("api/batch/", batch_view, name="batch"),
+
     # Auth
     path("api/auth/", include("users.urls")),
 
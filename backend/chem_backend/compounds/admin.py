@@ -1,6 +1,6 @@
 # compounds/admin.py
 from django.contrib import admin
-from .models import Compound
+from .models import Compound, PropertyDefinition
 
 @admin.register(Compound)
 class CompoundAdmin(admin.ModelAdmin):
@@ -18,3 +18,9 @@ class CompoundAdmin(admin.ModelAdmin):
     ordering = ("name",)
     date_hierarchy = "created_at"
     raw_id_fields = ("owner",)  # évite un menu déroulant trop long si beaucoup d'utilisateurs
+
+
+@admin.register(PropertyDefinition)
+class PropertyDefinitionAdmin(admin.ModelAdmin):
+    list_display = ("key", "name", "unit")
+    search_fields = ("key", "name")
@@ -0,0 +1,302 @@
+# compounds/catalog.py
+"""
+Instantanés versionnés du catalogue public pour les sites miroirs.
+
+`publish_catalog` (cron) publie une nouvelle version quand le journal
+CompoundChange a avancé. Dans CATALOG_DIR, fichiers immuables :
+- catalog-<v>.sqlite.gz      : base SQLite de tous les composés publics
+                               (table `compounds`, table `meta`) ;
+- delta-<u>-<v>.sqlite.gz    : de la version u à v, tables `upserts` (même
+                               schéma que `compounds`) et `deletes(id)` ;
+- manifest.json              : versions, fichiers, tailles, sha256 (écrit en
+                               dernier, remplacé atomiquement).
+
+Un miroir à la version u applique les deltas u→…→latest (voir APPLY_SQL) ;
+sans chaîne complète (trop en retard, ou version reconstruite), il télécharge
+le dernier instantané.
+
+Le delta est calculé depuis le journal : composés touchés depuis le jeton de
+la version précédente (plus la fenêtre COMPOUND_CHANGES_SETTLE_SECONDS, pour
+les transactions validées en retard ; réappliquer un upsert est sans effet),
+relus dans la table : public → upsert, sinon → delete (seulement s'il a
+été public un jour, comme pour les tombstones du journal et du flux SSE). L'instantané suivant
+est l'instantané précédent + ce delta (copie de travail CATALOG_DIR/current.sqlite) :
+pas de relecture de toute la table, et instantanés et deltas restent
+cohérents par construction. `--rebuild` relit toute la table et coupe la
+chaîne de deltas.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .indexfile import BuildLock
+from .models import Compound, CompoundChange
+
+FORMAT = 1
+FILE_RE = re.compile(r"^(catalog-\d+|delta-\d+-\d+)\.sqlite\.gz$")
+
+# (colonne, type SQLite) ; dates en ISO 8601 UTC, structure_file relatif à MEDIA_URL
+COLUMNS = [
+    ("id", "INTEGER PRIMARY KEY"),
+    ("name", "TEXT NOT NULL"),
+    ("formula", "TEXT NOT NULL"),
+    ("smiles", "TEXT NOT NULL"),
+    ("molecular_weight", "REAL"),
+    ("monoisotopic_mass", "REAL"),
+    ("description", "TEXT NOT NULL"),
+    ("structure_file", "TEXT"),
+    ("created_at", "TEXT"),
+    ("updated_at", "TEXT"),
+]
+_FIELDS = [name for name, _ in COLUMNS]
+_TABLE_SQL = ", ".join(f"{name} {kind}" for name, kind in COLUMNS)
+_PLACEHOLDERS = ", ".join("?" * len(COLUMNS))
+
+APPLY_SQL = (
+    "ATTACH DATABASE 'delta.sqlite' AS d;"
+    " INSERT OR REPLACE INTO compounds SELECT * FROM d.upserts;"
+    " DELETE FROM compounds WHERE id IN (SELECT id FROM d.deletes);"
+    " INSERT OR REPLACE INTO meta SELECT * FROM d.meta WHERE key IN ('version', 'token');"
+    " DETACH DATABASE d;"
+)
+
+
+def catalog_path(name: str) -> str:
+    return os.path.join(settings.CATALOG_DIR, name)
+
+
+def load_manifest() -> dict:
+    try:
+        with open(catalog_path("manifest.json")) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {"format": FORMAT, "latest": None, "versions": []}
+
+
+def _write_manifest(manifest):
+    fd, tmp = tempfile.mkstemp(dir=settings.CATALOG_DIR, suffix=".part")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp, catalog_path("manifest.json"))
+
+
+# ---------- Lignes ----------
+
+def _rows(qs):
+    for row in qs.order_by("id").values_list(*_FIELDS).iterator(chunk_size=settings.EXPORT_BATCH_SIZE):
+        row = list(row)
+        for i in (8, 9):  # created_at, updated_at
+            row[i] = row[i].isoformat() if row[i] else None
+        row[7] = row[7] or None  # structure_file vide → NULL
+        yield row
+
+
+def _insert(conn, table, rows) -> int:
+    n = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= 5000:
+            conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({_PLACEHOLDERS})", batch)
+            n += len(batch)
+            batch = []
+    conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({_PLACEHOLDERS})", batch)
+    return n + len(batch)
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    return conn
+
+
+def _set_meta(conn, **values):
+    conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in values.items()])
+
+
+# ---------- Fichiers ----------
+
+def _gzip_into(src, name, level) -> dict:
+    """Compresse `src` vers CATALOG_DIR/name (atomique) ; retourne {file, size, sha256}."""
+    fd, tmp = tempfile.mkstemp(dir=settings.CATALOG_DIR, suffix=".part")
+    hasher = hashlib.sha256()
+
+    class _Hashing:
+        def __init__(self, raw):
+            self.raw = raw
+
+        def write(self, data):
+            hasher.update(data)
+            return self.raw.write(data)
+
+        def flush(self):
+            self.raw.flush()
+
+    with os.fdopen(fd, "wb") as raw, open(src, "rb") as fin:
+        # mtime=0 : même contenu → mêmes octets
+        with gzip.GzipFile(fileobj=_Hashing(raw), mode="wb", compresslevel=level, mtime=0) as gz:
+            shutil.copyfileobj(fin, gz, 1024 * 1024)
+    os.replace(tmp, catalog_path(name))
+    return {"file": name, "size": os.path.getsize(catalog_path(name)), "sha256": hasher.hexdigest()}
+
+
+def _build_full(path, version, token) -> int:
+    if os.path.exists(path):
+        os.remove(path)
+    conn = _connect(path)
+    conn.execute(f"CREATE TABLE compounds ({_TABLE_SQL})")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    rows = _insert(conn, "compounds", _rows(Compound.objects.filter(is_public=True)))
+    _set_meta(conn, format=FORMAT, version=version, token=token)
+    conn.close()
+    return rows
+
+
+def _current_version(path):
+    """Version de la copie de travail (None si absente ou illisible)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return int(row[0]) if row else None
+
+
+# ---------- Publication ----------
+
+def publish(rebuild=False, snapshot_every=None) -> dict:
+    """
+    Publie une version si le journal a avancé depuis la précédente.
+    Retourne l'entrée du manifeste publiée ({} si rien de neuf ou publication en cours).
+    """
+    os.makedirs(settings.CATALOG_DIR, exist_ok=True)
+    snapshot_every = snapshot_every or settings.CATALOG_SNAPSHOT_EVERY
+    with BuildLock("catalog") as acquired:
+        if not acquired:
+            return {}
+        manifest = load_manifest()
+        previous = manifest["versions"][-1] if manifest["versions"] else None
+        now = timezone.now()
+        token = CompoundChange.objects.aggregate(m=Max("id"))["m"] or 0
+        if previous and not rebuild and token == previous["token"]:
+            return {}
+
+        version = previous["version"] + 1 if previous else 1
+        current = catalog_path("current.sqlite")
+        entry = {"version": version, "token": token, "published_at": now.isoformat(),
+                 "delta": None, "snapshot": None}
+
+        if previous and not rebuild and _current_version(current) == previous["version"]:
+            since = datetime.fromisoformat(previous["published_at"])
+            window = since - timedelta(seconds=settings.COMPOUND_CHANGES_SETTLE_SECONDS)
+            changed, once_public = set(), set()
+            for compound_id, ever_public in (
+                CompoundChange.objects.filter(Q(id__gt=previous["token"]) | Q(created_at__gte=window))
+                .values_list("compound_id", "ever_public")
+            ):
+                changed.add(compound_id)
+                if ever_public:
+                    once_public.add(compound_id)
+            entry["delta"], entry["rows"] = _write_delta(previous["version"], version, token,
+                                                         sorted(changed), once_public, current)
+            due = (version - _last_snapshot_version(manifest)) >= snapshot_every
+        else:
+            entry["rows"] = _build_full(current, version, token)
+            entry["rebuilt"] = True
+            due = True
+
+        if due:
+            entry["snapshot"] = _gzip_into(current, f"catalog-{version}.sqlite.gz", level=6)
+
+        manifest["versions"].append(entry)
+        manifest["latest"] = version
+        _prune(manifest)
+        _write_manifest(manifest)
+        return entry
+
+
+def _last_snapshot_version(manifest) -> int:
+    for v in reversed(manifest["versions"]):
+        if v.get("snapshot"):
+            return v["version"]
+    return 0
+
+
+def _write_delta(from_version, version, token, changed_ids, once_public, current):
+    """
+    Écrit delta-<u>-<v> et l'applique à la copie de travail ; retourne (infos, lignes après).
+    `deletes` ne contient que des composés publics à un moment donné
+    (CompoundChange.ever_public) : l'id d'un composé toujours privé ne sort pas.
+    """
+    fd, path = tempfile.mkstemp(dir=settings.CATALOG_DIR, suffix=".sqlite")
+    os.close(fd)
+    try:
+        conn = _connect(path)
+        conn.execute(f"CREATE TABLE upserts ({_TABLE_SQL})")
+        conn.execute("CREATE TABLE deletes (id INTEGER PRIMARY KEY)")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        upserts = 0
+        for i in range(0, len(changed_ids), 500):
+            upserts += _insert(conn, "upserts", _rows(
+                Compound.objects.filter(pk__in=changed_ids[i:i + 500], is_public=True)
+            ))
+        conn.execute("CREATE TEMP TABLE changed (id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO changed VALUES (?)", [(i,) for i in changed_ids if i in once_public])
+        conn.execute("INSERT INTO deletes SELECT id FROM changed WHERE id NOT IN (SELECT id FROM upserts)")
+        deletes = conn.execute("SELECT COUNT(*) FROM deletes").fetchone()[0]
+        _set_meta(conn, format=FORMAT, version=version, token=token, from_version=from_version)
+        conn.close()
+
+        # Copie de travail : même SQL que côté miroir
+        work = _connect(current)
+        work.executescript(APPLY_SQL.replace("delta.sqlite", path.replace("'", "''")))
+        rows = work.execute("SELECT COUNT(*) FROM compounds").fetchone()[0]
+        work.close()
+
+        info = _gzip_into(path, f"delta-{from_version}-{version}.sqlite.gz", level=9)
+    finally:
+        os.remove(path)
+    info.update({"from": from_version, "upserts": upserts, "deletes": deletes})
+    return info, rows
+
+
+def _prune(manifest):
+    """Garde les CATALOG_KEEP_SNAPSHOTS derniers instantanés et CATALOG_KEEP_VERSIONS deltas."""
+    versions = manifest["versions"]
+    with_snapshot = [v for v in versions if v.get("snapshot")]
+    for v in with_snapshot[:-settings.CATALOG_KEEP_SNAPSHOTS]:
+        _remove(v["snapshot"]["file"])
+        v["snapshot"] = None
+    for v in versions[:-settings.CATALOG_KEEP_VERSIONS]:
+        if v.get("delta"):
+            _remove(v["delta"]["file"])
+            v["delta"] = None
+    # Versions sans fichier et plus anciennes que le plus ancien instantané : inutiles
+    oldest = min((v["version"] for v in versions if v.get("snapshot")), default=None)
+    manifest["versions"] = [
+        v for v in versions
+        if v.get("snapshot") or v.get("delta") or oldest is None or v["version"] >= oldest
+    ]
+
+
+def _remove(name):
+    try:
+        os.remove(catalog_path(name))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,121 @@
+# compounds/chemistry.py
+"""
+Formules brutes et masses exactes.
+
+    parse_formula("CuSO4·5H2O")   → Counter({'O': 9, 'H': 10, 'Cu': 1, 'S': 1})
+    monoisotopic_mass("C6H12O6")  → 180.0633881...
+
+Masse monoisotopique = somme des masses de l'isotope le plus abondant de
+chaque élément (valeurs NIST/AME), à comparer aux m/z mesurés en
+spectrométrie de masse (à l'inverse de `molecular_weight`, masse moyenne).
+"""
+import re
+from collections import Counter
+
+# Masse de l'isotope le plus abondant (u)
+MONOISOTOPIC_MASSES = {
+    "H": 1.00782503223, "D": 2.01410177812, "Li": 7.0160034366, "B": 11.00930536,
+    "C": 12.0, "N": 14.00307400443, "O": 15.99491461957, "F": 18.99840316273,
+    "Na": 22.989769282, "Mg": 23.985041697, "Al": 26.98153853, "Si": 27.97692653465,
+    "P": 30.97376199842, "S": 31.9720711744, "Cl": 34.968852682, "K": 38.9637064864,
+    "Ca": 39.962590863, "Ti": 47.94794198, "V": 50.94395704, "Cr": 51.94050623,
+    "Mn": 54.93804391, "Fe": 55.93493633, "Co": 58.93319429, "Ni": 57.93534241,
+    "Cu": 62.92959772, "Zn": 63.92914201, "Ga": 68.9255735, "Ge": 73.921177761,
+    "As": 74.92159457, "Se": 79.9165218, "Br": 78.9183376, "Rb": 84.9117897379,
+    "Sr": 87.9056125, "Zr": 89.9046977, "Mo": 97.90540482, "Ru": 101.9043441,
+    "Rh": 102.905498, "Pd": 105.9034804, "Ag": 106.9050916, "Cd": 113.90336509,
+    "Sn": 119.90220163, "Sb": 120.903812, "Te": 129.906222748, "I": 126.9044719,
+    "Cs": 132.905451961, "Ba": 137.905247, "Gd": 157.9241123, "W": 183.95093092,
+    "Os": 191.961477, "Ir": 192.9629216, "Pt": 194.9647917, "Au": 196.96656879,
+    "Hg": 201.9706434, "Pb": 207.9766525, "Bi": 208.9803991,
+}
+
+ELECTRON = 0.000548579909
+PROTON = MONOISOTOPIC_MASSES["H"] - ELECTRON
+
+# Adduits : nom → (multiplicité de M, charge, masse ajoutée)
+# m/z = (n·M + delta) / |z|
+ADDUCTS = {
+    "[M]": (1, 1, 0.0),  # masse neutre (pas d'ionisation)
+    "[M]+": (1, 1, -ELECTRON),
+    "[M+H]+": (1, 1, PROTON),
+    "[M+Na]+": (1, 1, MONOISOTOPIC_MASSES["Na"] - ELECTRON),
+    "[M+K]+": (1, 1, MONOISOTOPIC_MASSES["K"] - ELECTRON),
+    "[M+NH4]+": (1, 1, MONOISOTOPIC_MASSES["N"] + 4 * MONOISOTOPIC_MASSES["H"] - ELECTRON),
+    "[M+2H]2+": (1, 2, 2 * PROTON),
+    "[2M+H]+": (2, 1, PROTON),
+    "[M-H]-": (1, -1, -PROTON),
+    "[M+Cl]-": (1, -1, MONOISOTOPIC_MASSES["Cl"] + ELECTRON),
+    "[M+HCOO]-": (1, -1, MONOISOTOPIC_MASSES["C"] + MONOISOTOPIC_MASSES["H"]
+                  + 2 * MONOISOTOPIC_MASSES["O"] + ELECTRON),
+}
+
+_TOKEN = re.compile(r"([A-Z][a-z]?)(\d*)|([(\[])|([)\]])(\d*)")
+_SEPARATORS = re.compile(r"[·•.*]")
+
+
+def _parse_group(text: str) -> Counter:
+    stack = [Counter()]
+    pos = 0
+    for m in _TOKEN.finditer(text):
+        if m.start() != pos:
+            raise ValueError(f"Unexpected '{text[pos:m.start()]}' in formula")
+        pos = m.end()
+        symbol, count, opening, closing, group_count = m.groups()
+        if symbol:
+            if symbol not in MONOISOTOPIC_MASSES:
+                raise ValueError(f"Unknown element '{symbol}'")
+            stack[-1][symbol] += int(count or 1)
+        elif opening:
+            stack.append(Counter())
+        else:
+            if len(stack) == 1:
+                raise ValueError("Unbalanced parentheses")
+            group = stack.pop()
+            n = int(group_count or 1)
+            for el, k in group.items():
+                stack[-1][el] += k * n
+    if pos != len(text):
+        raise ValueError(f"Unexpected '{text[pos:]}' in formula")
+    if len(stack) != 1:
+        raise ValueError("Unbalanced parentheses")
+    return stack[0]
+
+
+def parse_formula(formula: str) -> Counter:
+    """
+    Composition élémentaire. Gère parenthèses/crochets imbriqués et hydrates
+    ("CuSO4·5H2O", "CuSO4.5H2O"). Lève ValueError si la formule est invalide.
+    """
+    text = (formula or "").replace(" ", "")
+    if not text:
+        raise ValueError("Empty formula")
+    total = Counter()
+    for part in _SEPARATORS.split(text):
+        m = re.match(r"(\d+)(.+)", part)
+        mult, body = (int(m.group(1)), m.group(2)) if m else (1, part)
+        for el, k in _parse_group(body).items():
+            total[el] += k * mult
+    return total
+
+
+def monoisotopic_mass(formula: str):
+    """Masse monoisotopique (u) de la formule, None si elle n'est pas interprétable."""
+    try:
+        counts = parse_formula(formula)
+    except ValueError:
+        return None
+    if any(k < 0 for k in counts.values()):
+        return None
+    return round(sum(MONOISOTOPIC_MASSES[el] * k for el, k in counts.items()), 6)
+
+
+def neutral_mass_range(mz: float, tolerance_da: float, adduct: str):
+    """Intervalle de masse neutre M compatible avec un m/z observé ± tolérance."""
+    n, z, delta = ADDUCTS[adduct]
+    return ((mz - tolerance_da) * abs(z) - delta) / n, ((mz + tolerance_da) * abs(z) - delta) / n
+
+
+def adduct_mz(mass: float, adduct: str) -> float:
+    n, z, delta = ADDUCTS[adduct]
+    return (n * mass + delta) / abs(z)
@@ -0,0 +1,744 @@
+# compounds/depiction.py
+"""
+Dépiction 2D (SVG) à partir du SMILES, sans dépendance chimie externe.
+
+    mol = parse_smiles("c1ccccc1O")
+    key, svg = depict("c1ccccc1O", size=300)
+
+Étapes :
+1. parse_smiles : graphe (atomes, liaisons) du sous-ensemble courant de
+   SMILES (atomes organiques, crochets, charges, cycles, branches, "." ).
+   La stéréochimie (@, /, \\) est lue mais pas dessinée.
+2. canonicalize : ordre canonique des atomes (invariants raffinés à la
+   Morgan + départage). La clé = graphe complet réécrit dans cet ordre :
+   deux SMILES d'une même structure ("OCC", "C(O)C") partagent clé et
+   dessin ; deux structures différentes ne partagent jamais de clé.
+3. compute_layout : cycles (base minimale), systèmes cycliques en
+   polygones réguliers accolés, chaînes en zigzag à 120°.
+4. render_svg : liaisons simples/doubles/triples, cercle dans les cycles
+   aromatiques, étiquettes des hétéroatomes (H implicites, charges).
+
+Le cache disque (DepictionCache) garde les SVG sous la clé canonique + taille,
+en LRU borné par DEPICTION_CACHE_MAX_BYTES.
+"""
+import hashlib
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from chem_backend import metrics
+
+STYLE_VERSION = 1  # à incrémenter quand le rendu change (invalide le cache)
+
+ORGANIC = ("Cl", "Br", "B", "C", "N", "O", "P", "S", "F", "I")
+AROMATIC = ("b", "c", "n", "o", "p", "s")
+VALENCES = {
+    "B": (3,), "C": (4,), "N": (3, 5), "O": (2,), "P": (3, 5), "S": (2, 4, 6),
+    "F": (1,), "Cl": (1,), "Br": (1,), "I": (1,),
+}
+COLORS = {
+    "N": "#3050f8", "O": "#e0221b", "S": "#c9a100", "P": "#ff8000", "F": "#38a838",
+    "Cl": "#1fa01f", "Br": "#a62929", "I": "#940094", "B": "#c27a00",
+}
+INK = "#222"
+AROMATIC_BOND = 1.5
+
+_BRACKET = re.compile(
+    r"\[(?P<isotope>\d*)(?P<element>[A-Z][a-z]?|se|as|te|[bcnops]|\*)"
+    r"(?:@@?|@(?:TH|AL|SP|TB|OH)\d+)?(?:H(?P<h>\d*))?(?P<charge>[+-]\d+|\++|-+)?(?::\d+)?\]"
+)
+_BONDS = {"-": 1, "=": 2, "#": 3, "$": 3, ":": AROMATIC_BOND, "/": 1, "\\": 1}
+
+
+class DepictionError(ValueError):
+    """SMILES illisible."""
+
+
+class Atom:
+    __slots__ = ("element", "aromatic", "charge", "hcount", "bracket")
+
+    def __init__(self, element, aromatic=False, charge=0, hcount=None, bracket=False):
+        self.element, self.aromatic, self.charge = element, aromatic, charge
+        self.hcount, self.bracket = hcount, bracket
+
+
+class Molecule:
+    def __init__(self):
+        self.atoms = []
+        self.bonds = {}  # (i, j) avec i < j → ordre (1, 2, 3, AROMATIC_BOND)
+        self.neighbors = []
+
+    def add_atom(self, atom) -> int:
+        self.atoms.append(atom)
+        self.neighbors.append([])
+        return len(self.atoms) - 1
+
+    def add_bond(self, i, j, order):
+        if i == j or (min(i, j), max(i, j)) in self.bonds:
+            raise DepictionError("Invalid ring closure")
+        self.bonds[(min(i, j), max(i, j))] = order
+        self.neighbors[i].append(j)
+        self.neighbors[j].append(i)
+
+    def order(self, i, j):
+        return self.bonds[(min(i, j), max(i, j))]
+
+
+# ---------- Lecture du SMILES ----------
+
+def _default_order(mol, i, j):
+    return AROMATIC_BOND if mol.atoms[i].aromatic and mol.atoms[j].aromatic else 1
+
+
+def parse_smiles(smiles: str) -> Molecule:
+    text = (smiles or "").strip()
+    if not text:
+        raise DepictionError("Empty SMILES")
+    mol = Molecule()
+    prev, pending, stack, rings = None, None, [], {}
+    pos = 0
+    while pos < len(text):
+        ch = text[pos]
+        atom = None
+        if ch == "(":
+            if prev is None:
+                raise DepictionError("Branch without atom")
+            stack.append(prev)
+            pos += 1
+        elif ch == ")":
+            if not stack:
+                raise DepictionError("Unbalanced parentheses")
+            prev = stack.pop()
+            pos += 1
+        elif ch in _BONDS:
+            pending = _BONDS[ch]
+            pos += 1
+        elif ch == ".":
+            prev, pending = None, None
+            pos += 1
+        elif ch.isdigit() or ch == "%":
+            if ch == "%":
+                if not text[pos + 1:pos + 3].isdigit():
+                    raise DepictionError("Invalid ring number")
+                label, pos = text[pos + 1:pos + 3], pos + 3
+            else:
+                label, pos = ch, pos + 1
+            if prev is None:
+                raise DepictionError("Ring closure without atom")
+            if label in rings:
+                other, order = rings.pop(label)
+                order = pending or order or _default_order(mol, other, prev)
+                mol.add_bond(other, prev, order)
+            else:
+                rings[label] = (prev, pending)
+            pending = None
+        elif ch == "[":
+            m = _BRACKET.match(text, pos)
+            if not m:
+                raise DepictionError(f"Invalid bracket atom at {pos}")
+            element = m["element"]
+            charge = m["charge"] or ""
+            if charge:
+                sign = 1 if charge[0] == "+" else -1
+                charge = sign * (int(charge[1:]) if charge[1:].isdigit() else len(charge))
+            aromatic = element.islower()
+            atom = Atom(element.capitalize() if aromatic else element, aromatic, charge or 0,
+                        int(m["h"] or 1) if m["h"] is not None else 0, bracket=True)
+            pos = m.end()
+        else:
+            for symbol in ORGANIC + AROMATIC:
+                if text.startswith(symbol, pos):
+                    aromatic = symbol in AROMATIC
+                    atom = Atom(symbol.upper() if aromatic else symbol, aromatic)
+                    pos += len(symbol)
+                    break
+            else:
+                if ch != "*":
+                    raise DepictionError(f"Unexpected '{ch}' at {pos}")
+                atom = Atom("*", bracket=True, hcount=0)
+                pos += 1
+        if atom is not None:
+            idx = mol.add_atom(atom)
+            if prev is not None:
+                mol.add_bond(prev, idx, pending or _default_order(mol, prev, idx))
+            prev, pending = idx, None
+    if stack or rings:
+        raise DepictionError("Unclosed branch or ring")
+    if len(mol.atoms) > 250:
+        raise DepictionError("Molecule too large")
+    for i, atom in enumerate(mol.atoms):
+        if atom.hcount is None:
+            atom.hcount = _implicit_h(mol, i)
+    return mol
+
+
+def _implicit_h(mol, i) -> int:
+    atom = mol.atoms[i]
+    valences = VALENCES.get(atom.element)
+    if valences is None:
+        return 0
+    orders = [mol.order(i, j) for j in mol.neighbors[i]]
+    used = sum(1 if o == AROMATIC_BOND else o for o in orders)
+    if atom.aromatic and atom.element in ("B", "C", "N", "P"):
+        used += 1  # une des liaisons aromatiques compte double
+    for v in valences:
+        if used <= v:
+            return v - used
+    return 0
+
+
+# ---------- Ordre canonique ----------
+
+def _ranks(values):
+    table = {v: r for r, v in enumerate(sorted(set(values)))}
+    return [table[v] for v in values]
+
+
+def _refine(mol, ranks):
+    while True:
+        signature = [
+            (ranks[i], tuple(sorted((ranks[j], mol.order(i, j)) for j in mol.neighbors[i])))
+            for i in range(len(ranks))
+        ]
+        new = _ranks(signature)
+        if len(set(new)) == len(set(ranks)):
+            return new
+        ranks = new
+
+
+def canonicalize(mol: Molecule):
+    """
+    (molécule renumérotée dans l'ordre canonique, clé textuelle).
+    Invariants raffinés jusqu'à stabilité ; les ex æquo restants (atomes
+    symétriques) sont départagés un par un.
+    """
+    n = len(mol.atoms)
+    ranks = _ranks([
+        (a.element, a.aromatic, a.charge, a.hcount, len(mol.neighbors[i]))
+        for i, a in enumerate(mol.atoms)
+    ])
+    ranks = _refine(mol, ranks)
+    while len(set(ranks)) < n:
+        counts = {}
+        for r in ranks:
+            counts[r] = counts.get(r, 0) + 1
+        tied = min(r for r, c in counts.items() if c > 1)
+        chosen = ranks.index(tied)
+        ranks = _refine(mol, [2 * r + (0 if i == chosen or r != tied else 1) for i, r in enumerate(ranks)])
+
+    order = sorted(range(n), key=ranks.__getitem__)
+    new_index = {old: new for new, old in enumerate(order)}
+    canon = Molecule()
+    for old in order:
+        canon.add_atom(mol.atoms[old])
+    for (i, j), bond_order in sorted(mol.bonds.items(), key=lambda kv: sorted((new_index[kv[0][0]], new_index[kv[0][1]]))):
+        canon.add_bond(new_index[i], new_index[j], bond_order)
+    for nbrs in canon.neighbors:
+        nbrs.sort()
+
+    atoms = ";".join(f"{a.element}{'a' if a.aromatic else ''}{a.charge:+d}h{a.hcount}" for a in canon.atoms)
+    bonds = ";".join(f"{i}-{j}:{o}" for (i, j), o in sorted(canon.bonds.items()))
+    return canon, f"{atoms}|{bonds}"
+
+
+# ---------- Cycles ----------
+
+def _shortest_path(mol, start, goal, banned_edge):
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        a = queue.popleft()
+        if a == goal:
+            path = []
+            while a is not None:
+                path.append(a)
+                a = parents[a]
+            return path[::-1]
+        for b in mol.neighbors[a]:
+            if b not in parents and {a, b} != banned_edge:
+                parents[b] = a
+                queue.append(b)
+    return None
+
+
+def find_rings(mol: Molecule):
+    """Base minimale de cycles (listes d'atomes ordonnées), plus petits d'abord."""
+    edge_index = {edge: k for k, edge in enumerate(sorted(mol.bonds))}
+    n_components = len(_components(mol))
+    needed = len(mol.bonds) - len(mol.atoms) + n_components
+    if needed <= 0:
+        return []
+    candidates = {}
+    for (i, j) in mol.bonds:
+        path = _shortest_path(mol, i, j, {i, j})
+        if path:
+            candidates.setdefault(frozenset(path), path)
+    basis, rings = {}, []  # bit de tête → vecteur (élimination de Gauss sur GF(2))
+    for path in sorted(candidates.values(), key=len):
+        mask = 0
+        for a, b in zip(path, path[1:] + path[:1]):
+            mask ^= 1 << edge_index[(min(a, b), max(a, b))]
+        while mask and mask.bit_length() in basis:
+            mask ^= basis[mask.bit_length()]
+        if mask:  # indépendant des cycles déjà retenus
+            basis[mask.bit_length()] = mask
+            rings.append(path)
+            if len(rings) == needed:
+                break
+    return rings
+
+
+def _components(mol):
+    seen, comps = set(), []
+    for start in range(len(mol.atoms)):
+        if start in seen:
+            continue
+        comp, queue = [], deque([start])
+        seen.add(start)
+        while queue:
+            a = queue.popleft()
+            comp.append(a)
+            for b in mol.neighbors[a]:
+                if b not in seen:
+                    seen.add(b)
+                    queue.append(b)
+        comps.append(comp)
+    return comps
+
+
+def _ring_systems(rings):
+    systems = []
+    for ring in rings:
+        atoms, members = set(ring), [ring]
+        for system in [s for s in systems if s[0] & atoms]:
+            systems.remove(system)
+            atoms |= system[0]
+            members += system[1]
+        systems.append((atoms, members))
+    return systems
+
+
+# ---------- Coordonnées 2D ----------
+
+def _unit(angle):
+    return math.cos(angle), math.sin(angle)
+
+
+def _angle(p, q):
+    return math.atan2(q[1] - p[1], q[0] - p[0])
+
+
+def _centroid(points):
+    points = list(points)
+    return sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+
+
+def _arc(p, q, k, away):
+    """k points espacés de 1 sur un arc de q à p, bombé du côté opposé à `away`."""
+    d = math.dist(p, q)
+    if d >= k + 1 - 1e-9 or d < 1e-9:
+        # Impossible de fermer : segment droit
+        return [(q[0] + (p[0] - q[0]) * s / (k + 1), q[1] + (p[1] - q[1]) * s / (k + 1)) for s in range(1, k + 1)]
+    # sin((k+1)x)/sin(x) = d, décroissante sur ]0, π/(k+1)[
+    lo, hi = 1e-9, math.pi / (k + 1)
+    for _ in range(60):
+        x = (lo + hi) / 2
+        if math.sin((k + 1) * x) / math.sin(x) > d:
+            lo = x
+        else:
+            hi = x
+    phi = 2 * x
+    radius = 1 / (2 * math.sin(x))
+    mid = ((p[0] + q[0]) / 2, (p[1] + q[1]) / 2)
+    normal = (-(p[1] - q[1]) / d, (p[0] - q[0]) / d)
+    if (normal[0] * (away[0] - mid[0]) + normal[1] * (away[1] - mid[1])) > 0:
+        normal = (-normal[0], -normal[1])  # côté bombé : à l'opposé de `away`
+    h = math.sqrt(max(radius ** 2 - (d / 2) ** 2, 0.0))
+    # Arc plus grand qu'un demi-cercle : centre du côté bombé
+    sign = 1 if (k + 1) * phi > math.pi else -1
+    center = (mid[0] + sign * h * normal[0], mid[1] + sign * h * normal[1])
+    start = _angle(center, q)
+    # Sens de parcours : celui qui arrive sur p après k + 1 pas
+    direction = min((1, -1), key=lambda s: math.dist(p, (center[0] + radius * math.cos(start + s * phi * (k + 1)),
+                                                         center[1] + radius * math.sin(start + s * phi * (k + 1)))))
+    return [(center[0] + radius * math.cos(start + direction * phi * s),
+             center[1] + radius * math.sin(start + direction * phi * s)) for s in range(1, k + 1)]
+
+
+def _layout_ring_system(rings):
+    """Coordonnées locales d'un système cyclique (polygones accolés)."""
+    def fused(ring):
+        return sum(1 for other in rings if other is not ring and set(ring) & set(other))
+
+    first = max(rings, key=lambda r: (fused(r), len(r)))
+    n = len(first)
+    radius = 1 / (2 * math.sin(math.pi / n))
+    pos = {a: _unit(math.pi / 2 + math.pi / n + 2 * math.pi * k / n) for k, a in enumerate(first)}
+    pos = {a: (radius * x, radius * y) for a, (x, y) in pos.items()}
+    placed = [first]
+    remaining = [r for r in rings if r is not first]
+    while remaining:
+        ring = max(remaining, key=lambda r: (sum(a in pos for a in r), len(r)))
+        remaining.remove(ring)
+        size = len(ring)
+        flags = [a in pos for a in ring]
+        if all(flags):
+            placed.append(ring)
+            continue
+        if not any(flags):
+            remaining.append(ring)  # rattaché plus tard par un autre cycle
+            continue
+        # Plus longue suite (cyclique) d'atomes déjà placés : de p à q
+        best_start, best_len = 0, 0
+        for s in range(size):
+            if flags[s] and not flags[s - 1]:
+                length = 0
+                while length < size and flags[(s + length) % size]:
+                    length += 1
+                if length > best_len:
+                    best_start, best_len = s, length
+        p = ring[best_start]
+        q = ring[(best_start + best_len - 1) % size]
+        free = [ring[(best_start + best_len + t) % size] for t in range(size - best_len)]
+        if best_len == 1:
+            # Spiro : cycle construit vers l'extérieur de l'atome commun
+            a = p
+            around = [pos[b] for r in placed if a in r for b in r if b != a]
+            c = _centroid(around)
+            outward = _angle(c, pos[a])
+            r = 1 / (2 * math.sin(math.pi / size))
+            center = (pos[a][0] + r * math.cos(outward), pos[a][1] + r * math.sin(outward))
+            start = outward + math.pi
+            for t, b in enumerate(free, start=1):
+                pos[b] = (center[0] + r * math.cos(start + 2 * math.pi * t / size),
+                          center[1] + r * math.sin(start + 2 * math.pi * t / size))
+        else:
+            owners = [r for r in placed if p in r and q in r]
+            away = _centroid(pos[b] for r in (owners or placed) for b in r)
+            for b, xy in zip(free, _arc(pos[p], pos[q], len(free), away)):
+                pos[b] = xy
+        placed.append(ring)
+    return pos
+
+
+def compute_layout(mol: Molecule, rings):
+    """Coordonnées 2D (longueur de liaison 1) de tous les atomes."""
+    systems = _ring_systems(rings)
+    system_of = {}
+    for atoms, members in systems:
+        for a in atoms:
+            system_of[a] = (atoms, members)
+
+    coords = {}
+    offset_x = 0.0
+    for comp in _components(mol):
+        pos = _layout_component(mol, comp, system_of)
+        xs = [x for x, _ in pos.values()]
+        shift = offset_x - min(xs)
+        for a, (x, y) in pos.items():
+            coords[a] = (x + shift, y)
+        offset_x = max(xs) + shift + 1.5
+    return coords
+
+
+def _layout_component(mol, comp, system_of):
+    pos, parent, turn = {}, {}, {}
+    queue = deque()
+
+    def place_system(system, anchor=None, anchor_atom=None, direction=0.0):
+        atoms, members = system
+        local = _layout_ring_system(members)
+        if anchor is None:
+            transform = lambda xy: xy  # noqa: E731
+        else:
+            nbrs = [local[b] for b in mol.neighbors[anchor_atom] if b in atoms]
+            exterior = _angle(_centroid(nbrs), local[anchor_atom]) if nbrs else 0.0
+            rot = direction + math.pi - exterior  # extérieur du cycle tourné vers l'atome parent
+            cos, sin = math.cos(rot), math.sin(rot)
+            ax, ay = local[anchor_atom]
+            transform = lambda xy: (anchor[0] + cos * (xy[0] - ax) - sin * (xy[1] - ay),  # noqa: E731
+                                    anchor[1] + sin * (xy[0] - ax) + cos * (xy[1] - ay))
+        for a in sorted(atoms):
+            pos[a] = transform(local[a])
+            queue.append(a)
+
+    ringed = [a for a in comp if a in system_of]
+    if ringed:
+        biggest = max((system_of[a] for a in ringed), key=lambda s: (len(s[0]), -min(s[0])))
+        place_system(biggest)
+    else:
+        pos[comp[0]] = (0.0, 0.0)
+        queue.append(comp[0])
+
+    def clearance(point, skip):
+        return min((math.dist(point, xy) for b, xy in pos.items() if b != skip), default=9.0)
+
+    while queue:
+        a = queue.popleft()
+        new = [b for b in mol.neighbors[a] if b not in pos]
+        if not new:
+            continue
+        occupied = sorted(_angle(pos[a], pos[b]) for b in mol.neighbors[a] if b in pos)
+        k = len(new)
+        linear = any(mol.order(a, b) == 3 for b in mol.neighbors[a]) or \
+            sum(mol.order(a, b) == 2 for b in mol.neighbors[a]) == 2
+        if not occupied:
+            angles = [math.radians(-30) + 2 * math.pi * i / max(k, 1) if k != 2 else math.radians(-30 + 240 * i)
+                      for i in range(k)]
+        elif len(occupied) == 1:
+            back = occupied[0]
+            if k == 1 and linear:
+                angles = [back + math.pi]
+            elif k == 1:
+                preferred = -turn.get(parent.get(a), 1)
+                options = sorted((1, -1), key=lambda s: s != preferred)
+                # Zigzag, sauf si l'autre côté est nettement plus dégagé
+                best = max(options, key=lambda s: min(clearance(_offset(pos[a], back + s * 2 * math.pi / 3), a), 1.5))
+                turn[a] = best
+                angles = [back + best * 2 * math.pi / 3]
+            else:
+                step = 2 * math.pi / 3 if k == 2 else 2 * math.pi / (k + 1)
+                angles = [back + step * i for i in range(1, k + 1)]
+        else:
+            gaps = [(occupied[(i + 1) % len(occupied)] - occupied[i]) % (2 * math.pi) or 2 * math.pi
+                    for i in range(len(occupied))]
+            i = max(range(len(gaps)), key=gaps.__getitem__)
+            angles = [occupied[i] + gaps[i] * t / (k + 1) for t in range(1, k + 1)]
+
+        for b, angle in zip(new, angles):
+            if b in pos:  # placé entre-temps avec son système cyclique
+                continue
+            parent[b] = a
+            point = _offset(pos[a], angle)
+            if b in system_of:
+                place_system(system_of[b], anchor=point, anchor_atom=b, direction=angle)
+            else:
+                pos[b] = point
+                queue.append(b)
+    return pos
+
+
+def _offset(point, angle, length=1.0):
+    return point[0] + length * math.cos(angle), point[1] + length * math.sin(angle)
+
+
+# ---------- SVG ----------
+
+def _label(mol, i, pos):
+    """(symbole, texte H, charge) ou None pour un carbone non étiqueté."""
+    atom = mol.atoms[i]
+    degree = len(mol.neighbors[i])
+    if atom.element == "C" and not atom.charge and degree > 0:
+        return None
+    h = "" if not atom.hcount else ("H" if atom.hcount == 1 else f"H{atom.hcount}")
+    charge = ""
+    if atom.charge:
+        magnitude = abs(atom.charge)
+        charge = f"{magnitude if magnitude > 1 else ''}{'+' if atom.charge > 0 else '−'}"
+    # H à gauche si les liaisons partent vers la droite
+    h_left = bool(h) and degree > 0 and sum(pos[b][0] - pos[i][0] for b in mol.neighbors[i]) > 0.1
+    return atom.element, h, h_left, charge
+
+
+def render_svg(mol: Molecule, coords, rings, size: int) -> str:
+    if not coords:
+        raise DepictionError("Nothing to draw")
+    xs = [x for x, _ in coords.values()]
+    ys = [y for _, y in coords.values()]
+    span = max(max(xs) - min(xs), max(ys) - min(ys), 1e-6)
+    margin = 0.09 * size + 6
+    scale = min((size - 2 * margin) / span, 0.25 * size)  # une molécule d'un atome ne remplit pas tout
+    cx, cy = (max(xs) + min(xs)) / 2, (max(ys) + min(ys)) / 2
+
+    def px(a):
+        x, y = coords[a]
+        return size / 2 + (x - cx) * scale, size / 2 - (y - cy) * scale  # y vers le bas en SVG
+
+    stroke = max(0.8, scale * 0.055)
+    font = min(max(scale * 0.5, 7.0), 0.16 * size)
+    labels = {i: _label(mol, i, coords) for i in range(len(mol.atoms))}
+    out = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" width="{size}" height="{size}">',
+        f'<g stroke="{INK}" stroke-width="{stroke:.2f}" stroke-linecap="round" fill="none">',
+    ]
+
+    ring_of = {}
+    for ring in sorted(rings, key=len, reverse=True):
+        for a, b in zip(ring, ring[1:] + ring[:1]):
+            ring_of[(min(a, b), max(a, b))] = ring
+    aromatic_rings = [
+        r for r in rings
+        if all(mol.order(a, b) == AROMATIC_BOND for a, b in zip(r, r[1:] + r[:1]))
+    ]
+    circled = {(min(a, b), max(a, b)) for r in aromatic_rings for a, b in zip(r, r[1:] + r[:1])}
+
+    def line(p, q, dashed=False):
+        dash = ' stroke-dasharray="2,2"' if dashed else ""
+        out.append(f'<line x1="{p[0]:.1f}" y1="{p[1]:.1f}" x2="{q[0]:.1f}" y2="{q[1]:.1f}"{dash}/>')
+
+    gap = scale * 0.16
+    for (i, j), order in sorted(mol.bonds.items()):
+        p, q = px(i), px(j)
+        length = math.dist(p, q) or 1.0
+        ux, uy = (q[0] - p[0]) / length, (q[1] - p[1]) / length
+        # Liaison raccourcie au niveau des étiquettes
+        if labels[i]:
+            p = (p[0] + ux * font * 0.55, p[1] + uy * font * 0.55)
+        if labels[j]:
+            q = (q[0] - ux * font * 0.55, q[1] - uy * font * 0.55)
+        nx, ny = -uy, ux
+        ring = ring_of.get((i, j))
+        if order == 1 or (order == AROMATIC_BOND and (i, j) in circled):
+            line(p, q)
+        elif order in (2, AROMATIC_BOND) and ring:
+            # Trait intérieur, côté centre du cycle
+            center = _centroid(px(a) for a in ring)
+            side = 1 if (center[0] - p[0]) * nx + (center[1] - p[1]) * ny > 0 else -1
+            trim = 0.15 * math.dist(p, q)
+            line(p, q)
+            line((p[0] + side * gap * nx + ux * trim, p[1] + side * gap * ny + uy * trim),
+                 (q[0] + side * gap * nx - ux * trim, q[1] + side * gap * ny - uy * trim),
+                 dashed=order == AROMATIC_BOND)
+        elif order in (2, AROMATIC_BOND):
+            for side in (0.5, -0.5):
+                line((p[0] + side * gap * nx, p[1] + side * gap * ny), (q[0] + side * gap * nx, q[1] + side * gap * ny),
+                     dashed=order == AROMATIC_BOND and side < 0)
+        else:
+            for side in (1, 0, -1):
+                line((p[0] + side * gap * nx, p[1] + side * gap * ny), (q[0] + side * gap * nx, q[1] + side * gap * ny))
+
+    for ring in aromatic_rings:
+        points = [px(a) for a in ring]
+        center = _centroid(points)
+        inner = min(math.dist(center, ((a[0] + b[0]) / 2, (a[1] + b[1]) / 2))
+                    for a, b in zip(points, points[1:] + points[:1]))
+        out.append(f'<circle cx="{center[0]:.1f}" cy="{center[1]:.1f}" r="{0.62 * inner:.1f}"/>')
+    out.append("</g>")
+
+    out.append(f'<g font-family="Helvetica,Arial,sans-serif" font-size="{font:.1f}" text-anchor="middle" '
+               f'dominant-baseline="central" stroke="none">')
+    for i, label in labels.items():
+        if not label:
+            continue
+        element, h, h_left, charge = label
+        x, y = px(i)
+        color = COLORS.get(element, INK)
+        out.append(f'<text x="{x:.1f}" y="{y:.1f}" fill="{color}">{element}</text>')
+        width = 0.62 * font * len(element)
+        if h:
+            hx = x - width / 2 - 0.33 * font * len(h) if h_left else x + width / 2 + 0.33 * font * len(h)
+            digits = h[1:]
+            out.append(f'<text x="{hx:.1f}" y="{y:.1f}" fill="{color}">H'
+                       + (f'<tspan dy="{0.3 * font:.1f}" font-size="{0.7 * font:.1f}">{digits}</tspan>' if digits else "")
+                       + "</text>")
+        if charge:
+            out.append(f'<text x="{x + width / 2 + 0.25 * font:.1f}" y="{y - 0.45 * font:.1f}" '
+                       f'font-size="{0.7 * font:.1f}" fill="{color}">{charge}</text>')
+    out.append("</g></svg>")
+    return "".join(out)
+
+
+# ---------- Cache disque (LRU) ----------
+
+class DepictionCache:
+    """
+    SVG sur disque, un fichier par (structure, taille). La date de
+    modification sert d'horodatage LRU (rafraîchie à la lecture, au plus une
+    fois par minute) ; au-delà de DEPICTION_CACHE_MAX_BYTES, les fichiers les
+    plus anciens sont supprimés jusqu'à 90 % de la limite.
+    """
+    TOUCH_INTERVAL = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._size = None  # octets estimés (rescanné à chaque éviction)
+
+    def _path(self, key):
+        return os.path.join(settings.DEPICTION_CACHE_DIR, key[:2], f"{key}.svg")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as fh:
+                svg = fh.read()
+            if time.time() - os.stat(path).st_mtime > self.TOUCH_INTERVAL:
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        return svg
+
+    def put(self, key, svg):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(svg)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[0]
+            else:
+                self._size += len(svg)
+            if self._size > settings.DEPICTION_CACHE_MAX_BYTES:
+                self._evict()
+
+    def _scan(self):
+        total, files = 0, []
+        root = settings.DEPICTION_CACHE_DIR
+        for sub in os.scandir(root) if os.path.isdir(root) else ():
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".svg"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    total += st.st_size
+                    files.append((st.st_mtime, st.st_size, entry.path))
+        return total, files
+
+    def _evict(self):
+        total, files = self._scan()  # inclut les écritures des autres process
+        target = 0.9 * settings.DEPICTION_CACHE_MAX_BYTES
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._size = total
+
+
+cache = DepictionCache()
+
+
+def structure_key(smiles: str):
+    """(molécule canonique, clé de structure). Lève DepictionError."""
+    canon, key = canonicalize(parse_smiles(smiles))
+    return canon, hashlib.sha1(key.encode()).hexdigest()
+
+
+def render(mol: Molecule, size: int) -> str:
+    rings = find_rings(mol)
+    return render_svg(mol, compute_layout(mol, rings), rings, size)
+
+
+def depict(smiles: str, size: int):
+    """(clé de cache, SVG) ; rendu seulement si absent du cache. Lève DepictionError."""
+    mol, structure = structure_key(smiles)
+    key = hashlib.sha1(f"{STYLE_VERSION}|{size}|{structure}".encode()).hexdigest()
+    svg = cache.get(key)
+    metrics.cache_event("depiction", svg is not None)
+    if svg is None:
+        svg = render(mol, size)
+        cache.put(key, svg)
+    return key, svg
@@ -0,0 +1,68 @@
+# compounds/derived.py
+"""
+Données dérivées des composés (recalculables depuis les champs saisis).
+
+DERIVED : champ → (champs sources, fonction). Compound.save() les calcule
+ligne à ligne ; quand la méthode de calcul change, `recompute_compounds`
+les réapplique à toute la table par plages d'id (recompute_range).
+
+Seules les colonnes de Compound y figurent. Les empreintes structurales
+vivent dans CompoundFingerprint et se recalculent avec
+`build_related_compounds --rebuild` (compounds/related.py) ; les clés
+canoniques des dépictions ne sont pas stockées (calculées au rendu, le
+cache SVG est indexé dessus).
+"""
+from django.db import transaction
+
+from . import events
+from .chemistry import monoisotopic_mass
+from .models import Compound, CompoundChange
+
+DERIVED = {
+    "monoisotopic_mass": (("formula",), monoisotopic_mass),
+}
+
+
+def _same(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) <= 1e-9 * max(abs(a), abs(b), 1.0)
+    return a == b
+
+
+def recompute_range(lo: int, hi: int, fields) -> tuple:
+    """
+    Recalcule `fields` pour les composés d'id dans ]lo, hi] et n'écrit que
+    les lignes modifiées (bulk_update, une transaction). bulk_update ne
+    déclenche pas les signaux : les entrées du journal sont écrites ici, pour
+    que flux de changements, SSE et index de masse voient les nouvelles valeurs.
+    Retourne (lignes lues, lignes modifiées).
+    """
+    sources = sorted({src for f in fields for src in DERIVED[f][0]})
+    rows = Compound.objects.filter(id__gt=lo, id__lte=hi).values("id", "is_public", *sources, *fields)
+    changed = []
+    scanned = 0
+    for row in rows.iterator(chunk_size=2000):
+        scanned += 1
+        obj, dirty = Compound(id=row["id"], is_public=row["is_public"]), False
+        for field in fields:
+            args, func = DERIVED[field]
+            value = func(*(row[a] for a in args))
+            setattr(obj, field, value)
+            dirty = dirty or not _same(value, row[field])
+        if dirty:
+            changed.append(obj)
+    if changed:
+        with transaction.atomic():
+            Compound.objects.bulk_update(changed, list(fields), batch_size=1000)
+            seen_public = set(CompoundChange.objects.filter(
+                compound_id__in=[c.pk for c in changed if not c.is_public], ever_public=True,
+            ).values_list("compound_id", flat=True))
+            entries = CompoundChange.objects.bulk_create([
+                CompoundChange(compound_id=c.pk, action=CompoundChange.UPDATED, is_public=c.is_public,
+                               ever_public=c.is_public or c.pk in seen_public)
+                for c in changed
+            ], batch_size=1000)
+            for entry in entries:
+                if entry.pk is not None:
+                    events.publish(entry)
+    return scanned, len(changed)
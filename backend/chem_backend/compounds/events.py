@@ -0,0 +1,359 @@
+# compounds/events.py
+"""
+Diffusion en direct des créations / modifications / suppressions de composés
+(endpoint SSE /api/compounds/events/).
+
+Chaque connexion SSE est une coroutine qui attend sur sa propre asyncio.Queue :
+aucune ne monopolise de thread, des milliers de connexions inactives tiennent
+dans un seul process ASGI.
+
+Deux backends (COMPOUND_EVENTS_BACKEND) :
+- "local"    : diffusion dans le process, après commit. Suffisant pour un
+               seul worker (runserver, uvicorn sans --workers).
+- "postgres" : NOTIFY dans la transaction de l'écriture (livré au commit, rien
+               si rollback) ; chaque process ouvre une seule connexion LISTEN
+               et relaie à ses abonnés. Requiert psycopg 3.
+
+Format : event "compound" = une entrée de /api/compounds/changes/, avec le
+jeton du journal CompoundChange comme `id` SSE. À la reconnexion, le
+navigateur renvoie Last-Event-ID et les changements manqués sont rejoués
+depuis le journal ; s'il y en a trop (ou si le client est trop lent),
+event "resync" : le client repasse par /changes/. Non connecté : seuls les
+composés publics (un composé devenu privé arrive comme tombstone, un composé
+jamais public n'est pas annoncé).
+
+En ASGI, asgi.py route l'URL vers `sse_endpoint`, hors de la pile Django :
+les middlewares synchrones réserveraient sinon un thread par requête pour
+toute la durée du flux.
+"""
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.db import close_old_connections, connection, transaction
+from django.http import parse_cookie
+
+from .models import Compound, CompoundChange
+
+logger = logging.getLogger(__name__)
+
+
+def backend_name() -> str:
+    return getattr(settings, "COMPOUND_EVENTS_BACKEND", "local")
+
+
+def channel_name() -> str:
+    return getattr(settings, "COMPOUND_EVENTS_CHANNEL", "compound_events")
+
+
+# ---------- Messages ----------
+
+def sse_frame(data, event=None, event_id=None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+def change_frame(change: dict) -> str:
+    """Une entrée au format de /changes/ → trame SSE."""
+    return sse_frame(change, event="compound", event_id=change["token"])
+
+
+def build_frames(event: dict):
+    """
+    Prépare, une seule fois par événement, la trame pour les abonnés connectés
+    et celle pour les anonymes (None = rien à leur envoyer).
+    `event` : {"token", "action", "id", "is_public", "ever_public"}.
+    Anonymes : tombstone seulement si le composé a déjà été public
+    (CompoundChange.ever_public), sinon son id n'a jamais été exposé.
+    """
+    from .views import serialize_compound
+
+    tombstone = {"token": event["token"], "action": CompoundChange.DELETED, "id": event["id"]}
+    anon_tombstone = event.get("ever_public", False)
+    comp = None
+    if event["action"] != CompoundChange.DELETED:
+        comp = Compound.objects.select_related("owner").filter(pk=event["id"]).first()
+    if comp is None:
+        # Supprimé (éventuellement entre l'écriture et ici)
+        frame = change_frame(tombstone)
+        return frame, (frame if anon_tombstone else None)
+
+    full = change_frame({"token": event["token"], "action": event["action"], "id": comp.id,
+                         "compound": serialize_compound(comp)})
+    if comp.is_public:
+        return full, full
+    # Devenu privé : tombstone pour les anonymes ; jamais public : rien
+    return full, (change_frame(tombstone) if anon_tombstone else None)
+
+
+# ---------- Abonnés ----------
+
+class Subscriber:
+    """Une connexion SSE. Toutes les méthodes tournent dans la boucle de l'abonné."""
+
+    def __init__(self, authenticated: bool, maxsize: int):
+        self.loop = asyncio.get_running_loop()
+        self.authenticated = authenticated
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def push(self, full, anon):
+        frame = full if self.authenticated else anon
+        if frame is None or self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Client trop lent : on le déconnecte plutôt que de bufferiser sans fin
+            self.overflowed = True
+
+
+class Broker:
+    """Abonnés du process, regroupés par boucle d'événements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_loop = {}
+        self._listeners = {}
+        self._worker = None
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._by_loop.values())
+
+    def subscribe(self, sub: Subscriber):
+        with self._lock:
+            self._by_loop.setdefault(sub.loop, set()).add(sub)
+        if backend_name() == "postgres":
+            self._ensure_listener(sub.loop)
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            subs = self._by_loop.get(sub.loop)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_loop[sub.loop]
+
+    def dispatch(self, full, anon):
+        """Relaie une trame à tous les abonnés (appelable depuis n'importe quel thread)."""
+        with self._lock:
+            targets = [(loop, list(subs)) for loop, subs in self._by_loop.items()]
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, subs in targets:
+            if loop is current:
+                _fanout(subs, full, anon)
+            elif not loop.is_closed():
+                # Un seul callback par boucle, quel que soit le nombre d'abonnés
+                loop.call_soon_threadsafe(_fanout, subs, full, anon)
+
+    def dispatch_event(self, event: dict):
+        """
+        Backend local : appelé après commit dans le thread de l'écriture.
+        build_frames (lecture + sérialisation) part dans un thread dédié pour ne
+        pas retarder la réponse ; un seul thread, donc les événements restent
+        dans l'ordre du journal.
+        """
+        if not len(self):
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compound-events")
+        self._worker.submit(self._build_and_dispatch, event)
+
+    def _build_and_dispatch(self, event: dict):
+        try:
+            self.dispatch(*build_frames(event))
+        except Exception:
+            logger.exception("Compound event %r could not be dispatched", event)
+        finally:
+            close_old_connections()
+
+    # -- Backend postgres --
+
+    def _ensure_listener(self, loop):
+        with self._lock:
+            task = self._listeners.get(loop)
+            if task is not None and not task.done():
+                return
+            self._listeners[loop] = loop.create_task(self._listen())
+
+    async def _listen(self):
+        """Une connexion LISTEN par process ; reconnexion avec backoff."""
+        import psycopg
+        from psycopg import sql
+
+        db = settings.DATABASES["default"]
+        delay = 1.0
+        while True:
+            try:
+                conn = await psycopg.AsyncConnection.connect(
+                    dbname=db["NAME"], user=db.get("USER") or None, password=db.get("PASSWORD") or None,
+                    host=db.get("HOST") or None, port=db.get("PORT") or None, autocommit=True,
+                )
+                async with conn:
+                    await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel_name())))
+                    delay = 1.0
+                    async for notify in conn.notifies():
+                        try:
+                            frames = await sync_to_async(build_frames)(json.loads(notify.payload))
+                        except Exception:
+                            logger.exception("Invalid compound event %r", notify.payload)
+                            continue
+                        self.dispatch(*frames)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Compound events listener failed, reconnecting in %.0fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+
+def _fanout(subs, full, anon):
+    for sub in subs:
+        sub.push(full, anon)
+
+
+broker = Broker()
+
+
+# ---------- Publication (appelée depuis compounds/signals.py) ----------
+
+def publish(entry: CompoundChange):
+    """
+    Publie une entrée du journal. À appeler dans la transaction de l'écriture :
+    l'événement n'est émis qu'au commit.
+    """
+    event = {"token": entry.id, "action": entry.action, "id": entry.compound_id,
+             "is_public": entry.is_public, "ever_public": entry.ever_public}
+    if backend_name() == "postgres":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [channel_name(), json.dumps(event)])
+    elif len(broker):
+        transaction.on_commit(lambda: broker.dispatch_event(event))
+
+
+# ---------- Flux SSE ----------
+
+def parse_since(value):
+    """Last-Event-ID / ?since= → jeton (None si absent). ValueError si invalide."""
+    return max(0, int(value)) if value else None
+
+
+async def event_stream(authenticated: bool, since=None):
+    """Générateur des trames SSE d'une connexion."""
+    from .views import changes_since
+
+    sub = Subscriber(authenticated, settings.SSE_QUEUE_SIZE)
+    # Abonnement avant le rattrapage : rien ne se perd entre les deux
+    broker.subscribe(sub)
+    try:
+        yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+        if since is not None:
+            changes, _, has_more = await sync_to_async(changes_since)(
+                since, settings.SSE_REPLAY_LIMIT, authenticated, settle=False,
+            )
+            if has_more:
+                yield sse_frame({"since": since}, event="resync")
+                return
+            for change in changes:
+                yield change_frame(change)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.SSE_MAX_AGE_SECONDS
+        while not sub.overflowed:
+            timeout = min(settings.SSE_HEARTBEAT_SECONDS, deadline - loop.time())
+            if timeout <= 0:
+                # Fin de vie : le navigateur se reconnecte (authentification revérifiée)
+                return
+            try:
+                yield await asyncio.wait_for(sub.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+        yield sse_frame({}, event="resync")
+    finally:
+        broker.unsubscribe(sub)
+
+
+async def resolve_user(cookie_header):
+    """Utilisateur de la session (cookie), sans passer par les middlewares."""
+    session_key = parse_cookie(cookie_header or "").get(settings.SESSION_COOKIE_NAME)
+    store = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    return await aget_user(SimpleNamespace(session=store))
+
+
+def _cors_headers(origin):
+    if origin and origin in getattr(settings, "CORS_ALLOWED_ORIGINS", []):
+        headers = [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+        if getattr(settings, "CORS_ALLOW_CREDENTIALS", False):
+            headers.append((b"access-control-allow-credentials", b"true"))
+        return headers
+    return []
+
+
+async def _send_json(send, status, data, headers=()):
+    body = json.dumps(data).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def sse_endpoint(scope, receive, send):
+    """Application ASGI de /api/compounds/events/ (montée dans asgi.py)."""
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    cors = _cors_headers(headers.get("origin"))
+    if scope["method"] != "GET":
+        return await _send_json(send, 405, {"error": "Method not allowed"}, [(b"allow", b"GET"), *cors])
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    try:
+        since = parse_since(headers.get("last-event-id") or query.get("since", [None])[0])
+    except ValueError:
+        return await _send_json(send, 400, {"error": "Invalid Last-Event-ID"}, cors)
+    if len(broker) >= settings.SSE_MAX_CONNECTIONS:
+        return await _send_json(send, 503, {"error": "Too many event streams, retry later"},
+                                [(b"retry-after", b"5"), *cors])
+
+    user = await resolve_user(headers.get("cookie"))
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+        *cors,
+    ]})
+
+    async def stream():
+        async for chunk in event_stream(user.is_authenticated, since):
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    # Le flux s'arrête dès que le client se déconnecte (pas au prochain ping)
+    tasks = [asyncio.ensure_future(stream()), asyncio.ensure_future(disconnected())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for task in done:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
@@ -0,0 +1,348 @@
+# compounds/export.py
+"""
+Export colonnaire des propriétés des composés (analyse : pandas, NumPy, Arrow).
+
+Formats :
+- "npz"     : archive NumPy, écrite sans dépendre de NumPy côté serveur
+              (format .npy documenté). Une entrée par colonne ; les chaînes
+              sont une table (offsets int64 + octets UTF-8) :
+                  d = np.load("compounds.npz")
+                  o, b = d["name.offsets"], d["name.data"].tobytes()
+                  names = [b[o[i]:o[i + 1]].decode() for i in range(len(o) - 1)]
+- "arrow"   : Arrow IPC (fichier), si pyarrow est installé.
+- "parquet" : Parquet, si pyarrow est installé.
+
+Les lignes sont lues par lots (itérateur serveur) et écrites au fil de l'eau.
+Le fichier est mis en cache sur disque (EXPORT_CACHE_DIR) sous une clé
+dérivée du dernier jeton du journal CompoundChange (écrit à chaque
+création, modification ou suppression). Tant que rien ne change, les
+téléchargements relisent le même fichier.
+
+Après une modification du catalogue, une requête ne reconstruit pas
+l'export elle-même : elle sert la version précédente (son ETag) et confie la
+reconstruction à un thread du process, une seule à la fois par format et
+portée. Seul le tout premier export (aucun fichier) est construit dans la
+requête ; `export_compounds` le prépare depuis le déploiement ou un cron.
+"""
+import array
+import hashlib
+import logging
+import os
+import struct
+import sys
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max
+
+from chem_backend import metrics
+
+from .models import Compound, CompoundChange
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# (colonne, type) ; "str" = table de chaînes, "ts" = datetime64[us] UTC
+COLUMNS = [
+    ("id", "i8"),
+    ("name", "str"),
+    ("formula", "str"),
+    ("smiles", "str"),
+    ("molecular_weight", "f8"),
+    ("monoisotopic_mass", "f8"),
+    ("is_public", "bool"),
+    ("owner_id", "i8"),
+    ("created_at", "ts"),
+    ("updated_at", "ts"),
+]
+
+FORMATS = {
+    "npz": ("application/zip", "npz"),
+    "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+NAT = -(2 ** 63)  # valeur "Not a Time" de NumPy
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+_LOCKS_GUARD = threading.Lock()
+_build_locks = {}
+_pending = set()  # reconstructions en attente ou en cours : (format, public_only)
+_refresher = None  # ThreadPoolExecutor, créé au premier export périmé
+
+
+class ExportUnavailable(Exception):
+    """Format demandé mais dépendance absente (pyarrow)."""
+
+
+def available_formats():
+    return [f for f in FORMATS if f == "npz" or pyarrow is not None]
+
+
+def scoped_queryset(public_only: bool):
+    qs = Compound.objects.all()
+    return qs.filter(is_public=True) if public_only else qs
+
+
+def catalog_version(public_only: bool) -> str:
+    """
+    Clé de cache : colonnes + portée + dernier jeton du journal CompoundChange.
+    Toute écriture (création, modification, suppression, propriétés dérivées)
+    fait avancer le journal : MAX(id) se lit sur la clé primaire, sans
+    parcourir la table des composés.
+    """
+    token = CompoundChange.objects.aggregate(m=Max("id"))["m"] or 0
+    schema = ",".join(name for name, _ in COLUMNS)
+    raw = f"{schema}|{'public' if public_only else 'all'}|{token}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _micros(dt):
+    if dt is None:
+        return NAT
+    return (dt - EPOCH) // MICROSECOND  # entier exact (pas de float)
+
+
+def iter_batches(public_only: bool, batch_size: int):
+    """Lots de lignes (listes de tuples dans l'ordre de COLUMNS), triés par id."""
+    qs = scoped_queryset(public_only).order_by("id").values_list(*[c for c, _ in COLUMNS])
+    batch = []
+    for row in qs.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------- NPZ (sans NumPy) ----------
+
+def _npy_header(descr: str, length: int) -> bytes:
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({length},), }}"
+    # Magic (6) + version (2) + longueur (2) + en-tête, aligné sur 64 octets
+    pad = 64 - (10 + len(header) + 1) % 64
+    header = header + " " * pad + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin-1")
+
+
+def _le(arr: array.array) -> bytes:
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+class _Column:
+    """Colonne accumulée dans un fichier temporaire (pas de tableau complet en mémoire)."""
+
+    def __init__(self, name, kind, tmpdir):
+        self.name, self.kind, self.length = name, kind, 0
+        self.file = tempfile.TemporaryFile(dir=tmpdir)
+        if kind == "str":
+            self.offsets = tempfile.TemporaryFile(dir=tmpdir)
+            self.offset = 0
+            self.offsets.write(_le(array.array("q", [0])))
+
+    def extend(self, values):
+        self.length += len(values)
+        if self.kind == "str":
+            ends = array.array("q")
+            for v in values:
+                data = (v or "").encode("utf-8")
+                self.file.write(data)
+                self.offset += len(data)
+                ends.append(self.offset)
+            self.offsets.write(_le(ends))
+        elif self.kind == "f8":
+            self.file.write(_le(array.array("d", [float("nan") if v is None else v for v in values])))
+        elif self.kind == "bool":
+            self.file.write(bytes(1 if v else 0 for v in values))
+        elif self.kind == "ts":
+            self.file.write(_le(array.array("q", [_micros(v) for v in values])))
+        else:
+            self.file.write(_le(array.array("q", values)))
+
+    def entries(self):
+        """(nom d'entrée, descr, longueur, fichier) pour l'archive."""
+        if self.kind == "str":
+            return [
+                (f"{self.name}.offsets", "<i8", self.length + 1, self.offsets),
+                (f"{self.name}.data", "|u1", self.offset, self.file),
+            ]
+        descr = {"f8": "<f8", "bool": "|b1", "ts": "<M8[us]", "i8": "<i8"}[self.kind]
+        return [(self.name, descr, self.length, self.file)]
+
+    def close(self):
+        self.file.close()
+        if self.kind == "str":
+            self.offsets.close()
+
+
+def write_npz(path, public_only: bool, batch_size: int):
+    tmpdir = os.path.dirname(path)
+    columns = [_Column(name, kind, tmpdir) for name, kind in COLUMNS]
+    try:
+        for batch in iter_batches(public_only, batch_size):
+            for i, col in enumerate(columns):
+                col.extend([row[i] for row in batch])
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=settings.EXPORT_ZIP_LEVEL) as zf:
+            for col in columns:
+                for entry, descr, length, fh in col.entries():
+                    fh.seek(0)
+                    with zf.open(f"{entry}.npy", "w", force_zip64=True) as out:
+                        out.write(_npy_header(descr, length))
+                        while chunk := fh.read(1 << 20):
+                            out.write(chunk)
+    finally:
+        for col in columns:
+            col.close()
+
+
+# ---------- Arrow / Parquet ----------
+
+def _arrow_schema():
+    types = {
+        "i8": pyarrow.int64(), "str": pyarrow.string(), "f8": pyarrow.float64(),
+        "bool": pyarrow.bool_(), "ts": pyarrow.timestamp("us", tz="UTC"),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+
+def _arrow_batches(public_only, batch_size, schema):
+    for batch in iter_batches(public_only, batch_size):
+        arrays = [pyarrow.array([row[i] for row in batch], type=schema.field(i).type)
+                  for i in range(len(COLUMNS))]
+        yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_arrow(path, public_only: bool, batch_size: int):
+    schema = _arrow_schema()
+    with pyarrow.OSFile(path, "wb") as sink, pyarrow.ipc.new_file(sink, schema) as writer:
+        for rb in _arrow_batches(public_only, batch_size, schema):
+            writer.write_batch(rb)
+
+
+def write_parquet(path, public_only: bool, batch_size: int):
+    schema = _arrow_schema()
+    with pyarrow.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        for rb in _arrow_batches(public_only, batch_size, schema):
+            writer.write_batch(rb)
+
+
+WRITERS = {"npz": write_npz, "arrow": write_arrow, "parquet": write_parquet}
+
+
+# ---------- Cache disque ----------
+
+def _export_path(fmt, scope, version) -> str:
+    return os.path.join(settings.EXPORT_CACHE_DIR, f"compounds-{scope}-{version}.{FORMATS[fmt][1]}")
+
+
+def _cached(fmt, scope):
+    """Fichiers d'export existants pour ce format et cette portée, du plus récent au plus ancien."""
+    prefix, suffix = f"compounds-{scope}-", "." + FORMATS[fmt][1]
+    try:
+        names = os.listdir(settings.EXPORT_CACHE_DIR)
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in names:
+        if name.startswith(prefix) and name.endswith(suffix):
+            full = os.path.join(settings.EXPORT_CACHE_DIR, name)
+            try:
+                found.append((os.stat(full).st_mtime, full, name[len(prefix):-len(suffix)]))
+            except FileNotFoundError:
+                pass
+    return [(full, version) for _, full, version in sorted(found, reverse=True)]
+
+
+def get_export(fmt: str, public_only: bool, wait: bool = False):
+    """
+    Chemin du fichier d'export et sa version. Si le catalogue a changé depuis
+    le dernier export, sert ce dernier et lance la reconstruction en arrière-
+    plan ; `wait=True` (commande) attend la version à jour.
+    Lève ExportUnavailable si le format n'est pas disponible.
+    """
+    if fmt not in available_formats():
+        raise ExportUnavailable(f"Format '{fmt}' unavailable (available: {', '.join(available_formats())})")
+    scope = "public" if public_only else "all"
+    version = catalog_version(public_only)
+    path = _export_path(fmt, scope, version)
+    if os.path.exists(path):
+        metrics.cache_event("export", True)
+        return path, version
+
+    metrics.cache_event("export", False)
+    if not wait:
+        previous = _cached(fmt, scope)
+        if previous:
+            _schedule_rebuild(fmt, public_only)
+            return previous[0]
+    return build(fmt, public_only, version)
+
+
+def build(fmt: str, public_only: bool, version=None):
+    """Construit l'export de la version courante s'il n'existe pas encore ; retourne (chemin, version)."""
+    scope = "public" if public_only else "all"
+    if version is None:
+        version = catalog_version(public_only)
+    path = _export_path(fmt, scope, version)
+    with _LOCKS_GUARD:
+        lock = _build_locks.setdefault((fmt, scope), threading.Lock())
+    with lock:  # une seule construction par format/portée dans le process
+        if os.path.exists(path):
+            return path, version
+        directory = settings.EXPORT_CACHE_DIR
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+        os.close(fd)
+        try:
+            WRITERS[fmt](tmp, public_only, settings.EXPORT_BATCH_SIZE)
+            os.replace(tmp, path)  # atomique : jamais de fichier à moitié écrit
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        _remove_stale(fmt, scope, keep=path)
+    return path, version
+
+
+def _schedule_rebuild(fmt, public_only):
+    global _refresher
+    with _LOCKS_GUARD:
+        if (fmt, public_only) in _pending:
+            return
+        _pending.add((fmt, public_only))
+        if _refresher is None:
+            _refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-rebuild")
+    _refresher.submit(_rebuild, fmt, public_only)
+
+
+def _rebuild(fmt, public_only):
+    try:
+        build(fmt, public_only)
+    except Exception:
+        logger.exception("Export %s (public_only=%s) could not be rebuilt", fmt, public_only)
+    finally:
+        with _LOCKS_GUARD:
+            _pending.discard((fmt, public_only))
+        close_old_connections()
+
+
+def _remove_stale(fmt, scope, keep):
+    """Garde `keep` et la version précédente, peut-être en cours de téléchargement."""
+    for full, _ in [item for item in _cached(fmt, scope) if item[0] != keep][1:]:
+        try:
+            os.remove(full)
+        except OSError:
+            pass  # encore ouvert en lecture (Windows) : nettoyé au prochain export
@@ -0,0 +1,196 @@
+# compounds/indexfile.py
+"""
+Fichiers d'index de recherche partagés entre workers (mmap, lecture seule).
+
+Format (little-endian) :
+
+    "CHEMIDX1"            8 octets
+    longueur de l'en-tête u32
+    en-tête JSON          {"format": 1, "kind", "token", "count", "built_at",
+                           "columns": {nom: {"type", "offset", "length"}}}
+    colonnes              tableaux bruts alignés sur 64 octets
+
+Types de colonnes : codes du module array ("d" float64, "q" int64, "B" uint8).
+Les lecteurs obtiennent des vues sans copie sur le mapping (memoryview, ou
+np.frombuffer si NumPy est là) : les pages viennent du cache de l'OS et ne
+sont chargées qu'une fois pour tous les processus.
+
+Versionnage : un fichier par type d'index (<kind>.idx), remplacé par
+os.replace() (atomique). Les processus qui ont encore l'ancien fichier
+mappé le gardent jusqu'à ce qu'ils voient le nouveau (inode / mtime
+différents) : bascule sans redémarrage ni fichier à moitié écrit.
+"""
+import json
+import mmap
+import os
+import sys
+import tempfile
+import time
+from array import array
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+MAGIC = b"CHEMIDX1"
+FORMAT = 1
+ALIGN = 64
+ITEMSIZE = {"d": 8, "q": 8, "B": 1}
+NUMPY_DTYPES = {"d": "<f8", "q": "<i8", "B": "u1"}
+
+
+class IndexFileError(Exception):
+    """Fichier absent, tronqué ou d'un format inconnu."""
+
+
+def index_path(kind: str) -> str:
+    return os.path.join(settings.SEARCH_INDEX_DIR, f"{kind}.idx")
+
+
+def _stamp(st):
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def file_stamp(path):
+    """Identité de la version sur disque (None si absent) : change à chaque os.replace."""
+    try:
+        return _stamp(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _raw(values, typecode) -> bytes:
+    if np is not None and isinstance(values, np.ndarray):
+        return values.astype(NUMPY_DTYPES[typecode], copy=False).tobytes()
+    if isinstance(values, (bytes, bytearray, memoryview)):
+        return bytes(values)
+    arr = values if isinstance(values, array) else array(typecode, values)
+    if sys.byteorder != "little":
+        arr = array(typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def write_index(path, kind: str, token: int, columns: dict):
+    """
+    Écrit un index. `columns` : {nom: (type, valeurs)} de même longueur.
+    Écriture dans un fichier temporaire du même dossier puis os.replace().
+    """
+    raws = {name: (typecode, _raw(values, typecode)) for name, (typecode, values) in columns.items()}
+    counts = {len(raw) // ITEMSIZE[t] for t, raw in raws.values()}
+    if len(counts) > 1:
+        raise ValueError("Index columns must have the same length")
+
+    header = {"format": FORMAT, "kind": kind, "token": token, "count": counts.pop() if counts else 0,
+              "built_at": time.time(), "columns": {}}
+    # Deux passes : la taille de l'en-tête dépend des offsets, qui en dépendent
+    offset = 0
+    for _ in range(2):
+        encoded = json.dumps(header).encode()
+        offset = _align(len(MAGIC) + 4 + len(encoded) + 64)  # marge pour la 2e passe
+        for name, (typecode, raw) in raws.items():
+            header["columns"][name] = {"type": typecode, "offset": offset, "length": len(raw) // ITEMSIZE[typecode]}
+            offset = _align(offset + len(raw))
+    encoded = json.dumps(header).encode()
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(MAGIC + len(encoded).to_bytes(4, "little") + encoded)
+            for name, (typecode, raw) in raws.items():
+                fh.seek(header["columns"][name]["offset"])
+                fh.write(raw)
+            fh.truncate(offset)  # taille finale = fin alignée de la dernière colonne
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return header
+
+
+class IndexFile:
+    """Index mappé en lecture seule. Les colonnes sont des vues sans copie."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            self.stamp = _stamp(os.fstat(fh.fileno()))  # version réellement ouverte
+            try:
+                self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise IndexFileError(f"{path}: empty file")
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise IndexFileError(f"{path}: not an index file")
+        length = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 4], "little")
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mmap[start:start + length])
+        if self.header.get("format") != FORMAT:
+            raise IndexFileError(f"{path}: unsupported format {self.header.get('format')}")
+        for name, col in self.header["columns"].items():
+            if col["offset"] + col["length"] * ITEMSIZE[col["type"]] > len(self._mmap):
+                raise IndexFileError(f"{path}: column '{name}' truncated")
+
+    @property
+    def token(self) -> int:
+        return self.header["token"]
+
+    def column(self, name):
+        col = self.header["columns"][name]
+        typecode, offset, length = col["type"], col["offset"], col["length"]
+        if np is not None:
+            return np.frombuffer(self._mmap, dtype=NUMPY_DTYPES[typecode], count=length, offset=offset)
+        if sys.byteorder != "little":  # pragma: no cover - copie retournée
+            arr = array(typecode, self._mmap[offset:offset + length * ITEMSIZE[typecode]])
+            arr.byteswap()
+            return arr
+        view = memoryview(self._mmap)[offset:offset + length * ITEMSIZE[typecode]]
+        return view.cast(typecode)
+
+
+class BuildLock:
+    """
+    Verrou inter-processus (flock) autour d'une reconstruction : un seul
+    process réécrit l'index, les autres continuent avec leur version.
+    `timeout` (secondes) : attendre le verrou au lieu d'abandonner tout de suite.
+    """
+
+    def __init__(self, kind: str, timeout: float = 0):
+        self.path = index_path(kind) + ".lock"
+        self.timeout = timeout
+        self.fh = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fh = open(self.path, "a+")
+        if fcntl is None:
+            return True
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self.fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.1)
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fh, fcntl.LOCK_UN)
+        self.fh.close()
@@ -0,0 +1,80 @@
+# compounds/management/commands/bench_api.py
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from chem_backend.bench import SCENARIOS, run_benchmark
+from compounds.synthetic import BENCH_ADMIN_EMAIL, BENCH_PASSWORD
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the API endpoints and report throughput and p50/p95/p99 latency as JSON. "
+        "Run `seed_compounds` first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                            help=f"Comma-separated list among: {', '.join(SCENARIOS)}")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario.")
+        parser.add_argument("--requests", type=int, default=None,
+                            help="Stop each scenario after this many requests.")
+        parser.add_argument("--base-url", default=None,
+                            help="Benchmark a running server over HTTP (default: in-process client).")
+        parser.add_argument("--user-email", default="bench-1@example.com")
+        parser.add_argument("--admin-email", default=BENCH_ADMIN_EMAIL)
+        parser.add_argument("--password", default=BENCH_PASSWORD)
+        parser.add_argument("--max-offset", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--label", default="", help="Free-form label (release, commit...).")
+        parser.add_argument("--output", default=None, help="Write JSON results to this file.")
+        parser.add_argument("--no-shed", action="store_true",
+                            help="Disable LoadSheddingMiddleware (in-process only): measure raw capacity "
+                                 "instead of the per-client rate limits.")
+
+    def handle(self, *args, **opts):
+        scenarios = [s.strip() for s in opts["scenarios"].split(",") if s.strip()]
+        unknown = [s for s in scenarios if s not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        kwargs = {}
+        if opts["base_url"]:
+            kwargs["user_credentials"] = {"email": opts["user_email"], "password": opts["password"]}
+            kwargs["admin_credentials"] = {"email": opts["admin_email"], "password": opts["password"]}
+        else:
+            try:
+                kwargs["user"] = User.objects.get(email=opts["user_email"])
+                kwargs["admin"] = User.objects.get(email=opts["admin_email"])
+            except User.DoesNotExist:
+                raise CommandError("Benchmark users not found: run `manage.py seed_compounds` first.")
+
+        with override_settings(**({"SHED_ENABLED": False} if opts["no_shed"] else {})):
+            results = run_benchmark(
+                scenarios,
+                concurrency=opts["concurrency"],
+                duration=opts["duration"],
+                max_requests=opts["requests"],
+                base_url=opts["base_url"],
+                max_offset=opts["max_offset"],
+                seed=opts["seed"],
+                label=opts["label"],
+                **kwargs,
+            )
+
+        payload = json.dumps(results, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w") as fh:
+                fh.write(payload)
+            for name, r in results["endpoints"].items():
+                self.stdout.write(
+                    f"{name:16} {r['throughput_rps']:>9.1f} req/s  "
+                    f"p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms  errors {r['errors']}"
+                )
+        else:
+            self.stdout.write(payload)
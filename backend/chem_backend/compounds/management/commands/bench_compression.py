@@ -0,0 +1,150 @@
+# compounds/management/commands/bench_compression.py
+import json
+import random
+import re
+import statistics
+import time
+import zlib
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from chem_backend import compression
+from compounds.models import Compound
+
+User = get_user_model()
+
+# Niveaux mesurés par encodage (les niveaux retenus sont dans COMPRESSION_LEVELS)
+GRID = {"gzip": [1, 5, 6, 9], "br": [1, 4, 6, 11], "zstd": [1, 3, 6, 19]}
+
+
+def _decompressor(encoding):
+    if encoding == "gzip":
+        return lambda data: zlib.decompress(data, 31)
+    if encoding == "br":
+        return compression.brotli.decompress
+    return lambda data: compression.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def molfile_block(comp, rng):
+    """Bloc SDF approximatif (atomes de la formule, coordonnées aléatoires)."""
+    atoms = []
+    for symbol, n in re.findall(r"([A-Z][a-z]?)(\d*)", comp.formula or ""):
+        atoms += [symbol] * int(n or 1)
+    lines = [comp.name, "  bench", "", f"{len(atoms):>3}  0  0  0  0  0  0  0  0  0999 V2000"]
+    for symbol in atoms:
+        x, y = rng.uniform(-5, 5), rng.uniform(-5, 5)
+        lines.append(f"{x:>10.4f}{y:>10.4f}{0:>10.4f} {symbol:<3} 0  0  0  0  0  0  0  0  0  0  0  0")
+    lines += ["M  END", f">  <SMILES>\n{comp.smiles}\n", "$$$$"]
+    return "\n".join(lines)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure bytes saved vs CPU cost of gzip/brotli/zstd on representative payloads "
+        "(API JSON, structure files, already-compressed data) and the end-to-end cost of "
+        "CompressionMiddleware. Run `seed_compounds` first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="Rows per JSON page / SDF records.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Requests per encoding for the end-to-end middleware run.")
+        parser.add_argument("--output", default=None, help="Write JSON results to this file.")
+
+    def handle(self, *args, **opts):
+        payloads = self.build_payloads(opts["limit"])
+        encodings = compression.available_encodings()
+        missing = sorted(set(GRID) - set(encodings))
+        if missing:
+            self.stderr.write(f"Not installed, skipped: {', '.join(missing)}")
+
+        rows = []
+        for name, data in payloads.items():
+            for encoding in encodings:
+                for level in GRID[encoding]:
+                    rows.append(self.measure(name, data, encoding, level, opts["repeat"]))
+        results = {
+            "encodings": encodings,
+            "payloads": rows,
+            "middleware": self.end_to_end(encodings, opts["limit"], opts["requests"]),
+        }
+
+        self.stdout.write(f"{'payload':18} {'enc':5} {'lvl':>3} {'raw':>9} {'out':>9} "
+                          f"{'saved':>6} {'comp ms':>8} {'MB/s':>7} {'dec ms':>7}")
+        for r in rows:
+            self.stdout.write(
+                f"{r['payload']:18} {r['encoding']:5} {r['level']:>3} {r['raw_bytes']:>9} "
+                f"{r['compressed_bytes']:>9} {r['saved_pct']:>5.1f}% {r['compress_ms']:>8.2f} "
+                f"{r['compress_mb_s']:>7.1f} {r['decompress_ms']:>7.2f}"
+            )
+        self.stdout.write("\nEnd-to-end (GET /api/compounds/public/ through the middleware):")
+        for r in results["middleware"]:
+            self.stdout.write(
+                f"  {r['encoding']:9} {r['bytes']:>9} bytes  mean {r['mean_ms']:.2f} ms  p95 {r['p95_ms']:.2f} ms"
+            )
+        if opts["output"]:
+            with open(opts["output"], "w") as fh:
+                json.dump(results, fh, indent=2)
+
+    def build_payloads(self, limit):
+        client = Client(HTTP_HOST="localhost")
+        payloads = {"compounds_json": client.get(f"/api/compounds/public/?limit={limit}").content}
+
+        admin = User.objects.filter(is_active=True, is_staff=True).first()
+        if admin is not None:
+            client.force_login(admin)
+            payloads["admin_users_json"] = client.get(f"/api/admin/users/?limit={limit}").content
+
+        rng = random.Random(0)
+        compounds = Compound.objects.order_by("id")[:limit]
+        payloads["structure_sdf"] = "\n".join(molfile_block(c, rng) for c in compounds).encode()
+        # Recompresser un fichier déjà compressé : coût CPU sans gain (le middleware l'évite)
+        payloads["already_gzipped"] = zlib.compress(payloads["structure_sdf"], 6, 31)
+        return payloads
+
+    def measure(self, name, data, encoding, level, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            out = compression.compress_bytes(data, encoding, level)
+            timings.append(time.process_time() - start)
+        decompress = _decompressor(encoding)
+        dec = []
+        for _ in range(repeat):
+            start = time.process_time()
+            decompress(out)
+            dec.append(time.process_time() - start)
+        comp_s = statistics.median(timings)
+        return {
+            "payload": name,
+            "encoding": encoding,
+            "level": level,
+            "raw_bytes": len(data),
+            "compressed_bytes": len(out),
+            "saved_pct": round(100 * (1 - len(out) / len(data)), 1) if data else 0.0,
+            "compress_ms": round(comp_s * 1000, 3),
+            "compress_mb_s": round(len(data) / comp_s / 1e6, 1) if comp_s else float("inf"),
+            "decompress_ms": round(statistics.median(dec) * 1000, 3),
+        }
+
+    def end_to_end(self, encodings, limit, requests):
+        results = []
+        for encoding in ["identity", *encodings]:
+            client = Client(HTTP_HOST="localhost", HTTP_ACCEPT_ENCODING=encoding)
+            latencies, size = [], 0
+            for i in range(requests):
+                start = time.perf_counter()
+                response = client.get(f"/api/compounds/public/?limit={limit}&offset={i % 10 * limit}")
+                latencies.append(time.perf_counter() - start)
+                size = len(response.content)
+            latencies.sort()
+            results.append({
+                "encoding": encoding,
+                "bytes": size,
+                "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+                "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 3),
+            })
+        return results
@@ -0,0 +1,34 @@
+# compounds/management/commands/build_related_compounds.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from compounds import related
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the precomputed related-compounds table (top-k structural neighbours, "
+        "see compounds/related.py). Incremental from the change journal after the first "
+        "run: only neighbourhoods touched by structure changes are recomputed. Run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Recompute fingerprints and neighbours for every compound.")
+
+    def handle(self, *args, **opts):
+        start = time.perf_counter()
+        summary = related.refresh(rebuild=opts["rebuild"])
+        if not summary:
+            self.stdout.write("Another process is updating related compounds.")
+            return
+        parts = [summary["mode"]]
+        if "changed" in summary:
+            parts.append(f"{summary['changed']} structures changed")
+        parts.append(f"{summary['recomputed']} neighbourhoods recomputed")
+        if "rows" in summary:
+            parts.append(f"{summary['rows']} rows written")
+        self.stdout.write(self.style.SUCCESS(
+            f"{', '.join(parts)} (token {summary['token']}) in {time.perf_counter() - start:.2f}s"
+        ))
@@ -0,0 +1,37 @@
+# compounds/management/commands/build_search_index.py
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from compounds import massindex
+from compounds.indexfile import BuildLock, index_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the shared memory-mapped search index from the database. "
+        "Run it at deploy and from cron (e.g. every few minutes): workers never "
+        "write the file, so this is also what folds their change overlays back "
+        "into the index. Running workers switch to the new version on their "
+        "next search, without restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lock-timeout", type=float, default=60.0,
+            help="Seconds to wait for a concurrent build to finish (default: 60).",
+        )
+
+    def handle(self, *args, **opts):
+        start = time.perf_counter()
+        path = index_path(massindex.KIND)
+        with BuildLock(massindex.KIND, timeout=opts["lock_timeout"]) as acquired:
+            if not acquired:
+                raise CommandError(f"{path} is being rebuilt by another process")
+            snap = massindex.load_snapshot()
+            header = massindex.write_snapshot(snap, path)
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: {header['count']} compounds, token {header['token']}, "
+            f"{os.path.getsize(path) / 1e6:.1f} MB in {time.perf_counter() - start:.2f}s"
+        ))
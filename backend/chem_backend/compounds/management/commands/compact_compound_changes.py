@@ -0,0 +1,32 @@
+# compounds/management/commands/compact_compound_changes.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, Max, OuterRef
+
+from compounds.models import CompoundChange
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the compound change feed: drop entries superseded by a later entry "
+        "for the same compound. The latest entry (and every tombstone) is kept, so "
+        "clients syncing from any token still converge."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50_000,
+                            help="Journal ids scanned per DELETE (keeps transactions short).")
+
+    def handle(self, *args, **opts):
+        start = time.perf_counter()
+        top = CompoundChange.objects.aggregate(m=Max("id"))["m"] or 0
+        newer = CompoundChange.objects.filter(compound_id=OuterRef("compound_id"), id__gt=OuterRef("id"))
+        removed = 0
+        for lo in range(0, top, opts["batch_size"]):
+            hi = lo + opts["batch_size"]
+            n, _ = CompoundChange.objects.filter(id__gt=lo, id__lte=hi).filter(Exists(newer)).delete()
+            removed += n
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} superseded entries in {time.perf_counter() - start:.1f}s"
+        ))
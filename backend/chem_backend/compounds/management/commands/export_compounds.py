@@ -0,0 +1,30 @@
+# compounds/management/commands/export_compounds.py
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from compounds import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Build (or reuse) the cached columnar export of compound properties, "
+        "e.g. at deploy and from cron after bulk imports, so downloads never "
+        "serve an outdated export while a worker rebuilds it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", default="npz", choices=list(export.FORMATS))
+        parser.add_argument("--scope", default="all", choices=["all", "public"])
+
+    def handle(self, *args, **opts):
+        start = time.perf_counter()
+        try:
+            path, version = export.get_export(opts["format"], opts["scope"] == "public", wait=True)
+        except export.ExportUnavailable as e:
+            raise CommandError(str(e))
+        size = os.path.getsize(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"{path} ({size / 1e6:.1f} MB, version {version}) in {time.perf_counter() - start:.1f}s"
+        ))
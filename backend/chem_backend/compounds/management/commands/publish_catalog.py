@@ -0,0 +1,34 @@
+# compounds/management/commands/publish_catalog.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from compounds import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Publish a new version of the public catalog for mirrors (SQLite snapshot "
+        "and/or delta from the previous version, see compounds/catalog.py). "
+        "Does nothing if no compound changed since the last version; run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Rebuild the snapshot from the whole table (breaks the delta chain).")
+        parser.add_argument("--snapshot-every", type=int, default=None,
+                            help="Full snapshot every N versions (default: CATALOG_SNAPSHOT_EVERY).")
+
+    def handle(self, *args, **opts):
+        start = time.perf_counter()
+        entry = catalog.publish(rebuild=opts["rebuild"], snapshot_every=opts["snapshot_every"])
+        if not entry:
+            self.stdout.write("Catalog up to date (or another publisher is running).")
+            return
+        parts = [f"version {entry['version']}: {entry['rows']} public compounds"]
+        if entry["delta"]:
+            d = entry["delta"]
+            parts.append(f"delta {d['upserts']} upserts / {d['deletes']} deletes ({d['size'] / 1e3:.1f} kB)")
+        if entry["snapshot"]:
+            parts.append(f"snapshot {entry['snapshot']['size'] / 1e6:.1f} MB")
+        self.stdout.write(self.style.SUCCESS(f"{', '.join(parts)} in {time.perf_counter() - start:.1f}s"))
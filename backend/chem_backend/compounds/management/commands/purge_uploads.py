@@ -0,0 +1,15 @@
+# compounds/management/commands/purge_uploads.py
+from django.core.management.base import BaseCommand
+
+from compounds.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete chunked upload sessions (and their partial files) inactive for "
+        "more than UPLOAD_SESSION_TTL_HOURS. Run periodically (cron)."
+    )
+
+    def handle(self, *args, **opts):
+        count = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} upload session(s)."))
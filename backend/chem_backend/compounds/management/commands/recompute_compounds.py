@@ -0,0 +1,145 @@
+# compounds/management/commands/recompute_compounds.py
+import json
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from compounds.derived import DERIVED, recompute_range
+from compounds.models import Compound
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+    connections.close_all()  # pas de connexion héritée du parent (fork)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C géré par le parent (checkpoint)
+
+
+def _run_chunk(lo, hi, fields, min_seconds):
+    """Un bloc d'ids dans un worker ; dort si besoin pour respecter le débit demandé."""
+    start = time.perf_counter()
+    scanned, changed = recompute_range(lo, hi, fields)
+    elapsed = time.perf_counter() - start
+    if min_seconds and scanned:
+        time.sleep(max(0.0, scanned * min_seconds - elapsed))
+    return lo, scanned, changed
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute derived compound data (see compounds/derived.py) for the whole table after "
+        "its computation changed. The id range is split into chunks processed by a process "
+        "pool; progress is checkpointed so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fields", nargs="+", default=list(DERIVED), choices=list(DERIVED))
+        parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                            help="Worker processes (0 = run in this process).")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Ids per chunk.")
+        parser.add_argument("--max-rows-per-sec", type=float, default=0,
+                            help="Overall throttle to limit load on the primary (0 = unlimited).")
+        parser.add_argument("--checkpoint", default=None,
+                            help="Checkpoint file (default: VAR_DIR/recompute-<fields>.json).")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **opts):
+        fields = sorted(set(opts["fields"]))
+        chunk_size = opts["chunk_size"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive")
+        path = opts["checkpoint"] or os.path.join(settings.VAR_DIR, f"recompute-{'-'.join(fields)}.json")
+
+        state = self.load_checkpoint(path, fields, chunk_size) if not opts["restart"] else None
+        if state is None:
+            # Bornes figées au démarrage : les lignes créées ensuite passent par save()
+            bounds = Compound.objects.aggregate(lo=Min("id"), hi=Max("id"))
+            if bounds["lo"] is None:
+                self.stdout.write("No compounds.")
+                return
+            state = {"fields": fields, "chunk_size": chunk_size, "lo": bounds["lo"] - 1,
+                     "hi": bounds["hi"], "done": [], "scanned": 0, "changed": 0}
+            self.save_checkpoint(path, state)
+        else:
+            self.stdout.write(f"Resuming from {path}: {len(state['done'])} chunks already done")
+
+        done = set(state["done"])
+        pending = [lo for lo in range(state["lo"], state["hi"], chunk_size) if lo not in done]
+        total_chunks = len(done) + len(pending)
+        workers = opts["workers"]
+        rate = opts["max_rows_per_sec"]
+        min_seconds = max(1, workers) / rate if rate > 0 else 0.0  # secondes par ligne et par worker
+
+        start, scanned = time.perf_counter(), 0
+
+        def record(lo, n_scanned, n_changed):
+            nonlocal scanned
+            scanned += n_scanned
+            state["done"].append(lo)
+            state["scanned"] += n_scanned
+            state["changed"] += n_changed
+            self.save_checkpoint(path, state)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"  {len(state['done'])}/{total_chunks} chunks, {state['changed']} changed, "
+                f"{scanned / elapsed if elapsed else 0:,.0f} rows/s",
+                ending="\r",
+            )
+
+        try:
+            if workers <= 0:
+                for lo in pending:
+                    record(*_run_chunk(lo, min(lo + chunk_size, state["hi"]), fields, min_seconds))
+            else:
+                connections.close_all()  # ne pas partager la connexion du parent avec les workers
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                    queue = iter(pending)
+                    running = set()
+                    while True:
+                        # Au plus 2 blocs en attente par worker : une interruption perd peu de travail
+                        while len(running) < 2 * workers and (lo := next(queue, None)) is not None:
+                            running.add(pool.submit(_run_chunk, lo, min(lo + chunk_size, state["hi"]),
+                                                    fields, min_seconds))
+                        if not running:
+                            break
+                        finished, running = wait(running, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            record(*future.result())
+        except KeyboardInterrupt:
+            self.stdout.write("")
+            self.stderr.write(f"Interrupted: progress saved to {path}, run the same command to resume.")
+            return
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {', '.join(fields)}: {state['scanned']} rows, {state['changed']} changed "
+            f"in {elapsed:.1f}s ({scanned / elapsed if elapsed else 0:,.0f} rows/s)"
+        ))
+        os.remove(path)
+
+    def load_checkpoint(self, path, fields, chunk_size):
+        try:
+            with open(path) as fh:
+                state = json.load(fh)
+        except FileNotFoundError:
+            return None
+        if state.get("fields") != fields or state.get("chunk_size") != chunk_size:
+            raise CommandError(
+                f"{path} was written with other --fields/--chunk-size; use them again or pass --restart"
+            )
+        return state
+
+    def save_checkpoint(self, path, state):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(state, fh)
+        os.replace(tmp, path)
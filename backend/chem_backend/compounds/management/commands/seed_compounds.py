@@ -0,0 +1,102 @@
+# compounds/management/commands/seed_compounds.py
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from compounds.models import Compound, CompoundChange
+from compounds.synthetic import BENCH_ADMIN_EMAIL, BENCH_EMAIL_PREFIX, BENCH_PASSWORD, iter_compound_batches
+from stats import counters
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Seed synthetic users and compounds for benchmarks (10k to millions of rows)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--compounds", type=int, default=10_000)
+        parser.add_argument("--users", type=int, default=None,
+                            help="Number of users (default: compounds / 50, min 10).")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--public-ratio", type=float, default=0.7)
+        parser.add_argument("--skew", type=float, default=1.1,
+                            help="Zipf exponent of the ownership distribution.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--password", default=BENCH_PASSWORD)
+        parser.add_argument("--clear", action="store_true",
+                            help="Delete previously seeded bench users (and their compounds) first.")
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        batch_size = opts["batch_size"]
+        n_compounds = opts["compounds"]
+        n_users = opts["users"] or max(10, n_compounds // 50)
+
+        if opts["clear"]:
+            # Un signal par ligne supprimée sinon : compteurs recalculés en une fois plus bas
+            with counters.suspended():
+                deleted, _ = User.objects.filter(email__startswith=BENCH_EMAIL_PREFIX).delete()
+            self.stdout.write(f"Cleared {deleted} rows")
+
+        # Un seul hash pour tous les comptes : hasher N fois coûterait des heures.
+        password = make_password(opts["password"])
+
+        start = time.perf_counter()
+        if not User.objects.filter(email=BENCH_ADMIN_EMAIL).exists():
+            User.objects.create(
+                email=BENCH_ADMIN_EMAIL, full_name="Bench Admin", password=password,
+                role="admin", is_staff=True,
+            )
+
+        first = User.objects.filter(email__startswith=BENCH_EMAIL_PREFIX).count()
+        for lo in range(0, n_users, batch_size):
+            hi = min(lo + batch_size, n_users)
+            User.objects.bulk_create([
+                User(
+                    email=f"{BENCH_EMAIL_PREFIX}{first + i}@example.com",
+                    full_name=f"Bench User {first + i}",
+                    password=password,
+                    role="connected",
+                )
+                for i in range(lo, hi)
+            ], batch_size=batch_size)
+        owner_ids = list(
+            User.objects.filter(email__startswith=BENCH_EMAIL_PREFIX)
+            .order_by("id").values_list("id", flat=True)
+        )
+        # L'ordre Zipf suit un ordre aléatoire mais reproductible des propriétaires.
+        rng.shuffle(owner_ids)
+        users_done = time.perf_counter()
+        self.stdout.write(f"Users: {n_users} in {users_done - start:.1f}s")
+
+        created = 0
+        for batch in iter_compound_batches(
+            rng, owner_ids, n_compounds,
+            batch_size=batch_size,
+            public_ratio=opts["public_ratio"],
+            skew=opts["skew"],
+        ):
+            with transaction.atomic():
+                objs = Compound.objects.bulk_create([Compound(**data) for data in batch], batch_size=batch_size)
+                # bulk_create ne déclenche pas les signaux : journal du flux de changements écrit ici
+                CompoundChange.objects.bulk_create([
+                    CompoundChange(compound_id=c.pk, action=CompoundChange.CREATED, is_public=c.is_public,
+                                   ever_public=c.is_public)
+                    for c in objs
+                ], batch_size=batch_size)
+            created += len(batch)
+            elapsed = time.perf_counter() - users_done
+            self.stdout.write(f"  {created}/{n_compounds} compounds ({created / elapsed:,.0f} rows/s)", ending="\r")
+        self.stdout.write("")
+        # bulk_create ne déclenche pas les signaux : compteurs recalculés en une fois
+        counters.reconcile()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {n_users} users and {created} compounds in {elapsed:.1f}s "
+            f"(login: {BENCH_ADMIN_EMAIL} / bench-<n>@example.com, password '{opts['password']}')"
+        ))
@@ -0,0 +1,256 @@
+# compounds/massindex.py
+"""
+Index en mémoire des masses monoisotopiques (recherche par m/z).
+
+Un instantané = trois tableaux parallèles triés par masse (masse, id,
+public). Une recherche = deux recherches dichotomiques par intervalle ;
+avec NumPy, toutes les bornes d'un lot sont traitées d'un coup par
+np.searchsorted (sinon module bisect sur des array.array).
+
+Synchronisation avec la table via le journal CompoundChange : au plus une
+fois par MASS_INDEX_CATCHUP_SECONDS, les entrées postérieures au jeton de
+l'instantané (et celles de la fenêtre COMPOUND_CHANGES_SETTLE_SECONDS,
+validées éventuellement en retard) sont relues, et les composés touchés
+placés dans une petite surcouche triée. Le rattrapage se fait hors du verrou
+et par un seul thread : les autres recherches servent l'instantané courant
+au lieu d'attendre la requête SQL.
+
+Sans SEARCH_INDEX_SHARED, au-delà de MASS_INDEX_OVERLAY_MAX composés la
+surcouche est fusionnée en mémoire dans les tableaux principaux.
+
+Avec SEARCH_INDEX_SHARED, les tableaux principaux ne sont pas propres au
+process : ils sont mappés depuis SEARCH_INDEX_DIR/mass.idx (voir
+indexfile.py), écrit uniquement par `build_search_index` (au déploiement,
+puis en cron pour replier les surcouches). Les workers n'écrivent jamais le
+fichier. Chaque get() vérifie (un stat) s'il a été remplacé et bascule alors
+sur la nouvelle version ; la surcouche repart de son jeton.
+"""
+import bisect
+import logging
+import threading
+import time
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .chemistry import adduct_mz, neutral_mass_range
+from .indexfile import IndexFile, IndexFileError, file_stamp, index_path, write_index
+from .models import Compound, CompoundChange
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    np = None
+
+logger = logging.getLogger(__name__)
+
+KIND = "mass"
+
+
+class MassSnapshot:
+    """Instantané immuable : remplacé d'un bloc à chaque rafraîchissement."""
+
+    def __init__(self, masses, ids, public, token, overlay=None):
+        self.masses, self.ids, self.public, self.token = masses, ids, public, token
+        # id → (masse, public), ou None si supprimé / sans masse
+        self.overlay = overlay or {}
+        self.overridden = frozenset(self.overlay)
+        self.overlay_rows = sorted((v[0], cid, v[1]) for cid, v in self.overlay.items() if v is not None)
+        self.overlay_masses = [row[0] for row in self.overlay_rows]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _bounds(self, lows, highs):
+        if np is not None:
+            return (np.searchsorted(self.masses, lows, "left").tolist(),
+                    np.searchsorted(self.masses, highs, "right").tolist())
+        return ([bisect.bisect_left(self.masses, lo) for lo in lows],
+                [bisect.bisect_right(self.masses, hi) for hi in highs])
+
+    def search(self, lows, highs, public_only: bool):
+        """Pour chaque intervalle [lows[k], highs[k]] : liste de (masse, id)."""
+        starts, ends = self._bounds(lows, highs)
+        overridden, results = self.overridden, []
+        for k, (start, end) in enumerate(zip(starts, ends)):
+            hits = []
+            if end > start:
+                for mass, cid, pub in zip(self.masses[start:end], self.ids[start:end], self.public[start:end]):
+                    if cid not in overridden and (pub or not public_only):
+                        hits.append((float(mass), int(cid)))
+            if self.overlay_rows:
+                a = bisect.bisect_left(self.overlay_masses, lows[k])
+                b = bisect.bisect_right(self.overlay_masses, highs[k])
+                hits.extend((m, cid) for m, cid, pub in self.overlay_rows[a:b] if pub or not public_only)
+            results.append(hits)
+        return results
+
+
+def _arrays(masses, ids, public):
+    if np is not None:
+        return (np.asarray(masses, dtype=np.float64), np.asarray(ids, dtype=np.int64),
+                np.asarray(public, dtype=np.uint8))
+    return array("d", masses), array("q", ids), bytes(public)
+
+
+def load_snapshot() -> MassSnapshot:
+    """Lecture complète (index SQL sur monoisotopic_mass : déjà trié)."""
+    # Jeton lu avant les lignes : une écriture concurrente sera rejouée au rattrapage
+    token = CompoundChange.objects.aggregate(m=Max("id"))["m"] or 0
+    masses, ids, public = array("d"), array("q"), bytearray()
+    rows = (Compound.objects.exclude(monoisotopic_mass=None).order_by("monoisotopic_mass", "id")
+            .values_list("monoisotopic_mass", "id", "is_public"))
+    for mass, cid, pub in rows.iterator(chunk_size=20_000):
+        masses.append(mass)
+        ids.append(cid)
+        public.append(1 if pub else 0)
+    return MassSnapshot(*_arrays(masses, ids, public), token)
+
+
+def compact(snap: MassSnapshot) -> MassSnapshot:
+    """Fusionne la surcouche dans les tableaux principaux."""
+    if np is None:
+        return load_snapshot()  # sans NumPy, relire la base est plus simple que fusionner
+    keep = ~np.isin(snap.ids, np.fromiter(snap.overridden, dtype=np.int64, count=len(snap.overridden)))
+    masses = np.concatenate([snap.masses[keep], np.array([r[0] for r in snap.overlay_rows], dtype=np.float64)])
+    ids = np.concatenate([snap.ids[keep], np.array([r[1] for r in snap.overlay_rows], dtype=np.int64)])
+    public = np.concatenate([snap.public[keep], np.array([r[2] for r in snap.overlay_rows], dtype=np.uint8)])
+    order = np.argsort(masses, kind="stable")
+    return MassSnapshot(masses[order], ids[order], public[order], snap.token)
+
+
+def catch_up(snap: MassSnapshot) -> MassSnapshot:
+    """Applique les changements du journal depuis l'instantané (1 requête si rien de neuf)."""
+    cutoff = timezone.now() - timedelta(seconds=settings.COMPOUND_CHANGES_SETTLE_SECONDS)
+    entries = list(
+        CompoundChange.objects.filter(Q(id__gt=snap.token) | Q(created_at__gte=cutoff))
+        .values_list("id", "compound_id")
+    )
+    if not entries:
+        return snap
+    affected = {cid for _, cid in entries}
+    overlay = dict(snap.overlay)
+    overlay.update(dict.fromkeys(affected))
+    for cid, mass, pub in Compound.objects.filter(pk__in=affected).values_list("id", "monoisotopic_mass", "is_public"):
+        if mass is not None:
+            overlay[cid] = (mass, pub)
+    token = max(snap.token, max(i for i, _ in entries))
+    if overlay == snap.overlay and token == snap.token:
+        return snap
+    return MassSnapshot(snap.masses, snap.ids, snap.public, token, overlay)
+
+
+# ---------- Fichier partagé ----------
+
+def open_snapshot(path=None):
+    """Instantané sur le fichier mappé (aucune copie) et version ouverte."""
+    index = IndexFile(path or index_path(KIND))
+    snap = MassSnapshot(index.column("mass"), index.column("id"), index.column("public"), index.token)
+    return snap, index.stamp
+
+
+def write_snapshot(snap: MassSnapshot, path=None):
+    """Écrit les tableaux principaux (la surcouche doit avoir été fusionnée)."""
+    return write_index(path or index_path(KIND), KIND, snap.token, {
+        "mass": ("d", snap.masses), "id": ("q", snap.ids), "public": ("B", snap.public),
+    })
+
+
+class MassIndex:
+    """Index du process, chargé au premier usage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stamp = None  # version du fichier partagé actuellement mappée
+        self._next_catch_up = 0.0  # time.monotonic() du prochain rattrapage
+        self._catching_up = False
+
+    def _swap_if_replaced(self):
+        stamp = file_stamp(index_path(KIND))
+        if stamp is None or stamp == self._stamp:
+            return
+        try:
+            self._snapshot, self._stamp = open_snapshot()
+        except (FileNotFoundError, IndexFileError) as exc:
+            logger.warning("Shared mass index ignored: %s", exc)
+            self._stamp = stamp  # pas de nouvel essai avant le prochain remplacement
+
+    def _initial(self) -> MassSnapshot:
+        if settings.SEARCH_INDEX_SHARED:
+            logger.warning("No shared mass index at %s, loading from the database "
+                           "(run build_search_index)", index_path(KIND))
+        return load_snapshot()
+
+    def get(self) -> MassSnapshot:
+        with self._lock:
+            if settings.SEARCH_INDEX_SHARED:
+                self._swap_if_replaced()
+            if self._snapshot is None:
+                self._snapshot = self._initial()
+            snap = self._snapshot
+            if self._catching_up or time.monotonic() < self._next_catch_up:
+                return snap
+            self._catching_up = True
+        fresh = snap
+        try:
+            fresh = catch_up(snap)
+            if len(fresh.overlay) > settings.MASS_INDEX_OVERLAY_MAX:
+                if not settings.SEARCH_INDEX_SHARED:
+                    fresh = compact(fresh)
+                elif len(snap.overlay) <= settings.MASS_INDEX_OVERLAY_MAX:
+                    logger.warning("Mass index overlay above %d compounds, run build_search_index",
+                                   settings.MASS_INDEX_OVERLAY_MAX)
+        finally:
+            with self._lock:
+                self._catching_up = False
+                # Remplacé entre-temps (nouveau fichier, reset) : rattraper au prochain appel
+                if self._snapshot is snap:
+                    self._snapshot = fresh
+                    self._next_catch_up = time.monotonic() + settings.MASS_INDEX_CATCHUP_SECONDS
+        return fresh
+
+    def reset(self):
+        with self._lock:
+            self._snapshot = None
+            self._stamp = None
+            self._next_catch_up = 0.0
+            self._catching_up = False
+
+
+mass_index = MassIndex()
+
+
+def search(mzs, tolerance: float, unit: str, adducts, public_only: bool, limit: int):
+    """
+    Correspondances par m/z observé, triées par |erreur|.
+    Retourne une liste (une par m/z) de dicts {id, adduct, mass, mz, error_ppm}.
+    """
+    snap = mass_index.get()
+    lows, highs, pairs = [], [], []
+    for q, mz in enumerate(mzs):
+        tol = mz * tolerance / 1e6 if unit == "ppm" else tolerance
+        for adduct in adducts:
+            lo, hi = neutral_mass_range(mz, tol, adduct)
+            lows.append(lo)
+            highs.append(hi)
+            pairs.append((q, adduct))
+
+    results = [[] for _ in mzs]
+    for (q, adduct), hits in zip(pairs, snap.search(lows, highs, public_only)):
+        for mass, cid in hits:
+            theoretical = adduct_mz(mass, adduct)
+            results[q].append({
+                "id": cid,
+                "adduct": adduct,
+                "mass": mass,
+                "mz": round(theoretical, 6),
+                "error_ppm": round((mzs[q] - theoretical) / theoretical * 1e6, 3),
+            })
+    for matches in results:
+        matches.sort(key=lambda m: abs(m["error_ppm"]))
+        del matches[limit:]
+    return results
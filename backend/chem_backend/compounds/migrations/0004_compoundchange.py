@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_changes(apps, schema_editor):
+    """Une entrée "created" par composé existant : le flux part de since=0."""
+    Compound = apps.get_model("compounds", "Compound")
+    CompoundChange = apps.get_model("compounds", "CompoundChange")
+    batch = []
+    rows = Compound.objects.order_by("id").values_list("id", "is_public", "created_at")
+    for compound_id, is_public, created_at in rows.iterator(chunk_size=5000):
+        batch.append(CompoundChange(
+            compound_id=compound_id, action="created", is_public=is_public,
+            created_at=created_at or django.utils.timezone.now(),
+        ))
+        if len(batch) >= 5000:
+            CompoundChange.objects.bulk_create(batch)
+            batch = []
+    CompoundChange.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compounds', '0003_alter_compound_options_compound_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompoundChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('compound_id', models.BigIntegerField(db_index=True)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=10)),
+                ('is_public', models.BooleanField()),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
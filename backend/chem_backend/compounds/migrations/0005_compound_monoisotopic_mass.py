@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:42
+
+from django.db import migrations, models
+
+from compounds.chemistry import monoisotopic_mass
+
+
+def backfill_masses(apps, schema_editor):
+    Compound = apps.get_model("compounds", "Compound")
+    batch = []
+    for c in Compound.objects.only("id", "formula").order_by("id").iterator(chunk_size=5000):
+        c.monoisotopic_mass = monoisotopic_mass(c.formula)
+        batch.append(c)
+        if len(batch) >= 5000:
+            Compound.objects.bulk_update(batch, ["monoisotopic_mass"])
+            batch = []
+    Compound.objects.bulk_update(batch, ["monoisotopic_mass"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compounds', '0004_compoundchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compound',
+            name='monoisotopic_mass',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_masses, migrations.RunPython.noop),
+    ]
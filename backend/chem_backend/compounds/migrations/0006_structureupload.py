@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:06
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compounds', '0005_compound_monoisotopic_mass'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StructureUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('received', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('complete', 'Complete')], default='open', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('compound', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='compounds.compound')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='structure_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# (clé, nom, unité canonique) ; figé ici : la migration ne dépend pas du code applicatif
+DEFAULT_DEFINITIONS = [
+    ("mp", "Melting point", "°C"),
+    ("bp", "Boiling point", "°C"),
+    ("logp", "logP (octanol/water)", ""),
+    ("solubility", "Water solubility", "g/L"),
+    ("density", "Density", "g/cm3"),
+]
+
+
+def create_definitions(apps, schema_editor):
+    PropertyDefinition = apps.get_model("compounds", "PropertyDefinition")
+    for key, name, unit in DEFAULT_DEFINITIONS:
+        PropertyDefinition.objects.get_or_create(key=key, defaults={"name": name, "unit": unit})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compounds', '0006_structureupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyDefinition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.SlugField(max_length=32, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('unit', models.CharField(blank=True, max_length=16)),
+                ('description', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['key'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CompoundProperty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.FloatField()),
+                ('raw_value', models.FloatField()),
+                ('raw_unit', models.CharField(blank=True, max_length=16)),
+                ('source', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('compound', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='properties', to='compounds.compound')),
+                ('definition', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='values', to='compounds.propertydefinition')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['definition', 'value', 'compound'], name='compound_prop_range_idx')],
+                'constraints': [models.UniqueConstraint(fields=('compound', 'definition'), name='compound_property_unique')],
+            },
+        ),
+        migrations.RunPython(create_definitions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compounds', '0007_properties'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompoundFingerprint',
+            fields=[
+                ('compound', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='compounds.compound')),
+                ('bits', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedCompound',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('similarity', models.FloatField()),
+                ('compound', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='compounds.compound')),
+                ('related', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='compounds.compound')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('compound', 'rank'), name='related_compound_rank')],
+            },
+        ),
+    ]
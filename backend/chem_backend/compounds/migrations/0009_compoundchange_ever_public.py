@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+def backfill_ever_public(apps, schema_editor):
+    """`ever_public` = OU cumulé de is_public, entrée par entrée, pour chaque composé."""
+    CompoundChange = apps.get_model("compounds", "CompoundChange")
+    rows = CompoundChange.objects.order_by("compound_id", "id").values_list("id", "compound_id", "is_public")
+    current, seen, ids = None, False, []
+    for entry_id, compound_id, is_public in rows.iterator(chunk_size=5000):
+        if compound_id != current:
+            current, seen = compound_id, False
+        seen = seen or is_public
+        if seen:
+            ids.append(entry_id)
+        if len(ids) >= 5000:
+            CompoundChange.objects.filter(id__in=ids).update(ever_public=True)
+            ids = []
+    CompoundChange.objects.filter(id__in=ids).update(ever_public=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compounds', '0008_related_compounds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compoundchange',
+            name='ever_public',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_ever_public, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,20 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 
+from .chemistry import monoisotopic_mass
+
+
 class Compound(models.Model):
     # Core fields
     name = models.CharField(max_length=100, db_index=True)
     formula = models.CharField(max_length=100, db_index=True)
     smiles = models.CharField(max_length=255, db_index=True)
     molecular_weight = models.FloatField(null=True, blank=True)  # ← devient optionnel
+    # Calculée depuis la formule à chaque save() (recherche par m/z, compounds/massindex.py)
+    monoisotopic_mass = models.FloatField(null=True, blank=True, editable=False, db_index=True)
     structure_file = models.FileField(upload_to="structures3d/", null=True, blank=True)
     description = models.TextField(blank=True)
 
@@ -38,3 +45,160 @@ class Compound(models.Model):
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        self.monoisotopic_mass = monoisotopic_mass(self.formula)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "formula" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "monoisotopic_mass"}
+        # Ligne + compteurs statistiques (stats/signals.py) dans la même transaction
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class CompoundChange(models.Model):
+    """
+    Journal des écritures sur Compound (créations, modifications, suppressions).
+    Écrit dans la même transaction que l'écriture (compounds/signals.py) ;
+    l'id auto-incrémenté sert de jeton monotone au flux ?since=<token>.
+    Pas de FK : les tombstones survivent à la suppression du composé.
+    """
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    ACTION_CHOICES = [
+        (CREATED, "Created"),
+        (UPDATED, "Updated"),
+        (DELETED, "Deleted"),
+    ]
+
+    compound_id = models.BigIntegerField(db_index=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    is_public = models.BooleanField()
+    # Public à un moment, jusqu'à cette entrée incluse (reporté d'entrée en entrée,
+    # donc conservé par compact_compound_changes) : seuls ces composés donnent
+    # des tombstones aux anonymes, les autres ids n'ont jamais été publics.
+    ever_public = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"#{self.id} {self.action} compound {self.compound_id}"
+
+    @classmethod
+    def was_ever_public(cls, compound_id, is_public: bool) -> bool:
+        """Valeur de `ever_public` pour une nouvelle entrée (une requête si le composé est privé)."""
+        return is_public or cls.objects.filter(compound_id=compound_id, ever_public=True).exists()
+
+
+class StructureUpload(models.Model):
+    """
+    Envoi par morceaux d'un gros fichier de structure (compounds/uploads.py).
+    Les octets reçus vivent dans UPLOAD_TEMP_DIR/<id>.part jusqu'à la
+    finalisation, qui déplace le fichier dans Compound.structure_file.
+    """
+    OPEN = "open"
+    COMPLETE = "complete"
+    STATUS_CHOICES = [
+        (OPEN, "Open"),
+        (COMPLETE, "Complete"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="structure_uploads",
+    )
+    compound = models.ForeignKey(Compound, on_delete=models.CASCADE, related_name="uploads")
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # attendu pour le fichier entier (optionnel)
+    received = models.BigIntegerField(default=0)  # octets contigus écrits = offset de reprise
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+class PropertyDefinition(models.Model):
+    """
+    Propriété expérimentale mesurable (point de fusion, logP...).
+    Les valeurs sont stockées dans l'unité canonique `unit` (compounds/properties.py).
+    """
+    key = models.SlugField(max_length=32, unique=True)  # "mp", "logp" : nom court des filtres
+    name = models.CharField(max_length=100)
+    unit = models.CharField(max_length=16, blank=True)  # "" : sans dimension
+    description = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["key"]
+
+    def __str__(self):
+        return f"{self.name} ({self.unit})" if self.unit else self.name
+
+
+class CompoundProperty(models.Model):
+    """
+    Valeur d'une propriété pour un composé : `value` dans l'unité canonique
+    (filtres par plage), `raw_value` / `raw_unit` tels que saisis.
+    Index (definition, value, compound) : une plage sur une propriété est un
+    parcours d'index qui fournit directement les ids de composés.
+    """
+    # Pas d'index propres : couverts par la contrainte unique et l'index de plage
+    compound = models.ForeignKey(Compound, on_delete=models.CASCADE, related_name="properties", db_index=False)
+    definition = models.ForeignKey(
+        PropertyDefinition, on_delete=models.CASCADE, related_name="values", db_index=False,
+    )
+    value = models.FloatField()
+    raw_value = models.FloatField()
+    raw_unit = models.CharField(max_length=16, blank=True)
+    source = models.CharField(max_length=255, blank=True)  # référence, instrument...
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["compound", "definition"], name="compound_property_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["definition", "value", "compound"], name="compound_prop_range_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.definition_id}={self.value} (compound {self.compound_id})"
+
+
+class CompoundFingerprint(models.Model):
+    """
+    Empreinte structurale (chemins linéaires du graphe SMILES, compounds/related.py)
+    telle qu'utilisée pour le dernier calcul des voisins : permet de savoir si
+    une modification touche la structure (voisinages à recalculer) ou non.
+    """
+    compound = models.OneToOneField(Compound, on_delete=models.CASCADE, primary_key=True, related_name="fingerprint")
+    bits = models.BinaryField()
+
+
+class RelatedCompound(models.Model):
+    """
+    Voisins structuraux précalculés : les RELATED_TOP_K composés les plus
+    similaires (Tanimoto) de chaque composé, `rank` 0 = le plus proche.
+    Lu par le détail en une requête sur l'index unique (compound, rank).
+    """
+    compound = models.ForeignKey(Compound, on_delete=models.CASCADE, related_name="neighbours", db_index=False)
+    # Pas de cascade : la suppression d'un voisin laisse sa ligne (masquée par la
+    # jointure à la lecture), qui signale à refresh() le voisinage à recalculer
+    related = models.ForeignKey(Compound, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    similarity = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["compound", "rank"], name="related_compound_rank"),
+        ]
+
+    def __str__(self):
+        return f"{self.compound_id} → {self.related_id} ({self.similarity:.2f})"
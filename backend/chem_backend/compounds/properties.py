@@ -0,0 +1,233 @@
+# compounds/properties.py
+"""
+Propriétés expérimentales typées (point de fusion, logP, solubilité...).
+
+Chaque valeur est convertie à l'écriture dans l'unité canonique de sa
+propriété (PropertyDefinition.unit) : les filtres par plage comparent des
+nombres homogènes et passent par l'index (definition, value, compound).
+
+    parse_filters("mp between 100 and 150 °C AND logp < 3")
+    → {"mp": {"value__gte": 100.0, "value__lte": 150.0}, "logp": {"value__lt": 3.0}}
+
+Une condition par propriété devient une sous-requête `id IN (SELECT
+compound_id ... WHERE definition_id = d AND value BETWEEN lo AND hi)` ;
+plusieurs conditions sur la même propriété sont fusionnées.
+"""
+import math
+import re
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Compound, CompoundProperty, PropertyDefinition
+
+# unité → (dimension, facteur, décalage) : valeur_base = valeur * facteur + décalage
+UNITS = {
+    "": ("none", 1.0, 0.0),
+    "°C": ("temperature", 1.0, 0.0),
+    "K": ("temperature", 1.0, -273.15),
+    "°F": ("temperature", 5 / 9, -32 * 5 / 9),
+    # concentration massique (base g/L) : solubilité et masse volumique
+    "g/L": ("mass_concentration", 1.0, 0.0),
+    "mg/L": ("mass_concentration", 1e-3, 0.0),
+    "µg/mL": ("mass_concentration", 1e-3, 0.0),
+    "mg/mL": ("mass_concentration", 1.0, 0.0),
+    "kg/m3": ("mass_concentration", 1.0, 0.0),
+    "g/mL": ("mass_concentration", 1000.0, 0.0),
+    "g/cm3": ("mass_concentration", 1000.0, 0.0),
+}
+UNIT_ALIASES = {
+    "C": "°C", "degC": "°C", "ºC": "°C", "F": "°F", "degF": "°F", "ºF": "°F",
+    "ug/mL": "µg/mL", "μg/mL": "µg/mL", "g/cm³": "g/cm3", "kg/m³": "kg/m3",
+    "g/l": "g/L", "mg/l": "mg/L", "g/ml": "g/mL", "mg/ml": "mg/mL",
+}
+
+
+class PropertyError(ValueError):
+    pass
+
+
+def normalize_unit(unit) -> str:
+    if unit is None:
+        unit = ""
+    if not isinstance(unit, str):
+        raise PropertyError("unit must be a string")
+    unit = unit.strip().replace(" ", "")
+    unit = UNIT_ALIASES.get(unit, unit)
+    if unit not in UNITS:
+        raise PropertyError(f"Unknown unit '{unit}'")
+    return unit
+
+
+def convert(value: float, from_unit, to_unit) -> float:
+    src, dst = UNITS[normalize_unit(from_unit)], UNITS[normalize_unit(to_unit)]
+    if src[0] != dst[0]:
+        raise PropertyError(f"Cannot convert '{from_unit}' to '{to_unit}'")
+    return (value * src[1] + src[2] - dst[2]) / dst[1]
+
+
+def definitions() -> dict:
+    return {d.key: d for d in PropertyDefinition.objects.all()}
+
+
+# ---------- Écriture ----------
+
+def _finite(value) -> float:
+    """Nombre fini (ou chaîne numérique) ; booléens, NaN et infinis refusés."""
+    if isinstance(value, bool):
+        raise PropertyError("value must be a number")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise PropertyError("value must be a number") from None
+    if not math.isfinite(value):
+        raise PropertyError("value must be finite")
+    return value
+
+
+def bulk_upsert(rows, user=None, batch_size=1000):
+    """
+    rows : [{"compound_id", "property", "value", "unit"?, "source"?}] ;
+    value None → suppression. `user` non staff : ses composés seulement.
+    Retourne (écrits, supprimés, erreurs {index: message}) ; les lignes en
+    erreur sont ignorées, les autres écrites (INSERT ... ON CONFLICT UPDATE).
+    """
+    defs = definitions()
+    ids = set()
+    for row in rows:
+        try:
+            ids.add(int(row.get("compound_id")))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    owners = dict(Compound.objects.filter(pk__in=ids).values_list("id", "owner_id"))
+
+    errors, upserts, deletes = {}, {}, {}
+    for i, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise PropertyError("row must be an object")
+            try:
+                cid = int(row.get("compound_id"))
+            except (TypeError, ValueError):
+                raise PropertyError("compound_id must be an integer") from None
+            if cid not in owners:
+                raise PropertyError("Compound not found")
+            if user is not None and not user.is_staff and owners[cid] != user.pk:
+                raise PropertyError("Forbidden")
+            definition = defs.get(str(row.get("property") or "").lower())
+            if definition is None:
+                raise PropertyError(f"Unknown property '{row.get('property')}'")
+            key = (cid, definition.pk)
+            if row.get("value") is None:
+                deletes[key] = True
+                upserts.pop(key, None)
+                continue
+            raw = _finite(row["value"])
+            unit = normalize_unit(definition.unit if row.get("unit") is None else row["unit"])
+            upserts[key] = CompoundProperty(  # même couple répété : la dernière ligne gagne
+                compound_id=cid, definition_id=definition.pk,
+                value=_finite(convert(raw, unit, definition.unit)), raw_value=raw, raw_unit=unit,
+                source=str(row.get("source") or "")[:255],
+            )
+            deletes.pop(key, None)
+        except PropertyError as e:
+            errors[i] = str(e)
+
+    now = timezone.now()
+    objs = list(upserts.values())
+    for obj in objs:
+        obj.updated_at = now
+    deleted = 0
+    with transaction.atomic():
+        CompoundProperty.objects.bulk_create(
+            objs, batch_size=batch_size, update_conflicts=True,
+            unique_fields=["compound", "definition"],
+            update_fields=["value", "raw_value", "raw_unit", "source", "updated_at"],
+        )
+        by_definition = {}
+        for cid, did in deletes:
+            by_definition.setdefault(did, []).append(cid)
+        for did, cids in by_definition.items():
+            for lo in range(0, len(cids), batch_size):
+                deleted += CompoundProperty.objects.filter(
+                    definition_id=did, compound_id__in=cids[lo:lo + batch_size],
+                ).delete()[0]
+    return len(objs), deleted, errors
+
+
+# ---------- Filtres par plage ----------
+
+_NUM = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_UNIT = r"(?:\s*(?!and\b)(?P<unit>[^\s,;]+))?"
+_BETWEEN_RE = re.compile(
+    rf"(?P<key>[a-z][\w-]*)\s+between\s+(?P<lo>{_NUM})\s+and\s+(?P<hi>{_NUM}){_UNIT}", re.I,
+)
+_COMPARE_RE = re.compile(rf"(?P<key>[a-z][\w-]*)\s*(?P<op><=|>=|<|>|=)\s*(?P<num>{_NUM}){_UNIT}", re.I)
+_SEPARATOR_RE = re.compile(r"\s*(?:,|;|\band\b)\s*", re.I)
+_OPS = {"<": "value__lt", "<=": "value__lte", ">": "value__gt", ">=": "value__gte", "=": "value"}
+
+
+def _conditions(expr: str):
+    """(clé, lookup, nombre, unité ou None) pour chaque condition de `expr`."""
+    pos, expr = 0, expr.strip()
+    while pos < len(expr):
+        m = _BETWEEN_RE.match(expr, pos)
+        if m:
+            unit = m.group("unit")
+            yield m.group("key").lower(), "value__gte", float(m.group("lo")), unit
+            yield m.group("key").lower(), "value__lte", float(m.group("hi")), unit
+        else:
+            m = _COMPARE_RE.match(expr, pos)
+            if not m:
+                raise PropertyError(f"Cannot parse property filter near '{expr[pos:pos + 30]}'")
+            yield m.group("key").lower(), _OPS[m.group("op")], float(m.group("num")), m.group("unit")
+        pos = m.end()
+        sep = _SEPARATOR_RE.match(expr, pos)
+        if pos < len(expr):
+            if not sep or sep.end() == pos:
+                raise PropertyError(f"Expected ',' or 'AND' near '{expr[pos:pos + 30]}'")
+            pos = sep.end()
+
+
+def parse_filters(expr: str, defs=None) -> dict:
+    """clé → bornes Django (valeurs converties dans l'unité canonique)."""
+    defs = definitions() if defs is None else defs
+    filters = {}
+    for key, lookup, number, unit in _conditions(expr):
+        definition = defs.get(key)
+        if definition is None:
+            raise PropertyError(f"Unknown property '{key}'")
+        if unit is not None:
+            number = convert(number, unit, definition.unit)
+        bounds = filters.setdefault(key, {})
+        if lookup in bounds and lookup != "value":  # deux bornes du même côté : la plus restrictive
+            number = (max if lookup in ("value__gt", "value__gte") else min)(bounds[lookup], number)
+        bounds[lookup] = number
+    return filters
+
+
+def apply_property_filters(qs, expr):
+    """Filtre la queryset de composés selon ?props= ; PropertyError si invalide."""
+    if not expr or not expr.strip():
+        return qs
+    defs = definitions()
+    for key, bounds in parse_filters(expr, defs).items():
+        qs = qs.filter(pk__in=CompoundProperty.objects.filter(
+            definition_id=defs[key].pk, **bounds,
+        ).values("compound_id"))
+    return qs
+
+
+def serialize_properties(compound_id) -> dict:
+    rows = (CompoundProperty.objects.filter(compound_id=compound_id)
+            .select_related("definition").order_by("definition__key"))
+    return {
+        p.definition.key: {
+            "value": p.value,
+            "unit": p.definition.unit,
+            "raw_value": p.raw_value,
+            "raw_unit": p.raw_unit,
+            "source": p.source,
+        }
+        for p in rows
+    }
@@ -0,0 +1,377 @@
+# compounds/related.py
+"""
+Composés apparentés : les RELATED_TOP_K voisins structuraux de chaque
+composé, précalculés dans RelatedCompound (le détail les lit en une requête
+sur l'index (compound, rank), sans calcul de similarité à chaud).
+
+Similarité = Tanimoto sur une empreinte de chemins linéaires : chaque chemin
+de 0 à FP_PATH_LENGTH liaisons du graphe SMILES (depiction.parse_smiles),
+écrit dans son sens canonique, allume un bit parmi FP_BITS. Les atomes de
+cycle (depiction.find_rings) sont marqués, et un bit code le nombre d'atomes
+et de cycles : sans eux, hexane et cyclohexane (ou hexane et heptane, dont
+les chemins saturent FP_PATH_LENGTH) auraient la même empreinte. Les voisins sous
+RELATED_MIN_SIMILARITY sont ignorés ; à égalité, le plus petit id passe devant.
+
+`refresh()` (commande build_related_compounds, cron) :
+- premier passage, ou paramètres changés : calcul complet ;
+- ensuite, incrémental depuis le journal CompoundChange (même fenêtre
+  COMPOUND_CHANGES_SETTLE_SECONDS que catalog.py) : seuls les composés dont
+  l'empreinte a changé (créés, SMILES modifié, supprimés) déclenchent un
+  calcul ; un renommage ou un changement de visibilité ne coûte rien. Sont
+  recalculés : ces composés, ceux qui les avaient pour voisins, et ceux dont
+  ils entrent dans le top-k (similarité ≥ celle de leur k-ième voisin).
+
+Avec NumPy, les similarités sont calculées par blocs (produit matriciel des
+bits dépliés) ; sinon bit à bit sur des entiers Python, en ne comparant que
+les empreintes dont le nombre de bits est compatible avec le seuil.
+"""
+import bisect
+import heapq
+import json
+import os
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from .depiction import DepictionError, find_rings, parse_smiles
+from .indexfile import BuildLock
+from .models import Compound, CompoundChange, CompoundFingerprint, RelatedCompound
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    np = None
+
+KIND = "related"
+FP_BITS = 1024
+FP_BYTES = FP_BITS // 8
+FP_PATH_LENGTH = 5  # liaisons
+FP_VERSION = 2  # 2 : atomes de cycle marqués, bit de taille ; changer → calcul complet
+QUERY_BLOCK = 1024  # empreintes comparées ensemble (NumPy)
+TARGET_CHUNK = 4096
+
+_BOND_SYMBOLS = {1: "-", 2: "=", 3: "#", 1.5: ":"}
+
+
+# ---------- Empreinte ----------
+
+def _atom_label(atom, in_ring: bool) -> str:
+    label = atom.element.lower() if atom.aromatic else atom.element
+    if atom.charge:
+        label += f"{atom.charge:+d}"
+    return f"{label}r" if in_ring else label
+
+
+def _bit(key: str) -> int:
+    return 1 << (zlib.crc32(key.encode()) % FP_BITS)
+
+
+def fingerprint(smiles):
+    """Empreinte (FP_BYTES octets) ; None si le SMILES est illisible."""
+    try:
+        mol = parse_smiles(smiles)
+    except DepictionError:
+        return None
+    rings = find_rings(mol)
+    ring_atoms = {i for ring in rings for i in ring}
+    labels = [_atom_label(a, i in ring_atoms) for i, a in enumerate(mol.atoms)]
+    bits = _bit(f"#{len(mol.atoms)}/{len(rings)}")
+    for start in range(len(mol.atoms)):
+        stack = [(start, (start,), (labels[start],))]
+        while stack:
+            i, path, tokens = stack.pop()
+            if path[0] <= path[-1]:  # chaque chemin est vu depuis ses deux bouts
+                bits |= _bit("".join(min(tokens, tokens[::-1])))
+            if len(path) > FP_PATH_LENGTH:
+                continue
+            for j in mol.neighbors[i]:
+                if j not in path:
+                    bond = _BOND_SYMBOLS.get(mol.order(i, j), "~")
+                    stack.append((j, path + (j,), tokens + (bond, labels[j])))
+    return bits.to_bytes(FP_BYTES, "little")
+
+
+def tanimoto(a: bytes, b: bytes) -> float:
+    x, y = int.from_bytes(a, "little"), int.from_bytes(b, "little")
+    union = (x | y).bit_count()
+    return (x & y).bit_count() / union if union else 0.0
+
+
+# ---------- Recherche des voisins ----------
+
+def _ranked(candidates, k):
+    """(similarité, id) → les k meilleurs, similarité décroissante puis id croissant."""
+    return heapq.nsmallest(k, candidates, key=lambda c: (-c[0], c[1])) if k else sorted(
+        candidates, key=lambda c: (-c[0], c[1]))
+
+
+class FingerprintIndex:
+    """Toutes les empreintes en mémoire, triées par nombre de bits."""
+
+    def __init__(self, rows):
+        rows = sorted(((int.from_bytes(bits, "little"), cid, bytes(bits)) for cid, bits in rows),
+                      key=lambda r: (r[0].bit_count(), r[1]))
+        self.ints = [r[0] for r in rows]
+        self.ids = [r[1] for r in rows]
+        self.counts = [x.bit_count() for x in self.ints]
+        self.position = {cid: i for i, cid in enumerate(self.ids)}
+        if np is not None:
+            self.matrix = np.frombuffer(b"".join(r[2] for r in rows), dtype=np.uint8).reshape(len(rows), FP_BYTES)
+            self.np_counts = np.asarray(self.counts, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, cid):
+        return cid in self.position
+
+    # Python : Tanimoto ≤ min(|a|, |b|) / max(|a|, |b|), seule une fenêtre de tailles est comparée
+    def _similar_python(self, p, min_similarity):
+        x, count = self.ints[p], self.counts[p]
+        lo = bisect.bisect_left(self.counts, count * min_similarity)
+        hi = bisect.bisect_right(self.counts, count / min_similarity) if min_similarity > 0 else len(self)
+        hits = []
+        for i in range(lo, hi):
+            if i == p:
+                continue
+            inter = (x & self.ints[i]).bit_count()
+            union = count + self.counts[i] - inter
+            sim = inter / union if union else 0.0
+            if sim >= min_similarity:
+                hits.append((sim, self.ids[i]))
+        return hits
+
+    # NumPy : similarités d'un bloc de requêtes contre toutes les empreintes, par tranches
+    def _query_blocks(self, positions):
+        for q_lo in range(0, len(positions), QUERY_BLOCK):
+            pos = np.asarray(positions[q_lo:q_lo + QUERY_BLOCK], dtype=np.int64)
+            yield pos, self._chunks(pos)
+
+    def _chunks(self, pos):
+        query = np.unpackbits(self.matrix[pos], axis=1).astype(np.float32)
+        q_counts = self.np_counts[pos]
+        for lo in range(0, len(self), TARGET_CHUNK):
+            target = np.unpackbits(self.matrix[lo:lo + TARGET_CHUNK], axis=1).astype(np.float32)
+            inter = (query @ target.T).astype(np.float64)  # entiers ≤ FP_BITS : exacts en float32
+            union = q_counts[:, None] + self.np_counts[None, lo:lo + TARGET_CHUNK] - inter
+            sims = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+            own = np.nonzero((pos >= lo) & (pos < lo + sims.shape[1]))[0]
+            sims[own, pos[own] - lo] = -1.0  # pas soi-même
+            yield lo, sims
+
+    def similar(self, positions, min_similarity) -> dict:
+        """Position → [(similarité, id)] de tous les composés au-dessus du seuil."""
+        if np is None:
+            return {p: self._similar_python(p, min_similarity) for p in positions}
+        out = {p: [] for p in positions}
+        for pos, chunks in self._query_blocks(list(positions)):
+            for lo, sims in chunks:
+                rows, cols = np.nonzero(sims >= min_similarity)
+                for r, c in zip(rows.tolist(), cols.tolist()):
+                    out[int(pos[r])].append((float(sims[r, c]), self.ids[lo + c]))
+        return out
+
+    def neighbours(self, positions, k, min_similarity) -> dict:
+        """id → top-k [(similarité, id)] pour chaque position demandée."""
+        if np is None:
+            return {self.ids[p]: _ranked(self._similar_python(p, min_similarity), k) for p in positions}
+        take = k + 8  # marge pour départager les ex aequo par id
+        out = {}
+        for pos, chunks in self._query_blocks(list(positions)):
+            best, best_idx = np.empty((len(pos), 0)), np.empty((len(pos), 0), dtype=np.int64)
+            truncated = False
+            for lo, sims in chunks:
+                best = np.concatenate([best, sims], axis=1)
+                best_idx = np.concatenate([best_idx, np.broadcast_to(np.arange(lo, lo + sims.shape[1]), sims.shape)], axis=1)
+                if best.shape[1] > take:
+                    part = np.argpartition(-best, take - 1, axis=1)[:, :take]
+                    best, best_idx = np.take_along_axis(best, part, 1), np.take_along_axis(best_idx, part, 1)
+                    truncated = True
+            for r, p in enumerate(pos.tolist()):
+                hits = [(s, self.ids[i]) for s, i in zip(best[r].tolist(), best_idx[r].tolist()) if s >= min_similarity]
+                ranked = _ranked(hits, k)
+                if truncated and len(ranked) == k and min(best[r]) >= ranked[-1][0]:
+                    # plus de take ex aequo à la k-ième place : départage exact
+                    ranked = _ranked(self._similar_python(p, ranked[-1][0]), k)
+                out[self.ids[p]] = ranked
+        return out
+
+
+# ---------- Table des voisins ----------
+
+def _params() -> dict:
+    """Un changement de ces paramètres impose un calcul complet."""
+    return {"version": FP_VERSION, "bits": FP_BITS, "path_length": FP_PATH_LENGTH,
+            "k": settings.RELATED_TOP_K, "min_similarity": settings.RELATED_MIN_SIMILARITY}
+
+
+def _state_path() -> str:
+    return os.path.join(settings.SEARCH_INDEX_DIR, f"{KIND}.json")
+
+
+def _load_state():
+    try:
+        with open(_state_path()) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _save_state(state):
+    fd, tmp = tempfile.mkstemp(dir=settings.SEARCH_INDEX_DIR, suffix=".part")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, _state_path())
+
+
+def _chunked(ids, size=1000):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _load_index() -> FingerprintIndex:
+    return FingerprintIndex(CompoundFingerprint.objects.values_list("compound_id", "bits").iterator(chunk_size=20_000))
+
+
+def _write(neighbours: dict, cleared=(), everything=False):
+    """
+    Remplace les voisins des composés de `neighbours` (et vide ceux de
+    `cleared`) ; `everything` : remplace toute la table.
+    """
+    rows = [
+        RelatedCompound(compound_id=cid, related_id=other, rank=rank, similarity=sim)
+        for cid, hits in neighbours.items() for rank, (sim, other) in enumerate(hits)
+    ]
+    with transaction.atomic():
+        if everything:
+            RelatedCompound.objects.all().delete()
+        else:
+            for chunk in _chunked({*neighbours, *cleared}):
+                RelatedCompound.objects.filter(compound_id__in=chunk).delete()
+        RelatedCompound.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
+
+
+def _rebuild() -> dict:
+    fingerprints = []
+    for cid, smiles in Compound.objects.order_by("id").values_list("id", "smiles").iterator(chunk_size=5000):
+        bits = fingerprint(smiles)
+        if bits is not None:
+            fingerprints.append(CompoundFingerprint(compound_id=cid, bits=bits))
+    with transaction.atomic():
+        CompoundFingerprint.objects.all().delete()
+        CompoundFingerprint.objects.bulk_create(fingerprints, batch_size=2000)
+    index = FingerprintIndex((f.compound_id, f.bits) for f in fingerprints)
+    neighbours = index.neighbours(range(len(index)), settings.RELATED_TOP_K, settings.RELATED_MIN_SIMILARITY)
+    rows = _write(neighbours, everything=True)
+    return {"mode": "rebuild", "compounds": len(index), "recomputed": len(index), "rows": rows}
+
+
+def _sync_fingerprints(ids) -> set:
+    """Met à jour les empreintes de `ids` ; retourne les composés dont l'empreinte a changé."""
+    current, stored = {}, {}
+    for chunk in _chunked(ids):
+        current.update(Compound.objects.filter(pk__in=chunk).values_list("id", "smiles"))
+        stored.update((cid, bytes(bits)) for cid, bits in
+                      CompoundFingerprint.objects.filter(pk__in=chunk).values_list("compound_id", "bits"))
+    changed, upserts, removed = set(), [], []
+    for cid in ids:
+        bits = fingerprint(current[cid]) if cid in current else None
+        if cid not in current or bits != stored.get(cid):  # supprimé, créé ou SMILES modifié
+            changed.add(cid)
+            if bits is None:
+                removed.append(cid)
+            else:
+                upserts.append(CompoundFingerprint(compound_id=cid, bits=bits))
+    with transaction.atomic():
+        CompoundFingerprint.objects.bulk_create(upserts, batch_size=2000, update_conflicts=True,
+                                                unique_fields=["compound"], update_fields=["bits"])
+        for chunk in _chunked(removed):
+            CompoundFingerprint.objects.filter(pk__in=chunk).delete()
+    return changed
+
+
+def _incremental(changed) -> dict:
+    k, threshold = settings.RELATED_TOP_K, settings.RELATED_MIN_SIMILARITY
+    index = _load_index()
+    if len(changed) > settings.RELATED_FULL_RECOMPUTE_RATIO * max(len(index), 1):
+        neighbours = index.neighbours(range(len(index)), k, threshold)
+        rows = _write(neighbours, everything=True)
+        return {"mode": "full", "compounds": len(index), "recomputed": len(index), "rows": rows}
+
+    # Voisinages touchés : ceux qui avaient un composé modifié pour voisin...
+    stale = set()
+    for chunk in _chunked(changed):
+        stale.update(RelatedCompound.objects.filter(related_id__in=chunk).values_list("compound_id", flat=True))
+    # ... et ceux où il entre dans le top-k
+    candidates = {}
+    present = [index.position[cid] for cid in changed if cid in index]
+    for hits in index.similar(present, threshold).values():
+        for sim, other in hits:
+            candidates[other] = max(sim, candidates.get(other, 0.0))
+    for cid in changed:
+        candidates.pop(cid, None)
+    floors = {}
+    for chunk in _chunked(set(candidates) - stale):
+        floors.update(
+            (row["compound_id"], (row["n"], row["floor"])) for row in
+            RelatedCompound.objects.filter(compound_id__in=chunk).values("compound_id")
+            .annotate(n=Count("id"), floor=Min("similarity"))
+        )
+    for other, sim in candidates.items():
+        n, floor = floors.get(other, (0, None))
+        if n < k or sim >= floor:
+            stale.add(other)
+
+    targets = (changed | stale) & set(index.position)
+    neighbours = index.neighbours([index.position[cid] for cid in targets], k, threshold)
+    rows = _write(neighbours, cleared=(changed | stale) - targets)
+    return {"mode": "incremental", "compounds": len(index), "recomputed": len(targets), "rows": rows}
+
+
+def refresh(rebuild=False) -> dict:
+    """
+    Met la table des voisins à jour. Retourne un résumé ({} si un autre
+    process calcule déjà).
+    """
+    os.makedirs(settings.SEARCH_INDEX_DIR, exist_ok=True)
+    with BuildLock(KIND) as acquired:
+        if not acquired:
+            return {}
+        state, now = _load_state(), timezone.now()
+        # Jeton lu avant les lignes : une écriture concurrente sera rejouée au passage suivant
+        token = CompoundChange.objects.aggregate(m=Max("id"))["m"] or 0
+        if rebuild or state is None or state.get("params") != _params():
+            summary = _rebuild()
+        else:
+            since = datetime.fromisoformat(state["refreshed_at"])
+            window = since - timedelta(seconds=settings.COMPOUND_CHANGES_SETTLE_SECONDS)
+            affected = set(
+                CompoundChange.objects.filter(Q(id__gt=state["token"]) | Q(created_at__gte=window))
+                .values_list("compound_id", flat=True)
+            )
+            changed = _sync_fingerprints(sorted(affected))
+            summary = _incremental(changed) if changed else {"mode": "up-to-date", "recomputed": 0}
+            summary["changed"] = len(changed)
+        _save_state({"token": token, "refreshed_at": now.isoformat(), "params": _params()})
+        summary["token"] = token
+        return summary
+
+
+def related_compounds(compound_id, public_only: bool) -> list:
+    """Voisins précalculés d'un composé (une requête ; les voisins supprimés sont écartés par la jointure)."""
+    rows = RelatedCompound.objects.filter(compound_id=compound_id)
+    if public_only:
+        rows = rows.filter(related__is_public=True)
+    return [
+        {"id": rid, "name": name, "formula": formula, "smiles": smiles, "similarity": round(sim, 3)}
+        for rid, name, formula, smiles, sim in rows.order_by("rank").values_list(
+            "related_id", "related__name", "related__formula", "related__smiles", "similarity",
+        )
+    ]
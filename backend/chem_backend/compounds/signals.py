@@ -0,0 +1,33 @@
+# compounds/signals.py
+"""
+Journal des changements (CompoundChange) écrit dans la transaction de
+l'écriture : Compound.save() tourne dans transaction.atomic(), les
+suppressions (y compris en cascade) dans celle du Collector. Chaque entrée
+est aussi publiée aux flux SSE (compounds/events.py).
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import events
+from .models import Compound, CompoundChange
+
+
+@receiver(post_save, sender=Compound)
+def log_compound_saved(sender, instance, created, **kwargs):
+    events.publish(CompoundChange.objects.create(
+        compound_id=instance.pk,
+        action=CompoundChange.CREATED if created else CompoundChange.UPDATED,
+        is_public=instance.is_public,
+        ever_public=(instance.is_public if created
+                     else CompoundChange.was_ever_public(instance.pk, instance.is_public)),
+    ))
+
+
+@receiver(post_delete, sender=Compound)
+def log_compound_deleted(sender, instance, **kwargs):
+    events.publish(CompoundChange.objects.create(
+        compound_id=instance.pk,
+        action=CompoundChange.DELETED,
+        is_public=instance.is_public,
+        ever_public=CompoundChange.was_ever_public(instance.pk, instance.is_public),
+    ))
@@ -0,0 +1,155 @@
+# compounds/synthetic.py
+"""
+Générateur de composés synthétiques pour les benchmarks.
+
+Les molécules sont assemblées à partir d'un squelette (benzène, pyridine,
+chaîne alkyle...) et de substituants dont la composition atomique est connue :
+SMILES, formule brute (ordre de Hill) et masse moléculaire moyenne restent
+cohérents sans dépendance chimie externe, et la génération reste rapide
+(quelques µs par composé) pour seeder des millions de lignes.
+"""
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .chemistry import monoisotopic_mass
+
+# Comptes créés par `manage.py seed_compounds`
+BENCH_EMAIL_PREFIX = "bench-"
+BENCH_ADMIN_EMAIL = "bench-admin@example.com"
+BENCH_PASSWORD = "benchmark-password"
+
+# Masses atomiques moyennes (IUPAC)
+ATOMIC_WEIGHTS = {
+    "C": 12.011,
+    "H": 1.008,
+    "N": 14.007,
+    "O": 15.999,
+    "S": 32.06,
+    "F": 18.998,
+    "Cl": 35.45,
+    "Br": 79.904,
+}
+
+# (nom, template SMILES avec emplacements {0}, {1}..., composition sans substituant)
+SCAFFOLDS = [
+    ("benzene", "c1cc{0}cc{1}c1", {"C": 6, "H": 6}),
+    ("pyridine", "c1c{0}cnc{1}c1", {"C": 5, "H": 5, "N": 1}),
+    ("cyclohexane", "C1CC{0}CC{1}C1", {"C": 6, "H": 12}),
+    ("naphthalene", "c1ccc2cc{0}ccc2c{1}1", {"C": 10, "H": 8}),
+    ("thiophene", "c1cc{0}sc1", {"C": 4, "H": 4, "S": 1}),
+    ("furan", "c1cc{0}oc1", {"C": 4, "H": 4, "O": 1}),
+    ("piperidine", "C1CCN{0}CC1", {"C": 5, "H": 11, "N": 1}),
+    ("indole", "c1ccc2[nH]cc{0}c2c1", {"C": 8, "H": 7, "N": 1}),
+    ("propane", "CC{0}C{1}", {"C": 3, "H": 8}),
+    ("butane", "CCC{0}C{1}", {"C": 4, "H": 10}),
+    ("hexane", "CCCCC{0}C{1}", {"C": 6, "H": 14}),
+]
+
+# (préfixe, SMILES du groupe, composition du radical)
+SUBSTITUENTS = [
+    ("hydroxy", "O", {"O": 1, "H": 1}),
+    ("amino", "N", {"N": 1, "H": 2}),
+    ("methyl", "C", {"C": 1, "H": 3}),
+    ("ethyl", "CC", {"C": 2, "H": 5}),
+    ("methoxy", "OC", {"C": 1, "H": 3, "O": 1}),
+    ("chloro", "Cl", {"Cl": 1}),
+    ("fluoro", "F", {"F": 1}),
+    ("bromo", "Br", {"Br": 1}),
+    ("carboxy", "C(=O)O", {"C": 1, "H": 1, "O": 2}),
+    ("carbamoyl", "C(=O)N", {"C": 1, "H": 2, "N": 1, "O": 1}),
+    ("acetyl", "C(=O)C", {"C": 2, "H": 3, "O": 1}),
+    ("cyano", "C#N", {"C": 1, "N": 1}),
+    ("nitro", "[N+](=O)[O-]", {"N": 1, "O": 2}),
+    ("trifluoromethyl", "C(F)(F)F", {"C": 1, "F": 3}),
+    ("sulfamoyl", "S(=O)(=O)N", {"S": 1, "O": 2, "N": 1, "H": 2}),
+]
+
+DESCRIPTIONS = [
+    "Synthetic benchmark compound.",
+    "Intermediate used in medicinal chemistry screening.",
+    "Reference standard, stored at 4 °C.",
+    "Building block for library synthesis.",
+    "",
+]
+
+
+def hill_formula(counts) -> str:
+    """Formule brute en notation de Hill (C, H, puis ordre alphabétique)."""
+    parts = []
+    keys = sorted(counts)
+    if "C" in counts:
+        keys = ["C"] + (["H"] if "H" in counts else []) + [k for k in keys if k not in ("C", "H")]
+    for el in keys:
+        n = counts[el]
+        if n:
+            parts.append(el if n == 1 else f"{el}{n}")
+    return "".join(parts)
+
+
+def molecular_weight(counts) -> float:
+    return round(sum(ATOMIC_WEIGHTS[el] * n for el, n in counts.items()), 3)
+
+
+def random_compound(rng: random.Random) -> dict:
+    """Un composé plausible : name, formula, smiles, molecular_weight, monoisotopic_mass."""
+    scaffold_name, template, base = rng.choice(SCAFFOLDS)
+    nslots = template.count("{")
+    counts = Counter(base)
+    fills, prefixes = [], []
+    for pos in range(nslots):
+        if rng.random() < 0.65:
+            prefix, smi, group = rng.choice(SUBSTITUENTS)
+            counts["H"] -= 1  # le substituant remplace un H du squelette
+            counts.update(group)
+            fills.append(f"({smi})")
+            prefixes.append(f"{2 * pos + 2}-{prefix}")
+        else:
+            fills.append("")
+    smiles = template.format(*fills)
+    prefixes.sort(key=lambda p: p.split("-", 1)[1])
+    name = "-".join(prefixes) + scaffold_name if prefixes else scaffold_name
+    formula = hill_formula(counts)
+    return {
+        "name": name[:100],
+        "formula": formula,
+        "smiles": smiles,
+        "molecular_weight": molecular_weight(counts),
+        # bulk_create ne passe pas par Compound.save()
+        "monoisotopic_mass": monoisotopic_mass(formula),
+    }
+
+
+def zipf_cum_weights(n: int, s: float = 1.1):
+    """Poids cumulés ~ 1/rang^s : quelques propriétaires possèdent la majorité des composés."""
+    total, cum = 0.0, []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+def iter_compound_batches(rng, owner_ids, count, batch_size=5000, public_ratio=0.7,
+                          skew=1.1, spread_days=730):
+    """
+    Génère `count` dicts de composés par lots de `batch_size`, avec une
+    répartition des propriétaires biaisée (Zipf) et des dates étalées.
+    """
+    cum = zipf_cum_weights(len(owner_ids), skew)
+    now = timezone.now()
+    done = 0
+    while done < count:
+        n = min(batch_size, count - done)
+        owners = rng.choices(owner_ids, cum_weights=cum, k=n)
+        batch = []
+        for owner_id in owners:
+            data = random_compound(rng)
+            data["owner_id"] = owner_id
+            data["is_public"] = rng.random() < public_ratio
+            data["description"] = rng.choice(DESCRIPTIONS)
+            data["created_at"] = now - timedelta(seconds=rng.randrange(spread_days * 86400))
+            batch.append(data)
+        done += n
+        yield batch
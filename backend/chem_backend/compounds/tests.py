@@ -1,3 +1,1481 @@
-from django.test import TestCase
+import collections
+import fcntl
+import gzip
+import array
+import ast
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+
+from chem_backend import compression, metrics, profiling, queryguard, shedding, throttle
+from chem_backend.querybudget import QueryBudgetExceeded, assert_query_budget
+from compounds import catalog, depiction, events, export, massindex, properties, related, uploads
+from compounds.indexfile import file_stamp, index_path
+from compounds.models import Compound, CompoundChange, CompoundProperty
+from compounds.synthetic import BENCH_ADMIN_EMAIL, BENCH_PASSWORD
+from stats import counters
+from stats.models import Counter
+
+User = get_user_model()
+
+
+class CompoundTestCase(TestCase):
+    """Deux comptes, une dizaine de composés publics et privés ; fichiers générés dans un dossier temporaire."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.var_dir = tempfile.mkdtemp(prefix="chem-tests-")
+        cls._var_settings = override_settings(
+            SEARCH_INDEX_DIR=f"{cls.var_dir}/index", EXPORT_CACHE_DIR=f"{cls.var_dir}/exports",
+            DEPICTION_CACHE_DIR=f"{cls.var_dir}/depictions", CATALOG_DIR=f"{cls.var_dir}/catalog",
+            UPLOAD_TEMP_DIR=f"{cls.var_dir}/uploads", PROFILING_DIR=f"{cls.var_dir}/profiles",
+        )
+        cls._var_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._var_settings.disable()
+        shutil.rmtree(cls.var_dir, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin@example.com", "Admin", "admin-password")
+        cls.user = User.objects.create_user("user@example.com", "User", "user-password")
+        cls.compounds = [
+            Compound.objects.create(
+                name=f"compound-{i}", formula="C6H6O", smiles="c1ccccc1O",
+                owner=cls.admin if i % 2 else cls.user, is_public=i % 3 != 0,
+            )
+            for i in range(10)
+        ]
+
+
+# ---------- Budgets de requêtes SQL (chem_backend/querybudget.py) ----------
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class QueryBudgetTests(CompoundTestCase):
+    """Chaque vue chaude doit rester dans son budget QUERY_BUDGETS (exception sinon)."""
+
+    def test_public_list(self):
+        response = self.client.get("/api/compounds/public/")
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+
+    def test_public_search(self):
+        response = self.client.get("/api/compounds/public/", {"q": "compound-1"})
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+
+    def test_private_list_and_search(self):
+        self.client.force_login(self.user)
+        for params in ({}, {"q": "compound"}):
+            response = self.client.get("/api/compounds/private/", params)
+            self.assertEqual(response.status_code, 200)
+            assert_query_budget(response)
+
+    def test_detail(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f"/api/compounds/{self.compounds[0].pk}/")
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+
+    def test_detail_anonymous(self):
+        response = self.client.get(f"/api/compounds/{self.compounds[1].pk}/")
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+
+    def test_budget_is_enforced(self):
+        self.client.force_login(self.user)
+        with override_settings(QUERY_BUDGETS={"get_compounds": 1}), self.assertRaises(AssertionError):
+            self.client.get("/api/compounds/private/")
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True, COUNTER_SHARDS=64)
+class WriteQueryBudgetTests(CompoundTestCase):
+    """Écritures : compteurs stats et journal compris, sur un shard de compteur encore vide."""
+
+    def setUp(self):
+        patcher = mock.patch("stats.counters.random.randrange", return_value=63)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.user)
+
+    def post(self, url, data):
+        response = self.client.post(url, data, content_type="application/json")
+        self.assertIn(response.status_code, (200, 201), response.content)
+        assert_query_budget(response)
+        return response
+
+    def test_add(self):
+        self.post("/api/compounds/add/", {"name": "ethanol", "formula": "C2H6O", "smiles": "CCO", "is_public": True})
+
+    def test_update(self):
+        comp = self.compounds[0]
+        version = self.post(f"/api/compounds/{comp.pk}/update/", {"name": "renamed", "is_public": True}
+                            ).json()["compound"]["version"]
+        response = self.client.patch(f"/api/compounds/{comp.pk}/update/", {"is_public": False},
+                                     content_type="application/json", HTTP_IF_MATCH=f'"{version}"')
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+
+    def test_delete(self):
+        self.post(f"/api/compounds/{self.compounds[2].pk}/delete/", {})
+
+
+# ---------- Données synthétiques (compounds/synthetic.py, seed_compounds) ----------
+
+class SyntheticFlowTests(CompoundTestCase):
+    """Jeu de données du seeder de benchmarks, parcouru comme le fait le front."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_compounds", compounds=300, users=5, batch_size=100, seed=7, stdout=StringIO())
+
+    def test_seeded_rows(self):
+        self.assertEqual(Compound.objects.count(), 300)
+        self.assertEqual(CompoundChange.objects.count(), 300)
+        self.assertFalse(Compound.objects.filter(monoisotopic_mass=None).exists())
+
+    def test_public_list_and_search(self):
+        public = Compound.objects.filter(is_public=True)
+        response = self.client.get("/api/compounds/public/", {"limit": 50})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["total"], public.count())
+        self.assertEqual(len(data["results"]), 50)
+        self.assertTrue(all(c["is_public"] for c in data["results"]))
+
+        name = public.order_by("id").first().name
+        response = self.client.get("/api/compounds/public/", {"q": name})
+        self.assertIn(name, [c["name"] for c in response.json()["results"]])
+
+    def test_login_me_private_list_and_detail(self):
+        response = self.client.post("/api/auth/login/", {"email": BENCH_ADMIN_EMAIL, "password": BENCH_PASSWORD},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/auth/me/")
+        self.assertEqual(response.json()["user"]["email"], BENCH_ADMIN_EMAIL)
+
+        response = self.client.get("/api/compounds/private/", {"q": "benzene", "limit": 5})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertTrue(results)
+        compound = Compound.objects.get(pk=results[0]["id"])
+        response = self.client.get(f"/api/compounds/{compound.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["compound"]["formula"], compound.formula)
+
+    def test_private_detail_hidden_from_anonymous(self):
+        private = Compound.objects.filter(is_public=False).first()
+        self.assertEqual(self.client.get(f"/api/compounds/{private.pk}/").status_code, 404)
+
+
+# ---------- Compteurs statistiques (stats/counters.py) ----------
+
+class CounterDriftTests(CompoundTestCase):
+    """Les deltas appliqués à l'écriture doivent rester égaux à un recomptage complet."""
+
+    def assertNoDrift(self):
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_no_drift_after_orm_writes(self):
+        self.assertNoDrift()
+        c = self.compounds[0]
+        c.is_public = not c.is_public
+        c.save()
+        c.owner = self.admin
+        c.save(update_fields=["owner"])
+        self.compounds[1].delete()
+        Compound.objects.create(name="new", formula="CH4", smiles="C", owner=self.user, is_public=False)
+        self.user.is_active = False
+        self.user.save()
+        self.assertNoDrift()
+
+    def test_no_drift_after_api_writes(self):
+        self.client.force_login(self.admin)
+        response = self.client.post("/api/compounds/add/", {
+            "name": "ethanol", "formula": "C2H6O", "smiles": "CCO", "is_public": False,
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        cid = response.json()["compound"]["id"]
+        response = self.client.post(f"/api/compounds/{cid}/update/", {"is_public": True},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.post(f"/api/compounds/{self.compounds[1].pk}/delete/").status_code, 200)
+        self.assertNoDrift()
+        self.assertEqual(counters.get_value(counters.COMPOUNDS_TOTAL), Compound.objects.count())
+
+    def test_reconcile_fixes_drift(self):
+        Counter.objects.filter(key__startswith=counters.COMPOUNDS_PUBLIC).delete()
+        Counter.objects.create(key=counters.COMPOUNDS_PUBLIC, value=999)
+        drift = counters.reconcile()
+        self.assertEqual(drift[counters.COMPOUNDS_PUBLIC][0], 999)
+        self.assertEqual(counters.get_value(counters.COMPOUNDS_PUBLIC), Compound.objects.filter(is_public=True).count())
+        self.assertNoDrift()
+
+    @override_settings(COUNTER_SHARDS=4)
+    def test_writes_spread_over_shards(self):
+        shard = Counter.objects.filter(key=counters.COMPOUNDS_TOTAL + "#3")
+        before = shard.values_list("value", flat=True).first() or 0
+        with mock.patch("stats.counters.random.randrange", return_value=3):
+            Compound.objects.create(name="new", formula="CH4", smiles="C", owner=self.user, is_public=True)
+        self.assertEqual(shard.get().value, before + 1)
+        total = Compound.objects.count()
+        self.assertEqual(counters.get_value(counters.COMPOUNDS_TOTAL), total)
+        self.assertEqual(counters.get_value(counters.COMPOUNDS_TOTAL, for_update=True), total)
+        self.assertEqual(counters.get_values([counters.COMPOUNDS_TOTAL, counters.owner_key(self.user.pk)]), {
+            counters.COMPOUNDS_TOTAL: total,
+            counters.owner_key(self.user.pk): Compound.objects.filter(owner=self.user).count(),
+        })
+        # reconcile replie les shards dans la ligne de base sans signaler d'écart
+        self.assertNoDrift()
+        self.assertFalse(Counter.objects.filter(key__contains=counters.SHARD_SEP).exists())
+        self.assertEqual(Counter.objects.get(key=counters.COMPOUNDS_TOTAL).value, total)
+
+    def test_suspended_cascade_delete(self):
+        with mock.patch("stats.counters.apply") as apply, counters.suspended():
+            self.user.delete()
+        apply.assert_not_called()
+        self.assertFalse(counters.is_suspended())
+        drift = counters.reconcile()
+        self.assertEqual(drift[counters.COMPOUNDS_TOTAL][1], Compound.objects.count())
+        self.assertNoDrift()
+
+    def test_seed_clear_skips_signals(self):
+        call_command("seed_compounds", compounds=20, users=2, batch_size=10, stdout=StringIO())
+        with mock.patch("stats.counters.apply") as apply:
+            call_command("seed_compounds", compounds=20, users=2, batch_size=10, clear=True, stdout=StringIO())
+        # Seul le compte bench-admin, recréé par save(), passe par les signaux
+        self.assertEqual([set(c.args[0]) & {counters.COMPOUNDS_TOTAL} for c in apply.call_args_list], [set()])
+        self.assertNoDrift()
+
+
+# ---------- Flux de changements (/api/compounds/changes/) ----------
+
+@override_settings(COMPOUND_CHANGES_SETTLE_SECONDS=0)
+class ChangeFeedTests(CompoundTestCase):
+    """Les anonymes ne reçoivent de tombstone que pour des composés déjà publics."""
+
+    def feed(self, since=0):
+        response = self.client.get("/api/compounds/changes/", {"since": since})
+        self.assertEqual(response.status_code, 200)
+        return {c["id"]: c for c in response.json()["changes"]}
+
+    def test_tombstones_only_for_once_public_compounds(self):
+        since = CompoundChange.objects.order_by("id").last().id
+        always_private, private_deleted = self.compounds[0], self.compounds[3]
+        made_private, public_deleted = self.compounds[1], self.compounds[2]
+        private_deleted_id, public_deleted_id = private_deleted.pk, public_deleted.pk
+        always_private.description = "edited"
+        always_private.save()
+        private_deleted.delete()
+        made_private.is_public = False
+        made_private.save()
+        public_deleted.delete()
+
+        changes = self.feed(since)
+        self.assertEqual(set(changes), {made_private.pk, public_deleted_id})
+        self.assertTrue(all(c["action"] == CompoundChange.DELETED for c in changes.values()))
+
+        self.client.force_login(self.user)
+        changes = self.feed(since)
+        self.assertEqual(set(changes), {always_private.pk, private_deleted_id, made_private.pk, public_deleted_id})
+        self.assertIn("compound", changes[always_private.pk])
+
+    def test_compaction_keeps_tombstone_visibility(self):
+        made_private = self.compounds[1]
+        made_private.is_public = False
+        made_private.save()
+        made_private.description = "still private"
+        made_private.save()
+        self.compounds[0].description = "edited"
+        self.compounds[0].save()
+        call_command("compact_compound_changes", stdout=StringIO())
+
+        changes = self.feed()
+        self.assertEqual(changes[made_private.pk]["action"], CompoundChange.DELETED)
+        self.assertNotIn(self.compounds[0].pk, changes)
+
+
+# ---------- Événements en direct (compounds/events.py) ----------
+
+class CompoundEventTests(CompoundTestCase):
+    """Trames SSE : mêmes règles de visibilité que /changes/, construites hors du thread de l'écriture."""
+
+    def frames(self, entry):
+        return events.build_frames({"token": entry.id, "action": entry.action, "id": entry.compound_id,
+                                    "is_public": entry.is_public, "ever_public": entry.ever_public})
+
+    def test_always_private_compound_is_not_announced(self):
+        comp = self.compounds[0]
+        comp.description = "edited"
+        comp.save()
+        full, anon = self.frames(CompoundChange.objects.filter(compound_id=comp.pk).last())
+        self.assertIn('"compound"', full)
+        self.assertIsNone(anon)
+        comp_id = comp.pk
+        comp.delete()
+        full, anon = self.frames(CompoundChange.objects.filter(compound_id=comp_id).last())
+        self.assertIn('"deleted"', full)
+        self.assertIsNone(anon)
+
+    def test_compound_made_private_is_a_tombstone(self):
+        comp = self.compounds[1]
+        comp.is_public = False
+        comp.save()
+        full, anon = self.frames(CompoundChange.objects.filter(compound_id=comp.pk).last())
+        self.assertIn('"compound"', full)
+        self.assertIn('"deleted"', anon)
+
+    def test_local_dispatch_runs_off_the_writer_thread(self):
+        done, threads = threading.Event(), []
+
+        def build(event):
+            threads.append(threading.current_thread())
+            done.set()
+            return None, None
+
+        with mock.patch.object(events.Broker, "__len__", return_value=1), \
+                mock.patch.object(events, "build_frames", side_effect=build):
+            events.broker.dispatch_event({"token": 1, "action": CompoundChange.CREATED, "id": 1,
+                                          "is_public": True, "ever_public": True})
+            self.assertTrue(done.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+
+# ---------- Compression négociée (chem_backend/compression.py) ----------
+
+class CompressionTests(CompoundTestCase):
+    """Accept-Encoding : q-values, préférence serveur, seuil de taille."""
+
+    def test_negotiate(self):
+        encodings = ("zstd", "br", "gzip")
+        self.assertEqual(compression.negotiate("gzip, br", encodings), "br")
+        self.assertEqual(compression.negotiate("gzip;q=1, br;q=0.5", encodings), "gzip")
+        self.assertEqual(compression.negotiate("*;q=0.2, zstd;q=0", encodings), "br")
+        self.assertEqual(compression.negotiate("x-gzip", encodings), "gzip")
+        self.assertIsNone(compression.negotiate("identity", encodings))
+        self.assertIsNone(compression.negotiate("", encodings))
+
+    @override_settings(COMPRESSION_ENCODINGS=("gzip",))
+    def test_gzip_json_response(self):
+        plain = self.client.get("/api/compounds/public/")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", plain["Vary"])
+        self.assertGreater(len(plain.content), 1024)
+
+        response = self.client.get("/api/compounds/public/", HTTP_ACCEPT_ENCODING="br;q=0.9, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+
+    def test_small_response_is_not_compressed(self):
+        response = self.client.get("/api/compounds/public/", {"q": "no-such-compound"},
+                                   HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+# ---------- Délestage (chem_backend/shedding.py) ----------
+
+@override_settings(SHED_ENABLED=True, THROTTLE_BACKEND="local")
+class LoadSheddingTests(CompoundTestCase):
+    """Débit par client, délestage sous pression, part des anonymes ; les admins passent toujours."""
+
+    URL = "/api/compounds/public/"
+
+    def setUp(self):
+        throttle.buckets.clear()
+        patcher = mock.patch.object(shedding, "shedder", shedding.LoadShedder())
+        self.shedder = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertRefused(self, response, status):
+        self.assertEqual(response.status_code, status)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+    @override_settings(SHED_RATES={"anon": (0.001, 2), "user": (0.001, 2)})
+    def test_rate_limit_per_client(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.URL).status_code, 200)
+        self.assertRefused(self.client.get(self.URL), 429)
+        # limit=100 coûte 5 jetons : au-delà de la rafale d'un connecté
+        self.client.force_login(self.user)
+        self.assertRefused(self.client.get(self.URL, {"limit": 100}), 429)
+        self.client.force_login(self.admin)
+        for _ in range(5):
+            self.assertEqual(self.client.get(self.URL, {"limit": 100}).status_code, 200)
+        self.assertEqual(self.shedder.throttled, {"anon": 1, "user": 1, "admin": 0})
+
+    def test_sheds_anonymous_first_under_pressure(self):
+        with mock.patch.object(self.shedder, "pressure", return_value=1.6), \
+                mock.patch.object(shedding.random, "random", return_value=0.0):
+            self.assertRefused(self.client.get(self.URL), 503)
+            self.client.force_login(self.user)
+            self.assertEqual(self.client.get(self.URL).status_code, 200)
+        with mock.patch.object(self.shedder, "pressure", return_value=10.0), \
+                mock.patch.object(shedding.random, "random", return_value=0.0):
+            self.assertRefused(self.client.get(self.URL), 503)
+            self.client.force_login(self.admin)
+            self.assertEqual(self.client.get(self.URL).status_code, 200)
+        self.assertEqual(self.shedder.shed, {"anon": 1, "user": 1, "admin": 0})
+
+    @override_settings(SHED_CONCURRENCY={"list": 4}, SHED_ANON_SHARE=0.5)
+    def test_anonymous_share_of_endpoint_slots(self):
+        # Deux places "list" déjà occupées : la part anonyme (2 sur 4) est pleine
+        self.shedder.by_class["list"] = self.shedder.in_flight = 2
+        self.assertRefused(self.client.get(self.URL), 503)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+        self.shedder.by_class["list"] = self.shedder.in_flight = 4
+        self.assertRefused(self.client.get(self.URL), 503)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+        self.assertEqual(self.shedder.by_class["list"], 4)  # place libérée en sortie
+
+    @override_settings(QUERY_GUARD_ENABLED=False)
+    def test_classifies_from_resolver_match(self):
+        resolver = get_resolver()
+        with mock.patch.object(resolver, "resolve", wraps=resolver.resolve) as resolve:
+            self.assertEqual(self.client.get(self.URL).status_code, 200)
+        self.assertEqual(resolve.call_count, 1)  # celui du handler
+        self.assertEqual(self.shedder.by_class["list"], 0)
+        self.assertEqual(self.client.get("/api/nope/").status_code, 404)
+
+
+# ---------- Profilage à la demande (chem_backend/profiling.py) ----------
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTests(CompoundTestCase):
+    """Échantillonnage des piles, profil réservé au staff, rétention bornée."""
+
+    def setUp(self):
+        shutil.rmtree(settings.PROFILING_DIR, ignore_errors=True)
+
+    def test_staff_request_is_profiled(self):
+        self.client.force_login(self.admin)
+        response = self.client.get("/api/compounds/public/", HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        profile_id = response["X-Profile-Id"]
+        meta = self.client.get(f"/api/admin/profiles/{profile_id}/").json()
+        self.assertEqual((meta["method"], meta["url_name"], meta["status"]), ("GET", "get_all_compounds_public", 200))
+        self.assertEqual(meta["sql_count"], len(meta["sql"]))
+        self.assertTrue(any("compounds_compound" in e["sql"] for e in meta["sql"]))
+        self.assertEqual([p["id"] for p in self.client.get("/api/admin/profiles/").json()["results"]], [profile_id])
+        svg = self.client.get(f"/api/admin/profiles/{profile_id}/flamegraph.svg")
+        self.assertEqual(svg["Content-Type"], "image/svg+xml")
+
+    def test_non_staff_request_is_not_profiled(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(profiling, "StackSampler") as sampler:
+            response = self.client.get("/api/compounds/public/", {"_profile": "1"})
+        sampler.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(profiling.list_profiles(), [])
+
+    def test_forged_session_cookie_does_not_take_the_profiler(self):
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = "forged"
+        with mock.patch.object(profiling, "StackSampler") as sampler, \
+                mock.patch.object(profiling, "_busy") as busy:
+            response = self.client.get("/api/compounds/public/", HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+        sampler.assert_not_called()
+        busy.acquire.assert_not_called()
+        # la place reste libre pour le staff
+        self.client.force_login(self.admin)
+        self.assertIn("X-Profile-Id", self.client.get("/api/compounds/public/", HTTP_X_PROFILE="1"))
+
+    def test_sampler_records_the_running_stack(self):
+        def busy_wait():
+            # jusqu'à 5 échantillons (2 s au plus) : robuste sur une machine chargée
+            deadline = time.monotonic() + 2
+            while sum(sampler.stacks.values()) <= 5 and time.monotonic() < deadline:
+                pass
+
+        sampler = profiling.StackSampler(threading.get_ident(), sys._getframe(), 0.001)
+        sampler.start()
+        try:
+            busy_wait()
+        finally:
+            sampler.stop()
+        self.assertGreater(sum(sampler.stacks.values()), 5)
+        self.assertTrue(all(stack.endswith("busy_wait") for stack in sampler.stacks))
+        profile_id = profiling.save_profile({"started_at": "x"}, sampler.stacks, [])
+        self.assertEqual(profiling.load_stacks(profile_id), sampler.stacks)
+        self.assertEqual(profiling.load_profile(profile_id)["top_functions"][0]["self"], sum(sampler.stacks.values()))
+
+    @override_settings(PROFILING_KEEP=2)
+    def test_retention_removes_oldest_profiles(self):
+        ids = []
+        for i in range(3):
+            ids.append(profiling.save_profile({"started_at": str(i)}, collections.Counter({"a;b": 1}), []))
+            os.utime(profiling.profile_path(ids[-1], "json"), (i, i))
+        self.assertEqual(sorted(p["id"] for p in profiling.list_profiles()), sorted(ids[1:]))
+        self.assertFalse(os.path.exists(profiling.profile_path(ids[0], "folded")))
+        self.assertIsNone(profiling.load_profile("../../etc/passwd"))
+
+
+# ---------- Métriques (chem_backend/metrics.py, /api/metrics/) ----------
+
+@override_settings(METRICS_ENABLED=True, METRICS_SERVER_TIMING=True, METRICS_TOKEN="scrape-token")
+class MetricsTests(CompoundTestCase):
+    """Compteurs par vue exposés au format Prometheus ; compteurs par process, comparés avant/après."""
+
+    def scrape(self) -> str:
+        response = self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer scrape-token")
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    @staticmethod
+    def sample(text, name, **labels) -> float:
+        """Valeur d'une série (0 si absente)."""
+        wanted = metrics._labels(**labels) if labels else ""
+        for line in text.splitlines():
+            if line.startswith(name + wanted + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    def test_request_counters_and_histograms(self):
+        before = self.scrape()
+        for _ in range(2):
+            response = self.client.get("/api/compounds/public/")
+            self.assertIn("total;dur=", response["Server-Timing"])
+        self.client.get("/api/compounds/999999/")
+        after = self.scrape()
+
+        ok = {"view": "get_all_compounds_public", "method": "GET", "status": "200"}
+        self.assertEqual(self.sample(after, "chem_http_requests_total", **ok)
+                         - self.sample(before, "chem_http_requests_total", **ok), 2)
+        missing = {"view": "compound_detail", "method": "GET", "status": "404"}
+        self.assertEqual(self.sample(after, "chem_http_requests_total", **missing)
+                         - self.sample(before, "chem_http_requests_total", **missing), 1)
+        latency = {"view": "get_all_compounds_public", "method": "GET"}
+        self.assertEqual(self.sample(after, "chem_http_request_duration_seconds_count", **latency)
+                         - self.sample(before, "chem_http_request_duration_seconds_count", **latency), 2)
+        self.assertGreater(self.sample(after, "chem_db_queries_total", view="get_all_compounds_public"),
+                           self.sample(before, "chem_db_queries_total", view="get_all_compounds_public"))
+        self.assertIn("# TYPE chem_http_request_duration_seconds histogram", after)
+
+    def test_cache_events(self):
+        before = self.scrape()
+        metrics.cache_event("depiction", True)
+        metrics.cache_event("depiction", False)
+        metrics.cache_event("depiction", False)
+        after = self.scrape()
+        for result, n in (("hit", 1), ("miss", 2)):
+            self.assertEqual(self.sample(after, "chem_cache_requests_total", cache="depiction", result=result)
+                             - self.sample(before, "chem_cache_requests_total", cache="depiction", result=result), n)
+
+    def test_access(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+        self.assertEqual(self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+        self.client.force_login(self.admin)
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("chem_process_start_time_seconds", response.content.decode())
+
+
+# ---------- Garde-fou des recherches (chem_backend/queryguard.py) ----------
+
+@override_settings(QUERY_GUARD_ENABLED=True)
+class QueryGuardTests(CompoundTestCase):
+    """Délai par progress handler SQLite, repli par préfixe selon le coût estimé (EXPLAIN simulé)."""
+
+    URL = "/api/compounds/public/"
+
+    @staticmethod
+    def cost(qs):
+        # Sous-chaîne (filtre aussi sur description) chère, préfixe bon marché
+        return 1e6 if '"description" LIKE' in str(qs.query) else 10.0
+
+    @override_settings(QUERY_GUARD_ENDPOINTS={"get_all_compounds_public": {"timeout_ms": 1000}})
+    def test_timeout_returns_structured_422(self):
+        # Assez de lignes pour que SQLite appelle le progress handler (toutes les 1000 instructions)
+        Compound.objects.bulk_create([
+            Compound(name=f"bulk-{i}", formula="CH4", smiles="C", owner=self.user, is_public=True)
+            for i in range(500)
+        ])
+        clock = mock.Mock(monotonic=mock.Mock(side_effect=itertools.chain([0.0], itertools.repeat(1e9))))
+        with mock.patch.object(queryguard, "time", clock):
+            response = self.client.get(self.URL, {"q": "zzz"})
+        # Pas d'autre requête SQL ici : la transaction du test est marquée pour rollback
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json(), {"error": "Query took too long; refine the search",
+                                           "code": "query_timeout", "timeout_ms": 1000})
+
+    @override_settings(QUERY_GUARD_ENDPOINTS={"get_all_compounds_public": {"timeout_ms": 1000}})
+    def test_fast_query_is_untouched(self):
+        response = self.client.get(self.URL, {"q": "compound"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Query-Downgraded", response)
+
+    @override_settings(QUERY_GUARD_ENDPOINTS={"get_all_compounds_public": {"max_cost": 100}})
+    def test_expensive_search_falls_back_to_prefix(self):
+        with mock.patch.object(queryguard, "estimated_cost", side_effect=self.cost):
+            response = self.client.get(self.URL, {"q": "compound-1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Query-Downgraded"], "prefix")
+        self.assertEqual([c["name"] for c in response.json()["results"]], ["compound-1"])
+
+    @override_settings(QUERY_GUARD_ENDPOINTS={"get_all_compounds_public": {"max_cost": 1}})
+    def test_too_expensive_even_as_prefix(self):
+        with mock.patch.object(queryguard, "estimated_cost", side_effect=self.cost):
+            response = self.client.get(self.URL, {"q": "compound"})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()["code"], "query_too_expensive")
+        self.assertEqual(response.json()["cost"], 10)
+
+    @override_settings(QUERY_GUARD_ENDPOINTS={"get_all_compounds_public": {"max_cost": 100}}, SHED_ENABLED=True)
+    def test_guard_armed_from_resolver_match(self):
+        # délestage + garde-fou : seul le handler résout l'URL
+        resolver = get_resolver()
+        with mock.patch.object(resolver, "resolve", wraps=resolver.resolve) as resolve, \
+                mock.patch.object(queryguard, "estimated_cost", side_effect=self.cost):
+            response = self.client.get(self.URL, {"q": "compound-1"})
+        self.assertEqual(resolve.call_count, 1)
+        self.assertEqual(response["X-Query-Downgraded"], "prefix")
+
+
+# ---------- Recherche par masse (/api/compounds/mass-search/) ----------
+
+@override_settings(QUERY_BUDGET_ENFORCE=True, MASS_INDEX_CATCHUP_SECONDS=0)
+class MassSearchTests(CompoundTestCase):
+    """m/z ± tolérance, adduits, visibilité ; l'index du process est repris de zéro à chaque test."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.glucose = Compound.objects.create(name="glucose", formula="C6H12O6", smiles="OCC1OC(O)C(O)C(O)C1O",
+                                              owner=cls.admin, is_public=True)
+        cls.fructose = Compound.objects.create(name="fructose", formula="C6H12O6", smiles="OCC1(O)OCC(O)C(O)C1O",
+                                               owner=cls.admin, is_public=False)
+
+    def setUp(self):
+        massindex.mass_index.reset()
+
+    def search(self, **params):
+        response = self.client.get("/api/compounds/mass-search/", params)
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+        return response.json()
+
+    def test_public_only_when_anonymous(self):
+        matches = self.search(mz="180.0634", tol=5)["results"][0]["matches"]
+        self.assertEqual([m["id"] for m in matches], [self.glucose.pk])
+        self.assertLess(abs(matches[0]["error_ppm"]), 5)
+
+    def test_private_matches_when_authenticated(self):
+        self.client.force_login(self.user)
+        matches = self.search(mz="180.0634", tol=5)["results"][0]["matches"]
+        self.assertEqual({m["id"] for m in matches}, {self.glucose.pk, self.fructose.pk})
+
+    def test_adducts_and_several_mz(self):
+        data = self.search(mz="181.0707,94.0419", tol=0.002, unit="Da", adducts="[M+H]+,[M]")
+        first, second = (block["matches"] for block in data["results"])
+        self.assertEqual([(m["id"], m["adduct"]) for m in first], [(self.glucose.pk, "[M+H]+")])
+        self.assertTrue(second)
+        self.assertTrue(all(m["adduct"] == "[M]" for m in second))
+
+    def test_post_with_compounds(self):
+        response = self.client.post("/api/compounds/mass-search/", {
+            "mz": [180.0634], "tolerance": 5, "include_compounds": True,
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["compounds"], {
+            str(self.glucose.pk): {"name": "glucose", "formula": "C6H12O6", "smiles": self.glucose.smiles},
+        })
+
+    def test_new_compound_is_searchable(self):
+        self.search(mz="180.0634")
+        galactose = Compound.objects.create(name="galactose", formula="C6H12O6", smiles="OCC1OC(O)C(O)C(O)C1O",
+                                            owner=self.user, is_public=True)
+        matches = self.search(mz="180.0634")["results"][0]["matches"]
+        self.assertIn(galactose.pk, {m["id"] for m in matches})
+
+    def test_invalid_parameters(self):
+        for params in ({}, {"mz": "abc"}, {"mz": "180", "unit": "mmu"}, {"mz": "180", "tol": "5000"},
+                       {"mz": "180", "adducts": "[M+Xe]+"}):
+            self.assertEqual(self.client.get("/api/compounds/mass-search/", params).status_code, 400, params)
+
+
+@override_settings(SEARCH_INDEX_SHARED=True, COMPOUND_CHANGES_SETTLE_SECONDS=0)
+class SearchIndexTests(CompoundTestCase):
+    """Fichier partagé écrit par build_search_index sous BuildLock ; les workers ne font que le lire."""
+
+    def setUp(self):
+        massindex.mass_index.reset()
+        self.path = index_path(massindex.KIND)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def build(self, *args):
+        call_command("build_search_index", *args, stdout=StringIO())
+
+    def test_command_writes_mapped_index(self):
+        self.build()
+        snap = massindex.mass_index.get()
+        self.assertEqual(len(snap), len(self.compounds))
+        self.assertEqual(massindex.mass_index._stamp, file_stamp(self.path))
+
+    def test_command_waits_for_build_lock(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "a+") as held:
+            fcntl.flock(held, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            with self.assertRaises(CommandError):
+                self.build("--lock-timeout", "0")
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_get_never_writes_the_file(self):
+        with override_settings(MASS_INDEX_OVERLAY_MAX=0, MASS_INDEX_CATCHUP_SECONDS=0):
+            massindex.mass_index.get()
+            self.assertFalse(os.path.exists(self.path))
+            self.build()
+            stamp = file_stamp(self.path)
+            Compound.objects.create(name="phenol", formula="C6H6O", smiles="c1ccccc1O", owner=self.user)
+            snap = massindex.mass_index.get()
+        self.assertEqual(len(snap.overlay), 1)
+        self.assertEqual(file_stamp(self.path), stamp)
+
+    @override_settings(MASS_INDEX_CATCHUP_SECONDS=3600)
+    def test_catch_up_is_throttled(self):
+        self.build()
+        massindex.mass_index.get()
+        Compound.objects.create(name="phenol", formula="C6H6O", smiles="c1ccccc1O", owner=self.user)
+        with self.assertNumQueries(0):
+            snap = massindex.mass_index.get()
+        self.assertFalse(snap.overlay)
+        massindex.mass_index._next_catch_up = 0.0
+        self.assertEqual(len(massindex.mass_index.get().overlay), 1)
+
+    def test_rebuild_is_picked_up(self):
+        self.build()
+        first = massindex.mass_index.get()
+        Compound.objects.create(name="phenol", formula="C6H6O", smiles="c1ccccc1O", owner=self.user)
+        self.build()
+        second = massindex.mass_index.get()
+        self.assertGreater(second.token, first.token)
+        self.assertEqual(len(second), len(self.compounds) + 1)
+        self.assertFalse(second.overlay)
+
+
+# ---------- Recalcul des données dérivées (recompute_compounds) ----------
+
+class RecomputeTests(CompoundTestCase):
+    """Reprise depuis le point de contrôle : les blocs déjà faits ne sont pas relus."""
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command("recompute_compounds", "--workers", "0", "--chunk-size", "5", *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_resume_from_checkpoint(self):
+        ids = sorted(c.pk for c in self.compounds)
+        expected = Compound.objects.get(pk=ids[0]).monoisotopic_mass
+        Compound.objects.update(monoisotopic_mass=0.0)  # sans save() : aucun recalcul
+        checkpoint = os.path.join(self.var_dir, "recompute-monoisotopic_mass.json")
+        with open(checkpoint, "w") as fh:
+            json.dump({"fields": ["monoisotopic_mass"], "chunk_size": 5, "lo": ids[0] - 1, "hi": ids[-1],
+                       "done": [ids[0] - 1], "scanned": 5, "changed": 5}, fh)
+
+        with override_settings(VAR_DIR=self.var_dir):
+            output = self.run_command()
+        self.assertIn("Resuming", output)
+        self.assertIn("10 rows, 10 changed", output)
+        self.assertFalse(os.path.exists(checkpoint))
+        masses = dict(Compound.objects.values_list("id", "monoisotopic_mass"))
+        self.assertEqual({masses[i] for i in ids[:5]}, {0.0})  # bloc marqué fait
+        for i in ids[5:]:
+            self.assertAlmostEqual(masses[i], expected)
+
+    def test_checkpoint_with_other_options_is_refused(self):
+        checkpoint = os.path.join(self.var_dir, "other.json")
+        with open(checkpoint, "w") as fh:
+            json.dump({"fields": ["monoisotopic_mass"], "chunk_size": 100, "lo": 0, "hi": 1, "done": []}, fh)
+        with self.assertRaises(CommandError):
+            self.run_command("--checkpoint", checkpoint)
+        self.run_command("--checkpoint", checkpoint, "--restart")
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+# ---------- Dépictions 2D (compounds/depiction.py) ----------
+
+class DepictionTests(CompoundTestCase):
+    """Lecture du SMILES, clé canonique, SVG sans coordonnée non finie, erreurs propres."""
+
+    SVG_NUMBER = re.compile(r' (?:x|y|x1|y1|x2|y2|cx|cy|r|dy|font-size|stroke-width)="([^"]*)"')
+
+    def test_rings_and_branches(self):
+        mol = depiction.parse_smiles("CC1CCC(C(C)(C)O)CC1")
+        self.assertEqual(len(mol.atoms), 11)
+        self.assertEqual(len(mol.bonds), 11)
+        self.assertEqual([len(r) for r in depiction.find_rings(mol)], [6])
+        quaternary = 5
+        self.assertEqual(len(mol.neighbors[quaternary]), 4)
+        self.assertEqual(mol.atoms[quaternary].hcount, 0)
+        naphthalene = depiction.parse_smiles("c1ccc2ccccc2c1")
+        self.assertEqual(sorted(len(r) for r in depiction.find_rings(naphthalene)), [6, 6])
+        double = depiction.parse_smiles("C=CC#N")
+        self.assertEqual([double.order(0, 1), double.order(2, 3)], [2, 3])
+
+    def test_charges_and_hydrogens(self):
+        ammonium = depiction.parse_smiles("[NH4+]").atoms[0]
+        self.assertEqual((ammonium.element, ammonium.charge, ammonium.hcount), ("N", 1, 4))
+        nitro = depiction.parse_smiles("C[N+](=O)[O-]")
+        self.assertEqual([a.charge for a in nitro.atoms], [0, 1, 0, -1])
+        self.assertEqual(depiction.parse_smiles("[Fe+++]").atoms[0].charge, 3)
+        self.assertEqual(depiction.parse_smiles("[Cu-2]").atoms[0].charge, -2)
+        self.assertEqual([a.hcount for a in depiction.parse_smiles("CCO").atoms], [3, 2, 1])
+
+    def test_aromatic_atoms(self):
+        benzene = depiction.parse_smiles("c1ccccc1")
+        self.assertTrue(all(a.aromatic and a.element == "C" and a.hcount == 1 for a in benzene.atoms))
+        self.assertEqual(set(benzene.bonds.values()), {depiction.AROMATIC_BOND})
+        pyridine = depiction.parse_smiles("c1ccncc1")
+        self.assertEqual([a.hcount for a in pyridine.atoms if a.element == "N"], [0])
+        pyrrole = depiction.parse_smiles("[nH]1cccc1")
+        self.assertEqual((pyrrole.atoms[0].element, pyrrole.atoms[0].hcount), ("N", 1))
+
+    def test_equivalent_smiles_share_a_key(self):
+        groups = [
+            ("OCC", "C(O)C", "CCO"),
+            ("c1ccccc1O", "Oc1ccccc1", "c1cc(O)ccc1"),
+            ("CC(=O)O", "CC(O)=O", "OC(C)=O"),
+            ("CC1CCCCC1", "C1CCCCC1C", "C1CCC(C)CC1"),
+        ]
+        keys = []
+        for group in groups:
+            group_keys = {depiction.structure_key(smiles)[1] for smiles in group}
+            self.assertEqual(len(group_keys), 1, group)
+            keys.append(group_keys.pop())
+        keys.append(depiction.structure_key("COC")[1])
+        keys.append(depiction.structure_key("c1ccccc1N")[1])
+        self.assertEqual(len(set(keys)), len(keys))
+
+    def test_malformed_smiles(self):
+        for smiles in ("", "   ", "C1CC", "C(C", "C)C", "(C)C", "[C", "[+]", "C%1", "CQ", "1CC", "C11"):
+            with self.subTest(smiles=smiles), self.assertRaises(depiction.DepictionError):
+                depiction.parse_smiles(smiles)
+
+        broken = Compound.objects.create(name="broken", formula="C", smiles="C1CC(", owner=self.admin, is_public=True)
+        response = self.client.get(f"/api/compounds/{broken.pk}/depiction.svg")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Cannot depict SMILES", response.json()["error"])
+        response = self.client.get("/api/compounds/depictions/", {"ids": f"{broken.pk},{self.compounds[1].pk}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["depictions"]), {str(self.compounds[1].pk)})
+        self.assertEqual(set(response.json()["errors"]), {str(broken.pk)})
+        self.assertEqual(self.client.get(f"/api/compounds/{broken.pk}/depiction.svg", {"size": "x"}).status_code, 400)
+
+    def test_svg_coordinates_are_finite(self):
+        for smiles in ("[Na+]", "[Na+].[Cl-]", "C", "CC", "C#N", "c1ccc2ccccc2c1", "C1CC2CCC1C2",
+                       "C1CCC2(CC1)CCCC2", "C1CCCCCCCCCCC1", "CCCCCCCCCCCCCCCCCCCC", "OC(=O)c1ccccc1OC(C)=O"):
+            for size in (48, 300):
+                with self.subTest(smiles=smiles, size=size):
+                    svg = depiction.depict(smiles, size)[1]
+                    numbers = [float(v) for v in self.SVG_NUMBER.findall(svg)]
+                    self.assertTrue(numbers)
+                    self.assertTrue(all(math.isfinite(v) for v in numbers))
+
+    def test_etag_and_not_modified(self):
+        url = f"/api/compounds/{self.compounds[1].pk}/depiction.svg"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(f"/api/compounds/{self.compounds[0].pk}/depiction.svg").status_code, 404)
+
+
+# ---------- PATCH conditionnel (compounds/updates.py) ----------
+
+class ConditionalUpdateTests(CompoundTestCase):
+    """If-Match : 428 sans version, 409 si la version a changé, sinon un seul UPDATE."""
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.comp = self.compounds[0]  # privé, appartient à self.user
+
+    def patch(self, compound_id, data, if_match=None):
+        headers = {"HTTP_IF_MATCH": if_match} if if_match is not None else {}
+        return self.client.patch(f"/api/compounds/{compound_id}/update/", data,
+                                 content_type="application/json", **headers)
+
+    def etag(self):
+        response = self.client.get(f"/api/compounds/{self.comp.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"{response.json()["compound"]["version"]}"')
+        return response["ETag"]
+
+    def test_precondition_required(self):
+        self.assertEqual(self.patch(self.comp.pk, {"name": "x"}).status_code, 428)
+        self.assertEqual(self.patch(self.comp.pk, {"name": "x"}, "not-a-version").status_code, 428)
+        self.comp.refresh_from_db()
+        self.assertEqual(self.comp.name, "compound-0")
+
+    def test_update_with_current_version(self):
+        etag = self.etag()
+        response = self.patch(self.comp.pk, {"description": "patched", "is_public": True}, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response["ETag"], self.etag())
+        self.comp.refresh_from_db()
+        self.assertEqual((self.comp.description, self.comp.is_public), ("patched", True))
+        entry = CompoundChange.objects.filter(compound_id=self.comp.pk).last()
+        self.assertEqual((entry.action, entry.is_public, entry.ever_public), (CompoundChange.UPDATED, True, True))
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_single_update_statement(self):
+        for is_public in (False, True, True, False):
+            with self.subTest(is_public=is_public), CaptureQueriesContext(connection) as queries:
+                response = self.patch(self.comp.pk, {"description": f"{is_public}", "is_public": is_public}, "*")
+            self.assertEqual(response.status_code, 200)
+            updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "compounds_compound"')]
+            self.assertEqual(len(updates), 1)
+            self.assertEqual(CompoundChange.objects.filter(compound_id=self.comp.pk).last().is_public, is_public)
+            self.assertEqual(counters.reconcile(), {})
+
+    def test_stale_version_conflicts(self):
+        stale = self.etag()
+        self.assertEqual(self.patch(self.comp.pk, {"description": "first"}, stale).status_code, 200)
+        response = self.patch(self.comp.pk, {"description": "second"}, stale)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["compound"]["description"], "first")
+        self.assertEqual(response["ETag"], self.etag())
+        # ETag faible (W/"...") accepté
+        self.assertEqual(self.patch(self.comp.pk, {"description": "third"}, "W/" + response["ETag"]).status_code, 200)
+
+    def test_wildcard_skips_version_check(self):
+        self.assertEqual(self.patch(self.comp.pk, {"name": "renamed"}, "*").status_code, 200)
+        self.comp.refresh_from_db()
+        self.assertEqual(self.comp.name, "renamed")
+
+    def test_not_found_forbidden_and_invalid(self):
+        self.assertEqual(self.patch(10**9, {"name": "x"}, "*").status_code, 404)
+        self.assertEqual(self.patch(self.compounds[1].pk, {"name": "x"}, "*").status_code, 403)
+        self.assertEqual(self.patch(self.comp.pk, {"name": ""}, "*").status_code, 400)
+        self.assertEqual(self.patch(self.comp.pk, {"unknown": 1}, "*").status_code, 400)
+
+
+# ---------- Envoi par morceaux (compounds/uploads.py) ----------
+
+class UploadTests(CompoundTestCase):
+    """Morceaux dans le désordre, répétés ou corrompus ; finalisation incomplète, concurrente, idempotente."""
+
+    DATA = bytes(range(256)) * 40  # 10 240 octets
+
+    def setUp(self):
+        self.media = override_settings(MEDIA_ROOT=os.path.join(self.var_dir, "media"))
+        self.media.enable()
+        self.addCleanup(self.media.disable)
+        self.client.force_login(self.user)
+        self.comp = self.compounds[0]  # appartient à self.user
+
+    def start(self, sha256=None):
+        payload = {"compound_id": self.comp.pk, "filename": "density.cube", "size": len(self.DATA)}
+        if sha256:
+            payload["sha256"] = sha256
+        response = self.client.post("/api/compounds/uploads/", payload, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        return response.json()["upload"]["id"]
+
+    def put(self, upload_id, offset, data, digest=None):
+        headers = {"HTTP_X_CHUNK_SHA256": digest} if digest else {}
+        return self.client.put(f"/api/compounds/uploads/{upload_id}/?offset={offset}", data,
+                               content_type="application/octet-stream", **headers)
+
+    def finalize(self, upload_id):
+        return self.client.post(f"/api/compounds/uploads/{upload_id}/finalize/")
+
+    def offset(self, upload_id):
+        return self.client.get(f"/api/compounds/uploads/{upload_id}/").json()["upload"]["offset"]
+
+    def test_out_of_order_and_duplicate_chunks(self):
+        upload_id = self.start()
+        response = self.put(upload_id, 4096, self.DATA[4096:8192])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 0)
+        self.assertEqual(self.put(upload_id, 0, self.DATA[:4096]).status_code, 200)
+        self.assertEqual(self.put(upload_id, 0, self.DATA[:4096]).status_code, 200)  # réessai
+        self.assertEqual(self.offset(upload_id), 4096)
+        self.assertEqual(self.put(upload_id, 4096, self.DATA[4096:]).status_code, 200)
+        self.assertEqual(self.put(upload_id, 2048, self.DATA[2048:4096]).status_code, 200)  # réécrit la fin
+        self.assertEqual(self.offset(upload_id), 4096)
+        self.assertEqual(self.put(upload_id, 4096, self.DATA[4096:]).status_code, 200)
+
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 200)
+        self.comp.refresh_from_db()
+        with self.comp.structure_file.open("rb") as fh:
+            self.assertEqual(fh.read(), self.DATA)
+        self.assertFalse(os.path.exists(uploads.part_path(upload_id)))
+        self.assertEqual(self.finalize(upload_id).status_code, 200)  # réponse perdue : même résultat
+
+    def test_chunk_digest_mismatch(self):
+        upload_id = self.start()
+        chunk = self.DATA[:4096]
+        response = self.put(upload_id, 0, chunk, digest=hashlib.sha256(b"other").hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.offset(upload_id), 0)
+        self.assertEqual(self.put(upload_id, 0, chunk, digest=hashlib.sha256(chunk).hexdigest()).status_code, 200)
+        self.assertEqual(self.offset(upload_id), 4096)
+
+    def test_file_digest_mismatch_restarts(self):
+        upload_id = self.start(sha256=hashlib.sha256(self.DATA).hexdigest())
+        corrupted = bytes([self.DATA[0] ^ 1]) + self.DATA[1:]
+        self.assertEqual(self.put(upload_id, 0, corrupted).status_code, 200)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 0)
+        self.assertEqual(self.offset(upload_id), 0)
+        self.assertEqual(self.put(upload_id, 0, self.DATA).status_code, 200)
+        self.assertEqual(self.finalize(upload_id).status_code, 200)
+
+    def test_finalize_with_missing_chunks(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, self.DATA[:4096]).status_code, 200)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 4096)
+        self.comp.refresh_from_db()
+        self.assertFalse(self.comp.structure_file)
+
+    def test_concurrent_finalize(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, self.DATA).status_code, 200)
+        with open(uploads.part_path(upload_id), "r+b") as other_worker:
+            fcntl.flock(other_worker, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            response = self.finalize(upload_id)
+            self.assertEqual(response.status_code, 409)
+            self.assertIn("Another request", response.json()["error"])
+            self.assertEqual(self.put(upload_id, 0, self.DATA[:10]).status_code, 409)
+        self.assertEqual(self.finalize(upload_id).status_code, 200)
+        self.assertEqual(self.put(upload_id, 0, self.DATA[:10]).status_code, 409)  # déjà finalisé
+
+    def test_other_users_upload_is_hidden(self):
+        upload_id = self.start()
+        self.client.force_login(self.admin)
+        self.assertEqual(self.put(upload_id, 0, self.DATA).status_code, 404)
+        self.assertEqual(self.finalize(upload_id).status_code, 404)
+
+
+# ---------- Export colonnaire (compounds/export.py) ----------
+
+class ExportTests(CompoundTestCase):
+    """Relecture des fichiers sans NumPy ; export périmé servi pendant la reconstruction."""
+
+    def setUp(self):
+        shutil.rmtree(settings.EXPORT_CACHE_DIR, ignore_errors=True)
+
+    @staticmethod
+    def read_npz(data: bytes) -> dict:
+        """{entrée: (descr, valeurs)} d'après le format .npy (en-tête + données brutes)."""
+        typecodes = {"<i8": "q", "<M8[us]": "q", "<f8": "d"}
+        columns = {}
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            for name in zf.namelist():
+                raw = zf.read(name)
+                assert raw[:8] == b"\x93NUMPY\x01\x00"
+                (length,) = struct.unpack("<H", raw[8:10])
+                header = ast.literal_eval(raw[10:10 + length].decode("latin-1"))
+                body = raw[10 + length:]
+                if header["descr"] in typecodes:
+                    values = array.array(typecodes[header["descr"]], body).tolist()
+                else:
+                    values = list(body)
+                assert len(values) == header["shape"][0]
+                columns[name[:-4]] = (header["descr"], values)
+        return columns
+
+    @staticmethod
+    def strings(columns, name):
+        offsets, data = columns[f"{name}.offsets"][1], bytes(columns[f"{name}.data"][1])
+        return [data[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+    def test_npz_round_trip(self):
+        path, _ = export.get_export("npz", public_only=False)
+        with open(path, "rb") as fh:
+            columns = self.read_npz(fh.read())
+        rows = list(Compound.objects.order_by("id"))
+        self.assertEqual(columns["id"], ("<i8", [c.pk for c in rows]))
+        self.assertEqual(self.strings(columns, "name"), [c.name for c in rows])
+        self.assertEqual(self.strings(columns, "smiles"), [c.smiles for c in rows])
+        self.assertEqual(columns["is_public"], ("|b1", [int(c.is_public) for c in rows]))
+        self.assertEqual(columns["monoisotopic_mass"][1], [c.monoisotopic_mass for c in rows])
+        self.assertEqual(columns["owner_id"][1], [c.owner_id for c in rows])
+        self.assertEqual(columns["created_at"], ("<M8[us]", [export._micros(c.created_at) for c in rows]))
+
+    @unittest.skipIf(export.pyarrow is None, "pyarrow not installed")
+    def test_arrow_round_trip(self):
+        path, _ = export.get_export("arrow", public_only=True)
+        table = export.pyarrow.ipc.open_file(path).read_all()
+        public = Compound.objects.filter(is_public=True).order_by("id")
+        self.assertEqual(table.column("id").to_pylist(), [c.pk for c in public])
+        self.assertEqual(table.column("name").to_pylist(), [c.name for c in public])
+        self.assertEqual(table.column("created_at").to_pylist(), [c.created_at for c in public])
+
+    def test_view_scope_and_etag(self):
+        response = self.client.get("/api/compounds/export/")
+        self.assertEqual(response.status_code, 200)
+        columns = self.read_npz(b"".join(response.streaming_content))
+        self.assertEqual(columns["id"][1], list(Compound.objects.filter(is_public=True)
+                                                .order_by("id").values_list("id", flat=True)))
+        etag = response["ETag"]
+        self.assertEqual(self.client.get("/api/compounds/export/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.force_login(self.admin)
+        export.get_export("npz", public_only=False)  # fichier déjà construit : session + user + version
+        assert_query_budget(self.client.get("/api/compounds/export/"))
+        if export.pyarrow is None:
+            self.assertEqual(self.client.get("/api/compounds/export/", {"format": "arrow"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/compounds/export/", {"format": "csv"}).status_code, 400)
+
+    def test_stale_export_served_while_rebuilding(self):
+        first, v1 = export.get_export("npz", public_only=False)
+        comp = self.compounds[0]
+        comp.name = "renamed"
+        comp.save()
+        with mock.patch.object(export, "_schedule_rebuild") as schedule, \
+                mock.patch.object(export, "WRITERS", {}):  # aucune construction dans la requête
+            self.assertEqual(export.get_export("npz", public_only=False), (first, v1))
+        schedule.assert_called_once_with("npz", False)
+
+        # Reconstruction (ce que fait le thread) : la requête suivante sert la version à jour
+        with mock.patch.object(export, "close_old_connections"):  # connexion du test, pas celle d'un thread
+            export._rebuild("npz", False)
+        second, v2 = export.get_export("npz", public_only=False)
+        self.assertNotEqual(v2, v1)
+        with open(second, "rb") as fh:
+            self.assertIn("renamed", self.strings(self.read_npz(fh.read()), "name"))
+        self.assertTrue(os.path.exists(first))  # version précédente gardée (téléchargements en cours)
+
+        Compound.objects.create(name="new", formula="CH4", smiles="C", owner=self.user)
+        third, v3 = export.get_export("npz", public_only=False, wait=True)
+        self.assertNotIn(v3, (v1, v2))
+        self.assertEqual(sorted(p for p, _ in export._cached("npz", "all")), sorted([second, third]))
+
+    def test_version_reads_only_the_journal(self):
+        with CaptureQueriesContext(connection) as ctx:
+            v1 = export.catalog_version(public_only=False)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('"compounds_compoundchange"', ctx.captured_queries[0]["sql"])
+        self.assertNotIn('"compounds_compound"', ctx.captured_queries[0]["sql"])
+        self.assertNotEqual(export.catalog_version(public_only=True), v1)
+        self.compounds[0].delete()  # une suppression fait aussi avancer le journal
+        self.assertNotEqual(export.catalog_version(public_only=False), v1)
+
+
+# ---------- Catalogue public pour miroirs (compounds/catalog.py) ----------
+
+class CatalogTests(CompoundTestCase):
+    """Instantané, puis deltas appliqués avec APPLY_SQL : le miroir retrouve exactement les composés publics."""
+
+    def setUp(self):
+        shutil.rmtree(settings.CATALOG_DIR, ignore_errors=True)
+        self.tmp = tempfile.mkdtemp(dir=self.var_dir)
+
+    def unpack(self, name):
+        path = os.path.join(self.tmp, name[:-len(".gz")])
+        with gzip.open(catalog.catalog_path(name)) as src, open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        return path
+
+    def public_ids(self):
+        return set(Compound.objects.filter(is_public=True).values_list("id", flat=True))
+
+    def test_snapshot_then_delta(self):
+        first = catalog.publish(snapshot_every=100)
+        self.assertEqual(first["version"], 1)
+        self.assertIsNone(first["delta"])
+        self.assertEqual(first["rows"], len(self.public_ids()))
+        self.assertEqual(catalog.publish(snapshot_every=100), {})
+
+        edited, deleted, published = self.compounds[1], self.compounds[2], self.compounds[3]
+        edited.description = "edited"
+        edited.save()
+        deleted_id = deleted.pk
+        deleted.delete()
+        published.is_public = True
+        published.save()
+
+        second = catalog.publish(snapshot_every=100)
+        self.assertIsNone(second["snapshot"])
+        self.assertEqual(second["delta"]["file"], "delta-1-2.sqlite.gz")
+        self.assertEqual(second["rows"], len(self.public_ids()))
+        self.assertEqual(catalog.load_manifest()["latest"], 2)
+
+        mirror = sqlite3.connect(self.unpack(first["snapshot"]["file"]))
+        mirror.executescript(catalog.APPLY_SQL.replace("delta.sqlite", self.unpack(second["delta"]["file"])))
+        ids = {row[0] for row in mirror.execute("SELECT id FROM compounds")}
+        self.assertEqual(ids, self.public_ids())
+        self.assertNotIn(deleted_id, ids)
+        self.assertEqual(mirror.execute("SELECT description FROM compounds WHERE id = ?", (edited.pk,)).fetchone(),
+                         ("edited",))
+        self.assertEqual(mirror.execute("SELECT value FROM meta WHERE key = 'version'").fetchone(), ("2",))
+        mirror.close()
+
+    @override_settings(COMPOUND_CHANGES_SETTLE_SECONDS=0)
+    def test_private_only_changes_have_no_delete_row(self):
+        catalog.publish(snapshot_every=100)
+        always_private, private_deleted = self.compounds[0], self.compounds[3]
+        always_private.description = "edited"
+        always_private.save()
+        private_deleted.delete()
+
+        entry = catalog.publish(snapshot_every=100)
+        self.assertEqual((entry["delta"]["upserts"], entry["delta"]["deletes"]), (0, 0))
+        delta = sqlite3.connect(self.unpack(entry["delta"]["file"]))
+        self.assertEqual(delta.execute("SELECT id FROM deletes").fetchall(), [])
+        delta.close()
+
+    def test_snapshot_every(self):
+        published = []
+        for i in range(3):
+            self.compounds[1].description = f"edit {i}"
+            self.compounds[1].save()
+            published.append(catalog.publish(snapshot_every=2))
+        self.assertEqual([bool(e["snapshot"]) for e in published], [True, False, True])
+        self.assertEqual([bool(e["delta"]) for e in published], [False, True, True])
+
+
+# ---------- Requêtes groupées (chem_backend/batch.py) ----------
+
+@override_settings(BATCH_WORKERS=1)  # séquentiel : les threads ne voient pas la transaction du test
+class BatchTests(CompoundTestCase):
+    """Enveloppe : même ordre, ids, statuts et corps que les appels directs."""
+
+    def batch(self, requests, content_type="application/json"):
+        body = requests if isinstance(requests, str) else json.dumps({"requests": requests})
+        return self.client.post("/api/batch/", body, content_type=content_type)
+
+    def test_envelope_matches_direct_calls(self):
+        self.client.force_login(self.user)
+        private = self.compounds[0]
+        urls = ["/api/auth/me/", "/api/compounds/public/?limit=3&q=compound", f"/api/compounds/{private.pk}/",
+                "/api/compounds/999999999/"]
+        response = self.batch([urls[0], {"id": "list", "url": urls[1]}, {"id": "detail", "url": urls[2]}, urls[3]])
+        self.assertEqual(response.status_code, 200)
+        items = response.json()["responses"]
+        self.assertEqual([item["id"] for item in items], ["0", "list", "detail", "3"])
+        for item, url in zip(items, urls):
+            direct = self.client.get(url)
+            self.assertEqual(item["status"], direct.status_code, url)
+            if direct.status_code == 200:
+                self.assertEqual(item["body"], direct.json(), url)
+        self.assertEqual(items[3]["body"], {"error": "Not found"})
+        self.assertEqual(items[2]["headers"]["ETag"], self.client.get(urls[2])["ETag"])
+
+    def test_sub_requests_keep_visibility(self):
+        items = self.batch([f"/api/compounds/{self.compounds[0].pk}/", "/api/auth/me/"]).json()["responses"]
+        self.assertEqual(items[0]["status"], 404)
+        self.assertEqual(items[1]["status"], self.client.get("/api/auth/me/").status_code)
+
+    def test_unknown_and_excluded_urls(self):
+        items = self.batch(["/api/nope/", "/api/compounds/export/", "/api/batch/"]).json()["responses"]
+        self.assertEqual([item["status"] for item in items], [404, 400, 400])
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_sub_requests_use_their_own_budget(self):
+        self.client.force_login(self.user)
+        urls = ["/api/auth/me/", "/api/compounds/public/?limit=3", f"/api/compounds/{self.compounds[0].pk}/"]
+        for requests in (urls, urls[2:]):
+            response = self.batch(requests)
+            self.assertEqual(response.status_code, 200)
+            assert_query_budget(response)
+        budgets = {**settings.QUERY_BUDGETS, "compound_detail": 0}
+        with override_settings(QUERY_BUDGETS=budgets), self.assertRaises(QueryBudgetExceeded):
+            self.batch(urls[2:])
+
+    def test_invalid_envelopes(self):
+        self.assertEqual(self.batch(["/api/auth/me/"], content_type="text/plain").status_code, 415)
+        self.assertEqual(self.batch("{not json").status_code, 400)
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch(["https://example.com/api/auth/me/"]).status_code, 400)
+        self.assertEqual(self.batch(["/admin/"]).status_code, 400)
+        self.assertEqual(self.batch(["/api/auth/me/"] * 21).status_code, 400)
+        self.assertEqual(self.client.get("/api/batch/").status_code, 405)
+
+
+# ---------- Multi-get (/api/compounds/lookup/) ----------
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class LookupTests(CompoundTestCase):
+    """Résultats dans l'ordre des clés, doublons et absents compris."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.dce = Compound.objects.create(name="1,2-dichloroethane", formula="C2H4Cl2", smiles="ClCCCl",
+                                          owner=cls.admin, is_public=True)
+
+    def lookup(self, method="get", **data):
+        if method == "post":
+            response = self.client.post("/api/compounds/lookup/", data, content_type="application/json")
+        else:
+            response = self.client.get("/api/compounds/lookup/", data)
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+        return response.json()
+
+    def test_ids_in_key_order(self):
+        self.client.force_login(self.user)
+        a, b = self.compounds[3], self.compounds[1]
+        data = self.lookup(by="id", keys=[f"{a.pk},999999999", f"{b.pk},{a.pk}"])
+        self.assertEqual([r["key"] for r in data["results"]], [a.pk, 999999999, b.pk, a.pk])
+        self.assertEqual([r["found"] for r in data["results"]], [True, False, True, True])
+        self.assertEqual(data["results"][3]["compound"]["id"], a.pk)
+        self.assertEqual((data["found"], data["missing"]), (3, 1))
+
+    def test_anonymous_sees_public_only(self):
+        private, public = self.compounds[0], self.compounds[1]
+        data = self.lookup(method="post", by="id", keys=[private.pk, public.pk])
+        self.assertEqual([r["found"] for r in data["results"]], [False, True])
+
+    def test_names_with_commas(self):
+        data = self.lookup(by="name", keys=["1,2-dichloroethane", "compound-1", "missing"])
+        self.assertEqual([r["key"] for r in data["results"]], ["1,2-dichloroethane", "compound-1", "missing"])
+        self.assertEqual([[c["id"] for c in r["compounds"]] for r in data["results"]],
+                         [[self.dce.pk], [self.compounds[1].pk], []])
+
+    @override_settings(LOOKUP_MAX_MATCHES=2)
+    def test_shared_formula_is_truncated(self):
+        self.client.force_login(self.user)
+        data = self.lookup(method="post", by="formula", keys=["C6H6O", "C2H4Cl2"])
+        first, second = data["results"]
+        self.assertEqual([c["id"] for c in first["compounds"]], [c.pk for c in self.compounds[:2]])
+        self.assertTrue(first["truncated"])
+        self.assertFalse(second["truncated"])
+
+    def test_invalid_requests(self):
+        for data in ({"by": "colour", "keys": ["x"]}, {"by": "id", "keys": ["x"]}, {"keys": "1,2"}):
+            response = self.client.post("/api/compounds/lookup/", data, content_type="application/json")
+            self.assertEqual(response.status_code, 400, data)
+
+
+# ---------- Propriétés expérimentales (compounds/properties.py) ----------
+
+class PropertyTests(CompoundTestCase):
+    """Conversion d'unités, filtres ?props= et écriture en lot (droits, erreurs par ligne)."""
+
+    def bulk(self, *rows):
+        response = self.client.post("/api/compounds/properties/bulk/", {"rows": list(rows)},
+                                    content_type="application/json")
+        return response.status_code, response.json()
+
+    def test_convert(self):
+        self.assertAlmostEqual(properties.convert(373.15, "K", "°C"), 100.0)
+        self.assertAlmostEqual(properties.convert(212, "degF", "°C"), 100.0)
+        self.assertAlmostEqual(properties.convert(1.2, "g/cm³", "g/L"), 1200.0)
+        self.assertAlmostEqual(properties.convert(500, "µg/mL", "g/L"), 0.5)
+        for unit in ("furlong", 5, ["°C"]):
+            with self.assertRaises(properties.PropertyError):
+                properties.normalize_unit(unit)
+        with self.assertRaises(properties.PropertyError):
+            properties.convert(1.0, "K", "g/L")
+
+    def test_parse_filters(self):
+        self.assertEqual(properties.parse_filters("mp between 100 and 150 °C AND logp < 3"),
+                         {"mp": {"value__gte": 100.0, "value__lte": 150.0}, "logp": {"value__lt": 3.0}})
+        self.assertAlmostEqual(properties.parse_filters("bp >= 373.15 K")["bp"]["value__gte"], 100.0)
+        self.assertEqual(properties.parse_filters("mp > 10, mp > 20; mp < 90 and mp < 50"),
+                         {"mp": {"value__gt": 20.0, "value__lt": 50.0}})
+        for expr in ("mp ~ 3", "color < 3", "mp < 3 logp < 2", "mp < 3 K, logp > 1 g/L"):
+            with self.assertRaises(properties.PropertyError):
+                properties.parse_filters(expr)
+
+    def test_filtered_list(self):
+        self.client.force_login(self.admin)
+        status, body = self.bulk(
+            {"compound_id": self.compounds[1].pk, "property": "mp", "value": 395.15, "unit": "K"},
+            {"compound_id": self.compounds[2].pk, "property": "mp", "value": 40},
+        )
+        self.assertEqual((status, body["written"]), (200, 2))
+        self.client.logout()
+        response = self.client.get("/api/compounds/public/", {"props": "mp between 100 and 150 °C"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c["id"] for c in response.json()["results"]], [self.compounds[1].pk])
+        self.assertEqual(self.client.get("/api/compounds/public/", {"props": "mp ~ 3"}).status_code, 400)
+
+    def test_bulk_only_own_compounds(self):
+        self.client.force_login(self.user)
+        own, other = self.compounds[0], self.compounds[1]
+        status, body = self.bulk(
+            {"compound_id": own.pk, "property": "logp", "value": 1.5},
+            {"compound_id": other.pk, "property": "logp", "value": 1.5},
+        )
+        self.assertEqual((status, body["written"]), (200, 1))
+        self.assertEqual(body["errors"], {"1": "Forbidden"})
+        self.assertFalse(CompoundProperty.objects.filter(compound=other).exists())
+
+        status, body = self.bulk({"compound_id": own.pk, "property": "logp", "value": None})
+        self.assertEqual((status, body["deleted"]), (200, 1))
+
+    def test_bulk_invalid_rows_are_reported(self):
+        self.client.force_login(self.admin)
+        cid = self.compounds[1].pk
+        status, body = self.bulk(
+            {"compound_id": cid, "property": "mp", "value": 10, "unit": 5},
+            {"compound_id": cid, "property": "mp", "value": "nan"},
+            {"compound_id": cid, "property": "mp", "value": "inf"},
+            {"compound_id": cid, "property": "mp", "value": True},
+            {"compound_id": cid, "property": "mp", "value": 10, "unit": "g/L"},
+            {"compound_id": cid, "property": "color", "value": 1},
+            {"compound_id": "x", "property": "mp", "value": 1},
+            "row",
+        )
+        self.assertEqual(status, 400)
+        self.assertEqual(body["written"], 0)
+        self.assertEqual(body["errors"], {
+            "0": "unit must be a string", "1": "value must be finite", "2": "value must be finite",
+            "3": "value must be a number", "4": "Cannot convert 'g/L' to '°C'",
+            "5": "Unknown property 'color'", "6": "compound_id must be an integer", "7": "row must be an object",
+        })
+
+
+# ---------- Composés apparentés (compounds/related.py) ----------
+
+class RelatedCompoundTests(CompoundTestCase):
+    """Empreinte de chemins : cycles et taille distinguent des structures aux chemins identiques."""
+
+    def test_fingerprint(self):
+        self.assertLess(related.tanimoto(related.fingerprint("CCCCCC"), related.fingerprint("C1CCCCC1")), 1.0)
+        self.assertLess(related.tanimoto(related.fingerprint("CCCCCC"), related.fingerprint("CCCCCCC")), 1.0)
+        self.assertEqual(related.tanimoto(related.fingerprint("CCO"), related.fingerprint("OCC")), 1.0)
+        self.assertIsNone(related.fingerprint("C1CC("))
+
+    def test_neighbours_after_refresh(self):
+        make = lambda name, smiles: Compound.objects.create(  # noqa: E731
+            name=name, formula="C", smiles=smiles, owner=self.admin, is_public=True)
+        cyclohexane, methylcyclohexane = make("cyclohexane", "C1CCCCC1"), make("methylcyclohexane", "CC1CCCCC1")
+        hexane = make("hexane", "CCCCCC")
+        self.assertEqual(related.refresh(rebuild=True)["mode"], "rebuild")
+
+        neighbours = related.related_compounds(cyclohexane.pk, public_only=True)
+        self.assertEqual(neighbours[0]["id"], methylcyclohexane.pk)
+        self.assertNotIn(hexane.pk, {n["id"] for n in neighbours})
+        response = self.client.get(f"/api/compounds/{cyclohexane.pk}/")
+        self.assertEqual(response.json()["compound"]["related"], neighbours)
@@ -0,0 +1,124 @@
+# compounds/updates.py
+"""
+Mises à jour partielles avec contrôle de concurrence optimiste.
+
+La version d'un composé est son `updated_at` (en microsecondes depuis
+l'epoch), exposée dans `version` (serialize_compound) et en ETag. Un PATCH
+renvoie cette valeur dans If-Match ; l'écriture est un seul
+UPDATE ... SET <champs envoyés>, updated_at = now WHERE id = ? AND updated_at = ?
+sans lecture préalable : 0 ligne modifiée → la version a changé entre-temps
+(409), ou le composé n'existe pas / n'appartient pas à l'utilisateur (404 /
+403), ce qu'une lecture *après* l'échec permet de distinguer.
+
+QuerySet.update() ne déclenche pas les signaux : l'entrée du journal
+(compounds/signals.py) et le delta des compteurs (stats/signals.py) sont
+écrits ici, dans la même transaction. La dernière entrée du journal donne
+l'état d'avant l'UPDATE (l'écriture précédente l'a validée avec sa ligne,
+le verrou posé par notre UPDATE la fait attendre) : c'est elle qui dit si
+`is_public` a basculé, sans second UPDATE conditionnel.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from stats import counters
+
+from . import events
+from .chemistry import monoisotopic_mass
+from .models import Compound, CompoundChange
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class PreconditionError(ValueError):
+    """If-Match absent ou illisible."""
+
+
+def compound_version(c: Compound):
+    if c.updated_at is None:
+        return None
+    delta = c.updated_at - EPOCH
+    return str((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+
+def compound_etag(c: Compound) -> str:
+    return f'"{compound_version(c)}"'
+
+
+def parse_if_match(value):
+    """
+    If-Match → updated_at attendu (None pour "*" : pas de contrôle de version).
+    Accepte l'ETag ("123", W/"123") ou la valeur brute de `version`.
+    """
+    if not value:
+        raise PreconditionError("If-Match header is required")
+    value = value.strip()
+    if value == "*":
+        return None
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        micros = int(value.strip('"'))
+    except ValueError:
+        raise PreconditionError("If-Match must be the compound ETag") from None
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def apply_changes(comp: Compound, values: dict) -> list:
+    """Affecte `values` à `comp` ; retourne les champs réellement modifiés."""
+    changed = []
+    for field, value in values.items():
+        if getattr(comp, field) != value:
+            setattr(comp, field, value)
+            changed.append(field)
+    return changed
+
+
+def save_changed(comp: Compound, changed) -> None:
+    """save() limité aux colonnes modifiées (updated_at inclus : auto_now ne s'applique qu'aux update_fields)."""
+    if changed:
+        comp.save(update_fields=[*changed, "updated_at"])
+
+
+def conditional_update(compound_id: int, values: dict, expected=None, owner=None):
+    """
+    Écrit `values` si le composé est toujours à la version `expected`
+    (et appartient à `owner` si fourni). Retourne (composé ou None, statut HTTP) :
+    200 écrit, 404 absent, 403 autre propriétaire, 409 version périmée
+    (le composé actuel est alors renvoyé pour que le client fusionne).
+    """
+    row = dict(values, updated_at=timezone.now())
+    if "formula" in values:
+        row["monoisotopic_mass"] = monoisotopic_mass(values["formula"])
+
+    qs = Compound.objects.filter(pk=compound_id)
+    if owner is not None:
+        qs = qs.filter(owner=owner)
+    if expected is not None:
+        qs = qs.filter(updated_at=expected)
+
+    with transaction.atomic():
+        if qs.update(**row) == 1:
+            comp = Compound.objects.select_related("owner").get(pk=compound_id)
+            previous = (CompoundChange.objects.filter(compound_id=comp.pk).order_by("-id")
+                        .values_list("is_public", "ever_public").first())
+            flipped = previous is not None and previous[0] != comp.is_public
+            events.publish(CompoundChange.objects.create(
+                compound_id=comp.pk, action=CompoundChange.UPDATED, is_public=comp.is_public,
+                ever_public=comp.is_public or (previous is not None and previous[1]),
+            ))
+            if flipped:
+                counters.apply(counters.transition(
+                    counters.compound_keys,
+                    (comp.owner_id, not comp.is_public),
+                    (comp.owner_id, comp.is_public),
+                ))
+            return comp, 200
+
+    current = Compound.objects.select_related("owner").filter(pk=compound_id).first()
+    if current is None:
+        return None, 404
+    if owner is not None and current.owner_id != owner.pk:
+        return None, 403
+    return current, 409
@@ -0,0 +1,220 @@
+# compounds/uploads.py
+"""
+Envoi par morceaux, avec reprise, des gros fichiers de structure (CUBE, DX, PDB).
+
+Protocole (compounds/views.py) :
+1. POST   uploads/                     {compound_id, filename, size, sha256?} → session
+2. PUT    uploads/<id>/?offset=N       corps = octets [N, N + len[ ; en-tête
+                                       X-Chunk-SHA256 optionnel → nouvel offset
+   GET    uploads/<id>/                offset de reprise après une coupure
+3. POST   uploads/<id>/finalize/       vérifie taille (+ sha256) et attache le fichier
+   DELETE uploads/<id>/                abandon
+
+Chaque morceau est lu par blocs depuis le flux de la requête (jamais
+request.body) et écrit à son offset dans UPLOAD_TEMP_DIR/<id>.part en étant
+haché : un condensat différent de X-Chunk-SHA256 annule le morceau. Un
+morceau interrompu sans condensat garde les octets reçus : le client reprend
+à l'offset renvoyé par GET. Un offset inférieur à `received` réécrit la fin
+(réessai d'un morceau) ; supérieur → UploadConflict.
+
+La finalisation déplace le fichier (rename sur FileSystemStorage) au lieu de
+le recopier. Si le client a déclaré un sha256, elle relit le fichier pour le
+vérifier : le SHA-256 du fichier ne se déduit pas de ceux des morceaux, et
+l'état d'un hashlib ne se sauvegarde pas d'une requête (ou d'un worker) à
+l'autre, alors qu'un morceau peut être réécrit après coup. Sans sha256
+déclaré, aucune relecture. Un verrou flock sur le .part empêche deux écritures simultanées
+sur la même session (plusieurs workers).
+"""
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from . import updates
+from .models import StructureUpload
+
+READ_BLOCK = 1024 * 1024
+
+
+class UploadError(ValueError):
+    """Requête invalide (400)."""
+
+
+class UploadConflict(UploadError):
+    """Offset inattendu ou session occupée (409) ; `offset` = point de reprise."""
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class _PartFile(File):
+    """Fichier déjà sur disque : FileSystemStorage le déplace au lieu de le copier."""
+
+    def __init__(self, fh, path):
+        super().__init__(fh)
+        self._path = path
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def part_path(upload_id) -> str:
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f"{upload_id}.part")
+
+
+def expired_before():
+    return timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def clean_filename(name) -> str:
+    name = os.path.basename(str(name or "").replace("\\", "/")).strip()
+    try:
+        name = get_valid_filename(name)
+    except Exception:  # SuspiciousFileOperation : nom vide après nettoyage
+        raise UploadError("filename is invalid") from None
+    return name[-100:]
+
+
+def create_session(owner, compound, filename, size, sha256=""):
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("size must be an integer") from None
+    if size <= 0 or size > settings.UPLOAD_MAX_BYTES:
+        raise UploadError(f"size must be between 1 and {settings.UPLOAD_MAX_BYTES} bytes")
+    sha256 = (sha256 or "").strip().lower()
+    if sha256 and (len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256)):
+        raise UploadError("sha256 must be 64 hex characters")
+    upload = StructureUpload.objects.create(
+        owner=owner, compound=compound, filename=clean_filename(filename), size=size, sha256=sha256,
+    )
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    with open(part_path(upload.pk), "wb"):
+        pass
+    return upload
+
+
+@contextmanager
+def _locked_part(upload):
+    try:
+        fh = open(part_path(upload.pk), "r+b")
+    except FileNotFoundError:
+        raise UploadConflict("Upload data is gone; start a new upload") from None
+    with fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict("Another request is writing to this upload") from None
+        # Relu sous le verrou : un autre worker a pu avancer la session
+        upload.refresh_from_db(fields=["received", "status"])
+        if upload.status != StructureUpload.OPEN:
+            raise UploadConflict("Upload already finalized", upload.received)
+        yield fh
+
+
+def write_chunk(upload, offset, stream, length, digest=None) -> int:
+    """
+    Écrit `length` octets lus dans `stream` à partir de `offset`.
+    Retourne le nouvel offset de reprise (octets contigus reçus).
+    """
+    if length is None or length < 0:
+        raise UploadError("Content-Length is required")
+    if length > settings.UPLOAD_CHUNK_MAX_BYTES:
+        raise UploadError(f"Chunks are limited to {settings.UPLOAD_CHUNK_MAX_BYTES} bytes")
+    digest = (digest or "").strip().lower() or None
+
+    with _locked_part(upload) as fh:
+        if offset < 0 or offset > upload.received:
+            raise UploadConflict(f"Expected offset <= {upload.received}", upload.received)
+        if offset + length > upload.size:
+            raise UploadError(f"Chunk ends past the declared size ({upload.size} bytes)")
+
+        fh.seek(offset)
+        hasher = hashlib.sha256()
+        remaining = length
+        try:
+            while remaining:
+                block = stream.read(min(READ_BLOCK, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                fh.write(block)
+                remaining -= len(block)
+        except OSError:
+            pass  # client parti : on garde ce qui a été reçu (sauf condensat demandé)
+
+        complete = not remaining
+        if digest is not None and not (complete and hasher.hexdigest() == digest):
+            end = offset  # morceau rejeté en entier
+        else:
+            end = offset + length - remaining
+        fh.truncate(end)
+        fh.flush()
+        os.fsync(fh.fileno())  # l'offset en base ne dépasse jamais les octets sur disque
+        StructureUpload.objects.filter(pk=upload.pk).update(received=end, updated_at=timezone.now())
+        upload.received = end
+
+    if digest is not None and end == offset:
+        raise UploadError("Chunk digest mismatch" if complete else "Chunk incomplete")
+    return end
+
+
+def finalize(upload):
+    """Vérifie le fichier reçu et l'attache au composé ; retourne le composé."""
+    with _locked_part(upload) as fh:
+        if upload.received != upload.size:
+            raise UploadConflict(f"Upload incomplete ({upload.received}/{upload.size} bytes)", upload.received)
+        if upload.sha256:
+            hasher = hashlib.sha256()
+            fh.seek(0)
+            while block := fh.read(READ_BLOCK):
+                hasher.update(block)
+            if hasher.hexdigest() != upload.sha256:
+                # Morceau fautif inconnu : on repart de zéro
+                fh.truncate(0)
+                StructureUpload.objects.filter(pk=upload.pk).update(received=0, updated_at=timezone.now())
+                raise UploadConflict("File sha256 does not match; upload restarted from offset 0", 0)
+
+        path = part_path(upload.pk)
+        comp = upload.compound
+        old = comp.structure_file.name if comp.structure_file else None
+        fh.seek(0)
+        with transaction.atomic():
+            comp.structure_file.save(upload.filename, _PartFile(fh, path), save=False)
+            updates.save_changed(comp, ["structure_file"])
+            StructureUpload.objects.filter(pk=upload.pk).update(
+                status=StructureUpload.COMPLETE, updated_at=timezone.now(),
+            )
+            if old and old != comp.structure_file.name:
+                storage = comp.structure_file.storage
+                transaction.on_commit(lambda: storage.delete(old))
+        upload.status = StructureUpload.COMPLETE
+    if os.path.exists(path):  # stockage distant : copié, pas déplacé
+        os.remove(path)
+    return comp
+
+
+def abort(upload):
+    try:
+        os.remove(part_path(upload.pk))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def purge_expired() -> int:
+    """Supprime les sessions (ouvertes ou finalisées) inactives depuis UPLOAD_SESSION_TTL_HOURS."""
+    stale = StructureUpload.objects.filter(updated_at__lt=expired_before())
+    count = 0
+    for upload in stale.iterator():
+        abort(upload)
+        count += 1
+    return count
@@ -4,8 +4,22 @@ from . import views
 urlpatterns = [
     path('private/', views.get_compounds, name='get_compounds'),  # vue protégée (personnelle ou admin)
     path('public/', views.get_all_compounds, name='get_all_compounds_public'),  # ✅ nouvelle vue)
+    path('changes/', views.get_compound_changes, name='compound_changes'),  # flux ?since=<token>
+    path('events/', views.compound_events, name='compound_events'),  # SSE (ASGI)
+    path('export/', views.export_compounds, name='compound_export'),  # npz / arrow / parquet
+    path('catalog/', views.catalog_manifest, name='catalog_manifest'),  # miroirs : instantanés + deltas
+    path('catalog/<str:filename>', views.catalog_file, name='catalog_file'),
+    path('mass-search/', views.mass_search, name='mass_search'),  # m/z ± ppm/Da, adduits
+    path('properties/', views.property_definitions, name='property_definitions'),  # mp, bp, logp...
+    path('properties/bulk/', views.bulk_upsert_properties, name='property_bulk_upsert'),
+    path('lookup/', views.lookup_compounds, name='compound_lookup'),  # multi-get (ids, noms, formules, SMILES)
+    path('depictions/', views.compound_depictions, name='compound_depictions'),  # SVG par lot (?ids=)
     path('add/', views.add_compound, name='add_compound'),
+    path('uploads/', views.create_upload, name='create_upload'),  # fichiers 3D par morceaux
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
+    path('uploads/<uuid:upload_id>/finalize/', views.finalize_upload, name='finalize_upload'),
     path('<int:compound_id>/', views.get_compound_detail, name='compound_detail'),
+    path('<int:compound_id>/depiction.svg', views.compound_depiction, name='compound_depiction'),
     path('<int:compound_id>/update/', views.update_compound, name='update_compound'),
     path('<int:compound_id>/delete/', views.delete_compound, name='delete_compound'),
 ]
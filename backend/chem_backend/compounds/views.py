@@ -1,19 +1,29 @@
 # compounds/views.py
 import json
+import os
+from datetime import timedelta
 from typing import Optional
 
-from django.db.models import Q
-from django.http import JsonResponse, HttpResponseBadRequest
-from django.views.decorators.http import require_GET, require_POST
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import FileResponse, HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 from django.views.decorators.csrf import csrf_protect
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from .models import Compound
+from chem_backend import metrics, queryguard
+
+from . import catalog, depiction, events, export, massindex, properties, related, updates, uploads
+from .chemistry import ADDUCTS
+from .models import Compound, CompoundChange, StructureUpload
 
 
 # ---------- Helpers ----------
 
+@metrics.timed("serialize")  # phase "serialize" de Server-Timing
 def serialize_compound(c: Compound, request=None) -> dict:
     """
     Serialize a Compound to JSON.
@@ -25,10 +35,12 @@ def serialize_compound(c: Compound, request=None) -> dict:
         "formula": c.formula,
         "smiles": c.smiles,
         "molecular_weight": c.molecular_weight,
+        "monoisotopic_mass": c.monoisotopic_mass,
         "description": c.description or "",
         "is_public": c.is_public,
         "created_at": c.created_at.isoformat() if c.created_at else None,
         "updated_at": c.updated_at.isoformat() if c.updated_at else None,
+        "version": updates.compound_version(c),  # valeur attendue dans If-Match (PATCH)
         "owner": {"id": c.owner_id, "email": getattr(c.owner, "email", None)},
     }
     if c.structure_file:
@@ -42,16 +54,25 @@ def serialize_compound(c: Compound, request=None) -> dict:
 def apply_search(qs, q: Optional[str]):
     """
     Filtre la queryset selon ?q= (name, formula, smiles, description).
+    - Si le coût estimé dépasse le budget de l'endpoint (chem_backend/queryguard.py),
+      se rabat sur une recherche par préfixe (name, formula, smiles) ;
+      encore trop coûteuse → QueryTooExpensive (422).
     """
     if not q:
         return qs
     q = q.strip()
-    return qs.filter(
+    found = qs.filter(
         Q(name__icontains=q) |
         Q(formula__icontains=q) |
         Q(smiles__icontains=q) |
         Q(description__icontains=q)
     )
+    if queryguard.within_budget(found):
+        return found
+    prefix = qs.filter(Q(name__istartswith=q) | Q(formula__istartswith=q) | Q(smiles__istartswith=q))
+    queryguard.ensure_within_budget(prefix)
+    queryguard.mark_downgraded("prefix")
+    return prefix
 
 
 def apply_pagination(qs, request):
@@ -98,16 +119,83 @@ def parse_bool(v, default=False):
     return str(v).lower() in ("1", "true", "yes", "on")
 
 
+def parse_compound_fields(data: dict):
+    """
+    Champs modifiables présents dans `data` → (valeurs nettoyées, erreur ou None).
+    Textes strippés, molecular_weight float ou None, is_public booléen.
+    """
+    values = {}
+    for field in ("name", "formula", "smiles", "description"):
+        if field in data:
+            values[field] = (data.get(field) or "").strip()
+    if "molecular_weight" in data:
+        mw = data.get("molecular_weight")
+        if mw in (None, ""):
+            values["molecular_weight"] = None
+        else:
+            try:
+                values["molecular_weight"] = float(mw)
+            except (TypeError, ValueError):
+                return None, "molecular_weight must be a number"
+    if "is_public" in data:
+        values["is_public"] = parse_bool(data.get("is_public"))
+    return values, None
+
+
+def patch_compound(request, compound_id: int, owner=None):
+    """
+    PATCH partiel (JSON) : un seul UPDATE conditionnel sur la version envoyée
+    dans If-Match (voir compounds/updates.py). `owner` : restreint l'écriture
+    à ses composés (None pour l'admin).
+    """
+    try:
+        expected = updates.parse_if_match(request.headers.get("If-Match"))
+    except updates.PreconditionError as exc:
+        return JsonResponse({"error": str(exc)}, status=428)
+    data = parse_json_body(request)
+    if not isinstance(data, dict):
+        return HttpResponseBadRequest("Invalid payload")
+
+    values, error = parse_compound_fields(data)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+    if not values:
+        return JsonResponse({"error": "No updatable field in payload"}, status=400)
+    for field in ("name", "formula", "smiles"):
+        if field in values and not values[field]:
+            return JsonResponse({"error": f"{field} cannot be empty"}, status=400)
+
+    comp, status = updates.conditional_update(compound_id, values, expected, owner)
+    if status == 404:
+        return JsonResponse({"error": "Not found"}, status=404)
+    if status == 403:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    if status == 409:
+        resp = JsonResponse({
+            "error": "Compound was modified since it was loaded",
+            "compound": serialize_compound(comp, request),
+        }, status=409)
+    else:
+        resp = JsonResponse({"message": "Updated", "compound": serialize_compound(comp, request)})
+    resp["ETag"] = updates.compound_etag(comp)
+    return resp
+
+
 # ---------- Views ----------
 
 @require_GET
 def get_all_compounds(request):
     """
     PUBLIC: liste tous les composés publics.
-    GET /api/compounds/public/?q=&limit=&offset=
+    GET /api/compounds/public/?q=&props=&limit=&offset=
+    - props : filtres sur les propriétés, ex. "mp between 100 and 150 °C AND logp < 3"
     """
-    qs = Compound.objects.filter(is_public=True).order_by("name")
+    qs = Compound.objects.filter(is_public=True).select_related("owner").order_by("name")
     qs = apply_search(qs, request.GET.get("q"))
+    try:
+        qs = properties.apply_property_filters(qs, request.GET.get("props"))
+    except properties.PropertyError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     total, offset, limit, items = apply_pagination(qs, request)
     return JsonResponse({
         "total": total,
@@ -123,10 +211,14 @@ def get_compounds(request):
     """
     PRIVATE: liste les composés accessibles aux utilisateurs connectés.
     Désormais : TOUS les composés (peu importe le rôle).
-    GET /api/compounds/private/?q=&limit=&offset=
+    GET /api/compounds/private/?q=&props=&limit=&offset=
     """
-    qs = Compound.objects.all()  # ← plus de filtrage par owner/role
+    qs = Compound.objects.select_related("owner")  # ← plus de filtrage par owner/role
     qs = apply_search(qs.order_by("name"), request.GET.get("q"))
+    try:
+        qs = properties.apply_property_filters(qs, request.GET.get("props"))
+    except properties.PropertyError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     total, offset, limit, items = apply_pagination(qs, request)
     return JsonResponse({
         "total": total,
@@ -187,16 +279,22 @@ def add_compound(request):
     return JsonResponse({"message": "Created", "compound": serialize_compound(comp, request)}, status=201)
 
 
-@require_POST
+@require_http_methods(["POST", "PATCH"])
 @csrf_protect
 @login_required
 def update_compound(request, compound_id: int):
     """
     Met à jour un composé (owner ou staff).
+    PATCH /api/compounds/<id>/update/ (JSON, If-Match: <ETag ou version>)
+    - N'écrit que les champs envoyés, en une requête conditionnelle :
+      409 + composé actuel si quelqu'un l'a modifié depuis.
     POST /api/compounds/<id>/update/
-    Corps JSON ou multipart/form-data.
+    Corps JSON ou multipart/form-data (seuls les champs modifiés sont écrits).
     - Pour retirer le fichier : 'remove_structure_file' = true/1/yes/on
     """
+    if request.method == "PATCH":
+        return patch_compound(request, compound_id, owner=request.user)
+
     comp = get_object_or_404(Compound, pk=compound_id)
     if comp.owner_id != request.user.id:
         return JsonResponse({"error": "Forbidden"}, status=403)
@@ -206,38 +304,23 @@ def update_compound(request, compound_id: int):
     if data is None:
         return HttpResponseBadRequest("Invalid payload")
 
-    if "name" in data:
-        comp.name = (data.get("name") or "").strip()
-    if "formula" in data:
-        comp.formula = (data.get("formula") or "").strip()
-    if "smiles" in data:
-        comp.smiles = (data.get("smiles") or "").strip()
-    if "description" in data:
-        comp.description = (data.get("description") or "").strip()
-
-    if "molecular_weight" in data:
-        mw = data.get("molecular_weight")
-        if mw in (None, ""):
-            comp.molecular_weight = None
-        else:
-            try:
-                comp.molecular_weight = float(mw)
-            except (TypeError, ValueError):
-                return JsonResponse({"error": "molecular_weight must be a number"}, status=400)
-
-    if "is_public" in data:
-        comp.is_public = parse_bool(data.get("is_public"))
+    values, error = parse_compound_fields(data)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+    changed = updates.apply_changes(comp, values)
 
     # Fichier
     if fileobj is not None:
         comp.structure_file = fileobj
+        changed.append("structure_file")
     else:
         remove_flag = parse_bool(data.get("remove_structure_file"))
         if remove_flag and comp.structure_file:
             comp.structure_file.delete(save=False)
             comp.structure_file = None
+            changed.append("structure_file")
 
-    comp.save()
+    updates.save_changed(comp, changed)
     return JsonResponse({"message": "Updated", "compound": serialize_compound(comp, request)})
 
 
@@ -260,6 +343,557 @@ def delete_compound(request, compound_id: int):
     return JsonResponse({"message": "Deleted"})
     
 
+# ---------- Flux de changements ----------
+
+def changes_since(since: int, limit: int, authenticated: bool, request=None, settle=True):
+    """
+    Entrées du journal après `since`, au plus une par composé (la dernière).
+    Retourne (changes, next_token, has_more).
+    """
+    qs = CompoundChange.objects.filter(id__gt=since)
+    if settle:
+        # Les ids sont attribués à l'insertion, pas au commit : une transaction
+        # encore ouverte peut valider un id plus petit qu'un id déjà visible.
+        # On ne sert que les entrées assez anciennes pour être validées.
+        cutoff = timezone.now() - timedelta(seconds=settings.COMPOUND_CHANGES_SETTLE_SECONDS)
+        qs = qs.filter(created_at__lte=cutoff)
+    entries = list(qs.order_by("id")[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for e in entries:
+        latest.pop(e.compound_id, None)  # réordonne sur le dernier jeton
+        latest[e.compound_id] = e
+
+    live_ids = [cid for cid, e in latest.items() if e.action != CompoundChange.DELETED]
+    qs = Compound.objects.select_related("owner").filter(pk__in=live_ids)
+    if not authenticated:
+        qs = qs.filter(is_public=True)
+    found = {c.id: c for c in qs} if live_ids else {}
+
+    changes = []
+    for cid, e in latest.items():
+        comp = found.get(cid)
+        if comp is not None:
+            changes.append({"token": e.id, "action": e.action, "id": cid,
+                            "compound": serialize_compound(comp, request)})
+        elif authenticated or e.ever_public:
+            # Supprimé (ou devenu privé) : tombstone ; jamais public → rien pour les anonymes
+            changes.append({"token": e.id, "action": CompoundChange.DELETED, "id": cid})
+
+    return changes, (entries[-1].id if entries else since), has_more
+
+
+@require_GET
+def get_compound_changes(request):
+    """
+    Flux incrémental pour les clients qui répliquent le catalogue.
+    GET /api/compounds/changes/?since=<token>&limit=
+
+    - since=0 (ou absent) : tout le journal, donc un état complet.
+    - Chaque composé apparaît au plus une fois par page, avec son dernier
+      changement : "created"/"updated" → `compound` à jour (upsert côté client),
+      "deleted" → tombstone.
+    - Rappeler avec since=<next> tant que has_more est vrai.
+    - Non connecté : seuls les composés publics ; un composé devenu privé
+      arrive comme tombstone, un composé qui n'a jamais été public n'apparaît pas.
+    """
+    try:
+        since = max(0, int(request.GET.get("since") or 0))
+        limit = int(request.GET.get("limit", 500))
+    except ValueError:
+        return JsonResponse({"error": "since and limit must be integers"}, status=400)
+    limit = max(1, min(limit, 1000))
+
+    changes, next_token, has_more = changes_since(since, limit, request.user.is_authenticated, request)
+    return JsonResponse({
+        "since": since,
+        "next": next_token,
+        "has_more": has_more,
+        "changes": changes,
+    })
+
+
+@require_GET
+async def compound_events(request):
+    """
+    Événements en direct (Server-Sent Events).
+    GET /api/compounds/events/   (EventSource côté navigateur)
+
+    En production (ASGI), cette URL est interceptée dans asgi.py par
+    events.sse_endpoint, hors de la pile de middlewares : aucun thread n'est
+    retenu par connexion. Cette vue ne sert qu'en développement (runserver).
+    Format et paramètres : voir compounds/events.py.
+    """
+    try:
+        since = events.parse_since(request.headers.get("Last-Event-ID") or request.GET.get("since"))
+    except ValueError:
+        return JsonResponse({"error": "Invalid Last-Event-ID"}, status=400)
+    if len(events.broker) >= settings.SSE_MAX_CONNECTIONS:
+        response = JsonResponse({"error": "Too many event streams, retry later"}, status=503)
+        response["Retry-After"] = "5"
+        return response
+
+    user = await request.auser()
+    response = StreamingHttpResponse(
+        events.event_stream(user.is_authenticated, since), content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx : pas de mise en tampon
+    return response
+
+
+# ---------- Recherche par masse exacte ----------
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [v for v in str(value).split(",") if v.strip()]
+
+
+@require_http_methods(["GET", "POST"])
+def mass_search(request):
+    """
+    Composés dont la masse monoisotopique correspond à un ou plusieurs m/z.
+    GET  /api/compounds/mass-search/?mz=180.063,194.08&tol=5&unit=ppm&adducts=[M+H]+,[M+Na]+
+    POST /api/compounds/mass-search/  {"mz": [...], "tolerance": 5, "unit": "ppm"|"Da",
+                                       "adducts": [...], "limit": 10, "include_compounds": true}
+    - adducts par défaut : ["[M]"] (masse neutre) ; liste : voir chemistry.ADDUCTS.
+    - Non connecté : composés publics seulement.
+    - Réponse : un bloc par m/z, correspondances triées par |erreur ppm|.
+    """
+    if request.method == "POST":
+        data = parse_json_body(request)
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    else:
+        data = {
+            "mz": request.GET.get("mz"),
+            "tolerance": request.GET.get("tol"),
+            "unit": request.GET.get("unit"),
+            # "+" devient une espace dans une query string non encodée
+            "adducts": [a.lstrip().replace(" ", "+") for a in _as_list(request.GET.get("adducts"))],
+            "limit": request.GET.get("limit"),
+            "include_compounds": parse_bool(request.GET.get("include_compounds")),
+        }
+
+    try:
+        mzs = [float(v) for v in _as_list(data.get("mz"))]
+        tolerance = float(data.get("tolerance") or 10)
+        limit = int(data.get("limit") or 10)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "mz, tolerance and limit must be numbers"}, status=400)
+    unit = data.get("unit") or "ppm"
+    adducts = data.get("adducts") or ["[M]"]
+    if not mzs:
+        return JsonResponse({"error": "mz is required"}, status=400)
+    if len(mzs) > settings.MASS_SEARCH_MAX_QUERIES:
+        return JsonResponse({"error": f"At most {settings.MASS_SEARCH_MAX_QUERIES} m/z per request"}, status=400)
+    if unit not in ("ppm", "Da"):
+        return JsonResponse({"error": "unit must be 'ppm' or 'Da'"}, status=400)
+    if not (0 < tolerance <= (1000 if unit == "ppm" else 1.0)):
+        return JsonResponse({"error": "tolerance out of range (max 1000 ppm / 1 Da)"}, status=400)
+    unknown = [a for a in adducts if a not in ADDUCTS]
+    if unknown:
+        return JsonResponse({"error": f"Unknown adduct(s): {', '.join(map(str, unknown))}",
+                             "adducts": list(ADDUCTS)}, status=400)
+    limit = max(1, min(limit, 100))
+
+    results = massindex.search(mzs, tolerance, unit, adducts, not request.user.is_authenticated, limit)
+    payload = {
+        "unit": unit,
+        "tolerance": tolerance,
+        "adducts": adducts,
+        "results": [{"mz": mz, "matches": matches} for mz, matches in zip(mzs, results)],
+    }
+    if data.get("include_compounds"):
+        ids = sorted({m["id"] for matches in results for m in matches})
+        compounds = {}
+        for lo in range(0, len(ids), 2000):
+            for row in Compound.objects.filter(pk__in=ids[lo:lo + 2000]).values("id", "name", "formula", "smiles"):
+                compounds[row.pop("id")] = row
+        payload["compounds"] = compounds
+    return JsonResponse(payload)
+
+
+# ---------- Export colonnaire ----------
+
+@require_GET
+def export_compounds(request):
+    """
+    Export des propriétés de tout le catalogue en un fichier colonnaire.
+    GET /api/compounds/export/?format=npz|arrow|parquet
+    - Non connecté : composés publics ; connecté : tous.
+    - ETag = version du fichier servi (If-None-Match → 304) : après une
+      modification du catalogue, la version précédente le temps de la
+      reconstruction en arrière-plan.
+    Détails des formats : compounds/export.py.
+    """
+    fmt = request.GET.get("format", "npz")
+    if fmt not in export.FORMATS:
+        return JsonResponse({"error": f"Unknown format '{fmt}'"}, status=400)
+    public_only = not request.user.is_authenticated
+    try:
+        path, version = export.get_export(fmt, public_only)
+    except export.ExportUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    etag = f'"{version}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponse(status=304)
+    else:
+        content_type, ext = export.FORMATS[fmt]
+        scope = "public" if public_only else "all"
+        response = FileResponse(open(path, "rb"), as_attachment=True,
+                                filename=f"compounds-{scope}-{version}.{ext}", content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"  # revalidation à chaque fois (ETag)
+    return response
+
+
+# ---------- Instantanés du catalogue public (compounds/catalog.py) ----------
+
+@require_GET
+def catalog_manifest(request):
+    """
+    Manifeste des instantanés et deltas du catalogue public (sites miroirs).
+    GET /api/compounds/catalog/
+    - Miroir à la version u : appliquer les deltas from=u → … → latest
+      (`apply_sql`) ; sinon télécharger le dernier `snapshot`.
+    """
+    manifest = catalog.load_manifest()
+    base = request.build_absolute_uri("/api/compounds/catalog/")
+    for v in manifest["versions"]:
+        for kind in ("snapshot", "delta"):
+            if v.get(kind):
+                v[kind]["url"] = base + v[kind]["file"]
+    manifest["apply_sql"] = catalog.APPLY_SQL
+    response = JsonResponse(manifest)
+    response["Cache-Control"] = "public, max-age=60"
+    return response
+
+
+@require_GET
+def catalog_file(request, filename: str):
+    """
+    Fichier immuable du catalogue (instantané ou delta, SQLite gzip).
+    GET /api/compounds/catalog/<catalog-N.sqlite.gz | delta-U-V.sqlite.gz>
+    """
+    path = catalog.catalog_path(filename)
+    if not catalog.FILE_RE.match(filename) or not os.path.exists(path):
+        return JsonResponse({"error": "Not found"}, status=404)
+    response = FileResponse(open(path, "rb"), as_attachment=True, filename=filename,
+                            content_type="application/gzip")
+    response["Cache-Control"] = "public, max-age=31536000, immutable"  # le nom change à chaque version
+    return response
+
+
+# ---------- Dépictions 2D ----------
+
+def _depiction_size(request, default: int) -> int:
+    """?size= borné à [48, DEPICTION_MAX_SIZE]. ValueError si non entier."""
+    size = int(request.GET.get("size", default))
+    return max(48, min(size, settings.DEPICTION_MAX_SIZE))
+
+
+@require_GET
+def compound_depiction(request, compound_id: int):
+    """
+    Structure 2D du composé, rendue depuis son SMILES.
+    GET /api/compounds/<id>/depiction.svg?size=300
+    - Même visibilité que le détail (privé → 404 si non connecté).
+    - ETag = structure canonique + taille (If-None-Match → 304).
+    """
+    try:
+        size = _depiction_size(request, settings.DEPICTION_DEFAULT_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "size must be an integer"}, status=400)
+    row = Compound.objects.filter(pk=compound_id).values_list("smiles", "is_public").first()
+    if row is None or (not request.user.is_authenticated and not row[1]):
+        return JsonResponse({"error": "Not found"}, status=404)
+    try:
+        key, svg = depiction.depict(row[0], size)
+    except depiction.DepictionError as e:
+        return JsonResponse({"error": f"Cannot depict SMILES: {e}"}, status=400)
+
+    etag = f'"{key}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(svg, content_type="image/svg+xml")
+        response["Content-Security-Policy"] = "default-src 'none'; style-src 'unsafe-inline'"
+    response["ETag"] = etag
+    # Le SMILES peut être modifié : courte durée, puis revalidation par ETag
+    response["Cache-Control"] = f"{'public' if row[1] else 'private'}, max-age=300"
+    return response
+
+
+@require_GET
+def compound_depictions(request):
+    """
+    Vignettes d'une page de liste en une requête.
+    GET /api/compounds/depictions/?ids=1,2,3&size=120
+    → {"size", "depictions": {id: "<svg…>"}, "errors": {id: message}}
+    Les ids inconnus ou non visibles sont absents de la réponse.
+    """
+    try:
+        size = _depiction_size(request, settings.DEPICTION_THUMBNAIL_SIZE)
+        ids = {int(x) for x in request.GET.get("ids", "").split(",") if x.strip()}
+    except ValueError:
+        return JsonResponse({"error": "ids and size must be integers"}, status=400)
+    if len(ids) > settings.DEPICTION_BATCH_MAX:
+        return JsonResponse({"error": f"At most {settings.DEPICTION_BATCH_MAX} ids"}, status=400)
+
+    qs = Compound.objects.filter(pk__in=ids)
+    if not request.user.is_authenticated:
+        qs = qs.filter(is_public=True)
+    svgs, errors, rendered = {}, {}, {}
+    for cid, smiles in qs.values_list("id", "smiles"):
+        try:
+            if smiles not in rendered:  # SMILES répétés dans la page : un seul rendu
+                rendered[smiles] = depiction.depict(smiles, size)[1]
+            svgs[str(cid)] = rendered[smiles]
+        except depiction.DepictionError as e:
+            errors[str(cid)] = str(e)
+    return JsonResponse({"size": size, "depictions": svgs, "errors": errors})
+
+
+# ---------- Envoi de fichiers par morceaux (compounds/uploads.py) ----------
+
+def serialize_upload(u: StructureUpload) -> dict:
+    return {
+        "id": str(u.pk),
+        "compound_id": u.compound_id,
+        "filename": u.filename,
+        "size": u.size,
+        "offset": u.received,
+        "status": u.status,
+        "sha256": u.sha256 or None,
+        "chunk_size": settings.UPLOAD_CHUNK_SIZE,
+        "expires_at": (u.updated_at + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)).isoformat(),
+    }
+
+
+def _upload_error(exc: uploads.UploadError):
+    if isinstance(exc, uploads.UploadConflict):
+        return JsonResponse({"error": str(exc), "offset": exc.offset}, status=409)
+    return JsonResponse({"error": str(exc)}, status=400)
+
+
+def _get_upload(request, upload_id):
+    """Session de l'utilisateur, encore active (None sinon → 404)."""
+    return StructureUpload.objects.filter(
+        pk=upload_id, owner=request.user, updated_at__gte=uploads.expired_before(),
+    ).first()
+
+
+@require_POST
+@csrf_protect
+@login_required
+def create_upload(request):
+    """
+    Ouvre une session d'envoi par morceaux pour le fichier 3D d'un composé.
+    POST /api/compounds/uploads/
+    JSON : compound_id, filename, size (octets), sha256 (optionnel, fichier entier)
+    """
+    data = parse_json_body(request)
+    if not isinstance(data, dict):
+        return HttpResponseBadRequest("Invalid payload")
+    try:
+        compound_id = int(data.get("compound_id"))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "compound_id must be an integer"}, status=400)
+    comp = get_object_or_404(Compound, pk=compound_id)
+    if comp.owner_id != request.user.id:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    try:
+        upload = uploads.create_session(request.user, comp, data.get("filename"), data.get("size"),
+                                        data.get("sha256"))
+    except uploads.UploadError as exc:
+        return _upload_error(exc)
+    return JsonResponse({"upload": serialize_upload(upload)}, status=201)
+
+
+@require_http_methods(["GET", "PUT", "DELETE"])
+@csrf_protect
+@login_required
+def upload_detail(request, upload_id):
+    """
+    GET    /api/compounds/uploads/<id>/             → état (offset de reprise)
+    PUT    /api/compounds/uploads/<id>/?offset=N    corps brut ; X-Chunk-SHA256 optionnel
+    DELETE /api/compounds/uploads/<id>/             → abandon
+    """
+    upload = _get_upload(request, upload_id)
+    if upload is None:
+        return JsonResponse({"error": "Not found"}, status=404)
+    if request.method == "GET":
+        return JsonResponse({"upload": serialize_upload(upload)})
+    if request.method == "DELETE":
+        uploads.abort(upload)
+        return JsonResponse({"message": "Deleted"})
+
+    try:
+        offset = int(request.GET.get("offset", ""))
+        length = int(request.META.get("CONTENT_LENGTH") or -1)
+    except ValueError:
+        return JsonResponse({"error": "offset must be an integer"}, status=400)
+    try:
+        # `request` se lit comme un flux : le corps n'est jamais chargé en mémoire
+        uploads.write_chunk(upload, offset, request, length, request.headers.get("X-Chunk-SHA256"))
+    except uploads.UploadError as exc:
+        return _upload_error(exc)
+    return JsonResponse({"upload": serialize_upload(upload)})
+
+
+@require_POST
+@csrf_protect
+@login_required
+def finalize_upload(request, upload_id):
+    """
+    Vérifie la taille (et le sha256 déclaré) puis attache le fichier au composé.
+    POST /api/compounds/uploads/<id>/finalize/ (idempotent)
+    """
+    upload = _get_upload(request, upload_id)
+    if upload is None:
+        return JsonResponse({"error": "Not found"}, status=404)
+    if upload.status == StructureUpload.COMPLETE:
+        comp = upload.compound  # réponse perdue : on renvoie le même résultat
+    else:
+        if upload.compound.owner_id != request.user.id:
+            return JsonResponse({"error": "Forbidden"}, status=403)
+        try:
+            comp = uploads.finalize(upload)
+        except uploads.UploadError as exc:
+            return _upload_error(exc)
+    return JsonResponse({
+        "message": "Uploaded",
+        "upload": serialize_upload(upload),
+        "compound": serialize_compound(comp, request),
+    })
+
+
+# ---------- Propriétés expérimentales (compounds/properties.py) ----------
+
+@require_GET
+def property_definitions(request):
+    """
+    Propriétés disponibles (clés des filtres ?props=) et unités acceptées.
+    GET /api/compounds/properties/
+    """
+    return JsonResponse({
+        "properties": [
+            {"key": d.key, "name": d.name, "unit": d.unit, "description": d.description}
+            for d in properties.definitions().values()
+        ],
+        "units": sorted(properties.UNITS),
+    })
+
+
+@require_POST
+@csrf_protect
+@login_required
+def bulk_upsert_properties(request):
+    """
+    Écrit ou supprime des valeurs de propriétés en lot (insert ou mise à jour).
+    POST /api/compounds/properties/bulk/
+      {"rows": [{"compound_id": 1, "property": "mp", "value": 122.4, "unit": "°C",
+                 "source": "..."}, {"compound_id": 1, "property": "logp", "value": null}]}
+    - unit : facultative (unité canonique de la propriété) ; value null → suppression.
+    - Non staff : ses propres composés seulement. Lignes invalides → `errors` {index: message}.
+    """
+    data = parse_json_body(request)
+    rows = data.get("rows") if isinstance(data, dict) else None
+    if not isinstance(rows, list):
+        return JsonResponse({"error": "rows must be an array"}, status=400)
+    if len(rows) > settings.PROPERTY_BULK_MAX_ROWS:
+        return JsonResponse({"error": f"At most {settings.PROPERTY_BULK_MAX_ROWS} rows per request"}, status=400)
+    written, deleted, errors = properties.bulk_upsert(rows, user=request.user)
+    return JsonResponse({"written": written, "deleted": deleted, "errors": errors},
+                        status=200 if written or deleted or not errors else 400)
+
+
+# ---------- Recherche groupée (multi-get) ----------
+
+LOOKUP_FIELDS = {"id": "pk", "name": "name", "formula": "formula", "smiles": "smiles"}
+
+
+@require_http_methods(["GET", "POST"])
+def lookup_compounds(request):
+    """
+    Résout une liste de clés en composés, en quelques requêtes IN indexées.
+    GET  /api/compounds/lookup/?by=id&keys=3,1,2
+    GET  /api/compounds/lookup/?by=name&keys=1,2-dichloroethane&keys=benzene
+         (une clé par paramètre : les noms et SMILES peuvent contenir des virgules)
+    POST /api/compounds/lookup/  {"by": "id"|"name"|"formula"|"smiles", "keys": [...]}
+    - Même visibilité que le détail : non connecté → composés publics seulement.
+    - `results` dans l'ordre des clés (doublons compris) :
+      by=id → {"key", "found", "compound"} ; sinon {"key", "found", "compounds",
+      "truncated"} (au plus LOOKUP_MAX_MATCHES composés par clé, par id).
+    """
+    if request.method == "POST":
+        data = parse_json_body(request)
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+        keys = data.get("keys")
+    else:
+        data = {"by": request.GET.get("by")}
+        keys = request.GET.getlist("keys")
+        if (data["by"] or "id") == "id":
+            keys = [k for value in keys for k in _as_list(value)]
+
+    by = data.get("by") or "id"
+    if by not in LOOKUP_FIELDS:
+        return JsonResponse({"error": f"by must be one of: {', '.join(LOOKUP_FIELDS)}"}, status=400)
+    if not isinstance(keys, list):
+        return JsonResponse({"error": "keys must be an array"}, status=400)
+    if len(keys) > settings.LOOKUP_MAX_KEYS:
+        return JsonResponse({"error": f"At most {settings.LOOKUP_MAX_KEYS} keys per request"}, status=400)
+    try:
+        keys = [int(k) for k in keys] if by == "id" else [str(k).strip() for k in keys]
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "ids must be integers"}, status=400)
+
+    field = LOOKUP_FIELDS[by]
+    qs = Compound.objects.select_related("owner")
+    if not request.user.is_authenticated:
+        qs = qs.filter(is_public=True)
+    if by != "id":
+        # Rang par clé, pour plafonner une formule partagée par des milliers de composés
+        cap = settings.LOOKUP_MAX_MATCHES
+        qs = qs.annotate(
+            rank=Window(RowNumber(), partition_by=[F(field)], order_by=F("id").asc())
+        ).filter(rank__lte=cap + 1).order_by(field, "id")
+
+    unique = list(dict.fromkeys(k for k in keys if k != ""))
+    matches = {}
+    for lo in range(0, len(unique), settings.LOOKUP_CHUNK_SIZE):
+        for comp in qs.filter(**{f"{field}__in": unique[lo:lo + settings.LOOKUP_CHUNK_SIZE]}):
+            matches.setdefault(comp.pk if by == "id" else getattr(comp, field), []).append(comp)
+
+    serialized = {}  # un composé présent sous plusieurs clés : sérialisé une fois
+
+    def ser(comp):
+        if comp.pk not in serialized:
+            serialized[comp.pk] = serialize_compound(comp, request)
+        return serialized[comp.pk]
+
+    results, found = [], 0
+    for key in keys:
+        hits = matches.get(key, [])
+        found += bool(hits)
+        if by == "id":
+            item = {"key": key, "found": bool(hits), "compound": ser(hits[0]) if hits else None}
+        else:
+            item = {"key": key, "found": bool(hits),
+                    "compounds": [ser(c) for c in hits[:settings.LOOKUP_MAX_MATCHES]],
+                    "truncated": len(hits) > settings.LOOKUP_MAX_MATCHES}
+        results.append(item)
+    return JsonResponse({"by": by, "found": found, "missing": len(keys) - found, "results": results})
+
+
 # ---------- (Optionnel) Détail ----------
 # Si tu veux un endpoint de détail, ajoute la route dans compounds/urls.py :
 # path('<int:compound_id>/', views.get_compound_detail, name='compound_detail')
@@ -271,10 +905,16 @@ def get_compound_detail(request, compound_id: int):
     - Si l’utilisateur est connecté → accès à tous les composés.
     - Si non connecté → uniquement aux composés publics.
     """
-    comp = get_object_or_404(Compound, pk=compound_id)
+    comp = get_object_or_404(Compound.objects.select_related("owner"), pk=compound_id)
 
     # Non connecté + composé privé → 404
     if (not request.user.is_authenticated) and (not comp.is_public):
         return JsonResponse({"error": "Not found"}, status=404)
 
-    return JsonResponse({"compound": serialize_compound(comp, request)})
+    data = serialize_compound(comp, request)
+    data["properties"] = properties.serialize_properties(comp.pk)
+    # Précalculés (build_related_compounds) ; non connecté : voisins publics seulement
+    data["related"] = related.related_compounds(comp.pk, public_only=not request.user.is_authenticated)
+    resp = JsonResponse({"compound": data})
+    resp["ETag"] = updates.compound_etag(comp)  # à renvoyer dans If-Match (PATCH)
+    return resp
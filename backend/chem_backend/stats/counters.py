@@ -0,0 +1,252 @@
+# stats/counters.py
+"""
+Compteurs statistiques maintenus à l'écriture.
+
+Chaque save()/delete() d'un Compound ou d'un CustomUser applique un delta
+(+1/-1) aux compteurs concernés, dans la même transaction que l'écriture
+(voir stats/signals.py). Les lectures (admin, garde-fous "dernier admin")
+coûtent alors une requête par clé au lieu d'un COUNT(*) sur la table.
+
+Chaque compteur global est réparti sur COUNTER_SHARDS lignes ("<clé>",
+"<clé>#1", ..., "<clé>#N-1") : une écriture incrémente une ligne tirée au
+hasard et les lectures en font la somme. Deux transactions concurrentes ne
+se bloquent alors plus sur la même ligne "compounds:total" jusqu'à leur
+COMMIT. Les compteurs par propriétaire restent sur une seule ligne. Un
+delta complet = une seule requête (upsert), quel que soit le shard tiré.
+
+`reconcile()` recalcule tout depuis les tables (commande reconcile_stats, en
+cron) et replie les lignes de shard dans la ligne de base. Les écritures en
+masse suspendent les deltas (`suspended()`) et appellent reconcile() ensuite.
+"""
+import random
+import threading
+from collections import Counter as Delta
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Counter
+
+COMPOUNDS_TOTAL = "compounds:total"
+COMPOUNDS_PUBLIC = "compounds:public"
+COMPOUNDS_PRIVATE = "compounds:private"
+USERS_TOTAL = "users:total"
+USERS_ACTIVE = "users:active"
+USERS_ACTIVE_ADMINS = "users:active_admins"
+
+
+SHARD_SEP = "#"
+
+
+def owner_key(owner_id) -> str:
+    return f"compounds:owner:{owner_id}"
+
+
+def role_key(role) -> str:
+    return f"users:role:{role}"
+
+
+# ---------- Clés par état ----------
+
+def compound_state(c):
+    """État d'un composé pour les compteurs (None si champ différé)."""
+    d = c.__dict__
+    if "owner_id" not in d or "is_public" not in d:
+        return None
+    return (d["owner_id"], bool(d["is_public"]))
+
+
+def compound_keys(state):
+    owner_id, is_public = state
+    return [COMPOUNDS_TOTAL, COMPOUNDS_PUBLIC if is_public else COMPOUNDS_PRIVATE, owner_key(owner_id)]
+
+
+def user_state(u):
+    d = u.__dict__
+    if not all(k in d for k in ("role", "is_active", "is_staff")):
+        return None
+    return (d["role"], bool(d["is_active"]), bool(d["is_staff"]))
+
+
+def user_keys(state):
+    role, is_active, is_staff = state
+    keys = [USERS_TOTAL, role_key(role)]
+    if is_active:
+        keys.append(USERS_ACTIVE)
+        if is_staff or role == "admin":
+            keys.append(USERS_ACTIVE_ADMINS)
+    return keys
+
+
+def transition(keys_fn, old_state, new_state) -> Delta:
+    """Delta entre deux états (None = la ligne n'existe pas)."""
+    delta = Delta()
+    if old_state is not None:
+        for k in keys_fn(old_state):
+            delta[k] -= 1
+    if new_state is not None:
+        for k in keys_fn(new_state):
+            delta[k] += 1
+    return delta
+
+
+# ---------- Shards ----------
+
+def shard_key(key, shard: int) -> str:
+    return f"{key}{SHARD_SEP}{shard}" if shard else key
+
+
+def _rows(keys) -> Q:
+    """Lignes des compteurs `keys`, tous shards confondus (même si COUNTER_SHARDS a baissé)."""
+    q = Q()
+    for key in keys:
+        q |= Q(key=key) | Q(key__startswith=key + SHARD_SEP)
+    return q
+
+
+def base_key(row_key) -> str:
+    return row_key.split(SHARD_SEP, 1)[0]
+
+
+_local = threading.local()
+
+
+@contextmanager
+def suspended():
+    """
+    Les signaux n'appliquent plus de delta dans ce thread (suppressions en
+    cascade, imports) : appeler reconcile() après le bloc.
+    """
+    previous = getattr(_local, "suspended", False)
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = previous
+
+
+def is_suspended() -> bool:
+    return getattr(_local, "suspended", False)
+
+
+# ---------- Écriture / lecture ----------
+
+def _sharded(key) -> bool:
+    """Compteurs globaux seulement : un compteur par propriétaire est rarement écrit en parallèle."""
+    return not key.startswith("compounds:owner:")
+
+
+def apply(delta):
+    """
+    Applique un delta {clé: n} (à appeler dans la transaction de l'écriture),
+    en une requête : INSERT ... ON CONFLICT DO UPDATE (PostgreSQL, SQLite ≥ 3.24)
+    crée les lignes de shard manquantes avec leur valeur et incrémente les autres.
+    """
+    shard = random.randrange(settings.COUNTER_SHARDS)
+    rows = {shard_key(k, shard) if _sharded(k) else k: n for k, n in delta.items() if n}
+    if not rows:
+        return
+    table, qn = Counter._meta.db_table, connection.ops.quote_name
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    # Lignes prises dans un ordre stable : évite les interblocages entre transactions concurrentes.
+    keys = sorted(rows)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {qn(table)} ({qn('key')}, {qn('value')}, {qn('updated_at')}) "
+            f"VALUES {', '.join(['(%s, %s, %s)'] * len(keys))} "
+            f"ON CONFLICT ({qn('key')}) DO UPDATE SET "
+            f"{qn('value')} = {qn(table)}.{qn('value')} + EXCLUDED.{qn('value')}, "
+            f"{qn('updated_at')} = EXCLUDED.{qn('updated_at')}",
+            [param for key in keys for param in (key, rows[key], now)],
+        )
+
+
+def get_value(key, for_update=False) -> int:
+    """
+    Valeur d'un compteur (somme de ses shards). `for_update=True` (dans un
+    atomic) verrouille ses lignes : deux rétrogradations d'admins concurrentes
+    sont sérialisées.
+    """
+    qs = Counter.objects.filter(_rows([key]))
+    if for_update:
+        qs = qs.select_for_update().order_by("key")
+    return sum(qs.values_list("value", flat=True))
+
+
+def get_values(keys) -> dict:
+    values = dict.fromkeys(keys, 0)
+    for row_key, value in Counter.objects.filter(_rows(values)).values_list("key", "value"):
+        values[base_key(row_key)] += value
+    return values
+
+
+# ---------- Réconciliation ----------
+
+def compute(Compound, User) -> dict:
+    """Valeurs exactes depuis les tables (modèles passés en paramètre pour les migrations)."""
+    values = {}
+    agg = Compound.objects.aggregate(total=Count("id"), public=Count("id", filter=Q(is_public=True)))
+    values[COMPOUNDS_TOTAL] = agg["total"]
+    values[COMPOUNDS_PUBLIC] = agg["public"]
+    values[COMPOUNDS_PRIVATE] = agg["total"] - agg["public"]
+    for owner_id, n in Compound.objects.order_by().values_list("owner_id").annotate(n=Count("id")):
+        values[owner_key(owner_id)] = n
+
+    agg = User.objects.aggregate(
+        total=Count("id"),
+        active=Count("id", filter=Q(is_active=True)),
+        active_admins=Count("id", filter=Q(is_active=True) & (Q(is_staff=True) | Q(role="admin"))),
+    )
+    values[USERS_TOTAL] = agg["total"]
+    values[USERS_ACTIVE] = agg["active"]
+    values[USERS_ACTIVE_ADMINS] = agg["active_admins"]
+    for role, n in User.objects.order_by().values_list("role").annotate(n=Count("id")):
+        values[role_key(role)] = n
+    return values
+
+
+def reconcile(Compound=None, User=None, CounterModel=Counter) -> dict:
+    """
+    Recalcule tous les compteurs et corrige les écarts.
+    Les compteurs existants sont verrouillés avant le calcul : les écritures
+    concurrentes attendent la fin de la réconciliation puis appliquent leur
+    delta par-dessus la valeur corrigée. Retourne {clé: (ancienne, nouvelle)}.
+    """
+    if Compound is None:
+        from compounds.models import Compound
+    if User is None:
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+
+    with transaction.atomic():
+        rows = dict(CounterModel.objects.select_for_update().order_by("key").values_list("key", "value"))
+        current = {}
+        for row_key, value in rows.items():
+            current[base_key(row_key)] = current.get(base_key(row_key), 0) + value
+        expected = compute(Compound, User)
+        # Les compteurs devenus sans objet (propriétaire supprimé, rôle vide) retombent à 0.
+        for key in current:
+            expected.setdefault(key, 0)
+
+        drift = {k: (current.get(k), v) for k, v in expected.items() if current.get(k) != v}
+        # Lignes de shard repliées dans la ligne de base
+        shards = [k for k in rows if SHARD_SEP in k]
+        rewrite = set(drift) | {base_key(k) for k in shards}
+        now = timezone.now()
+        existing = [k for k in rewrite if k in rows]
+        if existing:
+            CounterModel.objects.bulk_update(
+                [CounterModel(key=k, value=expected[k], updated_at=now) for k in existing],
+                ["value", "updated_at"],
+            )
+        CounterModel.objects.bulk_create(
+            [CounterModel(key=k, value=expected[k], updated_at=now) for k in rewrite if k not in rows]
+        )
+        if shards:
+            CounterModel.objects.filter(key__in=shards).delete()
+        # Les compteurs par propriétaire à 0 sont inutiles.
+        CounterModel.objects.filter(key__startswith="compounds:owner:", value=0).delete()
+    return drift
@@ -0,0 +1,17 @@
+# stats/management/commands/reconcile_stats.py
+from django.core.management.base import BaseCommand
+
+from stats.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the statistics counters from the tables and fix any drift. "
+        "Run periodically (cron) and after bulk imports."
+    )
+
+    def handle(self, *args, **opts):
+        drift = reconcile()
+        for key, (old, new) in sorted(drift.items()):
+            self.stdout.write(f"  {key}: {old} -> {new}")
+        self.stdout.write(self.style.SUCCESS(f"Reconciled ({len(drift)} counter(s) corrected)"))
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def populate(apps, schema_editor):
+    from stats.counters import reconcile
+
+    reconcile(
+        Compound=apps.get_model("compounds", "Compound"),
+        User=apps.get_model("users", "CustomUser"),
+        CounterModel=apps.get_model("stats", "Counter"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0001_initial'),
+        ('compounds', '0003_alter_compound_options_compound_created_at_and_more'),
+        ('users', '0002_alter_customuser_options_alter_customuser_email_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import models
+from django.utils import timezone
+
+class Counter(models.Model):
+    """
+    Compteur maintenu incrémentalement (voir stats/counters.py).
+    Clés : "compounds:total", "compounds:public", "compounds:owner:<id>",
+    "users:role:<role>", "users:active_admins", ... ; suffixe "#<n>" pour
+    les lignes de shard d'un même compteur.
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.key}={self.value}"
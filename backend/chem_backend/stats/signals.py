@@ -0,0 +1,99 @@
+# stats/signals.py
+"""
+Maintien des compteurs à chaque écriture.
+
+post_init mémorise l'état chargé depuis la base ; post_save / post_delete
+appliquent le delta entre cet état et le nouveau. Compound.save() et
+CustomUser.save() tournent dans transaction.atomic(), et les suppressions
+(y compris en cascade) dans celle du Collector : compteur et ligne sont
+validés ou annulés ensemble.
+
+Les écritures en masse (bulk_create, QuerySet.update/delete) ne passent pas
+par ici : lancer `manage.py reconcile_stats` ensuite. Une suppression en
+cascade passe, elle, par un signal par ligne : l'entourer de
+`counters.suspended()` puis appeler counters.reconcile() (seed_compounds --clear).
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from compounds.models import Compound
+
+from . import counters
+
+
+def _remember(instance, state_fn):
+    instance._stats_state = state_fn(instance) if instance.pk is not None else None
+
+
+def _previous_state(sender, instance, state_fn):
+    """État en base avant l'écriture (relu si des champs étaient différés)."""
+    if instance._state.adding:
+        return None
+    state = getattr(instance, "_stats_state", None)
+    if state is None:
+        fresh = sender._base_manager.filter(pk=instance.pk).first()
+        state = state_fn(fresh) if fresh is not None else None
+    return state
+
+
+# ---------- Compounds ----------
+
+@receiver(post_init, sender=Compound)
+def compound_loaded(sender, instance, **kwargs):
+    _remember(instance, counters.compound_state)
+
+
+@receiver(pre_save, sender=Compound)
+def compound_before_save(sender, instance, **kwargs):
+    if counters.is_suspended():
+        return
+    instance._stats_previous = _previous_state(sender, instance, counters.compound_state)
+
+
+@receiver(post_save, sender=Compound)
+def compound_saved(sender, instance, **kwargs):
+    if counters.is_suspended():
+        return
+    new_state = counters.compound_state(instance)
+    counters.apply(counters.transition(counters.compound_keys, instance._stats_previous, new_state))
+    instance._stats_state = new_state
+
+
+@receiver(post_delete, sender=Compound)
+def compound_deleted(sender, instance, **kwargs):
+    if counters.is_suspended():
+        return
+    state = getattr(instance, "_stats_state", None) or counters.compound_state(instance)
+    counters.apply(counters.transition(counters.compound_keys, state, None))
+
+
+# ---------- Users ----------
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def user_loaded(sender, instance, **kwargs):
+    _remember(instance, counters.user_state)
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def user_before_save(sender, instance, **kwargs):
+    if counters.is_suspended():
+        return
+    instance._stats_previous = _previous_state(sender, instance, counters.user_state)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, **kwargs):
+    if counters.is_suspended():
+        return
+    new_state = counters.user_state(instance)
+    counters.apply(counters.transition(counters.user_keys, instance._stats_previous, new_state))
+    instance._stats_state = new_state
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    if counters.is_suspended():
+        return
+    state = getattr(instance, "_stats_state", None) or counters.user_state(instance)
+    counters.apply(counters.transition(counters.user_keys, state, None))
@@ -5,11 +5,22 @@ from . import admin_views
 urlpatterns = [
     # Users
     path("users/", admin_views.admin_list_users, name="admin_list_users"),
+    path("users/bulk/", admin_views.admin_bulk_create_users, name="admin_bulk_create_users"),
     path("users/<int:user_id>/set_active/", admin_views.admin_set_active, name="admin_set_active"),  # ✅ NEW
     path("users/<int:user_id>/set_admin/", admin_views.admin_set_admin, name="admin_set_admin"),
 
+    # Stats (compteurs O(1))
+    path("stats/", admin_views.admin_stats, name="admin_stats"),
+
+    # Profils de requêtes (X-Profile: 1)
+    path("profiles/", admin_views.admin_list_profiles, name="admin_list_profiles"),
+    path("profiles/<str:profile_id>/", admin_views.admin_get_profile, name="admin_get_profile"),
+    path("profiles/<str:profile_id>/stacks.folded", admin_views.admin_profile_stacks, name="admin_profile_stacks"),
+    path("profiles/<str:profile_id>/flamegraph.svg", admin_views.admin_profile_flamegraph,
+         name="admin_profile_flamegraph"),
+
     # Compounds
     path("compounds/", admin_views.admin_list_compounds, name="admin_list_compounds"),
-    path("compounds/<int:compound_id}/update/", admin_views.admin_update_compound, name="admin_update_compound"),
-    path("compounds/<int:compound_id}/delete/", admin_views.admin_delete_compound, name="admin_delete_compound"),
+    path("compounds/<int:compound_id>/update/", admin_views.admin_update_compound, name="admin_update_compound"),
+    path("compounds/<int:compound_id>/delete/", admin_views.admin_delete_compound, name="admin_delete_compound"),
 ]
@@ -2,21 +2,30 @@
 import json
 from typing import Optional
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_protect
-from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 
+from chem_backend import profiling
+from compounds import properties, updates
 from compounds.models import Compound
+from stats import counters
+from users.hashing import HasherBusy, hasher_busy, make_passwords
+from users.provisioning import parse_rows, provision_users
 
 # Réutilisation de helpers côté compounds
 from compounds.views import (
     serialize_compound,
     get_data_from_request,
     parse_bool,
+    parse_compound_fields,
+    patch_compound,
     apply_pagination as _apply_pagination_compounds,
     apply_search as _apply_search_compounds,
 )
@@ -37,6 +46,17 @@ def parse_json(request):
     except Exception:
         return None
 
+def is_active_admin(user) -> bool:
+    return bool(user.is_active and (user.is_staff or getattr(user, "role", "") == "admin"))
+
+def other_active_admins(target) -> int:
+    """
+    Nombre d'admins actifs hors `target`, lu sur le compteur (verrouillé :
+    à appeler dans un transaction.atomic()).
+    """
+    n = counters.get_value(counters.USERS_ACTIVE_ADMINS, for_update=True)
+    return n - 1 if is_active_admin(target) else n
+
 def apply_pagination(qs, request):
     try:
         limit = int(request.GET.get("limit", 50))
@@ -102,15 +122,15 @@ def admin_set_active(request, user_id: int):
     if target.id == request.user.id and not new_active:
         return JsonResponse({"error": "You cannot deactivate your own account."}, status=400)
 
-    # On ne désactive pas le dernier admin
-    is_target_admin = bool(getattr(target, "is_staff", False) or getattr(target, "role", "") == "admin")
-    if is_target_admin and not new_active:
-        admins_qs = User.objects.filter(Q(is_staff=True) | Q(role="admin"), is_active=True).exclude(pk=target.pk)
-        if admins_qs.count() == 0:
-            return JsonResponse({"error": "Cannot deactivate the last active administrator."}, status=400)
+    with transaction.atomic():
+        # On ne désactive pas le dernier admin
+        is_target_admin = bool(getattr(target, "is_staff", False) or getattr(target, "role", "") == "admin")
+        if is_target_admin and not new_active:
+            if other_active_admins(target) == 0:
+                return JsonResponse({"error": "Cannot deactivate the last active administrator."}, status=400)
 
-    target.is_active = new_active
-    target.save(update_fields=["is_active"])
+        target.is_active = new_active
+        target.save(update_fields=["is_active"])
 
     return JsonResponse({
         "message": "Updated",
@@ -139,22 +159,22 @@ def admin_set_admin(request, user_id: int):
 
     make_admin = parse_bool(data.get("is_admin"))
 
-    if make_admin:
-        target.is_staff = True
-        if getattr(target, "role", None) != "admin":
-            target.role = "admin"
-        target.save(update_fields=["is_staff", "role"])
-    else:
-        # ne pas rétrograder le dernier admin actif
-        others_admins = User.objects.filter(Q(is_staff=True) | Q(role="admin"), is_active=True).exclude(pk=target.pk)
-        if others_admins.count() == 0:
-            return JsonResponse({"error": "Cannot demote the last administrator."}, status=400)
-        target.is_staff = False
-        if getattr(target, "role", None) == "admin":
-            target.role = "connected"
+    with transaction.atomic():
+        if make_admin:
+            target.is_staff = True
+            if getattr(target, "role", None) != "admin":
+                target.role = "admin"
             target.save(update_fields=["is_staff", "role"])
         else:
-            target.save(update_fields=["is_staff"])
+            # ne pas rétrograder le dernier admin actif
+            if other_active_admins(target) == 0:
+                return JsonResponse({"error": "Cannot demote the last administrator."}, status=400)
+            target.is_staff = False
+            if getattr(target, "role", None) == "admin":
+                target.role = "connected"
+                target.save(update_fields=["is_staff", "role"])
+            else:
+                target.save(update_fields=["is_staff"])
 
     return JsonResponse({
         "message": "Updated",
@@ -169,6 +189,170 @@ def admin_set_admin(request, user_id: int):
     })
 
 
+@require_POST
+@csrf_protect
+@login_required
+def admin_bulk_create_users(request):
+    """
+    Provisionne des utilisateurs en masse (au plus USER_BULK_MAX_ROWS lignes,
+    hashées dans le pool borné de users/hashing.py, 503 s'il est saturé ;
+    au-delà : commande `provision_users`).
+    POST /api/admin/users/bulk/
+      - JSON : {"users": [{email, full_name, password, role?}, ...], "default_role"?, "dry_run"?}
+      - multipart/form-data : champ 'file' (CSV ou JSON)
+      - text/csv : corps brut
+    Réponse : {"received", "created", "failed": [{row, email, error}], "duration_s"}
+    """
+    if not is_admin(request.user):
+        return admin_forbidden()
+
+    content_type = request.META.get("CONTENT_TYPE") or ""
+    options = {}
+    try:
+        if content_type.startswith("multipart/form-data"):
+            fileobj = request.FILES.get("file")
+            if fileobj is None:
+                return HttpResponseBadRequest("Missing file")
+            rows = parse_rows(fileobj.read())
+            options = request.POST.dict()
+        elif content_type.startswith("text/csv"):
+            rows = parse_rows(request.body, "csv")
+        else:
+            data = parse_json(request)
+            if not isinstance(data, (dict, list)):
+                return HttpResponseBadRequest("Invalid payload")
+            rows = parse_rows(json.dumps(data), "json")
+            options = data if isinstance(data, dict) else {}
+    except (ValueError, UnicodeDecodeError):
+        return HttpResponseBadRequest("Invalid payload")
+
+    max_rows = settings.USER_BULK_MAX_ROWS
+    if len(rows) > max_rows:
+        return JsonResponse(
+            {"error": f"At most {max_rows} users per request; use the provision_users command for larger imports"},
+            status=413,
+        )
+    default_role = options.get("default_role") or "guest"
+    if not isinstance(default_role, str):
+        return JsonResponse({"error": "default_role must be a string"}, status=400)
+
+    try:
+        report = provision_users(
+            rows,
+            default_role=default_role,
+            dry_run=parse_bool(options.get("dry_run")),
+            hash_fn=make_passwords,
+        )
+    except HasherBusy:
+        return hasher_busy()
+    status = 201 if report["created"] else 200
+    return JsonResponse(report, status=status)
+
+
+# ------------ Stats ------------
+@require_GET
+@login_required
+def admin_stats(request):
+    """
+    Compteurs du tableau de bord admin, lus en O(1) (stats/counters.py).
+    GET /api/admin/stats/?owner=<user_id>
+    """
+    if not is_admin(request.user):
+        return admin_forbidden()
+
+    roles = [r for r, _ in User.ROLE_CHOICES]
+    keys = [
+        counters.COMPOUNDS_TOTAL, counters.COMPOUNDS_PUBLIC, counters.COMPOUNDS_PRIVATE,
+        counters.USERS_TOTAL, counters.USERS_ACTIVE, counters.USERS_ACTIVE_ADMINS,
+    ] + [counters.role_key(r) for r in roles]
+    owner_id = request.GET.get("owner")
+    if owner_id:
+        try:
+            owner_id = int(owner_id)
+        except ValueError:
+            return JsonResponse({"error": "owner must be an integer"}, status=400)
+        keys.append(counters.owner_key(owner_id))
+    values = counters.get_values(keys)
+
+    data = {
+        "compounds": {
+            "total": values[counters.COMPOUNDS_TOTAL],
+            "public": values[counters.COMPOUNDS_PUBLIC],
+            "private": values[counters.COMPOUNDS_PRIVATE],
+        },
+        "users": {
+            "total": values[counters.USERS_TOTAL],
+            "active": values[counters.USERS_ACTIVE],
+            "active_admins": values[counters.USERS_ACTIVE_ADMINS],
+            "by_role": {r: values[counters.role_key(r)] for r in roles},
+        },
+    }
+    if owner_id:
+        data["owner"] = {"id": owner_id, "compounds": values[counters.owner_key(owner_id)]}
+    return JsonResponse(data)
+
+
+# ------------ Profils de requêtes (chem_backend/profiling.py) ------------
+@require_GET
+@login_required
+def admin_list_profiles(request):
+    """
+    Profils enregistrés (X-Profile: 1 ou ?_profile=1 sur une requête staff).
+    GET /api/admin/profiles/
+    """
+    if not is_admin(request.user):
+        return admin_forbidden()
+    return JsonResponse({"results": profiling.list_profiles()})
+
+
+@require_GET
+@login_required
+def admin_get_profile(request, profile_id: str):
+    """
+    Détail : métadonnées, chronologie SQL, fonctions les plus coûteuses.
+    GET /api/admin/profiles/<id>/
+    """
+    if not is_admin(request.user):
+        return admin_forbidden()
+    meta = profiling.load_profile(profile_id)
+    if meta is None:
+        return JsonResponse({"error": "Not found"}, status=404)
+    return JsonResponse(meta)
+
+
+@require_GET
+@login_required
+def admin_profile_stacks(request, profile_id: str):
+    """
+    Piles repliées (flamegraph.pl, speedscope, inferno).
+    GET /api/admin/profiles/<id>/stacks.folded
+    """
+    if not is_admin(request.user):
+        return admin_forbidden()
+    if profiling.load_profile(profile_id) is None:
+        return JsonResponse({"error": "Not found"}, status=404)
+    with open(profiling.profile_path(profile_id, "folded")) as fh:
+        return HttpResponse(fh.read(), content_type="text/plain; charset=utf-8")
+
+
+@require_GET
+@login_required
+def admin_profile_flamegraph(request, profile_id: str):
+    """
+    GET /api/admin/profiles/<id>/flamegraph.svg
+    """
+    if not is_admin(request.user):
+        return admin_forbidden()
+    meta = profiling.load_profile(profile_id)
+    if meta is None:
+        return JsonResponse({"error": "Not found"}, status=404)
+    title = f"{meta['method']} {meta['path']} – {meta['duration_ms']:.1f} ms, {meta['sql_count']} SQL"
+    svg = profiling.flamegraph_svg(profiling.load_stacks(profile_id), title=title)
+    resp = HttpResponse(svg, content_type="image/svg+xml")
+    resp["Content-Security-Policy"] = "default-src 'none'; style-src 'unsafe-inline'"
+    return resp
+
+
 # ------------ Compounds Admin API ------------
 @require_GET
 @login_required
@@ -176,8 +360,12 @@ def admin_list_compounds(request):
     if not is_admin(request.user):
         return admin_forbidden()
 
-    qs = Compound.objects.all().order_by("name")
+    qs = Compound.objects.select_related("owner").order_by("name")
     qs = _apply_search_compounds(qs, request.GET.get("q"))
+    try:
+        qs = properties.apply_property_filters(qs, request.GET.get("props"))
+    except properties.PropertyError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     total, offset, limit, items = _apply_pagination_compounds(qs, request)
     return JsonResponse({
         "total": total,
@@ -187,49 +375,37 @@ def admin_list_compounds(request):
     })
 
 
-@require_POST
+@require_http_methods(["POST", "PATCH"])
 @csrf_protect
 @login_required
 def admin_update_compound(request, compound_id: int):
     if not is_admin(request.user):
         return admin_forbidden()
+    if request.method == "PATCH":
+        # If-Match obligatoire : deux admins sur la même fiche → 409 au second
+        return patch_compound(request, compound_id)
 
     comp = get_object_or_404(Compound, pk=compound_id)
     data, fileobj = get_data_from_request(request)
     if data is None:
         return HttpResponseBadRequest("Invalid payload")
 
-    if "name" in data:
-        comp.name = (data.get("name") or "").strip()
-    if "formula" in data:
-        comp.formula = (data.get("formula") or "").strip()
-    if "smiles" in data:
-        comp.smiles = (data.get("smiles") or "").strip()
-    if "description" in data:
-        comp.description = (data.get("description") or "").strip()
-
-    if "molecular_weight" in data:
-        mw = data.get("molecular_weight")
-        if mw in (None, ""):
-            comp.molecular_weight = None
-        else:
-            try:
-                comp.molecular_weight = float(mw)
-            except (TypeError, ValueError):
-                return JsonResponse({"error": "molecular_weight must be a number"}, status=400)
-
-    if "is_public" in data:
-        comp.is_public = parse_bool(data.get("is_public"))
+    values, error = parse_compound_fields(data)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+    changed = updates.apply_changes(comp, values)
 
     if fileobj is not None:
         comp.structure_file = fileobj
+        changed.append("structure_file")
     else:
         remove_flag = parse_bool(data.get("remove_structure_file"))
         if remove_flag and comp.structure_file:
             comp.structure_file.delete(save=False)
             comp.structure_file = None
+            changed.append("structure_file")
 
-    comp.save()
+    updates.save_changed(comp, changed)
     return JsonResponse({"message": "Updated", "compound": serialize_compound(comp, request)})
 
 
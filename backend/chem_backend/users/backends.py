@@ -0,0 +1,63 @@
+# users/backends.py
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from chem_backend import metrics
+
+from .hashing import acheck_password, amake_password
+
+
+def user_cache_key(user_id) -> str:
+    return f"users:snapshot:{user_id}"
+
+
+def invalidate_user_cache(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend dont `get_user()` (appelé par AuthenticationMiddleware à
+    chaque requête) lit un instantané de l'utilisateur en cache.
+
+    - L'instantané est invalidé à chaque save()/delete() du user (voir
+      users/signals.py) : profil, mot de passe, is_active, rôle admin.
+    - Le hash de session est toujours vérifié par django.contrib.auth.get_user
+      avec le mot de passe de l'instantané : un changement de mot de passe
+      déconnecte les autres sessions comme avant.
+
+    `aauthenticate()` (login async) vérifie le mot de passe dans le pool de
+    hash borné (users/hashing.py) ; peut lever HasherBusy.
+    """
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Même coût qu'un utilisateur existant (timing, cf. ModelBackend).
+            await amake_password(password)
+            return None
+        if await acheck_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        if not getattr(settings, "AUTH_CACHE_ENABLED", False):
+            return super().get_user(user_id)
+
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        metrics.cache_event("auth", user is not None)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, getattr(settings, "USER_CACHE_TIMEOUT", 300))
+            return user
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,141 @@
+# users/hashing.py
+"""
+Hash / vérification de mots de passe hors du worker.
+
+PBKDF2 coûte plusieurs centaines de ms de CPU. Les vues async de login,
+inscription et changement de mot de passe délèguent ce calcul à un pool de
+threads borné (hashlib relâche le GIL pendant PBKDF2) : une rafale de logins
+occupe au plus PASSWORD_HASHER_WORKERS cœurs, et au-delà de la file
+d'attente (PASSWORD_HASHER_QUEUE) on répond 503 au lieu d'empiler.
+
+Le throttle par IP / email (`throttle_hashing`) passe avant : le trafic de
+credential stuffing est rejeté sans jamais atteindre le pool.
+
+Portée : tous les middlewares du projet (metrics, querybudget, profiling,
+compression, shedding, queryguard) sont synchrones. Sous WSGI, et sous ASGI
+tant que la pile en contient un, Django appelle ces vues via async_to_sync :
+le thread du worker reste bloqué pendant le hash. Le gain est alors la
+limite de CPU consacrée au hash (PASSWORD_HASHER_WORKERS cœurs, 503 au-delà
+de la file), pas la libération du worker. Mesure (`bench_login_storm
+--no-throttle`, 1 cœur, SHED_ENABLED=False, 32 logins concurrents) : liste
+publique p50 19,6 → 25,6 ms, p99 48,7 → 88,8 ms, débit 192 → 139 req/s.
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.http import JsonResponse
+
+from chem_backend.throttle import client_ip, shared_buckets, too_many_requests
+
+
+class HasherBusy(Exception):
+    """Pool de hash saturé : la requête est refusée plutôt que mise en attente."""
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+def _get_pool():
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = getattr(settings, "PASSWORD_HASHER_WORKERS", None) or min(4, os.cpu_count() or 1)
+                queue = getattr(settings, "PASSWORD_HASHER_QUEUE", 32)
+                _slots = threading.BoundedSemaphore(workers + queue)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+    return _executor, _slots
+
+
+async def run_hasher(func, *args):
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise HasherBusy()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+    finally:
+        slots.release()
+
+
+def make_passwords(raw_passwords):
+    """
+    Hash plusieurs mots de passe en parallèle dans le pool borné, depuis du
+    code synchrone (provisionnement admin). Chaque mot de passe prend une
+    place de la file : HasherBusy si elle ne peut pas tous les accueillir.
+    """
+    executor, slots = _get_pool()
+    taken = 0
+    try:
+        for _ in raw_passwords:
+            if not slots.acquire(blocking=False):
+                raise HasherBusy()
+            taken += 1
+        return list(executor.map(make_password, raw_passwords))
+    finally:
+        for _ in range(taken):
+            slots.release()
+
+
+async def amake_password(raw_password):
+    return await run_hasher(make_password, raw_password)
+
+
+async def acheck_password(user, raw_password) -> bool:
+    """
+    Équivalent async de user.check_password() : vérifie dans le pool, puis
+    ré-hashe et sauvegarde si l'algorithme / le nombre d'itérations a changé.
+    """
+    encoded = user.password
+    if not await run_hasher(check_password, raw_password, encoded):
+        return False
+    preferred = get_hasher("default")
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return True
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        user.password = await amake_password(raw_password)
+        await user.asave(update_fields=["password"])
+    return True
+
+
+def hasher_busy():
+    resp = JsonResponse({"error": "Server busy, retry later"}, status=503)
+    resp["Retry-After"] = "1"
+    return resp
+
+
+def throttle_hashing(request, email=None):
+    """
+    Token buckets par IP et par email devant toute opération de hash.
+    Retourne une réponse 429 si la requête doit être rejetée, sinon None.
+    Taux : PASSWORD_THROTTLE_RATES = {"ip": (jetons/s, rafale), "email": (...)}.
+    Buckets partagés entre workers si THROTTLE_BACKEND = "cache".
+    """
+    rates = getattr(settings, "PASSWORD_THROTTLE_RATES", {})
+    registry = shared_buckets()
+    keys = [("ip", client_ip(request))]
+    if email:
+        keys.append(("email", email))
+    for scope, value in keys:
+        if scope not in rates:
+            continue
+        rate, capacity = rates[scope]
+        allowed, retry_after = registry.take(f"pwhash:{scope}:{value}", rate, capacity)
+        if not allowed:
+            return too_many_requests(retry_after, "Too many attempts, retry later")
+    return None
+
+
+async def athrottle_hashing(request, email=None):
+    """throttle_hashing depuis une vue async (le cache Django est synchrone)."""
+    return await sync_to_async(throttle_hashing)(request, email)
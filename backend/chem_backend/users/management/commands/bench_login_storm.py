@@ -0,0 +1,93 @@
+# users/management/commands/bench_login_storm.py
+import itertools
+import json
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from chem_backend.bench import SCENARIOS, InProcessTransport, build_context, run_scenario
+from chem_backend.throttle import buckets
+from compounds.synthetic import BENCH_ADMIN_EMAIL
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure list-endpoint latency alone, then during a login storm "
+        "(in-process). Run `seed_compounds` first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--list-scenario", default="public", choices=["public", "private", "admin_compounds"])
+        parser.add_argument("--list-concurrency", type=int, default=4)
+        parser.add_argument("--storm-concurrency", type=int, default=32)
+        parser.add_argument("--storm-ips", type=int, default=256,
+                            help="Number of distinct client IPs the storm rotates through.")
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument("--no-throttle", action="store_true",
+                            help="Disable the per-IP/per-email token buckets (hasher pool only).")
+        parser.add_argument("--output", default=None)
+
+    def handle(self, *args, **opts):
+        try:
+            user = User.objects.get(email="bench-1@example.com")
+            admin = User.objects.get(email=BENCH_ADMIN_EMAIL)
+        except User.DoesNotExist:
+            raise CommandError("Benchmark users not found: run `manage.py seed_compounds` first.")
+
+        ctx = build_context()
+        list_request, auth = SCENARIOS[opts["list_scenario"]]
+        who = {"user": user, "admin": admin}.get(auth)
+        list_factory = lambda: InProcessTransport(who)  # noqa: E731
+
+        ips = itertools.cycle(f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(opts["storm_ips"]))
+        ip_lock = threading.Lock()
+
+        def storm_factory():
+            with ip_lock:
+                return InProcessTransport(remote_addr=next(ips))
+
+        overrides = {"PASSWORD_THROTTLE_RATES": {}} if opts["no_throttle"] else {}
+        with override_settings(**overrides):
+            buckets.clear()
+            baseline = run_scenario(list_request, list_factory, ctx,
+                                    opts["list_concurrency"], opts["duration"])
+
+            stop = threading.Event()
+            storm_result = {}
+
+            def storm():
+                storm_result.update(run_scenario(
+                    SCENARIOS["login"][0], storm_factory, ctx, opts["storm_concurrency"],
+                    opts["duration"] * 10, stop_event=stop,
+                ))
+
+            storm_thread = threading.Thread(target=storm)
+            storm_thread.start()
+            try:
+                during = run_scenario(list_request, list_factory, ctx,
+                                      opts["list_concurrency"], opts["duration"])
+            finally:
+                stop.set()
+                storm_thread.join()
+
+        results = {
+            "meta": {
+                "list_scenario": opts["list_scenario"],
+                "list_concurrency": opts["list_concurrency"],
+                "storm_concurrency": opts["storm_concurrency"],
+                "storm_ips": opts["storm_ips"],
+                "throttle": not opts["no_throttle"],
+                "duration_s": opts["duration"],
+            },
+            "baseline": baseline,
+            "during_storm": {"list": during, "login": storm_result},
+        }
+        payload = json.dumps(results, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w") as fh:
+                fh.write(payload)
+        self.stdout.write(payload)
@@ -0,0 +1,60 @@
+# users/management/commands/provision_users.py
+import argparse
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.provisioning import min_iterations, parse_rows, provision_users
+
+
+def iterations_arg(value):
+    try:
+        iterations = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("must be an integer")
+    if iterations < min_iterations():
+        raise argparse.ArgumentTypeError(f"must be at least {min_iterations()} (hasher default)")
+    return iterations
+
+
+class Command(BaseCommand):
+    help = "Bulk-create users from a CSV (email,full_name,password[,role]) or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file ('-' for stdin).")
+        parser.add_argument("--format", choices=["csv", "json"], default=None,
+                            help="Input format (default: detected from content).")
+        parser.add_argument("--default-role", default="guest")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Hashing processes (default: number of CPUs).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--iterations", type=iterations_arg, default=None,
+                            help=f"PBKDF2 iterations (at least the hasher default, {min_iterations()}).")
+        parser.add_argument("--dry-run", action="store_true", help="Validate and dedupe only.")
+
+    def handle(self, *args, **opts):
+        try:
+            if opts["path"] == "-":
+                content = sys.stdin.read()
+            else:
+                with open(opts["path"], encoding="utf-8-sig") as fh:
+                    content = fh.read()
+            rows = parse_rows(content, opts["format"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        report = provision_users(
+            rows,
+            default_role=opts["default_role"],
+            workers=opts["workers"],
+            batch_size=opts["batch_size"],
+            dry_run=opts["dry_run"],
+            iterations=opts["iterations"],
+        )
+        for failure in report["failed"]:
+            self.stderr.write(f"  row {failure['row']} ({failure['email']}): {failure['error']}")
+        self.stdout.write(json.dumps({k: v for k, v in report.items() if k != "failed"}))
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['created']} created, {len(report['failed'])} failed in {report['duration_s']}s"
+        ))
@@ -1,9 +1,9 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 class CustomUserManager(BaseUserManager):
-    def create_user(self, email, full_name, password=None, **extra_fields):
+    def _build_user(self, email, full_name, password=None, **extra_fields):
         if not email:
             raise ValueError("Email is required")
         if not full_name:
@@ -18,11 +18,23 @@ class CustomUserManager(BaseUserManager):
             # If you really want to allow SSO-only users, you could do:
             # user.set_unusable_password()
             # return user
+        return user
 
+    def create_user(self, email, full_name, password=None, **extra_fields):
+        user = self._build_user(email, full_name, password, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
         return user
 
+    async def acreate_user(self, email, full_name, password=None, **extra_fields):
+        """Variante async : le hash tourne dans le pool borné (users/hashing.py)."""
+        from .hashing import amake_password
+
+        user = self._build_user(email, full_name, password, **extra_fields)
+        user.password = await amake_password(password)
+        await user.asave(using=self._db)
+        return user
+
     def create_superuser(self, email, full_name, password=None, **extra_fields):
         extra_fields.setdefault("is_staff", True)
         extra_fields.setdefault("is_superuser", True)
@@ -59,6 +71,11 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        # Ligne + compteurs statistiques (stats/signals.py) dans la même transaction
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
     # Optional helpers
     def get_full_name(self):
         return self.full_name
@@ -0,0 +1,229 @@
+# users/provisioning.py
+"""
+Création d'utilisateurs en masse (labos entiers) depuis du CSV ou du JSON.
+
+1. Validation ligne par ligne + dédoublonnage dans le fichier.
+2. Une seule requête `email IN (...)` contre l'index unique pour écarter
+   les emails déjà pris.
+3. Hash des mots de passe en parallèle (PBKDF2 coûte ~0,4 s CPU par mot de
+   passe) : pool de processus pour la commande `provision_users` ; pool de
+   hash borné de users/hashing.py pour l'endpoint HTTP (`hash_fn`), qui
+   plafonne aussi le nombre de lignes (USER_BULK_MAX_ROWS).
+4. `bulk_create` par lots ; les compteurs stats sont mis à jour dans la même
+   transaction, en un seul apply() par lot (bulk_create ne déclenche pas les
+   signaux). Sous USER_BULK_MAX_ROWS lignes, une requête HTTP = un lot.
+
+Chaque ligne rejetée est rapportée avec son numéro et la raison.
+"""
+import csv
+import io
+import json
+import os
+import time
+from collections import Counter as Delta
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from stats import counters
+
+User = get_user_model()
+
+HASH_CHUNK = 64  # mots de passe par tâche envoyée au pool
+
+
+def parse_rows(content, fmt=None):
+    """
+    Lit une liste d'utilisateurs : CSV avec en-tête (email, full_name,
+    password[, role]) ou JSON (liste d'objets ou {"users": [...]}).
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    if fmt is None:
+        fmt = "json" if content.lstrip()[:1] in ("[", "{") else "csv"
+    if fmt == "json":
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = data.get("users", [])
+        if not isinstance(data, list):
+            raise ValueError("JSON payload must be a list of users")
+        return data
+    return list(csv.DictReader(io.StringIO(content)))
+
+
+def _init_worker():
+    # Processus "spawn" (macOS/Windows) : Django n'est pas encore chargé.
+    import django
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chem_backend.settings")
+    django.setup()
+
+
+def min_iterations():
+    """Nombre d'itérations PBKDF2 du hasher par défaut : plancher de `iterations`."""
+    return PBKDF2PasswordHasher.iterations
+
+
+def _hash_chunk(passwords, iterations=None):
+    if iterations is None:
+        return [make_password(p) for p in passwords]
+    hasher = PBKDF2PasswordHasher()
+    return [hasher.encode(p, hasher.salt(), iterations) for p in passwords]
+
+
+def hash_passwords(passwords, workers=None, iterations=None):
+    """
+    Hash une liste de mots de passe en parallèle (ordre conservé).
+
+    `iterations` (optionnel) : coût PBKDF2 explicite, jamais inférieur à
+    celui du hasher par défaut (ValueError sinon).
+    """
+    if iterations is not None and iterations < min_iterations():
+        raise ValueError(f"iterations must be at least {min_iterations()}")
+    if not passwords:
+        return []
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) <= HASH_CHUNK:
+        return _hash_chunk(passwords, iterations)
+    chunks = [passwords[i:i + HASH_CHUNK] for i in range(0, len(passwords), HASH_CHUNK)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        hashed = pool.map(_hash_chunk, chunks, [iterations] * len(chunks))
+        return [h for chunk in hashed for h in chunk]
+
+
+def _text_fields(row):
+    """
+    Champs texte d'une ligne : (valeurs, nom du premier champ invalide).
+    Absent ou null = chaîne vide ; tout autre type que str est refusé (le
+    JSON peut contenir des nombres ou des listes, le CSV jamais).
+    """
+    values = {}
+    for field in ("email", "full_name", "password", "role"):
+        value = row.get(field)
+        if value is None:
+            value = ""
+        if not isinstance(value, str):
+            return values, field
+        values[field] = value
+    return values, None
+
+
+def validate_rows(rows, default_role="guest"):
+    """
+    Retourne (valides, échecs). `valides` : [(n° de ligne, dict nettoyé)].
+    Les numéros de ligne commencent à 1 (première ligne de données).
+    """
+    roles = {r for r, _ in User.ROLE_CHOICES}
+    valid, failures, seen = [], [], set()
+    for i, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            failures.append({"row": i, "email": None, "error": "Invalid row"})
+            continue
+        values, bad_field = _text_fields(row)
+        if bad_field:
+            email = values.get("email", "").strip() or None
+            failures.append({"row": i, "email": email, "error": f"{bad_field} must be a string"})
+            continue
+        email = User.objects.normalize_email(values["email"].strip()).lower()
+        full_name = values["full_name"].strip()
+        password = values["password"]
+        role = values["role"].strip() or default_role
+
+        error = None
+        if not email or not full_name or not password:
+            error = "email, full_name and password are required"
+        elif role not in roles:
+            error = f"Invalid role '{role}'"
+        else:
+            try:
+                validate_email(email)
+            except ValidationError:
+                error = "Invalid email"
+        if error is None and email in seen:
+            error = "Duplicate email in file"
+        if error:
+            failures.append({"row": i, "email": email or None, "error": error})
+            continue
+        seen.add(email)
+        valid.append((i, {"email": email, "full_name": full_name, "password": password, "role": role}))
+    return valid, failures
+
+
+def provision_users(rows, default_role="guest", workers=None, batch_size=1000, dry_run=False,
+                    iterations=None, hash_fn=None):
+    """
+    Crée les utilisateurs de `rows`. Retourne un rapport :
+    {"received", "created", "failed": [{"row", "email", "error"}], "duration_s"}.
+    `hash_fn(mots de passe) → hashes` remplace le pool de processus (workers, iterations).
+    """
+    start = time.perf_counter()
+    valid, failures = validate_rows(rows, default_role)
+
+    # Emails déjà en base : une requête sur l'index unique
+    emails = [data["email"] for _, data in valid]
+    taken = set(User.objects.filter(email__in=emails).values_list("email", flat=True)) if emails else set()
+    todo = []
+    for i, data in valid:
+        if data["email"] in taken:
+            failures.append({"row": i, "email": data["email"], "error": "Email already exists"})
+        else:
+            todo.append((i, data))
+
+    created = 0
+    if todo and not dry_run:
+        passwords = [data["password"] for _, data in todo]
+        hashes = hash_fn(passwords) if hash_fn else hash_passwords(passwords, workers, iterations)
+        for lo in range(0, len(todo), batch_size):
+            batch = list(zip(todo[lo:lo + batch_size], hashes[lo:lo + batch_size]))
+            created += _insert_batch(batch, failures)
+    elif dry_run:
+        created = len(todo)
+
+    failures.sort(key=lambda f: f["row"])
+    return {
+        "received": len(rows),
+        "created": created,
+        "failed": failures,
+        "dry_run": dry_run,
+        "duration_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def _insert_batch(batch, failures):
+    """
+    Insère un lot. En cas de conflit (inscription concurrente entre la
+    vérification et l'insertion), les emails fautifs sont retirés et le lot
+    est rejoué.
+    """
+    while batch:
+        users = [
+            User(
+                email=data["email"],
+                full_name=data["full_name"],
+                password=hashed,
+                role=data["role"],
+                is_staff=data["role"] == "admin",
+            )
+            for (_, data), hashed in batch
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                delta = Delta()
+                for u in users:
+                    delta.update(counters.transition(counters.user_keys, None, counters.user_state(u)))
+                counters.apply(delta)
+            return len(users)
+        except IntegrityError:
+            emails = [data["email"] for (_, data), _ in batch]
+            taken = set(User.objects.filter(email__in=emails).values_list("email", flat=True))
+            if not taken:
+                raise
+            for (i, data), _ in batch:
+                if data["email"] in taken:
+                    failures.append({"row": i, "email": data["email"], "error": "Email already exists"})
+            batch = [item for item in batch if item[0][1]["email"] not in taken]
+    return 0
@@ -0,0 +1,18 @@
+# users/signals.py
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_user_cache
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Invalidation immédiate + après commit (un lecteur concurrent aurait pu
+    # remettre en cache l'ancienne version avant la fin de la transaction).
+    invalidate_user_cache(instance.pk)
+    transaction.on_commit(lambda: invalidate_user_cache(instance.pk))
@@ -1,3 +1,228 @@
-from django.test import TestCase
+import json
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from chem_backend.querybudget import assert_query_budget
+from chem_backend.throttle import buckets
+from users import hashing
+from users.backends import user_cache_key
+from users.provisioning import hash_passwords
+
+User = get_user_model()
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin@example.com", "Admin", "admin-password")
+        cls.user = User.objects.create_user("user@example.com", "User", "user-password")
+
+    def test_me(self):
+        self.client.force_login(self.user)
+        response = self.client.get("/api/auth/me/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["email"], "user@example.com")
+        assert_query_budget(response)
+
+    def test_admin_stats(self):
+        self.client.force_login(self.admin)
+        response = self.client.get("/api/admin/stats/")
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+
+    def test_admin_stats_for_owner(self):
+        self.client.force_login(self.admin)
+        response = self.client.get("/api/admin/stats/", {"owner": self.user.pk})
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+
+    def test_admin_toggles(self):
+        self.client.force_login(self.admin)
+        for url, body in (("set_active", {"is_active": False}), ("set_active", {"is_active": True}),
+                          ("set_admin", {"is_admin": True}), ("set_admin", {"is_admin": False})):
+            response = self.client.post(f"/api/admin/users/{self.user.pk}/{url}/", body,
+                                        content_type="application/json")
+            self.assertEqual(response.status_code, 200, (url, body))
+            assert_query_budget(response)
+
+
+# ---------- Utilisateur en cache (users/backends.py, users/signals.py) ----------
+
+@override_settings(AUTH_CACHE_ENABLED=True)
+class CachedUserTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("user@example.com", "User", "user-password")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.key = user_cache_key(self.user.pk)
+
+    def me(self):
+        return self.client.get("/api/auth/me/")
+
+    def test_snapshot_is_reused(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.assertEqual(cache.get(self.key).email, "user@example.com")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.me().status_code, 200)
+        self.assertFalse([q for q in queries if User._meta.db_table in q["sql"]])
+
+    def test_deactivation_invalidates_snapshot(self):
+        self.me()
+        stale = cache.get(self.key)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.is_active = False
+            self.user.save()
+            self.assertIsNone(cache.get(self.key))
+            # Lecteur concurrent remettant l'ancienne version en cache avant le COMMIT
+            cache.set(self.key, stale)
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_password_change_invalidates_snapshot(self):
+        self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("new-password")
+            self.user.save()
+        # Hash de session calculé avec l'ancien mot de passe : session invalide
+        self.assertEqual(self.me().status_code, 401)
+        self.client.force_login(self.user)
+        self.assertEqual(self.me().status_code, 200)
+
+    def test_deletion_invalidates_snapshot(self):
+        self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(self.me().status_code, 401)
+
+
+# ---------- Limitation des tentatives de hash (users/hashing.py) ----------
+
+@override_settings(THROTTLE_BACKEND="cache", PASSWORD_THROTTLE_RATES={"email": (0.001, 2)})
+class HashingThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        buckets.clear()
+
+    def login(self, password="wrong-password"):
+        return self.client.post("/api/auth/login/", {"email": "nobody@example.com", "password": password},
+                                content_type="application/json")
+
+    def test_email_budget_is_shared_between_workers(self):
+        for _ in range(2):
+            self.assertEqual(self.login().status_code, 401)
+            buckets.clear()  # autre worker : aucun état local
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+
+# ---------- Provisionnement en masse (users/provisioning.py) ----------
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], USER_BULK_MAX_ROWS=5)
+class BulkProvisioningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin@example.com", "Admin", "admin-password")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def post_json(self, payload):
+        return self.client.post("/api/admin/users/bulk/", payload, content_type="application/json")
+
+    def test_json_rows_with_wrong_types_fail_per_row(self):
+        response = self.post_json({"users": [
+            {"email": "ok@example.com", "full_name": "Ok", "password": "secret-1"},
+            {"email": 5, "full_name": "Number", "password": "secret-2"},
+            {"email": "list@example.com", "full_name": ["A"], "password": "secret-3"},
+            {"email": "role@example.com", "full_name": "Role", "password": "secret-4", "role": 1},
+            {"email": "pw@example.com", "full_name": "Password", "password": 1234},
+        ]})
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(
+            [(f["row"], f["error"]) for f in report["failed"]],
+            [(2, "email must be a string"), (3, "full_name must be a string"),
+             (4, "role must be a string"), (5, "password must be a string")],
+        )
+        self.assertTrue(User.objects.get(email="ok@example.com").check_password("secret-1"))
+
+    def test_csv_rows(self):
+        body = ("email,full_name,password,role\n"
+                "a@example.com,A,secret-a,connected\n"
+                "b@example.com,,secret-b,\n"
+                "A@example.com,A again,secret-c,\n"
+                "c@example.com,C,secret-d,wizard\n")
+        response = self.client.post("/api/admin/users/bulk/", body, content_type="text/csv")
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual(report["created"], 1)
+        self.assertEqual([f["row"] for f in report["failed"]], [2, 3, 4])
+        self.assertEqual(User.objects.get(email="a@example.com").role, "connected")
+
+    def test_iterations_are_not_an_http_option(self):
+        response = self.post_json({"users": [{"email": "x@example.com", "full_name": "X", "password": "secret-x"}],
+                                   "iterations": 1})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(email="x@example.com").password.startswith("md5$"))
+
+    def test_large_imports_are_refused(self):
+        users = [{"email": f"u{i}@example.com", "full_name": "U", "password": "secret"} for i in range(6)]
+        self.assertEqual(self.post_json({"users": users}).status_code, 413)
+        self.assertFalse(User.objects.filter(email="u0@example.com").exists())
+
+    def test_passwords_hashed_in_bounded_pool_one_counter_write(self):
+        users = [{"email": f"p{i}@example.com", "full_name": "P", "password": f"secret-{i}"} for i in range(3)]
+        with mock.patch("users.admin_views.make_passwords", wraps=hashing.make_passwords) as pool, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.post_json({"users": users})
+        self.assertEqual(response.status_code, 201)
+        pool.assert_called_once_with(["secret-0", "secret-1", "secret-2"])
+        self.assertEqual(len([q for q in queries if "stats_counter" in q["sql"]]), 1)
+        self.assertTrue(User.objects.get(email="p2@example.com").check_password("secret-2"))
+
+    def test_saturated_pool_returns_503(self):
+        executor, _ = hashing._get_pool()
+        users = [{"email": f"q{i}@example.com", "full_name": "Q", "password": "secret"} for i in range(2)]
+        with mock.patch.object(hashing, "_get_pool", return_value=(executor, threading.BoundedSemaphore(1))):
+            response = self.post_json({"users": users})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertFalse(User.objects.filter(email__startswith="q").exists())
+
+    def test_non_admin_is_forbidden(self):
+        user = User.objects.create_user("user@example.com", "User", "user-password")
+        self.client.force_login(user)
+        self.assertEqual(self.post_json({"users": []}).status_code, 403)
+
+    def test_command_rejects_iterations_below_default(self):
+        with self.assertRaises(CommandError):
+            call_command("provision_users", "-", "--iterations", "1")
+        with self.assertRaises(ValueError):
+            hash_passwords(["secret"], iterations=1)
+
+    def test_command_reports_failures(self):
+        payload = json.dumps([{"email": "cmd@example.com", "full_name": "Cmd", "password": "secret"},
+                              {"email": "cmd@example.com", "full_name": "Dup", "password": "secret"},
+                              {"email": None, "full_name": {}, "password": "secret"}])
+        out, err = StringIO(), StringIO()
+        with mock.patch("sys.stdin", StringIO(payload)):
+            call_command("provision_users", "-", "--workers", "1", stdout=out, stderr=err)
+        self.assertTrue(User.objects.filter(email="cmd@example.com").exists())
+        self.assertIn("row 2", err.getvalue())
+        self.assertIn("row 3 (None): full_name must be a string", err.getvalue())
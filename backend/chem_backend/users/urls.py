@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import register_view, login_view, logout_view, me_view
+from .views import register_view, login_view, logout_view, me_view, update_profile, change_password
 
 urlpatterns = [
     path("register/", register_view, name="register"),
     path("login/", login_view, name="login"),
     path("logout/", logout_view, name="logout"),
     path("me/", me_view, name="me"),
+    path("update-profile/", update_profile, name="update_profile"),
+    path("change-password/", change_password, name="change_password"),
 ]
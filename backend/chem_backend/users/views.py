@@ -1,13 +1,15 @@
 import json
 from django.http import JsonResponse, HttpResponseBadRequest
-from django.contrib.auth import get_user_model, authenticate, login, logout
-from django.contrib.auth import update_session_auth_hash
+from django.contrib.auth import get_user_model, aauthenticate, alogin, logout
+from django.contrib.auth import HASH_SESSION_KEY
 from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect
 from django.contrib.auth.decorators import login_required
 from django.middleware.csrf import get_token, rotate_token
 from django.conf import settings
 
+from .hashing import HasherBusy, acheck_password, amake_password, athrottle_hashing, hasher_busy
+
 User = get_user_model()
 
 # ---- CSRF bootstrap: sets csrftoken cookie if missing
@@ -18,9 +20,11 @@ def csrf_token_view(request):
     return JsonResponse({"csrfToken": get_token(request)})
 
 # ---- Register (POST, CSRF-protected)
+# Vues async : le hash PBKDF2 tourne dans le pool borné de users/hashing.py,
+# derrière un throttle par IP / email (portée réelle sous WSGI : voir hashing.py).
 @require_POST
 @csrf_protect
-def register_view(request):
+async def register_view(request):
     try:
         data = json.loads(request.body.decode("utf-8"))
     except Exception:
@@ -33,11 +37,17 @@ def register_view(request):
     if not full_name or not email or not password:
         return JsonResponse({"error": "All fields are required"}, status=400)
 
-    if User.objects.filter(email=email).exists():
+    throttled = await athrottle_hashing(request)
+    if throttled:
+        return throttled
+
+    if await User.objects.filter(email=email).aexists():
         return JsonResponse({"error": "Email already exists"}, status=400)
 
     try:
-        User.objects.create_user(email=email, full_name=full_name, password=password)
+        await User.objects.acreate_user(email=email, full_name=full_name, password=password)
+    except HasherBusy:
+        return hasher_busy()
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
@@ -46,7 +56,7 @@ def register_view(request):
 # ---- Login (POST, CSRF-protected)
 @require_POST
 @csrf_protect
-def login_view(request):
+async def login_view(request):
     try:
         data = json.loads(request.body.decode("utf-8"))
     except Exception:
@@ -55,16 +65,23 @@ def login_view(request):
     email = (data.get("email") or "").strip().lower()
     password = data.get("password") or ""
 
-    user = authenticate(request, email=email, password=password)
+    throttled = await athrottle_hashing(request, email)
+    if throttled:
+        return throttled
+
+    try:
+        user = await aauthenticate(request, email=email, password=password)
+    except HasherBusy:
+        return hasher_busy()
     if user is None:
         return JsonResponse({"error": "Invalid credentials"}, status=401)
 
     # Upgrade 'guest' -> 'connected' au premier login si besoin
     if getattr(user, "role", None) == "guest":
         user.role = "connected"
-        user.save(update_fields=["role"])
+        await user.asave(update_fields=["role"])
 
-    login(request, user)  # crée la session + cookie 'sessionid'
+    await alogin(request, user)  # crée la session + cookie 'sessionid'
 
     return JsonResponse({
         "message": "Login successful",
@@ -159,7 +176,7 @@ def update_profile(request):
 @require_POST
 @csrf_protect
 @login_required
-def change_password(request):
+async def change_password(request):
     """
     Change le mot de passe de l'utilisateur connecté.
     Body JSON: { "current_password": "...", "new_password": "..." }
@@ -175,13 +192,22 @@ def change_password(request):
     if len(new_password) < 6:
         return JsonResponse({"error": "New password must be at least 6 characters"}, status=400)
 
-    u = request.user
-    if not u.check_password(current_password):
-        return JsonResponse({"error": "Current password is incorrect"}, status=400)
+    u = await request.auser()
+    throttled = await athrottle_hashing(request, u.email)
+    if throttled:
+        return throttled
 
-    u.set_password(new_password)
-    u.save(update_fields=["password"])
-    # Rester connecté après changement de mot de passe
-    update_session_auth_hash(request, u)
+    try:
+        if not await acheck_password(u, current_password):
+            return JsonResponse({"error": "Current password is incorrect"}, status=400)
+        u.password = await amake_password(new_password)
+    except HasherBusy:
+        return hasher_busy()
+
+    await u.asave(update_fields=["password"])
+    # Rester connecté après changement de mot de passe (équivalent de
+    # update_session_auth_hash, sans repasser par le request.user synchrone)
+    await request.session.acycle_key()
+    await request.session.aset(HASH_SESSION_KEY, u.get_session_auth_hash())
 
     return JsonResponse({"message": "Password updated"})
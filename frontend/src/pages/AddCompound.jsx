@@ -2,6 +2,7 @@
 import React, { useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { authFetch } from "../services/auth";
+import { CHUNKED_UPLOAD_THRESHOLD, uploadStructureFile } from "../services/compounds";
 
 export default function AddCompound() {
   const navigate = useNavigate();
@@ -63,7 +64,9 @@ export default function AddCompound() {
     if (form.molecular_weight !== "") fd.append("molecular_weight", String(Number(form.molecular_weight)));
     if (form.description.trim()) fd.append("description", form.description.trim());
     fd.append("is_public", String(form.is_public));
-    if (structureFile) fd.append("structure_file", structureFile);
+    // Gros fichier : envoyé par morceaux après la création (reprise possible)
+    const chunked = structureFile && structureFile.size > CHUNKED_UPLOAD_THRESHOLD;
+    if (structureFile && !chunked) fd.append("structure_file", structureFile);
 
     setLoading(true);
     try {
@@ -77,6 +80,16 @@ export default function AddCompound() {
         const j = await res.json().catch(() => ({}));
         throw new Error(j?.detail || j?.message || "Failed to create compound.");
       }
+      if (chunked) {
+        const { compound } = await res.json();
+        try {
+          await uploadStructureFile(compound.id, structureFile, {
+            onProgress: (p) => setNotice(`Uploading structure file… ${Math.round(p * 100)}%`),
+          });
+        } catch (e2) {
+          throw new Error(`Compound created, but the structure file upload failed: ${e2.message}`);
+        }
+      }
 
       setNotice("✅ Compound created successfully.");
       navigate("/advanced-search", { replace: true, state: { flash: "Compound created." } });
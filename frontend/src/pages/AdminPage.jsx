@@ -4,7 +4,7 @@ import {useNavigate } from "react-router-dom";
 import { getAuthState } from "../services/auth";
 import {
   adminFetchUsers, adminSetAdmin, adminSetActive,
-  adminFetchCompounds, adminDeleteCompound, adminUpdateCompound
+  adminFetchCompounds, adminDeleteCompound, adminUpdateCompound, adminPatchCompound
 } from "../services/admin";
 
 export default function AdminPage() {
@@ -140,6 +140,7 @@ export default function AdminPage() {
       molecular_weight: c.molecular_weight ?? "",
       description: c.description || "",
       is_public: !!c.is_public,
+      original: c,
     });
     setEditFile(null);
     setRemoveFile(false);
@@ -152,6 +153,34 @@ export default function AdminPage() {
     if (!editComp) return;
     setSaving(true); setErr(""); setNotice("");
     try {
+      if (!editFile && !removeFile) {
+        // Champs seulement : PATCH des champs modifiés, refusé (409) si la fiche a changé entre-temps
+        const { original } = editComp;
+        const next = {
+          name: editComp.name.trim(),
+          formula: editComp.formula.trim(),
+          smiles: editComp.smiles.trim(),
+          molecular_weight: editComp.molecular_weight === "" ? null : Number(editComp.molecular_weight),
+          description: editComp.description.trim(),
+          is_public: !!editComp.is_public,
+        };
+        const changes = Object.fromEntries(
+          Object.entries(next).filter(([k, v]) => v !== (original[k] ?? (k === "description" ? "" : null)))
+        );
+        if (Object.keys(changes).length) {
+          try {
+            await adminPatchCompound(editComp.id, changes, original.version);
+          } catch (e3) {
+            if (e3.status !== 409) throw e3;
+            if (e3.current) startEdit(e3.current);
+            throw new Error("This compound was modified by someone else. The form now shows the latest version.");
+          }
+        }
+        setNotice(Object.keys(changes).length ? "Compound updated." : "No changes.");
+        setEditOpen(false);
+        await loadComps(cq);
+        return;
+      }
       const fd = new FormData();
       fd.append("name", editComp.name.trim());
       fd.append("formula", editComp.formula.trim());
@@ -3,6 +3,7 @@
 import React, { useEffect, useRef, useState } from "react";
 import { Link, useNavigate, useParams } from "react-router-dom";
 import { authFetch, whoAmI } from "../services/auth";
+import { depictionUrl } from "../services/compounds";
 
 // Charge 3Dmol une seule fois
 function ensure3Dmol() {
@@ -425,6 +426,17 @@ export default function CompoundDetail() {
                       {compound.description || "—"}
                     </dd>
                   </div>
+                  {Object.entries(compound.properties || {}).map(([key, p]) => (
+                    <div key={key}>
+                      <dt className="text-gray-500 dark:text-gray-400">{key}</dt>
+                      <dd className="text-gray-900 dark:text-gray-100" title={p.source || undefined}>
+                        {p.value} {p.unit}
+                        {p.raw_unit !== p.unit && (
+                          <span className="text-gray-500 dark:text-gray-400"> ({p.raw_value} {p.raw_unit})</span>
+                        )}
+                      </dd>
+                    </div>
+                  ))}
                 </dl>
 
                 {compound.structure_file_url && (
@@ -438,11 +450,30 @@ export default function CompoundDetail() {
                     </a>
                   </div>
                 )}
+
+                {/* Voisins structuraux précalculés (Tanimoto) */}
+                {compound.related?.length > 0 && (
+                  <div className="mt-6">
+                    <h2 className="text-sm font-medium text-gray-700 dark:text-gray-200 mb-2">Related compounds</h2>
+                    <ul className="space-y-1 text-sm">
+                      {compound.related.map((r) => (
+                        <li key={r.id} className="flex items-center justify-between gap-2">
+                          <Link to={`/compounds/${r.id}`} className="text-blue-600 dark:text-blue-400 hover:underline truncate">
+                            {r.name}
+                          </Link>
+                          <span className="text-xs text-gray-500 dark:text-gray-400">{Math.round(r.similarity * 100)}%</span>
+                        </li>
+                      ))}
+                    </ul>
+                  </div>
+                )}
               </div>
 
               {/* Viewer 3D */}
               <div className="lg:col-span-2 rounded-2xl ring-1 ring-gray-200 dark:ring-neutral-800 p-4 bg-gray-50 dark:bg-neutral-900">
-                <h2 className="text-sm font-medium text-gray-700 dark:text-gray-200 mb-3">3D Structure</h2>
+                <h2 className="text-sm font-medium text-gray-700 dark:text-gray-200 mb-3">
+                  {compound.structure_file_url ? "3D Structure" : "2D Structure"}
+                </h2>
                 {compound.structure_file_url ? (
                   <div>
                     <div
@@ -457,7 +488,12 @@ export default function CompoundDetail() {
                     )}
                   </div>
                 ) : (
-                  <p className="text-sm text-gray-600 dark:text-gray-300">No 3D structure provided.</p>
+                  // Dépiction 2D rendue côté serveur depuis le SMILES (?v= : nouvelle URL après modification)
+                  <img
+                    src={depictionUrl(compound.id, { size: 420, version: compound.updated_at })}
+                    alt={`2D structure of ${compound.name}`}
+                    className="mx-auto w-full max-w-[420px] h-auto rounded-lg border border-gray-200 dark:border-neutral-800 bg-white"
+                  />
                 )}
               </div>
             </div>
@@ -1,5 +1,6 @@
 import React, { useEffect, useMemo, useState } from "react";
 import { authFetch } from "../services/auth";
+import { fetchDepictions } from "../services/compounds";
 import { Link } from "react-router-dom";
 
 
@@ -9,6 +10,7 @@ export default function CompoundsPage() {
   const [sort, setSort] = useState("name_asc");
   const [loading, setLoading] = useState(true);
   const [err, setErr] = useState("");
+  const [thumbs, setThumbs] = useState({});
 
   useEffect(() => {
     let mounted = true;
@@ -34,6 +36,16 @@ export default function CompoundsPage() {
     return () => { mounted = false; };
   }, []);
 
+  // Vignettes 2D de toute la page en une requête (rendu + cache côté serveur)
+  useEffect(() => {
+    let mounted = true;
+    const ids = items.map((c) => c.id).filter(Boolean).slice(0, 100);
+    fetchDepictions(ids)
+      .then((svgs) => { if (mounted) setThumbs(svgs); })
+      .catch(() => {}); // vignettes facultatives
+    return () => { mounted = false; };
+  }, [items]);
+
   const filtered = useMemo(() => {
     const text = q.trim().toLowerCase();
     let arr = items.filter((c) => {
@@ -113,6 +125,7 @@ export default function CompoundsPage() {
             <table className="min-w-full text-sm">
               <thead className="bg-gray-50 dark:bg-neutral-900 text-gray-700 dark:text-gray-200">
                 <tr>
+                  <th className="text-left px-4 py-3">Structure</th>
                   <th className="text-left px-4 py-3">Name</th>
                   <th className="text-left px-4 py-3">Molecular Formula</th>
                   <th className="text-left px-4 py-3">SMILES</th>
@@ -123,6 +136,19 @@ export default function CompoundsPage() {
               <tbody className="divide-y divide-gray-200 dark:divide-neutral-800">
                 {filtered.map((c) => (
                   <tr key={c.id ?? `${c.name}-${c.formula}`}>
+                    <td className="px-4 py-2">
+                      {thumbs[c.id] ? (
+                        <img
+                          src={`data:image/svg+xml;charset=utf-8,${encodeURIComponent(thumbs[c.id])}`}
+                          alt={`2D structure of ${c.name}`}
+                          width={60}
+                          height={60}
+                          className="rounded bg-white"
+                        />
+                      ) : (
+                        <div className="w-[60px] h-[60px] rounded bg-gray-100 dark:bg-neutral-800" />
+                      )}
+                    </td>
                     <td className="px-4 py-3 text-gray-900 dark:text-gray-100 font-medium">{c.name}</td>
                     <td className="px-4 py-3 text-gray-700 dark:text-gray-200">{c.formula}</td>
                     <td className="px-4 py-3 text-gray-700 dark:text-gray-200 truncate max-w-[320px]">{c.smiles}</td>
@@ -80,3 +80,20 @@ export async function adminUpdateCompound(id, payload) {
   if (!res.ok) throw new Error(data?.error || "Failed to update compound");
   return data;
 }
+
+// PATCH partiel (JSON, sans fichier) : If-Match = compound.version, 409 si modifié entre-temps
+export async function adminPatchCompound(id, changes, version) {
+  const res = await authFetch(`/api/admin/compounds/${id}/update/`, {
+    method: "PATCH",
+    headers: { "Content-Type": "application/json", "If-Match": `"${version}"` },
+    body: JSON.stringify(changes),
+  });
+  const data = await res.json().catch(() => ({}));
+  if (!res.ok) {
+    const err = new Error(data?.error || "Failed to update compound");
+    err.status = res.status;
+    err.current = data?.compound;
+    throw err;
+  }
+  return data;
+}
@@ -42,6 +42,21 @@ export async function authFetch(url, options = {}) {
   return fetch(`${url}`, { ...opts, headers });
 }
 
+/* ========== Requêtes GET groupées (/api/batch/) ========== */
+// urls: ["/api/csrf/", "/api/auth/me/", …] → [{ id, status, headers?, body }] dans le même ordre.
+// Un seul aller-retour ; le serveur exécute les GET en parallèle.
+export async function batchGet(urls) {
+  const res = await fetch(`/api/batch/`, {
+    method: "POST",
+    credentials: "include",
+    headers: { "Content-Type": "application/json", Accept: "application/json" },
+    body: JSON.stringify({ requests: urls.map((url, i) => ({ id: String(i), url })) }),
+  });
+  if (!res.ok) throw new Error("Batch request failed");
+  const data = await res.json();
+  return data.responses || [];
+}
+
 /* ========== Auth API ========== */
 async function apiLogin({ email, password }) {
   const res = await authFetch(`/api/auth/login/`, {
@@ -72,12 +87,22 @@ async function apiLogout() {
 /* ========== whoAmI robuste (JSON only) ========== */
 export async function whoAmI() {
   try {
-    const res = await authFetch(`/api/auth/me/`, { method: "GET" });
-    const ct = res.headers.get("content-type") || "";
-    if (!res.ok || !ct.includes("application/json")) {
-      return { authenticated: false, user: null, is_staff: false };
+    let data;
+    if (!getCookie("csrftoken")) {
+      // Premier chargement : cookie CSRF + session en un seul aller-retour
+      const [, me] = await batchGet(["/api/csrf/", "/api/auth/me/"]);
+      if (!me || me.status !== 200 || !me.body) {
+        return { authenticated: false, user: null, is_staff: false };
+      }
+      data = me.body;
+    } else {
+      const res = await authFetch(`/api/auth/me/`, { method: "GET" });
+      const ct = res.headers.get("content-type") || "";
+      if (!res.ok || !ct.includes("application/json")) {
+        return { authenticated: false, user: null, is_staff: false };
+      }
+      data = await res.json();
     }
-    const data = await res.json();
 
     const rootLooksLikeUser =
       data && (data.id || data.email || data.username || data.full_name);
@@ -1,28 +1,93 @@
 // src/services/compounds.js
 import { ensureCsrf } from "./auth";
 
+// 422 { code: "query_too_expensive" | "query_timeout" } → message "refine the search"
+async function listError(res, fallback) {
+  const data = await res.json().catch(() => ({}));
+  const err = new Error(data?.error || fallback);
+  err.status = res.status;
+  err.code = data?.code;
+  return err;
+}
+
 // PUBLIC list (no auth)
-export async function fetchPublicCompounds({ q = "", limit = 20, offset = 0 } = {}) {
+export async function fetchPublicCompounds({ q = "", props = "", limit = 20, offset = 0 } = {}) {
   const params = new URLSearchParams();
   if (q) params.set("q", q);
+  if (props) params.set("props", props); // e.g. "mp between 100 and 150 °C AND logp < 3"
   params.set("limit", String(limit));
   params.set("offset", String(offset));
   const res = await fetch(`/api/compounds/public/?${params.toString()}`, { credentials: "include" });
-  if (!res.ok) throw new Error("Failed to load compounds");
+  if (!res.ok) throw await listError(res, "Failed to load compounds");
   return res.json();
 }
 
 // PRIVATE list (auth required)
-export async function fetchPrivateCompounds({ q = "", limit = 20, offset = 0 } = {}) {
+export async function fetchPrivateCompounds({ q = "", props = "", limit = 20, offset = 0 } = {}) {
   const params = new URLSearchParams();
   if (q) params.set("q", q);
+  if (props) params.set("props", props); // e.g. "mp between 100 and 150 °C AND logp < 3"
   params.set("limit", String(limit));
   params.set("offset", String(offset));
   const res = await fetch(`/api/compounds/private/?${params.toString()}`, { credentials: "include" });
-  if (!res.ok) throw new Error("Failed to load private compounds");
+  if (!res.ok) throw await listError(res, "Failed to load private compounds");
+  return res.json();
+}
+
+// MULTI-GET: resolve many ids / names / formulas / SMILES in one request
+// → results in input order: { key, found, compound } (by "id") or { key, found, compounds, truncated }
+export async function lookupCompounds(keys, { by = "id" } = {}) {
+  if (!keys.length) return [];
+  const res = await fetch(`/api/compounds/lookup/`, {
+    method: "POST",
+    credentials: "include",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ by, keys }),
+  });
+  if (!res.ok) throw new Error("Failed to look up compounds");
+  const data = await res.json();
+  return data.results || [];
+}
+
+// PROPERTIES: definitions usable in `props` filters (key, name, canonical unit)
+export async function fetchPropertyDefinitions() {
+  const res = await fetch(`/api/compounds/properties/`, { credentials: "include" });
+  if (!res.ok) throw new Error("Failed to load properties");
   return res.json();
 }
 
+// BULK property write (auth + CSRF): rows = [{ compound_id, property, value, unit?, source? }],
+// value null → delete. → { written, deleted, errors: { rowIndex: message } }
+export async function upsertProperties(rows) {
+  const csrftoken = await ensureCsrf();
+  const res = await fetch(`/api/compounds/properties/bulk/`, {
+    method: "POST",
+    credentials: "include",
+    headers: { "Content-Type": "application/json", "X-CSRFToken": csrftoken || "" },
+    body: JSON.stringify({ rows }),
+  });
+  const data = await res.json().catch(() => ({}));
+  if (!res.ok && !data?.errors) throw new Error(data?.error || "Failed to save properties");
+  return data;
+}
+
+// 2D depiction (SVG rendered server-side from the SMILES)
+export function depictionUrl(id, { size = 300, version = "" } = {}) {
+  const params = new URLSearchParams({ size: String(size) });
+  if (version) params.set("v", version); // cache-busting after an edit
+  return `/api/compounds/${id}/depiction.svg?${params.toString()}`;
+}
+
+// 2D thumbnails for a whole list page in one request → { [id]: "<svg…>" }
+export async function fetchDepictions(ids, { size = 120 } = {}) {
+  if (!ids.length) return {};
+  const params = new URLSearchParams({ ids: ids.join(","), size: String(size) });
+  const res = await fetch(`/api/compounds/depictions/?${params.toString()}`, { credentials: "include" });
+  if (!res.ok) throw new Error("Failed to load depictions");
+  const data = await res.json();
+  return data.depictions || {};
+}
+
 // CREATE (auth + CSRF)
 export async function addCompound(payload) {
   const csrftoken = await ensureCsrf();
@@ -51,6 +116,108 @@ export async function updateCompound(id, payload) {
   return data;
 }
 
+// PATCH partiel : seuls les champs modifiés, If-Match = compound.version.
+// 409 → quelqu'un a modifié le composé entre-temps : err.current = version actuelle.
+export async function patchCompound(id, changes, version) {
+  const csrftoken = await ensureCsrf();
+  const res = await fetch(`/api/compounds/${id}/update/`, {
+    method: "PATCH",
+    credentials: "include",
+    headers: {
+      "Content-Type": "application/json",
+      "X-CSRFToken": csrftoken || "",
+      "If-Match": `"${version}"`,
+    },
+    body: JSON.stringify(changes),
+  });
+  const data = await res.json().catch(() => ({}));
+  if (!res.ok) {
+    const err = new Error(data?.error || "Failed to update compound");
+    err.status = res.status;
+    err.current = data?.compound;
+    throw err;
+  }
+  return data;
+}
+
+// Gros fichiers 3D : envoi par morceaux avec reprise (/api/compounds/uploads/).
+// Chaque morceau part avec son SHA-256 ; après une coupure, on repart de l'offset
+// connu du serveur. L'id de session est gardé dans localStorage pour reprendre
+// aussi après un rechargement de la page.
+export const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+
+async function sha256Hex(buffer) {
+  const digest = await crypto.subtle.digest("SHA-256", buffer);
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+async function uploadRequest(url, options, csrftoken) {
+  const res = await fetch(url, {
+    credentials: "include",
+    ...options,
+    headers: { "X-CSRFToken": csrftoken || "", ...(options.headers || {}) },
+  });
+  const data = await res.json().catch(() => ({}));
+  return { res, data };
+}
+
+export async function uploadStructureFile(compoundId, file, { onProgress, retries = 5 } = {}) {
+  const csrftoken = await ensureCsrf();
+  const storageKey = `upload:${compoundId}:${file.name}:${file.size}:${file.lastModified}`;
+  let upload = null;
+
+  const saved = localStorage.getItem(storageKey);
+  if (saved) {
+    const { res, data } = await uploadRequest(`/api/compounds/uploads/${saved}/`, { method: "GET" }, csrftoken);
+    if (res.ok && data.upload.status === "open") upload = data.upload;
+  }
+  if (!upload) {
+    const { res, data } = await uploadRequest(`/api/compounds/uploads/`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ compound_id: compoundId, filename: file.name, size: file.size }),
+    }, csrftoken);
+    if (!res.ok) throw new Error(data?.error || "Failed to start upload");
+    upload = data.upload;
+    localStorage.setItem(storageKey, upload.id);
+  }
+
+  let offset = upload.offset;
+  let failures = 0;
+  while (offset < file.size) {
+    const chunk = await file.slice(offset, offset + upload.chunk_size).arrayBuffer();
+    let result;
+    try {
+      result = await uploadRequest(`/api/compounds/uploads/${upload.id}/?offset=${offset}`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/octet-stream", "X-Chunk-SHA256": await sha256Hex(chunk) },
+        body: chunk,
+      }, csrftoken);
+    } catch (e) {
+      result = null; // réseau coupé : on redemande l'offset au serveur
+    }
+    if (result?.res.ok) {
+      offset = result.data.upload.offset;
+      failures = 0;
+      onProgress?.(offset / file.size);
+      continue;
+    }
+    if (result && result.res.status !== 409 && result.res.status < 500) {
+      throw new Error(result.data?.error || "Upload failed");
+    }
+    if (++failures > retries) throw new Error("Upload interrupted; try again to resume");
+    await new Promise((r) => setTimeout(r, 1000 * failures));
+    const state = await uploadRequest(`/api/compounds/uploads/${upload.id}/`, { method: "GET" }, csrftoken);
+    if (!state.res.ok) throw new Error(state.data?.error || "Upload session lost");
+    offset = state.data.upload.offset;
+  }
+
+  const { res, data } = await uploadRequest(`/api/compounds/uploads/${upload.id}/finalize/`, { method: "POST" }, csrftoken);
+  if (!res.ok) throw new Error(data?.error || "Failed to finalize upload");
+  localStorage.removeItem(storageKey);
+  return data;
+}
+
 // DELETE (auth + CSRF)
 export async function deleteCompound(id) {
   const csrftoken = await ensureCsrf();